@@ -0,0 +1,144 @@
+# app/api/v1/routes/ingest.py
+from datetime import datetime
+from decimal import Decimal
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends
+from pydantic import BaseModel, Field, field_validator
+
+from app.api.v1.routes.widgets import db_router
+from app.services.ingest_service import SalesIngestor
+
+router = APIRouter(tags=["ingest"])
+
+MAX_SALES_PER_REQUEST = 5000
+
+# um flusher por processo, escrevendo sempre no primário
+ingestor = SalesIngestor(lambda: db_router.session(read_only=False))
+
+
+# --------------------------------------------------------
+# payload (espelha as tabelas do schema.sql)
+# --------------------------------------------------------
+class ItemIn(BaseModel):
+    item_id: int
+    option_group_id: Optional[int] = None
+    quantity: float = 1
+    additional_price: float = 0
+    price: float = 0
+    amount: float = 1
+    observations: Optional[str] = Field(None, max_length=300)
+
+
+class ProductSaleIn(BaseModel):
+    product_id: int
+    quantity: float
+    base_price: float
+    total_price: float
+    observations: Optional[str] = Field(None, max_length=300)
+    items: List[ItemIn] = []
+
+
+class AddressIn(BaseModel):
+    street: Optional[str] = None
+    number: Optional[str] = None
+    complement: Optional[str] = None
+    formatted_address: Optional[str] = None
+    neighborhood: Optional[str] = None
+    city: Optional[str] = None
+    state: Optional[str] = None
+    country: Optional[str] = None
+    postal_code: Optional[str] = None
+    reference: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+
+class DeliveryIn(BaseModel):
+    courier_id: Optional[str] = None
+    courier_name: Optional[str] = None
+    courier_phone: Optional[str] = None
+    courier_type: Optional[str] = None
+    delivered_by: Optional[str] = None
+    delivery_type: Optional[str] = None
+    status: Optional[str] = None
+    delivery_fee: Optional[float] = None
+    courier_fee: Optional[float] = None
+    timing: Optional[str] = None
+    mode: Optional[str] = None
+    address: Optional[AddressIn] = None
+
+
+class PaymentIn(BaseModel):
+    payment_type_id: Optional[int] = None
+    value: Decimal
+    is_online: bool = False
+    description: Optional[str] = None
+    currency: str = "BRL"
+
+
+class SaleIn(BaseModel):
+    store_id: int
+    channel_id: int
+    cod_sale1: str = Field(..., min_length=1, max_length=100, description="ID do pedido no PDV (chave de idempotência)")
+    cod_sale2: Optional[str] = None
+    sub_brand_id: Optional[int] = None
+    customer_id: Optional[int] = None
+    customer_name: Optional[str] = Field(None, max_length=100)
+    created_at: datetime
+    sale_status_desc: str
+    total_amount_items: Decimal
+    total_discount: Decimal = Decimal("0")
+    total_increase: Decimal = Decimal("0")
+    delivery_fee: Decimal = Decimal("0")
+    service_tax_fee: Decimal = Decimal("0")
+    total_amount: Decimal
+    value_paid: Decimal = Decimal("0")
+    production_seconds: Optional[int] = None
+    delivery_seconds: Optional[int] = None
+    people_quantity: Optional[int] = None
+    discount_reason: Optional[str] = None
+    increase_reason: Optional[str] = None
+    origin: str = "POS"
+    products: List[ProductSaleIn] = []
+    delivery: Optional[DeliveryIn] = None
+    payments: List[PaymentIn] = []
+
+    @field_validator("created_at")
+    @classmethod
+    def _naive_local(cls, value: datetime) -> datetime:
+        # sales.created_at é TIMESTAMP sem fuso (hora local da loja). A loja
+        # não tem fuso cadastrado, e converter pro fuso do servidor mudaria o
+        # dia/hora da venda: com offset => 422
+        if value.tzinfo is not None:
+            raise ValueError("created_at deve vir sem fuso, na hora local da loja")
+        return value
+
+
+class SalesBatchIn(BaseModel):
+    sales: List[SaleIn] = Field(..., max_length=MAX_SALES_PER_REQUEST)
+
+
+def get_ingestor() -> SalesIngestor:
+    return ingestor
+
+
+# --------------------------------------------------------
+# ENDPOINTS
+# --------------------------------------------------------
+@router.post("/sales")
+async def ingest_sales(
+    payload: SalesBatchIn,
+    ingestor: SalesIngestor = Depends(get_ingestor),
+):
+    """
+    Recebe um lote de vendas do PDV (com produtos, itens, entrega e
+    pagamentos). Idempotente por (store_id, cod_sale1): reenvio volta em
+    `duplicates` sem gravar de novo. Responde depois do commit.
+    """
+    return await ingestor.submit([sale.model_dump() for sale in payload.sales])
+
+
+@router.get("/metrics")
+async def ingest_metrics(ingestor: SalesIngestor = Depends(get_ingestor)):
+    return ingestor.metrics()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Bytes-on-wire e tempo de decode dos payloads de lista: rows x columnar,
+sem compressão / gzip / brotli (se instalado).
+
+Sem argumentos usa payloads sintéticos no formato real (daily_breakdown de
+1 ano, 500 regiões do heatmap). Com --url mede uma resposta da API rodando:
+    python -m app.benchmarks.bench_payload_encoding
+    python -m app.benchmarks.bench_payload_encoding \\
+        --url "http://localhost:8000/api/v1/widgets/revenue-overview?store_id=1&start_date=2024-11-01&end_date=2025-10-31"
+"""
+
+import argparse
+import gzip
+import json
+import random
+import time
+import urllib.request
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List
+
+from app.core.compression import brotli
+from app.core.encoding import apply_format
+
+
+def synthetic_payloads() -> Dict[str, tuple]:
+    rnd = random.Random(1)
+    start = date(2024, 11, 1)
+    daily = [
+        {
+            "sale_date": (start + timedelta(days=i)).isoformat(),
+            "total_sales": round(rnd.uniform(8000, 30000), 2),
+            "total_orders": rnd.randint(150, 600),
+        }
+        for i in range(365)
+    ]
+    regions = [
+        {
+            "neighborhood": f"Bairro {i}",
+            "city": f"Cidade {i % 20}",
+            "delivery_count": rnd.randint(1, 900),
+            "avg_delivery_seconds": round(rnd.uniform(900, 3000), 1),
+            "p50_delivery_seconds": round(rnd.uniform(900, 2500), 1),
+            "p90_delivery_seconds": round(rnd.uniform(2000, 3400), 1),
+            "p99_delivery_seconds": round(rnd.uniform(3000, 3600), 1),
+        }
+        for i in range(500)
+    ]
+    return {
+        "revenue-overview (365 dias)": ({"store_id": 1, "daily_breakdown": daily}, ("daily_breakdown",)),
+        "delivery-heatmap (500 regiões)": ({"store_id": 1, "regions": regions}, ("regions",)),
+    }
+
+
+def _best_ms(fn: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, (time.perf_counter() - t0) * 1000)
+    return best
+
+
+def measure(name: str, payload: Dict[str, Any], list_keys: tuple, repeat: int) -> None:
+    codecs: List[tuple] = [
+        ("identity", lambda b: b, lambda b: b),
+        ("gzip", lambda b: gzip.compress(b, 6), gzip.decompress),
+    ]
+    if brotli is not None:
+        codecs.append(("br", lambda b: brotli.compress(b, quality=5), brotli.decompress))
+
+    print(f"\n{name}")
+    print(f"  {'formato':<9} | {'codec':<8} | {'bytes':>9} | {'decode ms':>9}")
+    for fmt in ("rows", "columnar"):
+        raw = json.dumps(apply_format(payload, fmt, *list_keys), default=str).encode()
+        for codec, enc, dec in codecs:
+            wire = enc(raw)
+            ms = _best_ms(lambda: json.loads(dec(wire)), repeat)
+            print(f"  {fmt:<9} | {codec:<8} | {len(wire):>9,} | {ms:>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tamanho/decode dos payloads por formato e codec")
+    parser.add_argument("--url", help="mede uma resposta real da API (JSON em formato rows)")
+    parser.add_argument("--keys", default="daily_breakdown,regions,customers,products,top_channels")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.url:
+        with urllib.request.urlopen(args.url) as resp:
+            payload = json.loads(resp.read())
+        keys = tuple(k for k in args.keys.split(",") if isinstance(payload.get(k), list))
+        measure(args.url, payload, keys, args.repeat)
+    else:
+        for name, (payload, keys) in synthetic_payloads().items():
+            measure(name, payload, keys, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
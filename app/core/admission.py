@@ -0,0 +1,202 @@
+# app/core/admission.py
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+from fastapi import HTTPException
+
+
+class EndpointClass:
+    """
+    Limites de uma classe de rota:
+      max_concurrent  requisições rodando ao mesmo tempo (≈ conexões do pool)
+      max_per_tenant  quantas dessas um mesmo tenant pode ocupar
+      max_queue       fila de espera; cheia => 503 na hora
+      max_wait        tempo máximo na fila antes do 503
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrent: int,
+        max_per_tenant: int,
+        max_queue: int,
+        max_wait: float,
+        retry_after: int = 1,
+    ):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_per_tenant = max_per_tenant
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.retry_after = retry_after
+
+        self.active = 0
+        self.active_by_tenant: Dict[str, int] = {}
+        # fila por tenant; a ordem do OrderedDict é o round-robin
+        self.queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self.queued = 0
+
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.max_queued = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    def _can_run(self, tenant: str) -> bool:
+        return (
+            self.active < self.max_concurrent
+            and self.active_by_tenant.get(tenant, 0) < self.max_per_tenant
+        )
+
+    def _start(self, tenant: str) -> None:
+        self.active += 1
+        self.active_by_tenant[tenant] = self.active_by_tenant.get(tenant, 0) + 1
+        self.admitted += 1
+
+    def leave(self, tenant: str) -> None:
+        self.active -= 1
+        left = self.active_by_tenant.get(tenant, 1) - 1
+        if left:
+            self.active_by_tenant[tenant] = left
+        else:
+            self.active_by_tenant.pop(tenant, None)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Libera vagas em round-robin entre tenants com fila (fair queuing)."""
+        for _ in range(len(self.queues)):
+            if self.active >= self.max_concurrent or not self.queues:
+                return
+            tenant, waiters = self.queues.popitem(last=False)
+            if self.active_by_tenant.get(tenant, 0) < self.max_per_tenant:
+                fut = waiters.popleft()
+                self.queued -= 1
+                self._start(tenant)
+                fut.set_result(None)
+            if waiters:
+                self.queues[tenant] = waiters  # volta pro fim da roda
+
+    def _remove(self, tenant: str, fut: asyncio.Future) -> None:
+        waiters = self.queues.get(tenant)
+        if waiters is not None and fut in waiters:
+            waiters.remove(fut)
+            self.queued -= 1
+            if not waiters:
+                del self.queues[tenant]
+
+    def _reject(self, detail: str) -> HTTPException:
+        return HTTPException(
+            status_code=503,
+            detail=detail,
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+    async def enter(self, tenant: str) -> None:
+        if not self.queued and self._can_run(tenant):
+            self._start(tenant)
+            return
+        if self.queued >= self.max_queue:
+            self.rejected_full += 1
+            raise self._reject("Servidor ocupado, tente de novo")
+
+        fut = asyncio.get_running_loop().create_future()
+        self.queues.setdefault(tenant, deque()).append(fut)
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        # pode haver vaga livre que só este tenant não podia usar
+        self._dispatch()
+
+        started = time.perf_counter()
+        try:
+            await asyncio.wait({fut}, timeout=self.max_wait)
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.leave(tenant)  # a vaga saiu junto com o cancelamento
+            else:
+                self._remove(tenant, fut)
+            raise
+        waited_ms = (time.perf_counter() - started) * 1000
+        self.total_wait_ms += waited_ms
+        self.max_wait_ms = max(self.max_wait_ms, waited_ms)
+
+        if not fut.done():
+            self._remove(tenant, fut)
+            fut.cancel()
+            self.rejected_timeout += 1
+            raise self._reject("Fila de espera esgotou, tente de novo")
+
+    def metrics(self) -> Dict[str, Any]:
+        waited = self.admitted
+        return {
+            "class": self.name,
+            "max_concurrent": self.max_concurrent,
+            "active": self.active,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "tenants_waiting": len(self.queues),
+            "admitted": self.admitted,
+            "rejected_full": self.rejected_full,
+            "rejected_timeout": self.rejected_timeout,
+            "avg_wait_ms": round(self.total_wait_ms / waited, 2) if waited else None,
+            "max_wait_ms": round(self.max_wait_ms, 2),
+        }
+
+
+class AdmissionController:
+    """
+    Porteiro das rotas de widget/relatório. Cada classe (interativo,
+    exportação) tem seu próprio limite, então uma leva de relatórios CSV
+    não ocupa as conexões dos dashboards; dentro da classe, a vaga que
+    libera vai pro próximo tenant da roda, não pro que mais enfileirou.
+    """
+
+    def __init__(self, classes: Dict[str, EndpointClass]):
+        self.classes = classes
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        """
+        ADMISSION_INTERACTIVE_CONCURRENCY  (padrão 12)
+        ADMISSION_EXPORT_CONCURRENCY       (padrão 3)
+        A soma padrão (15) é o pool do SQLAlchemy (5 + 10 overflow).
+        """
+        return cls({
+            "interactive": EndpointClass(
+                "interactive",
+                max_concurrent=int(os.getenv("ADMISSION_INTERACTIVE_CONCURRENCY", "12")),
+                max_per_tenant=4,
+                max_queue=200,
+                max_wait=2.0,
+                retry_after=1,
+            ),
+            "export": EndpointClass(
+                "export",
+                max_concurrent=int(os.getenv("ADMISSION_EXPORT_CONCURRENCY", "3")),
+                max_per_tenant=1,
+                max_queue=20,
+                max_wait=10.0,
+                retry_after=5,
+            ),
+        })
+
+    @asynccontextmanager
+    async def acquire(self, class_name: Optional[str], tenant: str) -> AsyncIterator[None]:
+        endpoint_class = self.classes.get(class_name) if class_name else None
+        if endpoint_class is None:
+            yield
+            return
+        await endpoint_class.enter(tenant)
+        try:
+            yield
+        finally:
+            endpoint_class.leave(tenant)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"classes": [c.metrics() for c in self.classes.values()]}
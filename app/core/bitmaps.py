@@ -0,0 +1,159 @@
+# app/core/bitmaps.py
+from __future__ import annotations
+
+import struct
+import sys
+from array import array
+from typing import Dict, Iterable, Iterator
+
+# contêiner com até 4096 valores vai como lista de uint16 (2 bytes cada);
+# acima disso o bitmap de 8 KB é menor
+ARRAY_MAX = 4096
+CONTAINER_BITS = 1 << 16
+CONTAINER_BYTES = CONTAINER_BITS // 8
+
+_ARRAY = 0
+_BITMAP = 1
+_HEADER = struct.Struct("<HBI")  # chave (16 bits altos), tipo, tamanho do payload
+
+
+class RoaringBitmap:
+    """
+    Conjunto de inteiros não negativos (ids de cliente) no formato Roaring
+    (Chambi, Lemire et al. 2016): os 16 bits altos escolhem o contêiner e
+    cada contêiner guarda os 16 bits baixos.
+
+    Na memória todo contêiner é um ``int`` de 65536 bits, então interseção
+    e contagem são ``&`` e ``bit_count()`` em C. Serializado (``to_bytes``)
+    o contêiner esparso vira lista ordenada de uint16 e o denso fica em
+    bitmap, que é o que deixa o de uma loja pequena com poucos bytes.
+    """
+
+    __slots__ = ("containers",)
+
+    def __init__(self, values: Iterable[int] = ()):
+        self.containers: Dict[int, int] = {}
+        self.update(values)
+
+    # ---------------------------------------------------------
+    # construção
+    # ---------------------------------------------------------
+    def add(self, value: int) -> None:
+        key = value >> 16
+        self.containers[key] = self.containers.get(key, 0) | (1 << (value & 0xFFFF))
+
+    def update(self, values: Iterable[int]) -> None:
+        # monta cada contêiner num bytearray e converte uma vez só
+        buffers: Dict[int, bytearray] = {}
+        for value in values:
+            value = int(value)
+            if value < 0:
+                raise ValueError("só inteiros não negativos")
+            buf = buffers.get(value >> 16)
+            if buf is None:
+                buf = buffers[value >> 16] = bytearray(CONTAINER_BYTES)
+            low = value & 0xFFFF
+            buf[low >> 3] |= 1 << (low & 7)
+        for key, buf in buffers.items():
+            self.containers[key] = self.containers.get(key, 0) | int.from_bytes(buf, "little")
+
+    # ---------------------------------------------------------
+    # álgebra
+    # ---------------------------------------------------------
+    def __and__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        out = RoaringBitmap()
+        for key, bits in self.containers.items():
+            both = bits & other.containers.get(key, 0)
+            if both:
+                out.containers[key] = both
+        return out
+
+    def __or__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        out = RoaringBitmap()
+        out.containers = dict(self.containers)
+        for key, bits in other.containers.items():
+            out.containers[key] = out.containers.get(key, 0) | bits
+        return out
+
+    def __sub__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        out = RoaringBitmap()
+        for key, bits in self.containers.items():
+            rest = bits & ~other.containers.get(key, 0)
+            if rest:
+                out.containers[key] = rest
+        return out
+
+    def intersection_count(self, other: "RoaringBitmap") -> int:
+        """|a ∩ b| sem montar o bitmap do resultado."""
+        small, large = sorted((self, other), key=lambda b: len(b.containers))
+        return sum(
+            (bits & large.containers.get(key, 0)).bit_count() for key, bits in small.containers.items()
+        )
+
+    def __len__(self) -> int:
+        return sum(bits.bit_count() for bits in self.containers.values())
+
+    def __contains__(self, value: int) -> bool:
+        return bool(self.containers.get(value >> 16, 0) >> (value & 0xFFFF) & 1)
+
+    def __iter__(self) -> Iterator[int]:
+        for key in sorted(self.containers):
+            base = key << 16
+            for low in _lows(self.containers[key]):
+                yield base + low
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, RoaringBitmap) and self.containers == other.containers
+
+    # ---------------------------------------------------------
+    # serialização (BYTEA)
+    # ---------------------------------------------------------
+    def to_bytes(self) -> bytes:
+        parts = []
+        for key in sorted(self.containers):
+            bits = self.containers[key]
+            if bits.bit_count() <= ARRAY_MAX:
+                payload, kind = _uint16_bytes(array("H", _lows(bits))), _ARRAY
+            else:
+                payload, kind = bits.to_bytes(CONTAINER_BYTES, "little"), _BITMAP
+            parts.append(_HEADER.pack(key, kind, len(payload)))
+            parts.append(payload)
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "RoaringBitmap":
+        out = cls()
+        view = memoryview(data)
+        offset = 0
+        while offset < len(view):
+            key, kind, size = _HEADER.unpack_from(view, offset)
+            offset += _HEADER.size
+            payload = view[offset:offset + size]
+            offset += size
+            if kind == _BITMAP:
+                out.containers[key] = int.from_bytes(payload, "little")
+                continue
+            lows = array("H", payload.tobytes())
+            if sys.byteorder == "big":
+                lows.byteswap()
+            buf = bytearray(CONTAINER_BYTES)
+            for low in lows:
+                buf[low >> 3] |= 1 << (low & 7)
+            out.containers[key] = int.from_bytes(buf, "little")
+        return out
+
+
+def _lows(bits: int) -> Iterator[int]:
+    # byte a byte: tirar bit a bit de um int de 64 Kbits copia o int toda vez
+    for index, byte in enumerate(bits.to_bytes(CONTAINER_BYTES, "little")):
+        while byte:
+            low = byte & -byte
+            yield (index << 3) + low.bit_length() - 1
+            byte ^= low
+
+
+def _uint16_bytes(values: array) -> bytes:
+    # formato em disco é little-endian, qualquer que seja a máquina
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
@@ -0,0 +1,98 @@
+# app/core/cancellation.py
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Dict, Optional
+
+from fastapi import HTTPException, Request
+
+# convenção do nginx: o cliente fechou a conexão antes da resposta
+CLIENT_CLOSED_REQUEST = 499
+# SQLSTATE de query_canceled (statement_timeout ou cancelamento)
+QUERY_CANCELED_SQLSTATE = "57014"
+
+REQUEST_GROUP_HEADER = "x-request-group"
+
+
+def is_query_canceled(exc: BaseException) -> bool:
+    """statement_timeout estourado (a exceção do driver vem em ``orig``)."""
+    orig = getattr(exc, "orig", None)
+    return getattr(orig, "sqlstate", None) == QUERY_CANCELED_SQLSTATE
+
+
+class RequestCanceller:
+    """
+    Roda o trabalho de uma rota numa task separada e a cancela se:
+
+    - o cliente desconectar (checado a cada ``poll_interval``);
+    - chegar requisição mais nova do mesmo grupo (header ``X-Request-Group``,
+      ex.: um id por bottom sheet de filtros): só a última segue. O grupo
+      vale dentro do ``owner`` (tenant/cliente): o mesmo id vindo de outro
+      tenant não cancela nada.
+
+    Cancelar a task interrompe o ``await`` no asyncpg, que manda o cancel
+    pro Postgres: a consulta para no banco, não só na API.
+    """
+
+    def __init__(self, poll_interval: float = 0.1):
+        self.poll_interval = poll_interval
+        self._groups: Dict[str, asyncio.Task] = {}
+
+        self.completed = 0
+        self.disconnected = 0
+        self.superseded = 0
+        self.timed_out = 0
+
+    async def run(
+        self,
+        request: Request,
+        work: Awaitable[Any],
+        group: Optional[str] = None,
+        owner: Optional[str] = None,
+    ) -> Any:
+        task = asyncio.ensure_future(work)
+        key = f"{owner or '-'}|{request.url.path}|{group}" if group else None
+        if key is not None:
+            previous = self._groups.get(key)
+            if previous is not None and not previous.done():
+                previous.cancel()
+                self.superseded += 1
+            self._groups[key] = task
+
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=self.poll_interval)
+                if done:
+                    break
+                if await request.is_disconnected():
+                    task.cancel()
+                    await asyncio.wait({task})  # deixa o cancel chegar ao banco antes de fechar a sessão
+                    self.disconnected += 1
+                    raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Cliente desconectou")
+        except asyncio.CancelledError:
+            # a própria requisição foi cancelada (servidor desligando etc.)
+            task.cancel()
+            raise
+        finally:
+            if key is not None and self._groups.get(key) is task:
+                del self._groups[key]
+
+        if task.cancelled():
+            raise HTTPException(status_code=409, detail="Requisição substituída por uma mais nova")
+        exc = task.exception()
+        if exc is not None:
+            if is_query_canceled(exc):
+                self.timed_out += 1
+                raise HTTPException(status_code=504, detail="Consulta excedeu o tempo limite") from exc
+            raise exc
+        self.completed += 1
+        return task.result()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "in_flight_groups": len(self._groups),
+            "completed": self.completed,
+            "disconnected": self.disconnected,
+            "superseded": self.superseded,
+            "timed_out": self.timed_out,
+        }
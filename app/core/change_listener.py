@@ -0,0 +1,226 @@
+# app/core/change_listener.py
+from __future__ import annotations
+
+import asyncio
+import inspect
+import json
+import time
+from datetime import date
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+CHANGE_CHANNEL = "sales_changed"
+
+# {store_id: {"store_id", "version", "from", "to"}} já juntado por loja
+Changes = Dict[int, Dict[str, Any]]
+
+
+class ChangeListener:
+    """
+    LISTEN no canal ``sales_changed`` (trigger da migração 007) numa conexão
+    dedicada ao primário. Avisos que chegam juntos (uma rajada de
+    ingestão) são agrupados por ``coalesce_seconds`` e entregues aos
+    handlers uma vez por loja, com a maior versão e o intervalo de dias.
+
+    O NOTIFY se perde se a conexão cair; por isso os handlers de estado
+    recebem ``connected=False`` (cache deve parar de confiar nos avisos) e
+    ``True`` na reconexão (hora de drenar a outbox).
+
+    Outros canais (ex.: ``dimensions_changed``) podem pegar carona na mesma
+    conexão via ``add_channel_handler``: o payload cru vai direto pro
+    handler, sem agrupamento.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Awaitable[Any]],
+        channel: str = CHANGE_CHANNEL,
+        coalesce_seconds: float = 0.5,
+        reconnect_seconds: float = 5.0,
+    ):
+        self._connect = connect
+        self.channel = channel
+        self.coalesce_seconds = coalesce_seconds
+        self.reconnect_seconds = reconnect_seconds
+
+        self._handlers: List[Callable[[Changes], Any]] = []
+        self._state_handlers: List[Callable[[bool], Any]] = []
+        self._channel_handlers: Dict[str, List[Callable[[str], Any]]] = {}
+        self._pending: Changes = {}
+        self._first_pending_at: Optional[float] = None
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.connected = False
+
+        self.connects = 0
+        self.notifications = 0
+        self.batches = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self.last_notify_lag_ms: Optional[float] = None
+        self.max_notify_lag_ms = 0.0
+        self.last_dispatch_ms: Optional[float] = None
+
+    @classmethod
+    def from_engine(cls, engine: Any, **kwargs: Any) -> "ChangeListener":
+        """
+        Conexão asyncpg própria, com a mesma URL do engine (fora do pool).
+        ``engine`` pode ser uma função: aí só é resolvido ao conectar, no
+        ``start`` do lifespan.
+        """
+
+        async def connect():
+            import asyncpg
+
+            target = engine() if callable(engine) else engine
+            url = target.url.set(drivername="postgresql")
+            return await asyncpg.connect(url.render_as_string(hide_password=False))
+
+        return cls(connect, **kwargs)
+
+    # ---------------------------------------------------------
+    # handlers
+    # ---------------------------------------------------------
+    def add_handler(self, handler: Callable[[Changes], Any]) -> None:
+        self._handlers.append(handler)
+
+    def add_state_handler(self, handler: Callable[[bool], Any]) -> None:
+        self._state_handlers.append(handler)
+
+    def add_channel_handler(self, channel: str, handler: Callable[[str], Any]) -> None:
+        """Handler síncrono e barato: roda dentro do callback do asyncpg."""
+        self._channel_handlers.setdefault(channel, []).append(handler)
+
+    def on_channel_notify(self, channel: str, payload: str) -> None:
+        self.notifications += 1
+        for handler in self._channel_handlers.get(channel, []):
+            try:
+                handler(payload)
+            except Exception as exc:
+                self.errors += 1
+                self.last_error = f"{type(exc).__name__}: {exc}"[:200]
+
+    async def _call(self, handlers: List[Callable[..., Any]], arg: Any) -> None:
+        for handler in handlers:
+            try:
+                result = handler(arg)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as exc:  # um handler com erro não derruba os outros
+                self.errors += 1
+                self.last_error = f"{type(exc).__name__}: {exc}"[:200]
+
+    async def _set_connected(self, connected: bool) -> None:
+        self.connected = connected
+        await self._call(self._state_handlers, connected)
+
+    # ---------------------------------------------------------
+    # avisos
+    # ---------------------------------------------------------
+    def on_notify(self, payload: str) -> None:
+        try:
+            msg = json.loads(payload)
+            store_id = int(msg["store_id"])
+            change = {
+                "store_id": store_id,
+                "version": int(msg["version"]),
+                "from": date.fromisoformat(msg["from"]),
+                "to": date.fromisoformat(msg["to"]),
+            }
+        except (ValueError, KeyError, TypeError):
+            self.errors += 1
+            return
+
+        self.notifications += 1
+        if msg.get("at"):
+            lag_ms = max(0.0, (time.time() - float(msg["at"])) * 1000)
+            self.last_notify_lag_ms = lag_ms
+            self.max_notify_lag_ms = max(self.max_notify_lag_ms, lag_ms)
+
+        current = self._pending.get(store_id)
+        if current is None:
+            self._pending[store_id] = change
+        else:
+            current["version"] = max(current["version"], change["version"])
+            current["from"] = min(current["from"], change["from"])
+            current["to"] = max(current["to"], change["to"])
+        if self._first_pending_at is None:
+            self._first_pending_at = time.monotonic()
+        self._wake.set()
+
+    async def dispatch(self) -> Changes:
+        """Entrega o que estiver pendente; devolve o lote entregue."""
+        pending, self._pending = self._pending, {}
+        first_at, self._first_pending_at = self._first_pending_at, None
+        self._wake.clear()
+        if not pending:
+            return pending
+        await self._call(self._handlers, pending)
+        self.batches += 1
+        if first_at is not None:
+            self.last_dispatch_ms = (time.monotonic() - first_at) * 1000
+        return pending
+
+    # ---------------------------------------------------------
+    # ciclo de vida
+    # ---------------------------------------------------------
+    async def _listen_once(self) -> None:
+        conn = await self._connect()
+        try:
+            await conn.add_listener(self.channel, lambda _c, _pid, _ch, payload: self.on_notify(payload))
+            for channel in self._channel_handlers:
+                await conn.add_listener(channel, lambda _c, _pid, ch, payload: self.on_channel_notify(ch, payload))
+            self.connects += 1
+            await self._set_connected(True)
+            while not conn.is_closed():
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    continue
+                await asyncio.sleep(self.coalesce_seconds)  # junta a rajada
+                await self.dispatch()
+        finally:
+            if not conn.is_closed():
+                await conn.close()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._listen_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # banco fora: tenta de novo depois
+                self.errors += 1
+                self.last_error = f"{type(exc).__name__}: {exc}"[:200]
+            finally:
+                if self.connected:
+                    await self._set_connected(False)
+            await asyncio.sleep(self.reconnect_seconds)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "channel": self.channel,
+            "extra_channels": sorted(self._channel_handlers),
+            "connected": self.connected,
+            "connects": self.connects,
+            "notifications": self.notifications,
+            "batches": self.batches,
+            "pending_stores": len(self._pending),
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "last_notify_lag_ms": round(self.last_notify_lag_ms, 2) if self.last_notify_lag_ms is not None else None,
+            "max_notify_lag_ms": round(self.max_notify_lag_ms, 2),
+            "last_dispatch_ms": round(self.last_dispatch_ms, 2) if self.last_dispatch_ms is not None else None,
+        }
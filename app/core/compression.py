@@ -0,0 +1,114 @@
+# app/core/compression.py
+from __future__ import annotations
+
+import gzip
+from typing import List, Optional, Tuple
+
+try:  # opcional: pip install brotli habilita "br"
+    import brotli
+except ImportError:  # pragma: no cover - depende do ambiente
+    brotli = None
+
+# abaixo disso o header + CPU custam mais do que economizam
+DEFAULT_MINIMUM_SIZE = 1024
+
+COMPRESSIBLE_TYPES = ("application/json", "text/csv", "text/plain", "text/html")
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """br > gzip, respeitando q=0 do cliente."""
+    offered = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if token:
+            offered[token.lower()] = q
+    if brotli is not None and offered.get("br", 0) > 0:
+        return "br"
+    if offered.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)  # q5: ~gzip -9 em tamanho, bem mais rápido
+    return gzip.compress(body, compresslevel=6)
+
+
+class CompressionMiddleware:
+    """
+    gzip/brotli negociado por Accept-Encoding para respostas >= minimum_size.
+    Bufferiza a resposta inteira (payloads de widget são pequenos); respostas
+    em streaming (text/event-stream) e já codificadas passam direto.
+    O ETag vira fraco (W/) no corpo comprimido, como no nginx.
+    """
+
+    def __init__(self, app, minimum_size: int = DEFAULT_MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict((k.lower(), v) for k, v in scope.get("headers", []))
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Optional[dict] = None
+        chunks: List[bytes] = []
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                resp_headers = dict((k.lower(), v) for k, v in message.get("headers", []))
+                content_type = resp_headers.get(b"content-type", b"").decode("latin-1")
+                if (
+                    b"content-encoding" in resp_headers
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                ):
+                    passthrough = True
+                    await send(message)
+                return
+
+            if message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if message.get("more_body", False):
+                    return
+                body = b"".join(chunks)
+                await self._finish(send, start_message, body, encoding)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _finish(self, send, start_message: dict, body: bytes, encoding: str) -> None:
+        raw_headers: List[Tuple[bytes, bytes]] = [
+            (k, v) for k, v in start_message.get("headers", []) if k.lower() != b"content-length"
+        ]
+        raw_headers.append((b"vary", b"Accept-Encoding"))
+
+        if len(body) >= self.minimum_size:
+            body = compress(body, encoding)
+            raw_headers.append((b"content-encoding", encoding.encode()))
+            raw_headers = [
+                (k, b"W/" + v if k.lower() == b"etag" and not v.startswith(b"W/") else v)
+                for k, v in raw_headers
+            ]
+
+        raw_headers.append((b"content-length", str(len(body)).encode()))
+        await send({**start_message, "headers": raw_headers})
+        await send({"type": "http.response.body", "body": body, "more_body": False})
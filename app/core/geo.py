@@ -0,0 +1,34 @@
+# app/core/geo.py
+from __future__ import annotations
+
+from typing import Tuple
+
+# zooms pré-calculados no rollup delivery_grid_daily.
+# grade equirretangular: no zoom z a célula tem 360/2^z graus de longitude
+# e 180/2^z de latitude (z=12 ≈ 10 km, z=14 ≈ 2,4 km, z=16 ≈ 600 m na longitude).
+GRID_ZOOMS: Tuple[int, ...] = (12, 14, 16)
+DEFAULT_GRID_ZOOM = 14
+
+GRID_ORIGIN = (-180.0, -90.0)  # (lon, lat) da célula (0, 0)
+
+
+def cell_size(zoom: int) -> Tuple[float, float]:
+    """(graus de longitude, graus de latitude) de uma célula no zoom."""
+    tiles = 2 ** zoom
+    return 360.0 / tiles, 180.0 / tiles
+
+
+def cell_of(latitude: float, longitude: float, zoom: int) -> Tuple[int, int]:
+    """Mesma conta do SQL em ``cell_sql`` (útil pra testes e pro cliente)."""
+    lon_step, lat_step = cell_size(zoom)
+    return (
+        int((longitude - GRID_ORIGIN[0]) // lon_step),
+        int((latitude - GRID_ORIGIN[1]) // lat_step),
+    )
+
+
+def cell_sql(lat_column: str, lon_column: str, zoom_column: str) -> Tuple[str, str]:
+    """Expressões SQL de (cell_x, cell_y) pro zoom da coluna/param informado."""
+    x = f"FLOOR(({lon_column} + 180) * POWER(2, {zoom_column}) / 360)::INTEGER"
+    y = f"FLOOR(({lat_column} + 90) * POWER(2, {zoom_column}) / 180)::INTEGER"
+    return x, y
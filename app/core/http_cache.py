@@ -0,0 +1,144 @@
+# app/core/http_cache.py
+from __future__ import annotations
+
+import hashlib
+import time
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# parâmetros de query que identificam as lojas de um widget
+STORE_PARAMS = ("store_id", "store_a_id", "store_b_id", "store_ids")
+
+# janela aberta (inclui hoje): o cliente sempre revalida, o 304 é barato
+CACHE_CONTROL_OPEN = "private, no-cache"
+# período fechado: muda pouco, mas carga retroativa/correção muda o ETag e o
+# cliente só revalida quando o max-age vence, então ele fica curto (1 min)
+CACHE_CONTROL_CLOSED = "private, max-age=60"
+
+# NOTIFY do RollupRepository depois de regravar rollups (payload = ids "1,7,9"):
+# a versão da loja subiu de novo, agora com o rollup novo já visível
+ROLLUPS_CHANNEL = "rollups_refreshed"
+
+
+def store_ids_from_query(items: Iterable[Tuple[str, str]]) -> List[int]:
+    ids = set()
+    for key, value in items:
+        if key in STORE_PARAMS:
+            try:
+                ids.add(int(value))
+            except ValueError:
+                continue  # a validação da rota responde 422
+    return sorted(ids)
+
+
+def make_etag(
+    path: str,
+    items: Iterable[Tuple[str, str]],
+    watermarks: Dict[int, int],
+    day: str = "",
+) -> str:
+    """
+    ETag = hash(endpoint, params normalizados, versão de dados de cada loja).
+    ``day`` entra nas janelas abertas: "mês corrente"/"últimos 30 dias"
+    mudam na virada do dia mesmo sem venda nova.
+    """
+    params = "&".join(f"{k}={v}" for k, v in sorted(items))
+    marks = ",".join(f"{sid}:{watermarks.get(sid, 0)}" for sid in sorted(watermarks))
+    digest = hashlib.sha1(f"{path}?{params}|{marks}|{day}".encode()).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    # comparação fraca (RFC 9110): ignora o prefixo W/
+    return "*" in candidates or etag in [c[2:] if c.startswith("W/") else c for c in candidates]
+
+
+def cache_control_for(end_date: Optional[str], today: Optional[date] = None) -> str:
+    """Sem end_date os widgets usam "hoje" (ou a última venda): janela aberta."""
+    today = today or date.today()
+    if not end_date:
+        return CACHE_CONTROL_OPEN
+    try:
+        end = date.fromisoformat(end_date)
+    except ValueError:
+        return CACHE_CONTROL_OPEN
+    return CACHE_CONTROL_CLOSED if end < today else CACHE_CONTROL_OPEN
+
+
+class WatermarkCache:
+    """
+    Versões de dados por loja em memória, pra o ETag não precisar nem do
+    lookup em store_data_watermark. Só vale enquanto o listener de mudanças
+    (NOTIFY) estiver conectado: cada aviso derruba a loja do cache. Fora
+    isso, ``ttl`` limita quanto uma versão lida de réplica atrasada pode
+    durar.
+    """
+
+    def __init__(self, ttl: float = 30.0):
+        self.ttl = ttl
+        self.enabled = False
+        self._versions: Dict[int, Tuple[int, float]] = {}
+        # geração da última invalidação por loja: leitura que começou antes
+        # do aviso não pode repor a versão velha
+        self._generation = 0
+        self._invalidated: Dict[int, int] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def set_enabled(self, enabled: bool) -> None:
+        self.enabled = enabled
+        self._versions.clear()
+
+    def token(self) -> int:
+        return self._generation
+
+    def get_many(self, store_ids: List[int]) -> Tuple[Dict[int, int], List[int]]:
+        """Devolve (versões em cache, lojas que faltam buscar no banco)."""
+        if not self.enabled:
+            return {}, list(store_ids)
+        now = time.monotonic()
+        found: Dict[int, int] = {}
+        missing: List[int] = []
+        for sid in store_ids:
+            entry = self._versions.get(sid)
+            if entry is not None and now - entry[1] < self.ttl:
+                found[sid] = entry[0]
+            else:
+                missing.append(sid)
+        self.hits += len(found)
+        self.misses += len(missing)
+        return found, missing
+
+    def update(self, marks: Dict[int, int], token: int) -> None:
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        for sid, version in marks.items():
+            if self._invalidated.get(sid, -1) <= token:
+                self._versions[sid] = (version, now)
+
+    def invalidate(self, store_ids: Iterable[int]) -> None:
+        self._generation += 1
+        for sid in store_ids:
+            self._versions.pop(sid, None)
+            self._invalidated[sid] = self._generation
+            self.invalidations += 1
+
+    def on_rollups_notify(self, payload: str) -> None:
+        ids = [int(p) for p in (payload or "").split(",") if p.strip().isdigit()]
+        if ids:
+            self.invalidate(ids)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "stores": len(self._versions),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
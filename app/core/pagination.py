@@ -0,0 +1,80 @@
+# app/core/pagination.py
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+
+
+def _scope_hash(scope: Dict[str, Any]) -> str:
+    raw = json.dumps(scope, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()[:12]
+
+
+def encode_cursor(key: Sequence[Any], scope: Dict[str, Any]) -> str:
+    """
+    Token opaco de continuação (keyset): a chave de ordenação da última
+    linha entregue + um hash dos filtros, pra não reaproveitar o cursor
+    numa consulta diferente.
+    """
+    payload = {"k": list(key), "s": _scope_hash(scope)}
+    raw = json.dumps(payload, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _key_part(value: Any, kind: type) -> Any:
+    # date viaja como ISO no JSON; int não aceita bool (True é int em Python)
+    if kind is date:
+        return date.fromisoformat(value)
+    if not isinstance(value, kind) or (kind is int and isinstance(value, bool)):
+        raise TypeError(f"esperado {kind.__name__}")
+    return value
+
+
+def decode_cursor(
+    token: Optional[str],
+    scope: Dict[str, Any],
+    key_types: Sequence[type] = (),
+) -> Optional[List[Any]]:
+    """
+    Chave da última linha da página anterior. ``key_types`` (ex.:
+    ``(int, str, str)``) valida tamanho e tipo de cada parte: cursor
+    montado à mão vira 400 aqui, não erro do driver na consulta.
+    """
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        key, token_scope = payload["k"], payload["s"]
+    except (ValueError, KeyError, TypeError) as exc:
+        raise HTTPException(status_code=400, detail="Cursor inválido") from exc
+    if token_scope != _scope_hash(scope):
+        raise HTTPException(status_code=400, detail="Cursor não pertence a esta consulta")
+    if key_types:
+        try:
+            if not isinstance(key, list) or len(key) != len(key_types):
+                raise TypeError("chave com tamanho errado")
+            key = [_key_part(value, kind) for value, kind in zip(key, key_types)]
+        except (ValueError, TypeError) as exc:
+            raise HTTPException(status_code=400, detail="Cursor inválido") from exc
+    return key
+
+
+def paginate(
+    rows: List[Dict[str, Any]],
+    limit: int,
+    key: Callable[[Dict[str, Any]], Sequence[Any]],
+    scope: Dict[str, Any],
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    ``rows`` vem do banco com ``limit + 1`` linhas: a sobra só indica que
+    existe próxima página (sem COUNT extra).
+    """
+    page = rows[:limit]
+    next_cursor = encode_cursor(key(page[-1]), scope) if len(rows) > limit and page else None
+    return page, next_cursor
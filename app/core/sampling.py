@@ -0,0 +1,81 @@
+# app/core/sampling.py
+from __future__ import annotations
+
+import math
+from typing import Dict, List, Optional
+
+# 95% (normal): metade do intervalo = 1,96 desvios
+CONFIDENCE_LEVEL = 0.95
+Z_95 = 1.96
+
+# semente fixa do TABLESAMPLE ... REPEATABLE: mesma requisição => mesma
+# amostra (a ETag continua valendo) e amostra maior contém a menor
+SAMPLE_SEED = 7
+
+# bloco da linha na tabela (partição + página do ctid): a unidade sorteada
+# pelo TABLESAMPLE SYSTEM, que é a unidade da variância
+BLOCK_SQL = "s.tableoid AS rel, (s.ctid::text::point)[0]::BIGINT AS page"
+
+
+class BlockEstimate:
+    """
+    Estimador de Horvitz-Thompson pra amostra de blocos de Bernoulli
+    (TABLESAMPLE SYSTEM com p = ``sample_pct``/100): cada bloco entra com
+    probabilidade p, então total = Σ_amostra y_b / p e a variância é
+    estimada por (1 - p)/p² · Σ_amostra y_b². Razões (ticket médio) usam
+    o método delta com a covariância entre pedidos e valor no bloco.
+
+    Recebe as somas por bloco já agregadas no banco (Σy_b, Σy_b², Σx_b·y_b);
+    bloco sorteado sem linha do filtro soma 0 e não muda nada.
+    """
+
+    def __init__(self, sample_pct: float, z: float = Z_95):
+        if not 0 < sample_pct <= 100:
+            raise ValueError("sample_pct deve estar entre 0 e 100")
+        self.p = sample_pct / 100.0
+        self.z = z
+        self.scale = 1.0 / self.p
+        self._var_factor = (1.0 - self.p) / (self.p * self.p)
+
+    def total(self, value: float, value_sq: float) -> Dict[str, float]:
+        estimate = float(value or 0) * self.scale
+        half = self.z * math.sqrt(max(float(value_sq or 0), 0.0) * self._var_factor)
+        return _interval(estimate, half)
+
+    def ratio(
+        self,
+        orders: float,
+        value: float,
+        orders_sq: float,
+        value_sq: float,
+        cross_sum: float,
+    ) -> Dict[str, float]:
+        """Valor/pedidos (ticket médio); o fator de escala se cancela na razão."""
+        orders = float(orders or 0)
+        if not orders:
+            return _interval(0.0, 0.0)
+        ratio = float(value or 0) / orders
+        # Σ (y_b - R x_b)²
+        residual = float(value_sq or 0) - 2 * ratio * float(cross_sum or 0) + ratio * ratio * float(orders_sq or 0)
+        var = max(residual, 0.0) * self._var_factor / (orders * self.scale) ** 2
+        return _interval(ratio, self.z * math.sqrt(var))
+
+
+def _interval(estimate: float, half_width: float) -> Dict[str, float]:
+    return {
+        "estimate": estimate,
+        "low": max(estimate - half_width, 0.0),
+        "high": estimate + half_width,
+        # erro relativo (±%) pra UI decidir se mostra o número ou espera o exato
+        "error_pct": round(half_width / estimate * 100, 2) if estimate else None,
+    }
+
+
+def ci(interval: Dict[str, float], digits: int = 2) -> List[float]:
+    return [round(interval["low"], digits), round(interval["high"], digits)]
+
+
+def next_sample_pct(sample_pct: float, step: float = 10.0) -> Optional[float]:
+    """Próximo passo do refinamento progressivo; None => já é hora do exato."""
+    following = sample_pct * step
+    return round(following, 3) if following < 100 else None
@@ -0,0 +1,197 @@
+# app/core/sketches.py
+from __future__ import annotations
+
+import hashlib
+import math
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+# erro relativo garantido nos quantis (1% => p90 de 30 min sai entre 29,7 e 30,3 min)
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+# tempo de produção da cozinha: 2% basta (p90 de 20 min sai com ±24 s) e
+# deixa uns 50 buckets entre 5 e 40 min, em vez de uns 100
+PRODUCTION_RELATIVE_ACCURACY = 0.02
+
+# bucket reservado p/ linhas sem tempo medido: entram na contagem, mas não no sketch
+NO_VALUE_BUCKET = -1
+
+# 2^12 registradores no HLL: erro padrão de 1,04/√4096 ≈ 1,6% na contagem distinta
+DEFAULT_HLL_PRECISION = 12
+
+
+class DDSketch:
+    """
+    Sketch de quantis mergeável (DDSketch, Masson et al. 2019).
+
+    Cada valor cai no bucket ``ceil(log_gamma(x))``; guardamos só a contagem
+    por bucket. Dois sketches com o mesmo ``gamma`` se juntam somando as
+    contagens, então dá pra pré-calcular um sketch por dia no banco e juntar
+    qualquer período na hora da consulta, sem ordenar as linhas originais.
+
+    O cálculo do bucket é espelhado em SQL (ver ``bucket_sql``) para que o
+    rollup seja gerado direto no Postgres.
+    """
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy deve estar entre 0 e 1")
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.count = 0
+
+    # ---------------------------------------------------------
+    # construção
+    # ---------------------------------------------------------
+    def key(self, value: float) -> int:
+        # valores < 1 (segundos) caem todos no bucket 0
+        return int(math.ceil(math.log(max(value, 1.0)) / self._log_gamma))
+
+    def add(self, value: float, count: int = 1) -> None:
+        self.add_bucket(self.key(value), count)
+
+    def add_bucket(self, key: int, count: int) -> None:
+        if count <= 0:
+            return
+        self.bins[key] = self.bins.get(key, 0) + count
+        self.count += count
+
+    def merge(self, other: "DDSketch") -> None:
+        if not math.isclose(self.gamma, other.gamma):
+            raise ValueError("só dá pra juntar sketches com a mesma precisão")
+        for key, count in other.bins.items():
+            self.add_bucket(key, count)
+
+    @classmethod
+    def from_buckets(
+        cls,
+        buckets: Iterable[Tuple[int, int]],
+        relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+    ) -> "DDSketch":
+        sketch = cls(relative_accuracy)
+        for key, count in buckets:
+            sketch.add_bucket(int(key), int(count))
+        return sketch
+
+    # ---------------------------------------------------------
+    # leitura
+    # ---------------------------------------------------------
+    def value(self, key: int) -> float:
+        """Representante do bucket (ponto com erro relativo mínimo)."""
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not 0 <= q <= 1:
+            raise ValueError("q deve estar entre 0 e 1")
+        if self.count == 0:
+            return None
+
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                return self.value(key)
+        return self.value(max(self.bins))
+
+    def bucket_sql(self, column: str) -> str:
+        """
+        Expressão SQL equivalente a ``key()``. O ``gamma`` vai como bind param
+        (``:sketch_gamma``) pra não divergir do Python.
+        """
+        return (
+            f"CASE WHEN {column} IS NULL THEN {NO_VALUE_BUCKET} "
+            f"ELSE CEIL(LN(GREATEST({column}, 1)) / LN(:sketch_gamma))::SMALLINT END"
+        )
+
+
+class HyperLogLog:
+    """
+    Contagem distinta aproximada (HyperLogLog, Flajolet et al. 2007).
+
+    Cada valor vira um hash de 64 bits: os ``precision`` primeiros bits
+    escolhem o registrador e o resto dá o rank (posição do primeiro bit 1).
+    O sketch guarda só o maior rank por registrador, então juntar dias,
+    canais ou lojas é MAX por registrador, e o erro padrão fica em
+    1,04/√m qualquer que seja o período.
+
+    Como o DDSketch, o cálculo é espelhado em SQL (``register_sql`` /
+    ``rank_sql``, hash = primeiros 64 bits do md5) e o rollup guarda só os
+    registradores não vazios, uma linha por registrador.
+    """
+
+    def __init__(self, precision: int = DEFAULT_HLL_PRECISION):
+        if not 4 <= precision <= 16:
+            raise ValueError("precision deve estar entre 4 e 16")
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers: Dict[int, int] = {}
+
+    # ---------------------------------------------------------
+    # construção
+    # ---------------------------------------------------------
+    def position(self, value: Any) -> Tuple[int, int]:
+        """(registrador, rank) do valor; mesmo resultado do SQL."""
+        h = int(hashlib.md5(str(value).encode()).hexdigest()[:16], 16)
+        rest_bits = 64 - self.precision
+        rest = h & ((1 << rest_bits) - 1)
+        return h >> rest_bits, rest_bits - rest.bit_length() + 1
+
+    def add(self, value: Any) -> None:
+        self.add_register(*self.position(value))
+
+    def add_register(self, register: int, rank: int) -> None:
+        if rank > self.registers.get(register, 0):
+            self.registers[register] = rank
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if self.precision != other.precision:
+            raise ValueError("só dá pra juntar sketches com a mesma precisão")
+        for register, rank in other.registers.items():
+            self.add_register(register, rank)
+
+    @classmethod
+    def from_registers(
+        cls,
+        registers: Iterable[Tuple[int, int]],
+        precision: int = DEFAULT_HLL_PRECISION,
+    ) -> "HyperLogLog":
+        sketch = cls(precision)
+        for register, rank in registers:
+            sketch.add_register(int(register), int(rank))
+        return sketch
+
+    # ---------------------------------------------------------
+    # leitura
+    # ---------------------------------------------------------
+    @property
+    def standard_error(self) -> float:
+        return 1.04 / math.sqrt(self.m)
+
+    def count(self) -> int:
+        if not self.registers:
+            return 0
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        zeros = self.m - len(self.registers)
+        harmonic = zeros + sum(2.0 ** -rank for rank in self.registers.values())
+        estimate = alpha * self.m * self.m / harmonic
+        if estimate <= 2.5 * self.m and zeros:
+            # poucos distintos: linear counting nos registradores vazios é mais preciso
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+    def _hash_sql(self, column: str) -> str:
+        return f"('x' || substr(md5({column}::TEXT), 1, 16))::BIT(64)"
+
+    def register_sql(self, column: str) -> str:
+        """Expressão SQL equivalente ao registrador de ``position()``."""
+        return f"substring({self._hash_sql(column)} FROM 1 FOR {self.precision})::BIT({self.precision})::INTEGER"
+
+    def rank_sql(self, column: str) -> str:
+        """Expressão SQL equivalente ao rank de ``position()`` (resto zerado => bits + 1)."""
+        rest_bits = 64 - self.precision
+        return (
+            f"COALESCE(NULLIF(position(B'1' IN substring({self._hash_sql(column)} "
+            f"FROM {self.precision + 1})), 0), {rest_bits + 1})"
+        )
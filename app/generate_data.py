@@ -314,6 +314,25 @@ def generate_sales(conn, stores, channels, products, items, option_groups, custo
     start_date = datetime.now() - timedelta(days=30 * months)
     end_date = datetime.now()
 
+    # Migração 003 aplicada: cria as partições mensais do período antes de inserir
+    cursor.execute("SELECT to_regproc('ensure_sales_partitions') IS NOT NULL")
+    if cursor.fetchone()[0]:
+        cursor.execute(
+            "SELECT ensure_sales_partitions(%s, %s)",
+            (start_date.date(), end_date.date())
+        )
+        conn.commit()
+
+    # product_sales.sale_created_at só existe depois da 003: no schema.sql puro
+    # o INSERT vai sem a coluna (a 003 aplicada depois copia os dados)
+    cursor.execute("""
+        SELECT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'product_sales' AND column_name = 'sale_created_at'
+        )
+    """)
+    with_sale_created_at = cursor.fetchone()[0]
+
     # Anomalies
     anomaly_week = start_date + timedelta(days=random.randint(30, 60))
     promo_day = start_date + timedelta(days=random.randint(90, 120))
@@ -363,14 +382,14 @@ def generate_sales(conn, stores, channels, products, items, option_groups, custo
             sales_batch.append(sale_data)
 
             if len(sales_batch) >= batch_size:
-                insert_sales_batch(cursor, sales_batch, items, option_groups)
+                insert_sales_batch(cursor, sales_batch, items, option_groups, with_sale_created_at)
                 total_sales += len(sales_batch)
                 sales_batch = []
                 conn.commit()
 
         # Insert remaining
         if sales_batch:
-            insert_sales_batch(cursor, sales_batch, items, option_groups)
+            insert_sales_batch(cursor, sales_batch, items, option_groups, with_sale_created_at)
             total_sales += len(sales_batch)
             conn.commit()
 
@@ -531,7 +550,7 @@ def generate_single_sale(sale_time, store_id, channel, customer_id, products, it
     }
 
 
-def insert_sales_batch(cursor, sales_batch, items, option_groups):
+def insert_sales_batch(cursor, sales_batch, items, option_groups, with_sale_created_at=True):
     """Insert batch of sales with all related data"""
 
     # Insert sales
@@ -570,17 +589,29 @@ def insert_sales_batch(cursor, sales_batch, items, option_groups):
     sale_ids.reverse()
 
     # Insert product_sales and related data
+    if with_sale_created_at:
+        product_sql = """
+            INSERT INTO product_sales (
+                sale_id, product_id, quantity, base_price, total_price,
+                sale_created_at
+            ) VALUES (%s,%s,%s,%s,%s,%s) RETURNING id
+        """
+    else:
+        product_sql = """
+            INSERT INTO product_sales (
+                sale_id, product_id, quantity, base_price, total_price
+            ) VALUES (%s,%s,%s,%s,%s) RETURNING id
+        """
     for sale_id, sale in zip(sale_ids, sales_batch):
         for prod_data in sale['products']:
-            cursor.execute("""
-                INSERT INTO product_sales (
-                    sale_id, product_id, quantity, base_price, total_price
-                ) VALUES (%s,%s,%s,%s,%s) RETURNING id
-            """, (
+            values = (
                 sale_id, prod_data['product_id'],
                 prod_data['quantity'], prod_data['base_price'],
                 prod_data['total_price']
-            ))
+            )
+            if with_sale_created_at:
+                values += (sale['created_at'],)
+            cursor.execute(product_sql, values)
             product_sale_id = cursor.fetchone()[0]
 
             # Insert items for this product
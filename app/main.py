@@ -1,10 +1,53 @@
 # app/main.py
-from fastapi import FastAPI
+import os
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from app.api.v1.routes import ingest as ingest_router
 from app.api.v1.routes import widgets as widgets_router
+from app.core.compression import CompressionMiddleware
+from app.services.warmup import warm_up
+
+# estatísticas do último startup (engine + warmup), expostas em /health/startup
+startup_stats = {}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # engines nascem aqui, não no import das rotas
+    started = time.perf_counter()
+    router = widgets_router.db_router.open()
+    startup_stats["engine_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    # lojas/canais/produtos em memória antes da primeira requisição; banco
+    # fora não segura o startup (carrega na primeira consulta que precisar)
+    try:
+        async with widgets_router.db_router.session(read_only=True) as session:
+            startup_stats["dimensions"] = await widgets_router.dimensions.load(session)
+    except Exception as exc:
+        startup_stats["dimensions"] = {"error": f"{type(exc).__name__}: {exc}"[:200]}
+    # DB_WARMUP=1: abre o pool mínimo e prepara os statements do
+    # SalesRepository antes do worker ficar pronto (deploy/scale-out)
+    if os.getenv("DB_WARMUP", "0") == "1":
+        connections = int(os.getenv("DB_WARMUP_CONNECTIONS", "0")) or None
+        startup_stats["warmup"] = await warm_up(router, connections=connections, dimensions=widgets_router.dimensions)
+    startup_stats["ready_ms"] = round((time.perf_counter() - started) * 1000, 2)
 
-app = FastAPI(title="Nola KitchenSights API")
+    # LISTEN sales_changed: invalidação de cache e rollups incrementais
+    # (DB_CHANGE_LISTENER=0 desliga, ex.: banco sem a migração 007)
+    if os.getenv("DB_CHANGE_LISTENER", "1") == "1":
+        widgets_router.change_listener.start()
+    yield
+    await widgets_router.change_listener.stop()
+    await widgets_router.rollup_refresher.stop()
+    # grava o que sobrou na fila de ingestão antes de desligar
+    await ingest_router.ingestor.stop()
+    await widgets_router.db_router.dispose()
+
+
+app = FastAPI(title="Nola KitchenSights API", lifespan=lifespan)
 
 # CORS bem aberto pra dev
 app.add_middleware(
@@ -13,19 +56,95 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Query-Strategy", "Link"],
 )
 
+# gzip/brotli negociado (>= 1 KB); brotli só se o pacote estiver instalado
+app.add_middleware(CompressionMiddleware, minimum_size=1024)
+
 # registra as rotas
+# admit: limite de concorrência (interativo x exportação) antes de qualquer consulta
+# conditional_get: ETag/304 por marca d'água da loja em todas as rotas de widget
 app.include_router(
     widgets_router.router,
     prefix="/api/v1/widgets",
     tags=["widgets"],
+    dependencies=[Depends(widgets_router.admit), Depends(widgets_router.conditional_get)],
 )
+app.include_router(ingest_router.router, prefix="/api/v1/ingest", tags=["ingest"])
 
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
+
+@app.get("/health/db")
+async def health_db():
+    # saúde, atraso e latência por banco (primário/réplicas)
+    router = widgets_router.db_router.open()
+    await router.check_health()
+    return router.metrics()
+
+
+@app.get("/health/startup")
+async def health_startup():
+    # tempo de criação dos engines e do warmup (DB_WARMUP=1) deste worker
+    return startup_stats
+
+
+@app.get("/health/analytics")
+async def health_analytics():
+    # espelho Parquet/DuckDB: cobertura do export e consultas servidas/desviadas
+    mirror = widgets_router.analytics_mirror
+    return mirror.metrics() if mirror is not None else {"enabled": False}
+
+
+@app.get("/health/hot-window")
+async def health_hot_window():
+    # janela quente em memória: lojas, linhas, MB, acertos e recargas
+    hot_window = widgets_router.hot_window
+    return hot_window.metrics() if hot_window is not None else {"enabled": False}
+
+
+@app.get("/health/dimensions")
+async def health_dimensions():
+    # cache id -> nome: linhas por tabela, recargas e lookups de id novo
+    return widgets_router.dimensions.metrics()
+
+
+@app.get("/health/planner")
+async def health_planner():
+    # estratégia escolhida por consulta, latência média/máx e quedas pro cru
+    return widgets_router.query_planner.metrics()
+
+
+@app.get("/health/admission")
+async def health_admission():
+    # vagas ocupadas, fila e rejeições (503) por classe de rota
+    return widgets_router.admission.metrics()
+
+
+@app.get("/health/requests")
+async def health_requests():
+    # consultas canceladas por desconexão, por requisição mais nova ou por timeout
+    return widgets_router.canceller.metrics()
+
+
+@app.get("/health/changes")
+async def health_changes():
+    # listener de NOTIFY, cache de versões e dreno de rollups (atrasos em ms/s)
+    return {
+        "listener": widgets_router.change_listener.metrics(),
+        "watermark_cache": widgets_router.watermark_cache.metrics(),
+        "rollup_refresher": widgets_router.rollup_refresher.metrics(),
+    }
+
+
+@app.get("/health/live")
+async def health_live():
+    # feeds ao vivo abertos: assinantes, consultas e eventos por loja
+    return widgets_router.live_hub.metrics()
+
 @app.get("/")
 async def root():
     return {"status": "ok", "app": "nola-kitchensights"}
@@ -0,0 +1,20 @@
+-- 001: rollup diário de tempos de entrega em formato DDSketch
+--
+-- Uma linha por (loja, dia, bairro, cidade, bucket). O bucket é
+-- ceil(log_gamma(delivery_seconds)) -- ver app/core/sketches.py -- e o
+-- bucket -1 guarda entregas sem delivery_seconds (contam no volume, não
+-- nos percentis). Qualquer período é o SUM das contagens por bucket, então
+-- p50/p90/p99 saem em tempo proporcional a dias x buckets, não a entregas.
+--
+-- Populado por: python -m app.refresh_rollups --start AAAA-MM-DD --end AAAA-MM-DD
+
+CREATE TABLE IF NOT EXISTS delivery_time_sketch_daily (
+    store_id               INTEGER      NOT NULL REFERENCES stores(id),
+    sale_date              DATE         NOT NULL,
+    neighborhood           VARCHAR(100) NOT NULL,
+    city                   VARCHAR(100) NOT NULL,
+    bucket                 SMALLINT     NOT NULL,
+    delivery_count         INTEGER      NOT NULL,
+    delivery_seconds_sum   BIGINT       NOT NULL DEFAULT 0,
+    PRIMARY KEY (store_id, sale_date, neighborhood, city, bucket)
+);
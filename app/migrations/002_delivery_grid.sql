@@ -0,0 +1,23 @@
+-- 002: rollup diário de entregas por célula de grade lat/long
+--
+-- Uma linha por (loja, dia, zoom, célula). Células numa grade
+-- equirretangular: no zoom z, cell_x = floor((lon + 180) * 2^z / 360) e
+-- cell_y = floor((lat + 90) * 2^z / 180) -- ver app/core/geo.py.
+-- Os zooms gerados ficam em GRID_ZOOMS. Todas as métricas são somáveis
+-- (ou min/max), então qualquer período é só um GROUP BY sobre os dias.
+--
+-- Populado por: python -m app.refresh_rollups --start AAAA-MM-DD --end AAAA-MM-DD
+
+CREATE TABLE IF NOT EXISTS delivery_grid_daily (
+    store_id               INTEGER  NOT NULL REFERENCES stores(id),
+    sale_date              DATE     NOT NULL,
+    zoom                   SMALLINT NOT NULL,
+    cell_x                 INTEGER  NOT NULL,
+    cell_y                 INTEGER  NOT NULL,
+    delivery_count         INTEGER  NOT NULL,
+    timed_count            INTEGER  NOT NULL DEFAULT 0,
+    delivery_seconds_sum   BIGINT   NOT NULL DEFAULT 0,
+    delivery_seconds_min   INTEGER,
+    delivery_seconds_max   INTEGER,
+    PRIMARY KEY (store_id, zoom, sale_date, cell_x, cell_y)
+);
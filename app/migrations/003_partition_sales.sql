@@ -0,0 +1,137 @@
+-- 003: particionamento mensal de sales / product_sales pela data da venda
+--
+-- sales vira PARTITION BY RANGE (created_at) e product_sales ganha a coluna
+-- sale_created_at (cópia de sales.created_at) pra ser particionada no mesmo
+-- recorte. Com os filtros do SalesRepository em TIMESTAMP semiaberto
+-- (created_at >= início AND created_at < fim) o planner só abre os meses do
+-- período pedido, e VACUUM/ANALYZE passam a trabalhar por mês.
+--
+-- O que muda pra quem escreve:
+--   * a PK passa a ser (id, created_at) / (id, sale_created_at): o Postgres
+--     exige a chave de partição em toda constraint única;
+--   * product_sales.sale_created_at é obrigatório no INSERT
+--     (generate_data.py já preenche);
+--   * as FKs de delivery_sales, delivery_addresses, payments, coupon_sales e
+--     item_product_sales pra sales(id)/product_sales(id) são removidas, porque
+--     id sozinho deixou de ser único. O ON DELETE CASCADE delas deixa de existir.
+--
+-- As tabelas antigas ficam como *_unpartitioned pra conferência e benchmark
+-- (app/benchmarks/bench_partitioning.py). Depois de validar:
+--   DROP TABLE product_sales_unpartitioned, sales_unpartitioned;
+--
+-- Partições novas: ensure_sales_partitions(de, até), chamada por
+--   python -m app.manage_partitions --months-ahead 3   (cron diário)
+
+BEGIN;
+
+-- ---------------------------------------------------------
+-- 1) tira as tabelas antigas do caminho
+-- ---------------------------------------------------------
+ALTER TABLE delivery_sales     DROP CONSTRAINT IF EXISTS delivery_sales_sale_id_fkey;
+ALTER TABLE delivery_addresses DROP CONSTRAINT IF EXISTS delivery_addresses_sale_id_fkey;
+ALTER TABLE payments           DROP CONSTRAINT IF EXISTS payments_sale_id_fkey;
+ALTER TABLE coupon_sales       DROP CONSTRAINT IF EXISTS coupon_sales_sale_id_fkey;
+ALTER TABLE item_product_sales DROP CONSTRAINT IF EXISTS item_product_sales_product_sale_id_fkey;
+
+ALTER TABLE sales RENAME TO sales_unpartitioned;
+ALTER INDEX sales_pkey RENAME TO sales_unpartitioned_pkey;
+ALTER TABLE product_sales RENAME TO product_sales_unpartitioned;
+ALTER INDEX product_sales_pkey RENAME TO product_sales_unpartitioned_pkey;
+
+-- ---------------------------------------------------------
+-- 2) tabelas particionadas (mesmas colunas e defaults)
+-- ---------------------------------------------------------
+CREATE TABLE sales (
+    LIKE sales_unpartitioned INCLUDING DEFAULTS
+) PARTITION BY RANGE (created_at);
+
+ALTER TABLE sales ADD PRIMARY KEY (id, created_at);
+ALTER TABLE sales ADD FOREIGN KEY (store_id) REFERENCES stores(id);
+ALTER TABLE sales ADD FOREIGN KEY (sub_brand_id) REFERENCES sub_brands(id);
+ALTER TABLE sales ADD FOREIGN KEY (customer_id) REFERENCES customers(id);
+ALTER TABLE sales ADD FOREIGN KEY (channel_id) REFERENCES channels(id);
+ALTER SEQUENCE sales_id_seq OWNED BY sales.id;
+
+CREATE TABLE product_sales (
+    LIKE product_sales_unpartitioned INCLUDING DEFAULTS,
+    sale_created_at TIMESTAMP NOT NULL
+) PARTITION BY RANGE (sale_created_at);
+
+ALTER TABLE product_sales ADD PRIMARY KEY (id, sale_created_at);
+ALTER TABLE product_sales ADD FOREIGN KEY (sale_id, sale_created_at)
+    REFERENCES sales (id, created_at) ON DELETE CASCADE;
+ALTER TABLE product_sales ADD FOREIGN KEY (product_id) REFERENCES products(id);
+ALTER SEQUENCE product_sales_id_seq OWNED BY product_sales.id;
+
+-- índices no pai são replicados em cada partição
+CREATE INDEX idx_sales_store_created ON sales (store_id, created_at);
+CREATE INDEX idx_sales_channel_created ON sales (channel_id, created_at);
+CREATE INDEX idx_product_sales_sale ON product_sales (sale_id, sale_created_at);
+CREATE INDEX idx_product_sales_product ON product_sales (product_id, sale_created_at);
+
+-- rede de segurança: venda fora de qualquer mês criado não quebra o INSERT
+CREATE TABLE sales_default PARTITION OF sales DEFAULT;
+CREATE TABLE product_sales_default PARTITION OF product_sales DEFAULT;
+
+-- ---------------------------------------------------------
+-- 3) criação automática de partições mensais
+-- ---------------------------------------------------------
+CREATE OR REPLACE FUNCTION ensure_sales_partitions(p_from DATE, p_to DATE)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    month_start DATE := date_trunc('month', p_from)::DATE;
+    month_end   DATE;
+    suffix      TEXT;
+    created     INTEGER := 0;
+BEGIN
+    WHILE month_start <= p_to LOOP
+        month_end := (month_start + INTERVAL '1 month')::DATE;
+        suffix := to_char(month_start, 'YYYY_MM');
+
+        IF to_regclass('sales_' || suffix) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF sales FOR VALUES FROM (%L) TO (%L)',
+                'sales_' || suffix, month_start, month_end
+            );
+            created := created + 1;
+        END IF;
+
+        IF to_regclass('product_sales_' || suffix) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF product_sales FOR VALUES FROM (%L) TO (%L)',
+                'product_sales_' || suffix, month_start, month_end
+            );
+            created := created + 1;
+        END IF;
+
+        month_start := month_end;
+    END LOOP;
+    RETURN created;
+END;
+$$;
+
+-- ---------------------------------------------------------
+-- 4) cria os meses do histórico (+3 à frente) e copia os dados
+-- ---------------------------------------------------------
+SELECT ensure_sales_partitions(
+    COALESCE((SELECT MIN(created_at) FROM sales_unpartitioned)::DATE, CURRENT_DATE),
+    (GREATEST(
+        COALESCE((SELECT MAX(created_at) FROM sales_unpartitioned)::DATE, CURRENT_DATE),
+        CURRENT_DATE
+    ) + INTERVAL '3 months')::DATE
+);
+
+INSERT INTO sales
+SELECT * FROM sales_unpartitioned;
+
+INSERT INTO product_sales
+SELECT ps.*, s.created_at
+FROM product_sales_unpartitioned ps
+JOIN sales_unpartitioned s ON s.id = ps.sale_id;
+
+COMMIT;
+
+ANALYZE sales;
+ANALYZE product_sales;
@@ -0,0 +1,12 @@
+-- 004: índices que sustentam a paginação keyset das listas
+--
+-- available-stores:   ORDER BY name, id            -> idx_stores_name_id
+-- at-risk-customers:  GROUP BY customer_id por loja -> idx_sales_store_customer_created
+--                     (agregação em ordem de índice, sem sort/hash do semestre inteiro)
+
+CREATE INDEX IF NOT EXISTS idx_stores_name_id
+    ON stores (name, id);
+
+CREATE INDEX IF NOT EXISTS idx_sales_store_customer_created
+    ON sales (store_id, customer_id, created_at)
+    WHERE customer_id IS NOT NULL AND sale_status_desc = 'COMPLETED';
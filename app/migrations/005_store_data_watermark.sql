@@ -0,0 +1,57 @@
+-- 005: marca d'água de dados por loja
+--
+-- store_data_watermark.version sobe a cada comando que insere, altera ou
+-- apaga vendas da loja (trigger por COMANDO com transition table: um lote de
+-- 500 vendas custa um UPDATE por loja, não por linha). É o que a API usa
+-- para montar o ETag dos widgets sem rodar a consulta principal: se a
+-- versão não mudou, o payload de antes continua válido.
+
+CREATE TABLE IF NOT EXISTS store_data_watermark (
+    store_id      INTEGER   PRIMARY KEY REFERENCES stores(id),
+    version       BIGINT    NOT NULL DEFAULT 1,
+    last_sale_at  TIMESTAMP,
+    updated_at    TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION bump_store_data_watermark()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    -- "changed" é a transition table (NEW TABLE no INSERT/UPDATE, OLD TABLE no DELETE)
+    INSERT INTO store_data_watermark AS w (store_id, version, last_sale_at, updated_at)
+    SELECT store_id, 1, MAX(created_at), now()
+    FROM changed
+    GROUP BY store_id
+    ON CONFLICT (store_id) DO UPDATE
+        SET version      = w.version + 1,
+            last_sale_at = GREATEST(w.last_sale_at, EXCLUDED.last_sale_at),
+            updated_at   = now();
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_sales_watermark_ins ON sales;
+DROP TRIGGER IF EXISTS trg_sales_watermark_upd ON sales;
+DROP TRIGGER IF EXISTS trg_sales_watermark_del ON sales;
+
+CREATE TRIGGER trg_sales_watermark_ins
+    AFTER INSERT ON sales
+    REFERENCING NEW TABLE AS changed
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_store_data_watermark();
+
+CREATE TRIGGER trg_sales_watermark_upd
+    AFTER UPDATE ON sales
+    REFERENCING NEW TABLE AS changed
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_store_data_watermark();
+
+CREATE TRIGGER trg_sales_watermark_del
+    AFTER DELETE ON sales
+    REFERENCING OLD TABLE AS changed
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_store_data_watermark();
+
+-- estado inicial
+INSERT INTO store_data_watermark (store_id, version, last_sale_at)
+SELECT st.id, 1, (SELECT MAX(s.created_at) FROM sales s WHERE s.store_id = st.id)
+FROM stores st
+ON CONFLICT (store_id) DO NOTHING;
@@ -0,0 +1,39 @@
+-- 006: ingestão de vendas pela API (POST /api/v1/ingest/sales)
+--
+-- sale_ingest_keys: idempotência por (store_id, cod_sale1). Com sales
+-- particionada por created_at não dá pra ter UNIQUE só no código externo,
+-- então a chave fica numa tabela própria, reivindicada com
+-- INSERT ... ON CONFLICT DO NOTHING no mesmo commit da venda: reenvio do
+-- PDV (timeout, retry) vira "duplicate" sem gravar de novo.
+--
+-- rollup_dirty_days: (loja, dia) que receberam venda depois do último
+-- refresh. O trigger de sales marca (migração 007); `python -m app.refresh_rollups --dirty`
+-- recalcula só esses dias e limpa a marca.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS sale_ingest_keys (
+    store_id        INTEGER      NOT NULL,
+    cod_sale1       VARCHAR(100) NOT NULL,
+    sale_id         INTEGER      NOT NULL,
+    sale_created_at TIMESTAMP    NOT NULL,
+    ingested_at     TIMESTAMP    NOT NULL DEFAULT now(),
+    PRIMARY KEY (store_id, cod_sale1)
+);
+
+-- vendas que já existiam antes da API também contam como "já recebidas"
+INSERT INTO sale_ingest_keys (store_id, cod_sale1, sale_id, sale_created_at)
+SELECT DISTINCT ON (store_id, cod_sale1) store_id, cod_sale1, id, created_at
+FROM sales
+WHERE cod_sale1 IS NOT NULL
+ORDER BY store_id, cod_sale1, id
+ON CONFLICT DO NOTHING;
+
+CREATE TABLE IF NOT EXISTS rollup_dirty_days (
+    store_id  INTEGER   NOT NULL,
+    sale_date DATE      NOT NULL,
+    marked_at TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (store_id, sale_date)
+);
+
+COMMIT;
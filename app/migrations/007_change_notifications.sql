@@ -0,0 +1,60 @@
+-- 007: aviso de mudança em sales (LISTEN/NOTIFY + outbox)
+--
+-- O trigger por comando da 005 passa a, além de subir a versão da loja:
+--   * marcar os (loja, dia) tocados em rollup_dirty_days (006) — é a
+--     outbox: durável, drenada por `refresh_rollups --dirty` ou pelo
+--     listener da API;
+--   * mandar um NOTIFY 'sales_changed' por loja com a nova versão e o
+--     intervalo de dias. O NOTIFY só sai no COMMIT e se perde se ninguém
+--     estiver ouvindo; por isso a outbox é a fonte de verdade e o aviso é
+--     só o "acorda".
+--
+-- Payload: {"store_id": 7, "version": 42, "from": "2025-10-31",
+--           "to": "2025-10-31", "at": 1761900000.123}
+-- "at" (epoch do trigger) permite medir o atraso até a API receber.
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION bump_store_data_watermark()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    -- "changed" é a transition table (NEW TABLE no INSERT/UPDATE, OLD TABLE no DELETE)
+    INSERT INTO store_data_watermark AS w (store_id, version, last_sale_at, updated_at)
+    SELECT store_id, 1, MAX(created_at), now()
+    FROM changed
+    GROUP BY store_id
+    ON CONFLICT (store_id) DO UPDATE
+        SET version      = w.version + 1,
+            last_sale_at = GREATEST(w.last_sale_at, EXCLUDED.last_sale_at),
+            updated_at   = now();
+
+    -- um aviso por loja, com a versão que acabou de ser gravada
+    PERFORM pg_notify(
+        'sales_changed',
+        json_build_object(
+            'store_id', d.store_id,
+            'version', w.version,
+            'from', d.from_day,
+            'to', d.to_day,
+            'at', EXTRACT(EPOCH FROM clock_timestamp())
+        )::TEXT
+    )
+    FROM (
+        SELECT store_id, MIN(created_at)::DATE AS from_day, MAX(created_at)::DATE AS to_day
+        FROM changed
+        GROUP BY store_id
+    ) d
+    JOIN store_data_watermark w ON w.store_id = d.store_id;
+
+    INSERT INTO rollup_dirty_days (store_id, sale_date)
+    SELECT DISTINCT store_id, created_at::DATE
+    FROM changed
+    ON CONFLICT (store_id, sale_date) DO UPDATE SET marked_at = now();
+
+    RETURN NULL;
+END;
+$$;
+
+COMMIT;
@@ -0,0 +1,31 @@
+-- 008: rollups por hora (matriz dia da semana × hora)
+--
+-- sales_hourly: uma linha por (loja, dia, hora, canal) com pedidos e
+-- faturamento das vendas COMPLETED. product_sales_hourly: uma linha por
+-- (loja, dia, hora, produto) com pedidos, quantidade e faturamento do item.
+-- Tudo somável: a matriz 7×24 de qualquer período é um GROUP BY de
+-- ISODOW(sale_date) e hour, em tempo proporcional a dias × horas, não a
+-- vendas. A hora é a do created_at (horário local da loja, como em sales).
+--
+-- Populado por: python -m app.refresh_rollups --start AAAA-MM-DD --end AAAA-MM-DD
+
+CREATE TABLE IF NOT EXISTS sales_hourly (
+    store_id        INTEGER       NOT NULL REFERENCES stores(id),
+    sale_date       DATE          NOT NULL,
+    hour            SMALLINT      NOT NULL,
+    channel_id      INTEGER       NOT NULL REFERENCES channels(id),
+    total_orders    INTEGER       NOT NULL,
+    total_sales     NUMERIC(14,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (store_id, sale_date, hour, channel_id)
+);
+
+CREATE TABLE IF NOT EXISTS product_sales_hourly (
+    store_id        INTEGER          NOT NULL REFERENCES stores(id),
+    sale_date       DATE             NOT NULL,
+    hour            SMALLINT         NOT NULL,
+    product_id      INTEGER          NOT NULL REFERENCES products(id),
+    total_orders    INTEGER          NOT NULL,
+    total_quantity  DOUBLE PRECISION NOT NULL DEFAULT 0,
+    total_sales     NUMERIC(14,2)    NOT NULL DEFAULT 0,
+    PRIMARY KEY (store_id, product_id, sale_date, hour)
+);
@@ -0,0 +1,41 @@
+-- 009: aviso de mudança nas dimensões (stores, channels, products)
+--
+-- A API guarda id -> nome dessas tabelas em memória (DimensionCache) e as
+-- consultas de vendas agrupam só por id. Qualquer INSERT/UPDATE/DELETE
+-- numa delas manda NOTIFY 'dimensions_changed' com o nome da tabela; o
+-- listener da 007 escuta o canal na mesma conexão e o cache recarrega a
+-- tabela na próxima consulta. Sem aviso (listener fora), o TTL do cache
+-- limita o atraso de um nome renomeado.
+--
+-- Payload: 'stores' | 'channels' | 'products'
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION notify_dimension_changed()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    -- por comando: uma carga de 500 produtos gera um aviso só
+    PERFORM pg_notify('dimensions_changed', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_stores_dimension_notify ON stores;
+DROP TRIGGER IF EXISTS trg_channels_dimension_notify ON channels;
+DROP TRIGGER IF EXISTS trg_products_dimension_notify ON products;
+
+CREATE TRIGGER trg_stores_dimension_notify
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON stores
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_dimension_changed();
+
+CREATE TRIGGER trg_channels_dimension_notify
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON channels
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_dimension_changed();
+
+CREATE TRIGGER trg_products_dimension_notify
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON products
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_dimension_changed();
+
+COMMIT;
@@ -0,0 +1,25 @@
+-- 010: clientes únicos por (loja, dia, canal) em HyperLogLog
+--
+-- COUNT(DISTINCT customer_id) de um período não sai de rollup somável.
+-- customer_hll_daily guarda, por (loja, dia, canal), o maior rank de cada
+-- registrador HLL tocado (2^12 registradores, ver HyperLogLog em
+-- app/core/sketches.py; hash = 64 primeiros bits do md5 do customer_id).
+-- Qualquer período/canal/loja é um MAX(rank) GROUP BY register, em tempo
+-- proporcional a dias × registradores, com erro padrão de ~1,6%.
+--
+-- sales_hourly.customer_orders conta os pedidos com cliente identificado:
+-- com os únicos dá a taxa de recompra (pedidos que não são o primeiro do
+-- cliente no período).
+--
+-- Populado por: python -m app.refresh_rollups --start AAAA-MM-DD --end AAAA-MM-DD
+
+CREATE TABLE IF NOT EXISTS customer_hll_daily (
+    store_id        INTEGER   NOT NULL REFERENCES stores(id),
+    sale_date       DATE      NOT NULL,
+    channel_id      INTEGER   NOT NULL REFERENCES channels(id),
+    register        SMALLINT  NOT NULL,
+    rank            SMALLINT  NOT NULL,
+    PRIMARY KEY (store_id, sale_date, channel_id, register)
+);
+
+ALTER TABLE sales_hourly ADD COLUMN IF NOT EXISTS customer_orders INTEGER NOT NULL DEFAULT 0;
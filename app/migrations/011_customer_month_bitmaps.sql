@@ -0,0 +1,25 @@
+-- 011: clientes ativos por (loja, mês) em bitmap Roaring
+--
+-- Base da matriz de coorte (mês do 1º pedido × meses depois). Por loja e
+-- mês guardamos três conjuntos de customer_id, serializados por
+-- RoaringBitmap (app/core/bitmaps.py):
+--   active         clientes com pedido COMPLETED no mês
+--   new_customers  clientes cujo 1º pedido na loja foi no mês (a coorte)
+--   seen           todos os clientes da loja até o fim do mês
+-- Cada célula da matriz é |new_customers[M] ∩ active[M + k]|: interseção
+-- de bitmaps, sem self-join em sales. O mês M só precisa do seen do mês
+-- com dados anterior, então a carga é incremental, mês a mês, em ordem.
+--
+-- Populado por: python -m app.refresh_rollups --cohorts --start AAAA-MM-DD [--end AAAA-MM-DD]
+
+CREATE TABLE IF NOT EXISTS customer_month_bitmap (
+    store_id        INTEGER    NOT NULL REFERENCES stores(id),
+    month           DATE       NOT NULL,   -- primeiro dia do mês
+    active_count    INTEGER    NOT NULL,
+    new_count       INTEGER    NOT NULL,
+    active          BYTEA      NOT NULL,
+    new_customers   BYTEA      NOT NULL,
+    seen            BYTEA      NOT NULL,
+    updated_at      TIMESTAMP  NOT NULL DEFAULT now(),
+    PRIMARY KEY (store_id, month)
+);
@@ -0,0 +1,44 @@
+-- 012: "comprados juntos" (cesta de produtos por venda)
+--
+-- product_pairs_daily: por (loja, dia), quantas vendas tiveram os produtos
+-- A e B juntos (product_a < product_b). São os não zeros de Bᵀ·B, com B a
+-- matriz venda × produto. Cada cesta tem de 1 a 5 produtos, então são no
+-- máximo 10 pares por venda. Somável e recalculado por dia como os outros
+-- rollups, inclusive pelos dias pendentes.
+--
+-- product_affinity: top N produtos relacionados a cada produto da loja
+-- numa janela (padrão 90 dias), com suporte, confiança e lift já
+-- calculados. A PK (loja, produto, rank) faz da consulta do endpoint uma
+-- leitura de índice de N linhas, qualquer que seja o volume de vendas.
+-- Reconstruído a partir de product_pairs_daily (custo proporcional a pares,
+-- não a vendas).
+--
+-- Populado por:
+--   python -m app.refresh_rollups --start AAAA-MM-DD --end AAAA-MM-DD   (pares por dia)
+--   python -m app.refresh_rollups --affinity [--end AAAA-MM-DD]          (matriz da janela)
+
+CREATE TABLE IF NOT EXISTS product_pairs_daily (
+    store_id        INTEGER  NOT NULL REFERENCES stores(id),
+    sale_date       DATE     NOT NULL,
+    product_a       INTEGER  NOT NULL REFERENCES products(id),
+    product_b       INTEGER  NOT NULL REFERENCES products(id),
+    orders          INTEGER  NOT NULL,
+    PRIMARY KEY (store_id, sale_date, product_a, product_b)
+);
+
+CREATE TABLE IF NOT EXISTS product_affinity (
+    store_id            INTEGER           NOT NULL REFERENCES stores(id),
+    product_id          INTEGER           NOT NULL REFERENCES products(id),
+    rank                SMALLINT          NOT NULL,
+    related_product_id  INTEGER           NOT NULL REFERENCES products(id),
+    pair_orders         INTEGER           NOT NULL,
+    product_orders      INTEGER           NOT NULL,
+    related_orders      INTEGER           NOT NULL,
+    baskets             INTEGER           NOT NULL,
+    support             DOUBLE PRECISION  NOT NULL,  -- P(A e B)
+    confidence          DOUBLE PRECISION  NOT NULL,  -- P(B | A)
+    lift                DOUBLE PRECISION  NOT NULL,  -- P(B | A) / P(B)
+    window_start        DATE              NOT NULL,
+    window_end          DATE              NOT NULL,
+    PRIMARY KEY (store_id, product_id, rank)
+);
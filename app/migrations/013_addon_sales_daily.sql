@@ -0,0 +1,49 @@
+-- 013: adicionais/customizações (item_product_sales)
+--
+-- item_product_sales é a maior tabela da carga e só chega em sales passando
+-- por product_sales (sem created_at, sem poda de partição). Os dois rollups
+-- abaixo fazem esse join uma vez por dia e os widgets de adicionais leem só
+-- eles:
+--
+-- addon_sales_daily: por (loja, dia, produto, item), em quantas linhas de
+-- product_sales o item entrou, quantidade (item × produto) e faturamento do
+-- adicional (additional_price × quantidade do item × quantidade do produto).
+--
+-- addon_product_daily: por (loja, dia, produto), o denominador do attach
+-- rate. São as linhas do produto, quantas tiveram algum adicional e o
+-- faturamento total de adicionais. "Algum adicional" não sai somando os
+-- itens (uma linha pode ter vários), por isso a tabela própria.
+--
+-- Só vendas COMPLETED, como os outros rollups. items entra no aviso de
+-- dimensões da 009 (o cache de nomes passa a guardar os itens também).
+--
+-- Populado por: python -m app.refresh_rollups --start AAAA-MM-DD --end AAAA-MM-DD
+
+CREATE INDEX IF NOT EXISTS idx_item_product_sales_product_sale
+    ON item_product_sales (product_sale_id);
+
+CREATE TABLE IF NOT EXISTS addon_sales_daily (
+    store_id        INTEGER          NOT NULL REFERENCES stores(id),
+    sale_date       DATE             NOT NULL,
+    product_id      INTEGER          NOT NULL REFERENCES products(id),
+    item_id         INTEGER          NOT NULL REFERENCES items(id),
+    product_lines   INTEGER          NOT NULL,
+    quantity        DOUBLE PRECISION NOT NULL DEFAULT 0,
+    revenue         NUMERIC(14,2)    NOT NULL DEFAULT 0,
+    PRIMARY KEY (store_id, sale_date, product_id, item_id)
+);
+
+CREATE TABLE IF NOT EXISTS addon_product_daily (
+    store_id           INTEGER       NOT NULL REFERENCES stores(id),
+    sale_date          DATE          NOT NULL,
+    product_id         INTEGER       NOT NULL REFERENCES products(id),
+    product_lines      INTEGER       NOT NULL,
+    lines_with_addons  INTEGER       NOT NULL,
+    addon_revenue      NUMERIC(14,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (store_id, sale_date, product_id)
+);
+
+DROP TRIGGER IF EXISTS trg_items_dimension_notify ON items;
+CREATE TRIGGER trg_items_dimension_notify
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON items
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_dimension_changed();
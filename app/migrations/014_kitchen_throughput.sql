@@ -0,0 +1,40 @@
+-- 014: operação da cozinha (sales.production_seconds)
+--
+-- kitchen_slot_daily: uma linha por (loja, dia, faixa de 15 min, canal).
+-- Traz os pedidos que entraram na faixa e os que estavam em produção nela
+-- (carga concorrente). Um pedido conta em toda faixa entre o created_at e
+-- o created_at + production_seconds, limitado à última faixa do dia. Também
+-- guarda contagem, soma e soma dos quadrados do tempo de produção dos
+-- pedidos que entraram na faixa, o que basta pra média e pra correlação
+-- carga × tempo de qualquer período sem voltar em sales.
+--
+-- kitchen_production_sketch_daily: DDSketch (erro relativo de 2%, ver
+-- PRODUCTION_RELATIVE_ACCURACY em app/core/sketches.py) do tempo de produção
+-- por (loja, dia, hora, canal). Percentis por hora, dia da semana ou canal
+-- são soma de contagens por bucket, como em delivery_time_sketch_daily.
+-- Pedido sem production_seconds fica fora do sketch (entra na carga).
+--
+-- Populado por: python -m app.refresh_rollups --start AAAA-MM-DD --end AAAA-MM-DD
+
+CREATE TABLE IF NOT EXISTS kitchen_slot_daily (
+    store_id                   INTEGER   NOT NULL REFERENCES stores(id),
+    sale_date                  DATE      NOT NULL,
+    slot                       SMALLINT  NOT NULL,  -- 0..95 (00:00, 00:15, ...)
+    channel_id                 INTEGER   NOT NULL REFERENCES channels(id),
+    orders_started             INTEGER   NOT NULL DEFAULT 0,
+    orders_active              INTEGER   NOT NULL,
+    production_count           INTEGER   NOT NULL DEFAULT 0,
+    production_seconds_sum     BIGINT    NOT NULL DEFAULT 0,
+    production_seconds_sq_sum  BIGINT    NOT NULL DEFAULT 0,
+    PRIMARY KEY (store_id, sale_date, slot, channel_id)
+);
+
+CREATE TABLE IF NOT EXISTS kitchen_production_sketch_daily (
+    store_id      INTEGER   NOT NULL REFERENCES stores(id),
+    sale_date     DATE      NOT NULL,
+    hour          SMALLINT  NOT NULL,
+    channel_id    INTEGER   NOT NULL REFERENCES channels(id),
+    bucket        SMALLINT  NOT NULL,
+    order_count   INTEGER   NOT NULL,
+    PRIMARY KEY (store_id, sale_date, hour, channel_id, bucket)
+);
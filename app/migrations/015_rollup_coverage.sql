@@ -0,0 +1,20 @@
+-- 015: período coberto pelos rollups, por loja
+--
+-- rollup_dirty_days (006/007) só diz que um dia mudou DEPOIS de calculado;
+-- num banco em que a 008 foi aplicada e o refresh_rollups nunca rodou, não
+-- há dia pendente e o rollup está simplesmente vazio. O planner (ver
+-- app/services/query_planner.py) só escolhe o rollup se o período pedido
+-- cabe em [covered_from, covered_to] de todas as lojas.
+--
+-- Mantido pelo RollupRepository.refresh_all (refresh por período e dreno
+-- dos dias pendentes): o intervalo só cresce quando o recorte recalculado
+-- encosta ou sobrepõe o que já estava coberto, ou quando o buraco entre os
+-- dois não tem venda da loja (dia sem venda nunca fica pendente), então um
+-- buraco com venda nunca conta como coberto.
+
+CREATE TABLE IF NOT EXISTS rollup_coverage (
+    store_id      INTEGER   PRIMARY KEY REFERENCES stores(id),
+    covered_from  DATE      NOT NULL,
+    covered_to    DATE      NOT NULL,
+    updated_at    TIMESTAMP NOT NULL DEFAULT now()
+);
@@ -0,0 +1,53 @@
+-- 016: dias do espelho analítico que mudaram depois de exportados
+--
+-- O export incremental (app/export_mirror.py) só relia os últimos
+-- `lookback_days` cobertos; cancelamento ou carga retroativa de um dia mais
+-- antigo ficava no Parquet velho e o espelho seguia servindo aquele dia.
+--
+-- mirror_dirty_days é uma outbox própria do espelho (a rollup_dirty_days é
+-- drenada pelo refresh dos rollups, que roda bem mais vezes): o trigger por
+-- comando em sales marca o dia, e o export reexporta os dias marcados até
+-- o fim do recorte e apaga só as marcas que leu (mesmo marked_at), então
+-- uma venda que chega durante o export deixa o dia pendente pro próximo.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS mirror_dirty_days (
+    sale_date DATE      PRIMARY KEY,
+    marked_at TIMESTAMP NOT NULL DEFAULT clock_timestamp()
+);
+
+CREATE OR REPLACE FUNCTION mark_mirror_dirty_days()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    -- "changed" é a transition table (NEW TABLE no INSERT/UPDATE, OLD TABLE no DELETE)
+    INSERT INTO mirror_dirty_days (sale_date)
+    SELECT DISTINCT created_at::DATE
+    FROM changed
+    ON CONFLICT (sale_date) DO UPDATE SET marked_at = clock_timestamp();
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_sales_mirror_dirty_ins ON sales;
+DROP TRIGGER IF EXISTS trg_sales_mirror_dirty_upd ON sales;
+DROP TRIGGER IF EXISTS trg_sales_mirror_dirty_del ON sales;
+
+CREATE TRIGGER trg_sales_mirror_dirty_ins
+    AFTER INSERT ON sales
+    REFERENCING NEW TABLE AS changed
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_mirror_dirty_days();
+
+CREATE TRIGGER trg_sales_mirror_dirty_upd
+    AFTER UPDATE ON sales
+    REFERENCING NEW TABLE AS changed
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_mirror_dirty_days();
+
+CREATE TRIGGER trg_sales_mirror_dirty_del
+    AFTER DELETE ON sales
+    REFERENCING OLD TABLE AS changed
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_mirror_dirty_days();
+
+COMMIT;
@@ -0,0 +1,663 @@
+# app/repositories/analytics_mirror.py
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:  # opcional: pip install duckdb habilita o espelho analítico
+    import duckdb
+except ImportError:  # pragma: no cover - depende do ambiente
+    duckdb = None
+
+from app.repositories.dimension_cache import DimensionCache
+from app.repositories.sales_repository import SalesRepository, day_bounds
+
+# tabelas de fato: um arquivo Parquet por dia ({root}/{tabela}/sale_date=AAAA-MM-DD/data.parquet)
+FACT_EXPORTS = {
+    "sales": (
+        "created_at",
+        """
+        SELECT id, store_id, channel_id, customer_id, sub_brand_id, created_at,
+               sale_status_desc, total_amount, total_discount, delivery_fee,
+               production_seconds, delivery_seconds
+        FROM sales
+        """,
+    ),
+    "product_sales": (
+        "sale_created_at",
+        """
+        SELECT id, sale_id, product_id, quantity, total_price, sale_created_at
+        FROM product_sales
+        """,
+    ),
+}
+# dimensões: pequenas, regravadas inteiras a cada export
+DIMENSION_EXPORTS = {
+    "stores": "SELECT id, name FROM stores",
+    "channels": "SELECT id, name FROM channels",
+    "products": "SELECT id, name FROM products",
+}
+
+# classes de consulta que podem ir pro espelho (ANALYTICS_MIRROR_QUERIES)
+QUERY_CLASSES = {
+    "reports": ("get_store_performance_for_period",),
+    "comparison": ("get_store_comparison",),
+    "overview": ("get_revenue_overview",),
+    "portfolio": ("get_portfolio_overview",),
+}
+
+STATE_FILE = "_state.json"
+
+
+def _ts_literal(value: datetime) -> str:
+    return value.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _quoted(sql: str) -> str:
+    """SQL do Postgres dentro de uma string do DuckDB (postgres_query/execute)."""
+    return sql.replace("'", "''")
+
+
+def _pg_libpq_url(db_url: str) -> str:
+    """postgresql+asyncpg://... -> postgresql://... (formato do ATTACH)."""
+    scheme, sep, rest = db_url.partition("://")
+    return f"postgresql://{rest}" if sep else db_url
+
+
+class ParquetMirror:
+    """
+    Cópia colunar local de ``sales``/``product_sales`` (Parquet por dia) e
+    das dimensões, consultada por um DuckDB embutido. Serve as consultas
+    históricas pesadas (relatórios de todas as lojas, comparações de um
+    ano) sem varrer o Postgres OLTP.
+
+    Só responde períodos (contando o período anterior de comparação) dentro
+    de ``covered_from..covered_through`` (dias exportados sem buraco); o
+    resto continua no Postgres. Dias antigos que
+    mudaram depois do export ficam em ``mirror_dirty_days`` (migração 016)
+    e são reexportados no próximo incremental.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        query_classes: Iterable[str] = ("reports",),
+        lookback_days: int = 2,
+    ):
+        self.root = root
+        self.methods = {m for cls in query_classes for m in QUERY_CLASSES.get(cls, ())}
+        self.query_classes = sorted(c for c in query_classes if c in QUERY_CLASSES)
+        self.lookback_days = lookback_days
+
+        self._con = None
+        self._lock = threading.Lock()
+        self._state: Dict[str, Any] = {}
+        self._state_mtime: Optional[float] = None
+
+        self.served = 0
+        self.fallbacks = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.last_error: Optional[str] = None
+
+    @classmethod
+    def from_env(cls) -> Optional["ParquetMirror"]:
+        """
+        ANALYTICS_MIRROR_PATH     pasta dos Parquet (sem ela, espelho desligado)
+        ANALYTICS_MIRROR_QUERIES  classes servidas pelo espelho (padrão "reports");
+                                  opções: reports, comparison, overview, portfolio
+        """
+        root = os.getenv("ANALYTICS_MIRROR_PATH")
+        if not root or duckdb is None:
+            return None
+        classes = [c.strip() for c in os.getenv("ANALYTICS_MIRROR_QUERIES", "reports").split(",") if c.strip()]
+        return cls(root, classes)
+
+    # ---------------------------------------------------------
+    # estado do export
+    # ---------------------------------------------------------
+    def _state_path(self) -> str:
+        return os.path.join(self.root, STATE_FILE)
+
+    def state(self) -> Dict[str, Any]:
+        path = self._state_path()
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return {}
+        if mtime != self._state_mtime:
+            with open(path, encoding="utf-8") as fh:
+                self._state = json.load(fh)
+            self._state_mtime = mtime
+        return self._state
+
+    def covered_through(self) -> Optional[date]:
+        value = self.state().get("covered_through")
+        return date.fromisoformat(value) if value else None
+
+    def covered_from(self) -> Optional[date]:
+        value = self.state().get("covered_from")
+        return date.fromisoformat(value) if value else None
+
+    def covers(self, method: str, start_date: date, end_date: date) -> bool:
+        """``start_date`` é o primeiro dia lido, já com o período anterior."""
+        if method not in self.methods:
+            return False
+        first, last = self.covered_from(), self.covered_through()
+        return first is not None and last is not None and first <= start_date and end_date <= last
+
+    def _write_state(self, state: Dict[str, Any]) -> None:
+        tmp = self._state_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(state, fh)
+        os.replace(tmp, self._state_path())
+
+    # ---------------------------------------------------------
+    # export (Postgres -> Parquet), via extensão postgres do DuckDB
+    # ---------------------------------------------------------
+    def export(
+        self,
+        db_url: str,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Exporta os dias ``start..end`` (padrão: desde ``covered_through`` menos
+        ``lookback_days``, pra pegar cancelamentos e vendas atrasadas, até
+        ontem) mais os dias até ``end`` marcados em ``mirror_dirty_days``
+        (correção de um dia mais antigo). Cada dia vira um arquivo por
+        tabela, gravado em .tmp e trocado com os.replace: quem está
+        consultando nunca lê arquivo pela metade. A consulta roda inteira no
+        Postgres (postgres_query), então o filtro de data poda as partições
+        mensais de lá.
+        """
+        if duckdb is None:
+            raise RuntimeError("duckdb não instalado: pip install duckdb")
+        end = end or date.today() - timedelta(days=1)
+        if start is None:
+            covered = self.covered_through()
+            if covered is None:
+                raise ValueError("primeiro export precisa de start")
+            start = covered - timedelta(days=self.lookback_days - 1)
+
+        os.makedirs(self.root, exist_ok=True)
+        con = duckdb.connect()
+        out: List[Dict[str, Any]] = []
+        try:
+            con.execute("INSTALL postgres")
+            con.execute("LOAD postgres")
+            # sem READ_ONLY: o export apaga as marcas de mirror_dirty_days que reexportou
+            con.execute(f"ATTACH '{_pg_libpq_url(db_url)}' AS pg (TYPE POSTGRES)")
+            dirty = self._dirty_days(con, end)
+            days = {start + timedelta(days=i) for i in range((end - start).days + 1)}
+            days.update(day for day, _ in dirty)
+
+            for table, select_sql in DIMENSION_EXPORTS.items():
+                started = time.perf_counter()
+                rows = self._copy(con, select_sql, os.path.join(self.root, f"{table}.parquet"))
+                out.append({"table": table, "day": None, "rows": rows, "ms": (time.perf_counter() - started) * 1000})
+
+            for day in sorted(days):
+                lo, hi = day_bounds(day, day)
+                for table, (ts_column, select_sql) in FACT_EXPORTS.items():
+                    started = time.perf_counter()
+                    sql = (
+                        f"{select_sql} WHERE {ts_column} >= '{_ts_literal(lo)}' "
+                        f"AND {ts_column} < '{_ts_literal(hi)}'"
+                    )
+                    folder = os.path.join(self.root, table, f"sale_date={day.isoformat()}")
+                    os.makedirs(folder, exist_ok=True)
+                    rows = self._copy(con, sql, os.path.join(folder, "data.parquet"))
+                    out.append({"table": table, "day": day, "rows": rows, "ms": (time.perf_counter() - started) * 1000})
+            if dirty:
+                self._clear_dirty_days(con, dirty)
+        finally:
+            con.close()
+
+        self._write_state({
+            **self._coverage_after(start, end),
+            "exported_at": datetime.now().isoformat(timespec="seconds"),
+        })
+        return out
+
+    def _coverage_after(self, start: date, end: date) -> Dict[str, str]:
+        """
+        Junta ``start..end`` à cobertura anterior só se encostar ou sobrepor;
+        com buraco no meio, a cobertura passa a ser só o recorte exportado.
+        Estado antigo sem ``covered_from`` começa no ``start`` deste export.
+        """
+        first, last = self.covered_from(), self.covered_through()
+        touches = last is not None and start <= last + timedelta(days=1)
+        if touches and first is not None and end >= first - timedelta(days=1):
+            start, end = min(first, start), max(last, end)
+        elif touches and first is None:
+            end = max(last, end)
+        return {"covered_from": start.isoformat(), "covered_through": end.isoformat()}
+
+    @staticmethod
+    def _dirty_days(con: Any, end: date) -> List[Tuple[date, datetime]]:
+        """(dia, marked_at) de mirror_dirty_days até ``end``; vazio sem a migração 016."""
+        check = _quoted("SELECT to_regclass('mirror_dirty_days') IS NOT NULL")
+        exists = con.execute(f"SELECT * FROM postgres_query('pg', '{check}')").fetchone()[0]
+        if not exists:
+            return []
+        sql = f"SELECT sale_date, marked_at FROM mirror_dirty_days WHERE sale_date <= '{end.isoformat()}'"
+        return [tuple(row) for row in con.execute(f"SELECT * FROM postgres_query('pg', '{_quoted(sql)}')").fetchall()]
+
+    @staticmethod
+    def _clear_dirty_days(con: Any, dirty: Sequence[Tuple[date, datetime]]) -> None:
+        # só as marcas lidas: dia marcado de novo durante o export (marked_at
+        # mais novo) continua pendente
+        values = ", ".join(
+            f"('{day.isoformat()}'::DATE, '{marked_at.isoformat(sep=' ')}'::TIMESTAMP)"
+            for day, marked_at in dirty
+        )
+        sql = f"DELETE FROM mirror_dirty_days WHERE (sale_date, marked_at) IN ({values})"
+        con.execute(f"CALL postgres_execute('pg', '{_quoted(sql)}')")
+
+    @staticmethod
+    def _copy(con: Any, select_sql: str, path: str) -> int:
+        tmp = path + ".tmp"
+        con.execute(
+            f"COPY (SELECT * FROM postgres_query('pg', '{_quoted(select_sql)}')) "
+            f"TO '{tmp}' (FORMAT PARQUET, COMPRESSION ZSTD)"
+        )
+        rows = con.execute(f"SELECT COUNT(*) FROM read_parquet('{tmp}')").fetchone()[0]
+        os.replace(tmp, path)
+        return rows
+
+    # ---------------------------------------------------------
+    # consulta
+    # ---------------------------------------------------------
+    def _connection(self) -> Any:
+        if self._con is None:
+            con = duckdb.connect()
+            for table in FACT_EXPORTS:
+                pattern = os.path.join(self.root, table, "*", "*.parquet")
+                con.execute(
+                    f"CREATE VIEW {table} AS "
+                    f"SELECT * FROM read_parquet('{pattern}', hive_partitioning = true)"
+                )
+            for table in DIMENSION_EXPORTS:
+                path = os.path.join(self.root, f"{table}.parquet")
+                con.execute(f"CREATE VIEW {table} AS SELECT * FROM read_parquet('{path}')")
+            self._con = con
+        return self._con
+
+    def _query_many(self, statements: Sequence[Tuple[str, Dict[str, Any]]]) -> List[List[Dict[str, Any]]]:
+        with self._lock:
+            con = self._connection()
+        cur = con.cursor()  # um cursor por thread
+        try:
+            out = []
+            for sql, params in statements:
+                cur.execute(sql, params)
+                columns = [d[0] for d in cur.description]
+                out.append([dict(zip(columns, row)) for row in cur.fetchall()])
+            return out
+        finally:
+            cur.close()
+
+    async def query_many(self, statements: Sequence[Tuple[str, Dict[str, Any]]]) -> List[List[Dict[str, Any]]]:
+        # DuckDB é síncrono: roda fora do event loop
+        started = time.perf_counter()
+        result = await asyncio.to_thread(self._query_many, statements)
+        self.served += 1
+        self.total_ms += (time.perf_counter() - started) * 1000
+        return result
+
+    def record_error(self, exc: BaseException) -> None:
+        self.errors += 1
+        self.last_error = f"{type(exc).__name__}: {exc}"[:200]
+
+    def metrics(self) -> Dict[str, Any]:
+        first, covered = self.covered_from(), self.covered_through()
+        return {
+            "enabled": True,
+            "root": self.root,
+            "query_classes": self.query_classes,
+            "covered_from": first.isoformat() if first else None,
+            "covered_through": covered.isoformat() if covered else None,
+            "exported_at": self.state().get("exported_at"),
+            "served": self.served,
+            "fallbacks": self.fallbacks,
+            "errors": self.errors,
+            "avg_ms": round(self.total_ms / self.served, 2) if self.served else None,
+            "last_error": self.last_error,
+        }
+
+
+def _share(part: float, total: float) -> float:
+    # o Parquet guarda NUMERIC como DECIMAL: misturado com float, converte
+    return round(float(part) / float(total) * 100, 2) if total else 0.0
+
+
+class MirrorSalesRepository(SalesRepository):
+    """
+    SalesRepository que desvia pro espelho Parquet as classes de consulta
+    ligadas, quando o período já está exportado. Fora disso (classe
+    desligada, período até hoje, erro no DuckDB) cai na versão Postgres
+    herdada, com o mesmo formato de resposta.
+    """
+
+    def __init__(self, db: Any, mirror: Optional[ParquetMirror], dimensions: Optional[DimensionCache] = None):
+        super().__init__(db, dimensions)
+        self.mirror = mirror
+
+    def raw_source(self, method: str, first_day: date, end_date: date) -> str:
+        if self.mirror is not None and self.mirror.covers(method, first_day, end_date):
+            return "mirror"
+        return super().raw_source(method, first_day, end_date)
+
+    async def _mirrored(
+        self, method: str, first_day: date, end_date: date, statements
+    ) -> Optional[List[List[Dict[str, Any]]]]:
+        """``first_day``: primeiro dia que as consultas leem (período anterior incluso)."""
+        if self.mirror is None:
+            return None
+        if not self.mirror.covers(method, first_day, end_date):
+            self.mirror.fallbacks += 1
+            return None
+        try:
+            return await self.mirror.query_many(statements)
+        except Exception as exc:
+            self.mirror.record_error(exc)
+            self.mirror.fallbacks += 1
+            return None
+
+    # ---------------------------------------------------------
+    # relatório de performance por loja
+    # ---------------------------------------------------------
+    async def get_store_performance_for_period(
+        self,
+        store_ids: List[int],
+        start_date: date,
+        end_date: date,
+    ) -> List[Dict[str, Any]]:
+        sql = """
+        WITH filtered AS (
+            SELECT store_id, total_amount, channel_id
+            FROM sales
+            WHERE sale_date BETWEEN $start_date AND $end_date
+              AND sale_status_desc = 'COMPLETED'
+              AND list_contains($store_ids, store_id)
+        ),
+        summary AS (
+            SELECT store_id,
+                   COALESCE(SUM(total_amount), 0) AS total_sales,
+                   COUNT(*)                       AS total_orders,
+                   COALESCE(AVG(total_amount), 0) AS average_ticket
+            FROM filtered
+            GROUP BY store_id
+        ),
+        channel_rank AS (
+            SELECT f.store_id, ch.name AS channel_name, SUM(f.total_amount) AS channel_sales,
+                   RANK() OVER (PARTITION BY f.store_id ORDER BY SUM(f.total_amount) DESC) AS rnk
+            FROM filtered f
+            JOIN channels ch ON ch.id = f.channel_id
+            GROUP BY f.store_id, ch.name
+        )
+        SELECT st.name AS store_name, sm.store_id, sm.total_sales, sm.total_orders, sm.average_ticket,
+               tc.channel_name, tc.channel_sales
+        FROM summary sm
+        JOIN stores st ON st.id = sm.store_id
+        LEFT JOIN channel_rank tc ON tc.store_id = sm.store_id AND tc.rnk = 1
+        ORDER BY sm.total_sales DESC
+        """
+        params = {"start_date": start_date, "end_date": end_date, "store_ids": list(store_ids)}
+        result = await self._mirrored("get_store_performance_for_period", start_date, end_date, [(sql, params)])
+        if result is None:
+            return await super().get_store_performance_for_period(store_ids, start_date, end_date)
+
+        rows = []
+        for r in result[0]:
+            channel_name, channel_sales = r.pop("channel_name"), r.pop("channel_sales")
+            r["top_channel"] = (
+                {"channel": channel_name, "share_pct": _share(channel_sales, r["total_sales"])}
+                if r["total_sales"] and channel_name is not None
+                else None
+            )
+            rows.append(r)
+        return rows
+
+    # ---------------------------------------------------------
+    # comparação de duas lojas
+    # ---------------------------------------------------------
+    async def get_store_comparison(
+        self,
+        store_a_id: int,
+        store_b_id: int,
+        start_date: date,
+        end_date: date,
+    ) -> List[Dict[str, Any]]:
+        period_days = (end_date - start_date).days + 1
+        prev_end = start_date - timedelta(days=1)
+        prev_start = prev_end - timedelta(days=period_days - 1)
+        sql = """
+        WITH scoped AS (
+            SELECT store_id, channel_id, total_amount, sale_date
+            FROM sales
+            WHERE sale_status_desc = 'COMPLETED'
+              AND store_id IN ($store_a_id, $store_b_id)
+              AND sale_date BETWEEN $prev_start AND $end_date
+        ),
+        summary AS (
+            SELECT store_id,
+                   COALESCE(SUM(total_amount), 0) AS total_sales,
+                   COUNT(*)                       AS total_orders,
+                   COALESCE(AVG(total_amount), 0) AS average_ticket
+            FROM scoped WHERE sale_date >= $start_date
+            GROUP BY store_id
+        ),
+        previous_period AS (
+            SELECT store_id, COALESCE(SUM(total_amount), 0) AS total_sales
+            FROM scoped WHERE sale_date <= $prev_end
+            GROUP BY store_id
+        ),
+        channel_rank AS (
+            SELECT s.store_id, ch.name AS channel_name, SUM(s.total_amount) AS channel_sales,
+                   RANK() OVER (PARTITION BY s.store_id ORDER BY SUM(s.total_amount) DESC) AS channel_rank
+            FROM scoped s
+            JOIN channels ch ON ch.id = s.channel_id
+            WHERE s.sale_date >= $start_date
+            GROUP BY s.store_id, ch.name
+        )
+        SELECT sm.store_id, st.name AS store_name, sm.total_sales, sm.total_orders, sm.average_ticket,
+               prev.total_sales AS previous_total_sales,
+               cr.channel_name AS top_channel, cr.channel_sales AS top_channel_sales
+        FROM summary sm
+        JOIN stores st ON st.id = sm.store_id
+        LEFT JOIN previous_period prev ON prev.store_id = sm.store_id
+        LEFT JOIN channel_rank cr ON cr.store_id = sm.store_id AND cr.channel_rank = 1
+        ORDER BY sm.total_sales DESC
+        """
+        params = {
+            "store_a_id": store_a_id, "store_b_id": store_b_id,
+            "start_date": start_date, "end_date": end_date,
+            "prev_start": prev_start, "prev_end": prev_end,
+        }
+        result = await self._mirrored("get_store_comparison", prev_start, end_date, [(sql, params)])
+        if result is None:
+            return await super().get_store_comparison(store_a_id, store_b_id, start_date, end_date)
+
+        rows = []
+        for r in result[0]:
+            previous = r.pop("previous_total_sales") or 0
+            channel_sales = r.pop("top_channel_sales")
+            r["sales_change_pct"] = round((r["total_sales"] - previous) / previous * 100, 2) if previous else 0
+            r["top_channel_share_pct"] = (
+                _share(channel_sales, r["total_sales"])
+                if r["total_sales"] and channel_sales is not None
+                else None
+            )
+            rows.append(r)
+        return rows
+
+    # ---------------------------------------------------------
+    # revenue overview (ex.: ano contra ano)
+    # ---------------------------------------------------------
+    async def get_revenue_overview(
+        self,
+        store_id: int,
+        start_date: date,
+        end_date: date,
+    ) -> Dict[str, Any]:
+        period_days = (end_date - start_date).days + 1
+        previous_end = start_date - timedelta(days=1)
+        previous_start = previous_end - timedelta(days=period_days - 1) if period_days > 0 else previous_end
+        scope = """
+            FROM sales
+            WHERE store_id = $store_id
+              AND sale_status_desc = 'COMPLETED'
+              AND sale_date BETWEEN $start_date AND $end_date
+        """
+        current = {"store_id": store_id, "start_date": start_date, "end_date": end_date}
+        previous = {"store_id": store_id, "start_date": previous_start, "end_date": previous_end}
+        statements = [
+            (f"""SELECT COALESCE(SUM(total_amount), 0) AS total_sales, COUNT(*) AS total_orders,
+                        COALESCE(AVG(total_amount), 0) AS average_ticket {scope}""", current),
+            (f"SELECT COALESCE(SUM(total_amount), 0) AS total_sales, COUNT(*) AS total_orders {scope}", previous),
+            (f"""SELECT sale_date, COALESCE(SUM(total_amount), 0) AS total_sales, COUNT(*) AS total_orders
+                 {scope} GROUP BY sale_date ORDER BY sale_date""", current),
+            (f"""SELECT ch.name AS channel, SUM(s.total_amount) AS total_sales
+                 FROM (SELECT channel_id, total_amount {scope}) s
+                 JOIN channels ch ON ch.id = s.channel_id
+                 GROUP BY ch.name ORDER BY total_sales DESC""", current),
+        ]
+        result = await self._mirrored("get_revenue_overview", min(previous_start, start_date), end_date, statements)
+        if result is None:
+            return await super().get_revenue_overview(store_id, start_date, end_date)
+
+        summary, prev, daily, channels = result[0][0], result[1][0], result[2], result[3]
+        total_sales = float(summary["total_sales"])
+        total_orders = summary["total_orders"]
+        previous_sales = float(prev["total_sales"] or 0)
+        previous_orders = prev["total_orders"] or 0
+        return {
+            "total_sales": total_sales,
+            "total_orders": total_orders,
+            "average_ticket": float(summary["average_ticket"]),
+            "sales_change_pct": _share(total_sales - previous_sales, previous_sales),
+            "orders_change_pct": _share(total_orders - previous_orders, previous_orders),
+            "top_channels": [
+                {"channel": c["channel"], "total_sales": float(c["total_sales"]), "share_pct": _share(c["total_sales"], total_sales)}
+                for c in channels
+            ],
+            "daily_breakdown": [
+                {"sale_date": d["sale_date"].isoformat(), "total_sales": float(d["total_sales"]), "total_orders": d["total_orders"]}
+                for d in daily
+            ],
+        }
+
+    # ---------------------------------------------------------
+    # portfólio (N lojas + consolidado)
+    # ---------------------------------------------------------
+    async def get_portfolio_overview(
+        self,
+        store_ids: List[int],
+        start_date: date,
+        end_date: date,
+        top_n: int = 5,
+    ) -> List[Dict[str, Any]]:
+        period_days = (end_date - start_date).days + 1
+        prev_end = start_date - timedelta(days=1)
+        prev_start = prev_end - timedelta(days=period_days - 1)
+        sql = """
+        WITH filtered AS (
+            SELECT id, sale_date, store_id, channel_id, total_amount
+            FROM sales
+            WHERE sale_status_desc = 'COMPLETED'
+              AND list_contains($store_ids, store_id)
+              AND sale_date BETWEEN $start_date AND $end_date
+        ),
+        summary AS (
+            SELECT COALESCE(store_id, 0) AS store_key, store_id,
+                   COALESCE(SUM(total_amount), 0) AS total_sales,
+                   COUNT(*)                       AS total_orders,
+                   COALESCE(AVG(total_amount), 0) AS average_ticket
+            FROM filtered
+            GROUP BY GROUPING SETS ((store_id), ())
+        ),
+        previous_period AS (
+            SELECT COALESCE(store_id, 0) AS store_key,
+                   COALESCE(SUM(total_amount), 0) AS total_sales,
+                   COUNT(*)                       AS total_orders
+            FROM sales
+            WHERE sale_status_desc = 'COMPLETED'
+              AND list_contains($store_ids, store_id)
+              AND sale_date BETWEEN $prev_start AND $prev_end
+            GROUP BY GROUPING SETS ((store_id), ())
+        ),
+        channel_sales AS (
+            SELECT COALESCE(store_id, 0) AS store_key, channel_id, SUM(total_amount) AS channel_sales
+            FROM filtered
+            GROUP BY GROUPING SETS ((store_id, channel_id), (channel_id))
+        ),
+        channel_list AS (
+            SELECT r.store_key,
+                   list(struct_pack(
+                       channel := ch.name,
+                       total_sales := r.channel_sales,
+                       share_pct := CASE WHEN sm.total_sales > 0
+                           THEN ROUND(r.channel_sales / sm.total_sales * 100, 2) ELSE 0 END
+                   ) ORDER BY r.channel_sales DESC) AS top_channels
+            FROM (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY store_key ORDER BY channel_sales DESC) AS rn
+                FROM channel_sales
+            ) r
+            JOIN channels ch ON ch.id = r.channel_id
+            JOIN summary sm ON sm.store_key = r.store_key
+            WHERE r.rn <= $top_n
+            GROUP BY r.store_key
+        ),
+        product_agg AS (
+            SELECT COALESCE(f.store_id, 0) AS store_key, ps.product_id,
+                   SUM(ps.quantity) AS total_quantity, SUM(ps.total_price) AS total_revenue
+            FROM filtered f
+            JOIN product_sales ps ON ps.sale_id = f.id AND ps.sale_date = f.sale_date
+            WHERE ps.sale_date BETWEEN $start_date AND $end_date
+            GROUP BY GROUPING SETS ((f.store_id, ps.product_id), (ps.product_id))
+        ),
+        product_list AS (
+            SELECT r.store_key,
+                   list(struct_pack(
+                       product_id := r.product_id,
+                       product_name := p.name,
+                       total_quantity := r.total_quantity,
+                       total_revenue := r.total_revenue
+                   ) ORDER BY r.total_revenue DESC) AS top_products
+            FROM (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY store_key ORDER BY total_revenue DESC) AS rn
+                FROM product_agg
+            ) r
+            JOIN products p ON p.id = r.product_id
+            WHERE r.rn <= $top_n
+            GROUP BY r.store_key
+        )
+        SELECT sm.store_id, st.name AS store_name, sm.total_sales, sm.total_orders, sm.average_ticket,
+               COALESCE(prev.total_sales, 0)  AS previous_total_sales,
+               COALESCE(prev.total_orders, 0) AS previous_total_orders,
+               cl.top_channels, pl.top_products
+        FROM summary sm
+        LEFT JOIN stores st ON st.id = sm.store_id
+        LEFT JOIN previous_period prev ON prev.store_key = sm.store_key
+        LEFT JOIN channel_list cl ON cl.store_key = sm.store_key
+        LEFT JOIN product_list pl ON pl.store_key = sm.store_key
+        ORDER BY sm.store_id NULLS FIRST
+        """
+        params = {
+            "store_ids": list(store_ids), "start_date": start_date, "end_date": end_date,
+            "prev_start": prev_start, "prev_end": prev_end, "top_n": top_n,
+        }
+        result = await self._mirrored("get_portfolio_overview", prev_start, end_date, [(sql, params)])
+        if result is None:
+            return await super().get_portfolio_overview(store_ids, start_date, end_date, top_n)
+        for r in result[0]:
+            r["top_channels"] = r["top_channels"] or []
+            r["top_products"] = r["top_products"] or []
+        return result[0]
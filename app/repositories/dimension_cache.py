@@ -0,0 +1,141 @@
+# app/repositories/dimension_cache.py
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import text
+
+# tabelas de dimensão que as consultas só usavam pra trocar id por nome
+DIMENSION_TABLES = ("stores", "channels", "products", "items")
+# NOTIFY da migração 009 (payload = nome da tabela alterada)
+DIMENSIONS_CHANNEL = "dimensions_changed"
+
+
+def named(row: Dict[str, Any], id_key: str, name_key: str, names: Dict[int, str], keep_id: bool = False) -> Dict[str, Any]:
+    """
+    Cópia da linha com o nome no lugar do id (mesma posição da chave, pro
+    JSON sair na ordem de antes). ``keep_id`` mantém o id antes do nome.
+    """
+    out: Dict[str, Any] = {}
+    for key, value in row.items():
+        if key != id_key:
+            out[key] = value
+            continue
+        if keep_id:
+            out[key] = value
+        out[name_key] = names.get(int(value)) if value is not None else None
+    return out
+
+
+class DimensionCache:
+    """
+    id -> nome de lojas, canais e produtos em memória. As consultas do
+    SalesRepository agrupam só por id inteiro (sem JOIN nas dimensões, sem
+    ordenar/agrupar por texto) e o nome é colado em Python depois.
+
+    Cada tabela é lida inteira na primeira vez (ou no lifespan) e vale até
+    chegar o aviso ``dimensions_changed``. Sem listener conectado, ``ttl``
+    limita quanto um nome renomeado pode ficar velho. Id que não está no
+    cache (produto cadastrado depois da carga) vira um lookup por PK.
+    """
+
+    def __init__(self, ttl: float = 300.0):
+        self.ttl = ttl
+        self.notified = False
+        self._names: Dict[str, Dict[int, str]] = {t: {} for t in DIMENSION_TABLES}
+        self._loaded_at: Dict[str, Optional[float]] = {t: None for t in DIMENSION_TABLES}
+        # aviso que chega durante a leitura não pode ser engolido por ela
+        self._generation: Dict[str, int] = {t: 0 for t in DIMENSION_TABLES}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+        self.loads = 0
+        self.lookups = 0
+        self.invalidations = 0
+
+    # ---------------------------------------------------------
+    # avisos
+    # ---------------------------------------------------------
+    def set_enabled(self, connected: bool) -> None:
+        # reconexão: o que mudou enquanto estava fora não chegou
+        self.notified = connected
+        if connected:
+            self.invalidate()
+
+    def invalidate(self, tables: Optional[Iterable[str]] = None) -> None:
+        for table in tables or DIMENSION_TABLES:
+            if table in self._loaded_at:
+                self._loaded_at[table] = None
+                self._generation[table] += 1
+                self.invalidations += 1
+
+    def on_notify(self, payload: str) -> None:
+        table = (payload or "").strip()
+        self.invalidate([table] if table in DIMENSION_TABLES else None)
+
+    # ---------------------------------------------------------
+    # carga
+    # ---------------------------------------------------------
+    def _fresh(self, table: str) -> bool:
+        loaded_at = self._loaded_at[table]
+        if loaded_at is None:
+            return False
+        return self.notified or time.monotonic() - loaded_at < self.ttl
+
+    async def _reload(self, db: Any, table: str) -> None:
+        lock = self._locks.setdefault(table, asyncio.Lock())
+        async with lock:
+            if self._fresh(table):
+                return
+            generation = self._generation[table]
+            res = await db.execute(text(f"SELECT id, name FROM {table}"))
+            self._names[table] = {int(r[0]): r[1] for r in res.fetchall()}
+            self.loads += 1
+            if self._generation[table] == generation:
+                self._loaded_at[table] = time.monotonic()
+
+    async def load(self, db: Any, tables: Iterable[str] = DIMENSION_TABLES) -> Dict[str, int]:
+        """Carga completa (lifespan); devolve quantas linhas por tabela."""
+        for table in tables:
+            self._loaded_at[table] = None
+            await self._reload(db, table)
+        return {table: len(self._names[table]) for table in tables}
+
+    # ---------------------------------------------------------
+    # consulta
+    # ---------------------------------------------------------
+    async def all(self, db: Any, table: str) -> Dict[int, str]:
+        if not self._fresh(table):
+            await self._reload(db, table)
+        return self._names[table]
+
+    async def names(self, db: Any, table: str, ids: Iterable[Any]) -> Dict[int, str]:
+        wanted = {int(i) for i in ids if i is not None}
+        if not wanted:
+            return {}
+        known = await self.all(db, table)
+        missing = [i for i in wanted if i not in known]
+        if missing:
+            self.lookups += 1
+            res = await db.execute(
+                text(f"SELECT id, name FROM {table} WHERE id = ANY(:ids)"),
+                {"ids": missing},
+            )
+            known.update({int(r[0]): r[1] for r in res.fetchall()})
+        return {i: known[i] for i in wanted if i in known}
+
+    async def ids_for(self, db: Any, table: str, name: str) -> List[int]:
+        """Ids com esse nome (ex.: filtro ?channel=iFood vira channel_id = ANY)."""
+        known = await self.all(db, table)
+        return sorted(i for i, n in known.items() if n == name)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "notified": self.notified,
+            "rows": {t: len(self._names[t]) for t in DIMENSION_TABLES},
+            "fresh": {t: self._fresh(t) for t in DIMENSION_TABLES},
+            "loads": self.loads,
+            "lookups": self.lookups,
+            "invalidations": self.invalidations,
+        }
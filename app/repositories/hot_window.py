@@ -0,0 +1,587 @@
+# app/repositories/hot_window.py
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+try:  # opcional: pip install numpy habilita a janela quente
+    import numpy as np
+except ImportError:  # pragma: no cover - depende do ambiente
+    np = None
+
+from sqlalchemy import text
+
+from app.repositories.analytics_mirror import MirrorSalesRepository
+from app.repositories.dimension_cache import DimensionCache, named
+from app.repositories.sales_repository import day_bounds
+
+EPOCH = date(1970, 1, 1)
+
+# métodos que a janela responde (o resto segue pro espelho/Postgres)
+HOT_METHODS = (
+    "get_revenue_overview",
+    "get_channel_performance",
+    "get_top_products_flexible",
+    "get_hourly_matrix",
+    "get_hourly_matrix_raw",
+)
+
+
+def _day_number(value: date) -> int:
+    return (value - EPOCH).days
+
+
+class StoreWindow:
+    """
+    Vendas COMPLETED recentes de uma loja em colunas NumPy (uma posição
+    por venda) + itens de produto apontando pra posição da venda. As
+    agregações dos widgets viram máscaras booleanas e ``bincount``: nada de
+    dicionário por linha, nada de round-trip ao banco.
+
+    Colunas derivadas na carga: ``day`` (dias desde 1970), ``hour`` e
+    ``dow`` no padrão do Postgres (domingo = 0), pra bater com os filtros
+    EXTRACT(DOW/HOUR) do SalesRepository. Como no SQL, tudo sai agrupado
+    por id (canal, produto); o nome é colado pelo repositório.
+    """
+
+    def __init__(self, store_id: int, first_day: date):
+        self.store_id = store_id
+        self.first_day = first_day
+        self.sales = {
+            "sale_id": np.empty(0, np.int64),
+            "day": np.empty(0, np.int32),
+            "hour": np.empty(0, np.int8),
+            "dow": np.empty(0, np.int8),
+            "channel_id": np.empty(0, np.int32),
+            "amount": np.empty(0, np.float64),
+            "customer_id": np.empty(0, np.int64),
+        }
+        self.lines = {
+            "sale_idx": np.empty(0, np.int32),
+            "product_id": np.empty(0, np.int32),
+            "quantity": np.empty(0, np.float64),
+            "total_price": np.empty(0, np.float64),
+        }
+        self.last_sale_id = 0
+        self.loaded_at = 0.0
+        self.resynced_at = 0.0
+        self.stale = False
+
+    # ---------------------------------------------------------
+    # carga / manutenção
+    # ---------------------------------------------------------
+    @property
+    def size(self) -> int:
+        return len(self.sales["sale_id"])
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in self.sales.values()) + sum(a.nbytes for a in self.lines.values())
+
+    def append(self, sale_rows: List[Tuple], line_rows: List[Tuple]) -> int:
+        """Vendas novas (ordenadas por id, todas > last_sale_id) e seus itens."""
+        if sale_rows:
+            sale_id, ts, channel_id, amount, customer_id = zip(*sale_rows)
+            stamps = np.array(ts, dtype="datetime64[s]")
+            days = stamps.astype("datetime64[D]")
+            new = {
+                "sale_id": np.array(sale_id, np.int64),
+                "day": days.astype(np.int64).astype(np.int32),
+                "hour": ((stamps - days).astype(np.int64) // 3600).astype(np.int8),
+                # 1970-01-01 foi quinta (dow 4 no Postgres)
+                "dow": ((days.astype(np.int64) + 4) % 7).astype(np.int8),
+                "channel_id": np.array(channel_id, np.int32),
+                "amount": np.array([float(a or 0) for a in amount], np.float64),
+                "customer_id": np.array([c if c is not None else -1 for c in customer_id], np.int64),
+            }
+            for name, column in new.items():
+                self.sales[name] = np.concatenate([self.sales[name], column])
+            self.last_sale_id = int(self.sales["sale_id"][-1])
+
+        if line_rows:
+            sale_id, product_id, quantity, total_price = zip(*line_rows)
+            ids = np.array(sale_id, np.int64)
+            idx = np.searchsorted(self.sales["sale_id"], ids)
+            found = (idx < self.size) & (self.sales["sale_id"][np.minimum(idx, self.size - 1)] == ids)
+            new_lines = {
+                "sale_idx": idx[found].astype(np.int32),
+                "product_id": np.array(product_id, np.int32)[found],
+                "quantity": np.array([float(q or 0) for q in quantity], np.float64)[found],
+                "total_price": np.array([float(p or 0) for p in total_price], np.float64)[found],
+            }
+            for name, column in new_lines.items():
+                self.lines[name] = np.concatenate([self.lines[name], column])
+        return len(sale_rows)
+
+    def trim(self, first_day: date) -> None:
+        """Descarta os dias que saíram da janela (virada do dia)."""
+        self.first_day = first_day
+        keep = self.sales["day"] >= _day_number(first_day)
+        if keep.all():
+            return
+        new_index = np.cumsum(keep) - 1
+        line_keep = keep[self.lines["sale_idx"]]
+        for name in self.sales:
+            self.sales[name] = self.sales[name][keep]
+        for name in self.lines:
+            self.lines[name] = self.lines[name][line_keep]
+        self.lines["sale_idx"] = new_index[self.lines["sale_idx"]].astype(np.int32)
+
+    def covers(self, start_date: date) -> bool:
+        return start_date >= self.first_day
+
+    # ---------------------------------------------------------
+    # máscaras
+    # ---------------------------------------------------------
+    def _period(self, start_date: date, end_date: date):
+        day = self.sales["day"]
+        return (day >= _day_number(start_date)) & (day <= _day_number(end_date))
+
+    def _filters(self, mask, channel_ids=None, dow=None, hour_start=None, hour_end=None):
+        if channel_ids is not None:
+            mask = mask & np.isin(self.sales["channel_id"], channel_ids)
+        if dow is not None:
+            mask = mask & (self.sales["dow"] == dow)
+        if hour_start is not None and hour_end is not None:
+            hour = self.sales["hour"]
+            mask = mask & (hour >= hour_start) & (hour <= hour_end)
+        return mask
+
+    def _sum_count(self, mask) -> Tuple[float, int]:
+        return float(self.sales["amount"][mask].sum()), int(mask.sum())
+
+    # ---------------------------------------------------------
+    # agregações (mesmo formato do SalesRepository)
+    # ---------------------------------------------------------
+    def revenue_overview(
+        self,
+        start_date: date,
+        end_date: date,
+        previous_start: date,
+        previous_end: date,
+    ) -> Dict[str, Any]:
+        current = self._period(start_date, end_date)
+        total_sales, total_orders = self._sum_count(current)
+        previous_sales, previous_orders = self._sum_count(self._period(previous_start, previous_end))
+
+        first = _day_number(start_date)
+        days = self.sales["day"][current] - first
+        amounts = self.sales["amount"][current]
+        n_days = (end_date - start_date).days + 1
+        daily_sales = np.bincount(days, weights=amounts, minlength=n_days)
+        daily_orders = np.bincount(days, minlength=n_days)
+        daily = [
+            {
+                "sale_date": (start_date + timedelta(days=int(i))).isoformat(),
+                "total_sales": round(float(daily_sales[i]), 2),
+                "total_orders": int(daily_orders[i]),
+            }
+            for i in np.flatnonzero(daily_orders)
+        ]
+
+        channels = self._by_channel(current)
+        return {
+            "total_sales": round(total_sales, 2),
+            "total_orders": total_orders,
+            "average_ticket": total_sales / total_orders if total_orders else 0.0,
+            "sales_change_pct": round((total_sales - previous_sales) / previous_sales * 100, 2) if previous_sales else 0.0,
+            "orders_change_pct": round((total_orders - previous_orders) / previous_orders * 100, 2) if previous_orders else 0.0,
+            "top_channels": [
+                {**c, "share_pct": round(c["total_sales"] / total_sales * 100, 2) if total_sales > 0 else 0}
+                for c in channels
+            ],
+            "daily_breakdown": daily,
+        }
+
+    def _by_channel(self, mask) -> List[Dict[str, Any]]:
+        ids = self.sales["channel_id"][mask]
+        if not len(ids):
+            return []
+        sums = np.bincount(ids, weights=self.sales["amount"][mask])
+        counts = np.bincount(ids)
+        channels = [(int(cid), float(sums[cid])) for cid in np.flatnonzero(counts)]
+        return [
+            {"channel_id": cid, "total_sales": round(value, 2)}
+            for cid, value in sorted(channels, key=lambda kv: -kv[1])
+        ]
+
+    def channel_performance(self, first_day: date) -> List[Dict[str, Any]]:
+        return self._by_channel(self.sales["day"] >= _day_number(first_day))
+
+    def _product_totals(self, sale_mask) -> Dict[int, List[float]]:
+        line_mask = sale_mask[self.lines["sale_idx"]]
+        products = self.lines["product_id"][line_mask]
+        if not len(products):
+            return {}
+        quantity = np.bincount(products, weights=self.lines["quantity"][line_mask])
+        revenue = np.bincount(products, weights=self.lines["total_price"][line_mask])
+        return {int(pid): [float(quantity[pid]), float(revenue[pid])] for pid in np.unique(products)}
+
+    def top_products(
+        self,
+        start_date: date,
+        end_date: date,
+        prev_start: date,
+        prev_end: date,
+        channel_ids=None,
+        dow=None,
+        hour_start=None,
+        hour_end=None,
+        limit: int = 10,
+    ) -> List[Dict[str, Any]]:
+        current = self._product_totals(
+            self._filters(self._period(start_date, end_date), channel_ids, dow, hour_start, hour_end),
+        )
+        previous = self._product_totals(
+            self._filters(self._period(prev_start, prev_end), channel_ids, dow, hour_start, hour_end),
+        )
+        total_revenue = sum(v[1] for v in current.values())
+        rows = []
+        for pid, (quantity, revenue) in sorted(current.items(), key=lambda kv: -kv[1][1])[:limit]:
+            prev_quantity = previous.get(pid, [0.0])[0]
+            rows.append({
+                "product_id": pid,
+                "total_quantity": quantity,
+                "total_revenue": round(revenue, 2),
+                "pct_of_total": round(revenue / total_revenue * 100, 2) if total_revenue > 0 else 0,
+                "wow_change_pct": round((quantity - prev_quantity) / prev_quantity * 100, 2) if prev_quantity else None,
+            })
+        return rows
+
+    def hourly_matrix(
+        self,
+        start_date: date,
+        end_date: date,
+        channel_ids=None,
+        product_id: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        mask = self._filters(self._period(start_date, end_date), channel_ids)
+        iso_dow = np.where(self.sales["dow"] == 0, 7, self.sales["dow"]).astype(np.int64)
+        # célula = (dow ISO - 1) * 24 + hora
+        cell = (iso_dow - 1) * 24 + self.sales["hour"].astype(np.int64)
+        quantity = None
+        if product_id is None:
+            orders = np.bincount(cell[mask], minlength=168)
+            sales = np.bincount(cell[mask], weights=self.sales["amount"][mask], minlength=168)
+        else:
+            line_mask = mask[self.lines["sale_idx"]] & (self.lines["product_id"] == product_id)
+            line_cell = cell[self.lines["sale_idx"][line_mask]]
+            sales = np.bincount(line_cell, weights=self.lines["total_price"][line_mask], minlength=168)
+            quantity = np.bincount(line_cell, weights=self.lines["quantity"][line_mask], minlength=168)
+            # pedidos = vendas distintas com o produto
+            distinct = np.unique(self.lines["sale_idx"][line_mask])
+            orders = np.bincount(cell[distinct], minlength=168)
+        rows = []
+        for c in np.flatnonzero(orders):
+            row = {"dow": int(c // 24) + 1, "hour": int(c % 24), "total_orders": int(orders[c]),
+                   "total_sales": round(float(sales[c]), 2)}
+            if quantity is not None:
+                row["total_quantity"] = float(quantity[c])
+            rows.append(row)
+        return rows
+
+
+class HotSalesWindow:
+    """
+    Janela quente por loja (últimos ``days`` dias), carregada na primeira
+    consulta e atualizada incrementalmente (vendas com id > último visto)
+    quando passa de ``refresh_seconds``. Cancelamentos, pedido PENDING que
+    vira COMPLETED e ids commitados fora de ordem escapam do cursor: aviso
+    de mudança da loja (que já mudou o ETag) recarrega a loja inteira, e
+    sem aviso isso acontece a cada ``resync_seconds``.
+
+    ``max_bytes`` limita a memória total: estouro tira as lojas usadas há
+    mais tempo (LRU); loja que sozinha passa do limite não fica em cache
+    (as consultas dela seguem no SQL).
+    """
+
+    def __init__(
+        self,
+        days: int = 62,
+        max_bytes: int = 256 * 1024 * 1024,
+        refresh_seconds: float = 5.0,
+        resync_seconds: float = 600.0,
+        today: Callable[[], date] = date.today,
+    ):
+        self.days = days
+        self.max_bytes = max_bytes
+        self.refresh_seconds = refresh_seconds
+        self.resync_seconds = resync_seconds
+        self.today = today
+
+        self._stores: "OrderedDict[int, StoreWindow]" = OrderedDict()
+        self._locks: Dict[int, asyncio.Lock] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.refreshes = 0
+        self.evictions = 0
+        self.too_big = 0
+        self.total_load_ms = 0.0
+
+    @classmethod
+    def from_env(cls) -> Optional["HotSalesWindow"]:
+        """
+        HOT_WINDOW_DAYS    dias na janela (padrão 62: 30 dias + 30 de comparação)
+        HOT_WINDOW_MAX_MB  teto de memória (padrão 256; 0 desliga)
+        Sem numpy instalado, desligada.
+        """
+        max_mb = float(os.getenv("HOT_WINDOW_MAX_MB", "256"))
+        days = int(os.getenv("HOT_WINDOW_DAYS", "62"))
+        if np is None or max_mb <= 0 or days <= 0:
+            return None
+        return cls(days=days, max_bytes=int(max_mb * 1024 * 1024))
+
+    @property
+    def first_day(self) -> date:
+        return self.today() - timedelta(days=self.days - 1)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(w.nbytes for w in self._stores.values())
+
+    def covers(self, start_date: date) -> bool:
+        return start_date >= self.first_day
+
+    def invalidate(self, store_ids: Iterable[int]) -> None:
+        """
+        Handler do ChangeListener: a próxima consulta recarrega a loja inteira.
+        O incremento por id não vê UPDATE (cancelamento, PENDING -> COMPLETED)
+        e o ETag já subiu de versão: responder o corpo velho sob o ETag novo
+        deixaria o 304 errado até o resync.
+        """
+        for sid in store_ids:
+            window = self._stores.get(sid)
+            if window is not None:
+                window.stale = True
+
+    # ---------------------------------------------------------
+    # carga
+    # ---------------------------------------------------------
+    async def _fetch(self, db: Any, window: StoreWindow) -> Tuple[List[Tuple], List[Tuple]]:
+        start_ts, end_ts = day_bounds(window.first_day, self.today())
+        params = {
+            "store_id": window.store_id,
+            "start_ts": start_ts,
+            "end_ts": end_ts,
+            "after_sale_id": window.last_sale_id,
+        }
+        scope = """
+            s.store_id = :store_id
+            AND s.sale_status_desc = 'COMPLETED'
+            AND s.created_at >= :start_ts AND s.created_at < :end_ts
+            AND s.id > :after_sale_id
+        """
+        sales = await db.execute(
+            text(f"""
+                SELECT s.id, s.created_at, s.channel_id, s.total_amount, s.customer_id
+                FROM sales s
+                WHERE {scope}
+                ORDER BY s.id
+            """),
+            params,
+        )
+        lines = await db.execute(
+            text(f"""
+                SELECT ps.sale_id, ps.product_id, ps.quantity, ps.total_price
+                FROM sales s
+                JOIN product_sales ps ON ps.sale_id = s.id AND ps.sale_created_at = s.created_at
+                WHERE {scope}
+                  AND ps.sale_created_at >= :start_ts AND ps.sale_created_at < :end_ts
+            """),
+            params,
+        )
+        return [tuple(r) for r in sales.fetchall()], [tuple(r) for r in lines.fetchall()]
+
+    def _fits(self, store_id: int, window: StoreWindow) -> bool:
+        """Aplica o teto de memória tirando as lojas menos usadas."""
+        if window.nbytes > self.max_bytes:
+            self._stores.pop(store_id, None)
+            self.too_big += 1
+            return False
+        while self.nbytes > self.max_bytes:
+            victim, _ = self._stores.popitem(last=False)
+            self.evictions += 1
+            if victim == store_id:
+                return False
+        return True
+
+    async def get(self, db: Any, store_id: int) -> Optional[StoreWindow]:
+        """Janela atualizada da loja, ou None se não couber no orçamento."""
+        lock = self._locks.setdefault(store_id, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            first_day = self.first_day
+            window = self._stores.get(store_id)
+            full = window is None or window.stale or now - window.resynced_at > self.resync_seconds
+            if full:
+                window = StoreWindow(store_id, first_day)
+            elif now - window.loaded_at > self.refresh_seconds:
+                window.trim(first_day)
+            else:
+                self._stores.move_to_end(store_id)
+                return window
+
+            started = time.perf_counter()
+            sale_rows, line_rows = await self._fetch(db, window)
+            window.append(sale_rows, line_rows)
+            window.loaded_at = now
+            if full:
+                window.resynced_at = now
+                self.loads += 1
+                self.total_load_ms += (time.perf_counter() - started) * 1000
+            else:
+                self.refreshes += 1
+
+            self._stores[store_id] = window
+            self._stores.move_to_end(store_id)
+            return window if self._fits(store_id, window) else None
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "days": self.days,
+            "first_day": self.first_day.isoformat(),
+            "stores": len(self._stores),
+            "rows": sum(w.size for w in self._stores.values()),
+            "mb": round(self.nbytes / 1024 / 1024, 2),
+            "max_mb": round(self.max_bytes / 1024 / 1024, 2),
+            "hits": self.hits,
+            "misses": self.misses,
+            "loads": self.loads,
+            "refreshes": self.refreshes,
+            "evictions": self.evictions,
+            "too_big": self.too_big,
+            "avg_load_ms": round(self.total_load_ms / self.loads, 2) if self.loads else None,
+        }
+
+
+class HotWindowSalesRepository(MirrorSalesRepository):
+    """
+    Respostas dos widgets de período recente direto da janela em memória.
+    Período que começa antes da janela (contando o período anterior de
+    comparação) ou loja fora do orçamento cai na versão herdada: espelho
+    Parquet quando ligado, senão Postgres.
+    """
+
+    def __init__(
+        self,
+        db: Any,
+        hot_window: Optional[HotSalesWindow],
+        mirror: Any = None,
+        dimensions: Optional[DimensionCache] = None,
+    ):
+        super().__init__(db, mirror, dimensions)
+        self.hot_window = hot_window
+
+    def raw_source(self, method: str, first_day: date, end_date: date) -> str:
+        if self.hot_window is not None and method in HOT_METHODS and self.hot_window.covers(first_day):
+            return "memory"
+        return super().raw_source(method, first_day, end_date)
+
+    async def _window(self, store_id: int, first_needed: date) -> Optional[StoreWindow]:
+        hot = self.hot_window
+        if hot is None:
+            return None
+        if not hot.covers(first_needed):
+            hot.misses += 1
+            return None
+        window = await hot.get(self.db, store_id)
+        if window is None:
+            hot.misses += 1
+            return None
+        hot.hits += 1
+        return window
+
+    async def _window_channel_ids(self, channel: Optional[str]):
+        if not channel:
+            return None
+        return np.array(await self._channel_ids(channel), np.int32)
+
+    async def _channel_names(self, rows: List[Dict[str, Any]], name_key: str) -> List[Dict[str, Any]]:
+        names = await self._names("channels", [r["channel_id"] for r in rows])
+        return [named(r, "channel_id", name_key, names) for r in rows]
+
+    async def get_revenue_overview(self, store_id: int, start_date: date, end_date: date) -> Dict[str, Any]:
+        period_days = (end_date - start_date).days + 1
+        previous_end = start_date - timedelta(days=1)
+        previous_start = previous_end - timedelta(days=period_days - 1) if period_days > 0 else previous_end
+        window = await self._window(store_id, previous_start)
+        if window is None:
+            return await super().get_revenue_overview(store_id, start_date, end_date)
+        overview = window.revenue_overview(start_date, end_date, previous_start, previous_end)
+        overview["top_channels"] = await self._channel_names(overview["top_channels"], "channel")
+        return overview
+
+    async def get_channel_performance(self, store_id: int, period_days: int = 30):
+        # mesmo recorte do SQL: created_at >= CURRENT_DATE - period_days
+        hot = self.hot_window
+        first_day = hot.today() - timedelta(days=period_days) if hot is not None else EPOCH
+        window = await self._window(store_id, first_day)
+        if window is None:
+            return await super().get_channel_performance(store_id, period_days)
+        return await self._channel_names(window.channel_performance(first_day), "channel")
+
+    async def get_top_products_flexible(
+        self,
+        store_id: int,
+        channel: Optional[str],
+        start_date: date,
+        end_date: date,
+        day_of_week: Optional[int],
+        hour_start: Optional[int],
+        hour_end: Optional[int],
+        limit: int = 10,
+    ) -> List[Dict[str, Any]]:
+        period_days = (end_date - start_date).days + 1
+        prev_end = start_date - timedelta(days=1)
+        prev_start = prev_end - timedelta(days=period_days - 1)
+        window = await self._window(store_id, prev_start)
+        if window is None:
+            return await super().get_top_products_flexible(
+                store_id, channel, start_date, end_date, day_of_week, hour_start, hour_end, limit
+            )
+        rows = window.top_products(
+            start_date, end_date, prev_start, prev_end,
+            channel_ids=await self._window_channel_ids(channel),
+            dow=day_of_week % 7 if day_of_week is not None else None,
+            hour_start=hour_start,
+            hour_end=hour_end,
+            limit=limit,
+        )
+        names = await self._names("products", [r["product_id"] for r in rows])
+        return [named(r, "product_id", "product_name", names, keep_id=True) for r in rows]
+
+    async def get_hourly_matrix(
+        self,
+        store_id: int,
+        start_date: date,
+        end_date: date,
+        channel: Optional[str] = None,
+        product_id: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        window = await self._window(store_id, start_date)
+        if window is None:
+            return await super().get_hourly_matrix(store_id, start_date, end_date, channel, product_id)
+        return window.hourly_matrix(
+            start_date, end_date, channel_ids=await self._window_channel_ids(channel), product_id=product_id
+        )
+
+    async def get_hourly_matrix_raw(
+        self,
+        store_id: int,
+        start_date: date,
+        end_date: date,
+        channel: Optional[str] = None,
+        product_id: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        window = await self._window(store_id, start_date)
+        if window is None:
+            return await super().get_hourly_matrix_raw(store_id, start_date, end_date, channel, product_id)
+        return window.hourly_matrix(
+            start_date, end_date, channel_ids=await self._window_channel_ids(channel), product_id=product_id
+        )
@@ -0,0 +1,215 @@
+# app/repositories/ingest_repository.py
+from __future__ import annotations
+
+from typing import Any, Dict, List, Sequence, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+SaleKey = Tuple[int, str]
+
+# (coluna, tipo no Postgres) na ordem do INSERT
+SALES_COLUMNS = [
+    ("id", "INTEGER"),
+    ("store_id", "INTEGER"),
+    ("sub_brand_id", "INTEGER"),
+    ("customer_id", "INTEGER"),
+    ("channel_id", "INTEGER"),
+    ("cod_sale1", "TEXT"),
+    ("cod_sale2", "TEXT"),
+    ("created_at", "TIMESTAMP"),
+    ("customer_name", "TEXT"),
+    ("sale_status_desc", "TEXT"),
+    ("total_amount_items", "NUMERIC"),
+    ("total_discount", "NUMERIC"),
+    ("total_increase", "NUMERIC"),
+    ("delivery_fee", "NUMERIC"),
+    ("service_tax_fee", "NUMERIC"),
+    ("total_amount", "NUMERIC"),
+    ("value_paid", "NUMERIC"),
+    ("production_seconds", "INTEGER"),
+    ("delivery_seconds", "INTEGER"),
+    ("people_quantity", "INTEGER"),
+    ("discount_reason", "TEXT"),
+    ("increase_reason", "TEXT"),
+    ("origin", "TEXT"),
+]
+PRODUCT_SALES_COLUMNS = [
+    ("id", "INTEGER"),
+    ("sale_id", "INTEGER"),
+    ("sale_created_at", "TIMESTAMP"),
+    ("product_id", "INTEGER"),
+    ("quantity", "FLOAT8"),
+    ("base_price", "FLOAT8"),
+    ("total_price", "FLOAT8"),
+    ("observations", "TEXT"),
+]
+ITEM_PRODUCT_SALES_COLUMNS = [
+    ("product_sale_id", "INTEGER"),
+    ("item_id", "INTEGER"),
+    ("option_group_id", "INTEGER"),
+    ("quantity", "FLOAT8"),
+    ("additional_price", "FLOAT8"),
+    ("price", "FLOAT8"),
+    ("amount", "FLOAT8"),
+    ("observations", "TEXT"),
+]
+DELIVERY_SALES_COLUMNS = [
+    ("id", "INTEGER"),
+    ("sale_id", "INTEGER"),
+    ("courier_id", "TEXT"),
+    ("courier_name", "TEXT"),
+    ("courier_phone", "TEXT"),
+    ("courier_type", "TEXT"),
+    ("delivered_by", "TEXT"),
+    ("delivery_type", "TEXT"),
+    ("status", "TEXT"),
+    ("delivery_fee", "FLOAT8"),
+    ("courier_fee", "FLOAT8"),
+    ("timing", "TEXT"),
+    ("mode", "TEXT"),
+]
+DELIVERY_ADDRESSES_COLUMNS = [
+    ("sale_id", "INTEGER"),
+    ("delivery_sale_id", "INTEGER"),
+    ("street", "TEXT"),
+    ("number", "TEXT"),
+    ("complement", "TEXT"),
+    ("formatted_address", "TEXT"),
+    ("neighborhood", "TEXT"),
+    ("city", "TEXT"),
+    ("state", "TEXT"),
+    ("country", "TEXT"),
+    ("postal_code", "TEXT"),
+    ("reference", "TEXT"),
+    ("latitude", "FLOAT8"),
+    ("longitude", "FLOAT8"),
+]
+PAYMENTS_COLUMNS = [
+    ("sale_id", "INTEGER"),
+    ("payment_type_id", "INTEGER"),
+    ("value", "NUMERIC"),
+    ("is_online", "BOOLEAN"),
+    ("description", "TEXT"),
+    ("currency", "TEXT"),
+]
+
+
+def unnest_insert_sql(table: str, columns: Sequence[Tuple[str, str]]) -> str:
+    """
+    INSERT de N linhas com um parâmetro (array) por coluna:
+    o custo de parse/plan e de ida e volta é o mesmo pra 1 ou 5.000 linhas.
+    """
+    names = ", ".join(name for name, _ in columns)
+    arrays = ", ".join(f"CAST(:{name} AS {pg_type}[])" for name, pg_type in columns)
+    return f"INSERT INTO {table} ({names}) SELECT * FROM unnest({arrays})"
+
+
+class IngestRepository:
+    """
+    Gravação em lote das vendas recebidas do PDV. Tudo numa transação
+    (o commit fica com quem chama): ids pré-alocados nas sequences pra
+    ligar filhos aos pais sem RETURNING, e um INSERT ... SELECT unnest(...)
+    por tabela, independente do tamanho do lote.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def _next_ids(self, sequence: str, n: int) -> List[int]:
+        if n == 0:
+            return []
+        res = await self.db.execute(
+            text("SELECT nextval(CAST(:seq AS regclass)) FROM generate_series(1, :n)"),
+            {"seq": sequence, "n": n},
+        )
+        return [int(r[0]) for r in res.fetchall()]
+
+    async def _insert(
+        self,
+        table: str,
+        columns: Sequence[Tuple[str, str]],
+        rows: List[Dict[str, Any]],
+    ) -> int:
+        if not rows:
+            return 0
+        params = {name: [r.get(name) for r in rows] for name, _ in columns}
+        await self.db.execute(text(unnest_insert_sql(table, columns)), params)
+        return len(rows)
+
+    async def _claim_keys(self, sales: List[Dict[str, Any]]) -> Set[int]:
+        """Reivindica (store_id, cod_sale1); devolve os sale_id que ganharam."""
+        res = await self.db.execute(
+            text("""
+                INSERT INTO sale_ingest_keys (store_id, cod_sale1, sale_id, sale_created_at)
+                SELECT *
+                FROM unnest(
+                    CAST(:store_ids AS INTEGER[]),
+                    CAST(:cods AS TEXT[]),
+                    CAST(:sale_ids AS INTEGER[]),
+                    CAST(:created_ats AS TIMESTAMP[])
+                )
+                ON CONFLICT (store_id, cod_sale1) DO NOTHING
+                RETURNING sale_id
+            """),
+            {
+                "store_ids": [s["store_id"] for s in sales],
+                "cods": [s["cod_sale1"] for s in sales],
+                "sale_ids": [s["id"] for s in sales],
+                "created_ats": [s["created_at"] for s in sales],
+            },
+        )
+        return {int(r[0]) for r in res.fetchall()}
+
+    async def write_batch(self, sales: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        ``sales``: dicts no formato de SaleIn (filhos aninhados em
+        products[].items[], delivery.address e payments[]).
+        Duplicadas (no lote ou já gravadas) são ignoradas.
+        """
+        unique: Dict[SaleKey, Dict[str, Any]] = {}
+        for sale in sales:
+            unique.setdefault((sale["store_id"], sale["cod_sale1"]), sale)
+        batch = list(unique.values())
+
+        sale_ids = await self._next_ids("sales_id_seq", len(batch))
+        batch = [{**sale, "id": sid} for sale, sid in zip(batch, sale_ids)]
+        claimed = await self._claim_keys(batch)
+        batch = [sale for sale in batch if sale["id"] in claimed]
+
+        products = [(sale, p) for sale in batch for p in sale.get("products") or []]
+        deliveries = [sale for sale in batch if sale.get("delivery")]
+        product_ids = await self._next_ids("product_sales_id_seq", len(products))
+        delivery_ids = await self._next_ids("delivery_sales_id_seq", len(deliveries))
+
+        product_rows, item_rows = [], []
+        for (sale, product), ps_id in zip(products, product_ids):
+            product_rows.append({**product, "id": ps_id, "sale_id": sale["id"], "sale_created_at": sale["created_at"]})
+            item_rows.extend({**item, "product_sale_id": ps_id} for item in product.get("items") or [])
+
+        delivery_rows, address_rows = [], []
+        for sale, ds_id in zip(deliveries, delivery_ids):
+            delivery = sale["delivery"]
+            delivery_rows.append({**delivery, "id": ds_id, "sale_id": sale["id"]})
+            if delivery.get("address"):
+                address_rows.append({**delivery["address"], "sale_id": sale["id"], "delivery_sale_id": ds_id})
+
+        payment_rows = [{**p, "sale_id": sale["id"]} for sale in batch for p in sale.get("payments") or []]
+
+        # pais antes dos filhos (FK product_sales -> sales)
+        written = {
+            "sales": await self._insert("sales", SALES_COLUMNS, batch),
+            "product_sales": await self._insert("product_sales", PRODUCT_SALES_COLUMNS, product_rows),
+            "item_product_sales": await self._insert("item_product_sales", ITEM_PRODUCT_SALES_COLUMNS, item_rows),
+            "delivery_sales": await self._insert("delivery_sales", DELIVERY_SALES_COLUMNS, delivery_rows),
+            "delivery_addresses": await self._insert("delivery_addresses", DELIVERY_ADDRESSES_COLUMNS, address_rows),
+            "payments": await self._insert("payments", PAYMENTS_COLUMNS, payment_rows),
+        }
+
+        # rollup_dirty_days e NOTIFY saem do trigger de sales (migração 007)
+        store_days = sorted({(sale["store_id"], sale["created_at"].date()) for sale in batch})
+        return {
+            "inserted_keys": {(sale["store_id"], sale["cod_sale1"]) for sale in batch},
+            "store_days": store_days,
+            "written": written,
+        }
@@ -0,0 +1,774 @@
+# app/repositories/rollup_repository.py
+from __future__ import annotations
+
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.bitmaps import RoaringBitmap
+from app.core.geo import GRID_ZOOMS, cell_sql
+from app.core.http_cache import ROLLUPS_CHANNEL
+from app.core.sketches import PRODUCTION_RELATIVE_ACCURACY, DDSketch, HyperLogLog
+from app.repositories.sales_repository import day_bounds
+
+
+class RollupRepository:
+    """
+    Manutenção das tabelas pré-agregadas (app/migrations/*.sql).
+    Cada refresh apaga e recalcula só o recorte (loja, período) pedido,
+    então dá pra rodar incremental por dia sem tocar no histórico.
+    O commit fica com quem chama.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    # ---------------------------------------------------------
+    # helpers básicos
+    # ---------------------------------------------------------
+    @staticmethod
+    def _scope(
+        start_date: date,
+        end_date: date,
+        store_id: Optional[int],
+    ) -> Tuple[str, Dict[str, Any]]:
+        """Recorte no rollup (sale_date)."""
+        filters = ["sale_date BETWEEN :start_date AND :end_date"]
+        params: Dict[str, Any] = {"start_date": start_date, "end_date": end_date}
+        if store_id is not None:
+            filters.append("store_id = :store_id")
+            params["store_id"] = store_id
+        return " AND ".join(filters), params
+
+    @staticmethod
+    def _sales_scope(
+        start_date: date,
+        end_date: date,
+        store_id: Optional[int],
+    ) -> Tuple[str, Dict[str, Any]]:
+        """Mesmo recorte em `sales s`, em TIMESTAMP pra podar partições."""
+        start_ts, end_ts = day_bounds(start_date, end_date)
+        filters = ["s.created_at >= :start_ts AND s.created_at < :end_ts"]
+        params: Dict[str, Any] = {"start_ts": start_ts, "end_ts": end_ts}
+        if store_id is not None:
+            filters.append("s.store_id = :store_id")
+        return " AND ".join(filters), params
+
+    async def bump_data_version(self, store_ids: Optional[Iterable[int]] = None) -> None:
+        """
+        Sobe a versão de dados (store_data_watermark, migração 005) das lojas
+        cujo rollup acabou de ser regravado, na mesma transação. O ETag dos
+        widgets servidos por rollup subiu quando a venda chegou, mas o
+        rollup só muda agora: sem isso, quem perguntou no intervalo guarda o
+        número velho com o ETag novo e recebe 304 dali em diante. O NOTIFY
+        sai no COMMIT e derruba a versão cacheada (WatermarkCache).
+        ``None`` = todas as lojas.
+        """
+        res = await self.db.execute(text("SELECT to_regclass('store_data_watermark') IS NOT NULL"))
+        if not res.scalar():
+            return  # banco sem a 005: não tem ETag por versão pra corrigir
+        ids = None if store_ids is None else sorted(set(store_ids))
+        if ids == []:
+            return
+        await self.db.execute(
+            text("""
+                WITH bumped AS (
+                    UPDATE store_data_watermark
+                    SET version = version + 1, updated_at = now()
+                    WHERE :all_stores OR store_id = ANY(:store_ids)
+                    RETURNING store_id
+                )
+                SELECT pg_notify(:channel, COALESCE(string_agg(store_id::TEXT, ','), ''))
+                FROM bumped
+            """),
+            {"all_stores": ids is None, "store_ids": ids or [], "channel": ROLLUPS_CHANNEL},
+        )
+
+    async def _replace(
+        self,
+        table: str,
+        insert_sql: str,
+        start_date: date,
+        end_date: date,
+        store_id: Optional[int],
+        extra_params: Optional[Dict[str, Any]] = None,
+    ) -> int:
+        where_rollup, params = self._scope(start_date, end_date, store_id)
+        await self.db.execute(text(f"DELETE FROM {table} WHERE {where_rollup}"), params)
+
+        if extra_params:
+            params.update(extra_params)
+        res = await self.db.execute(text(insert_sql), params)
+        return res.rowcount or 0
+
+    # ---------------------------------------------------------
+    # DELIVERY TIME SKETCH
+    # ---------------------------------------------------------
+    async def refresh_delivery_time_sketch(
+        self,
+        start_date: date,
+        end_date: date,
+        store_id: Optional[int] = None,
+    ) -> int:
+        sketch = DDSketch()
+        where_sales, sales_params = self._sales_scope(start_date, end_date, store_id)
+        bucket = sketch.bucket_sql("s.delivery_seconds")
+
+        insert_sql = f"""
+            INSERT INTO delivery_time_sketch_daily (
+                store_id, sale_date, neighborhood, city, bucket,
+                delivery_count, delivery_seconds_sum
+            )
+            SELECT
+                s.store_id,
+                s.created_at::DATE                       AS sale_date,
+                COALESCE(da.neighborhood, 'Sem bairro')  AS neighborhood,
+                COALESCE(da.city, 'Sem cidade')          AS city,
+                {bucket}                                 AS bucket,
+                COUNT(*)                                 AS delivery_count,
+                COALESCE(SUM(s.delivery_seconds), 0)     AS delivery_seconds_sum
+            FROM sales s
+            JOIN delivery_addresses da ON da.sale_id = s.id
+            WHERE s.sale_status_desc = 'COMPLETED'
+              AND {where_sales}
+            GROUP BY 1, 2, 3, 4, 5
+        """
+        return await self._replace(
+            "delivery_time_sketch_daily",
+            insert_sql,
+            start_date,
+            end_date,
+            store_id,
+            extra_params={**sales_params, "sketch_gamma": sketch.gamma},
+        )
+
+    # ---------------------------------------------------------
+    # DELIVERY GRID (lat/long)
+    # ---------------------------------------------------------
+    async def refresh_delivery_grid(
+        self,
+        start_date: date,
+        end_date: date,
+        store_id: Optional[int] = None,
+    ) -> int:
+        where_sales, sales_params = self._sales_scope(start_date, end_date, store_id)
+        cell_x, cell_y = cell_sql("da.latitude", "da.longitude", "g.zoom")
+
+        # um único scan de sales gera todos os zooms (CROSS JOIN com a lista)
+        insert_sql = f"""
+            INSERT INTO delivery_grid_daily (
+                store_id, sale_date, zoom, cell_x, cell_y,
+                delivery_count, timed_count, delivery_seconds_sum,
+                delivery_seconds_min, delivery_seconds_max
+            )
+            SELECT
+                s.store_id,
+                s.created_at::DATE                    AS sale_date,
+                g.zoom,
+                {cell_x}                              AS cell_x,
+                {cell_y}                              AS cell_y,
+                COUNT(*)                              AS delivery_count,
+                COUNT(s.delivery_seconds)             AS timed_count,
+                COALESCE(SUM(s.delivery_seconds), 0)  AS delivery_seconds_sum,
+                MIN(s.delivery_seconds)               AS delivery_seconds_min,
+                MAX(s.delivery_seconds)               AS delivery_seconds_max
+            FROM sales s
+            JOIN delivery_addresses da ON da.sale_id = s.id
+            CROSS JOIN unnest(CAST(:zooms AS SMALLINT[])) AS g(zoom)
+            WHERE s.sale_status_desc = 'COMPLETED'
+              AND da.latitude IS NOT NULL
+              AND da.longitude IS NOT NULL
+              AND {where_sales}
+            GROUP BY 1, 2, 3, 4, 5
+        """
+        return await self._replace(
+            "delivery_grid_daily",
+            insert_sql,
+            start_date,
+            end_date,
+            store_id,
+            extra_params={**sales_params, "zooms": list(GRID_ZOOMS)},
+        )
+
+    # ---------------------------------------------------------
+    # VENDAS POR HORA (matriz dia da semana × hora)
+    # ---------------------------------------------------------
+    async def refresh_sales_hourly(
+        self,
+        start_date: date,
+        end_date: date,
+        store_id: Optional[int] = None,
+    ) -> int:
+        where_sales, sales_params = self._sales_scope(start_date, end_date, store_id)
+        insert_sql = f"""
+            INSERT INTO sales_hourly (
+                store_id, sale_date, hour, channel_id, total_orders, total_sales, customer_orders
+            )
+            SELECT
+                s.store_id,
+                s.created_at::DATE                    AS sale_date,
+                EXTRACT(HOUR FROM s.created_at)       AS hour,
+                s.channel_id,
+                COUNT(*)                              AS total_orders,
+                COALESCE(SUM(s.total_amount), 0)      AS total_sales,
+                COUNT(s.customer_id)                  AS customer_orders
+            FROM sales s
+            WHERE s.sale_status_desc = 'COMPLETED'
+              AND {where_sales}
+            GROUP BY 1, 2, 3, 4
+        """
+        return await self._replace(
+            "sales_hourly", insert_sql, start_date, end_date, store_id, extra_params=sales_params
+        )
+
+    async def refresh_product_sales_hourly(
+        self,
+        start_date: date,
+        end_date: date,
+        store_id: Optional[int] = None,
+    ) -> int:
+        where_sales, sales_params = self._sales_scope(start_date, end_date, store_id)
+        insert_sql = f"""
+            INSERT INTO product_sales_hourly (
+                store_id, sale_date, hour, product_id,
+                total_orders, total_quantity, total_sales
+            )
+            SELECT
+                s.store_id,
+                s.created_at::DATE                    AS sale_date,
+                EXTRACT(HOUR FROM s.created_at)       AS hour,
+                ps.product_id,
+                COUNT(DISTINCT s.id)                  AS total_orders,
+                COALESCE(SUM(ps.quantity), 0)         AS total_quantity,
+                COALESCE(SUM(ps.total_price), 0)      AS total_sales
+            FROM sales s
+            JOIN product_sales ps ON ps.sale_id = s.id AND ps.sale_created_at = s.created_at
+            WHERE s.sale_status_desc = 'COMPLETED'
+              AND {where_sales}
+              AND ps.sale_created_at >= :start_ts AND ps.sale_created_at < :end_ts
+            GROUP BY 1, 2, 3, 4
+        """
+        return await self._replace(
+            "product_sales_hourly", insert_sql, start_date, end_date, store_id, extra_params=sales_params
+        )
+
+    # ---------------------------------------------------------
+    # COZINHA (faixas de 15 min + sketch de produção, migração 014)
+    # ---------------------------------------------------------
+    async def refresh_kitchen_slots(
+        self,
+        start_date: date,
+        end_date: date,
+        store_id: Optional[int] = None,
+    ) -> int:
+        where_sales, sales_params = self._sales_scope(start_date, end_date, store_id)
+        # pedido ocupa a cozinha da faixa em que entrou até a faixa em que
+        # ficou pronto; passou da meia-noite, fica na última faixa do dia
+        insert_sql = f"""
+            INSERT INTO kitchen_slot_daily (
+                store_id, sale_date, slot, channel_id, orders_started, orders_active,
+                production_count, production_seconds_sum, production_seconds_sq_sum
+            )
+            WITH orders AS (
+                SELECT
+                    s.store_id,
+                    s.created_at::DATE AS sale_date,
+                    s.channel_id,
+                    s.production_seconds,
+                    FLOOR(EXTRACT(EPOCH FROM s.created_at::TIME) / 900)::INTEGER AS slot,
+                    LEAST(
+                        95,
+                        FLOOR((EXTRACT(EPOCH FROM s.created_at::TIME) + COALESCE(s.production_seconds, 0)) / 900)
+                    )::INTEGER AS last_slot
+                FROM sales s
+                WHERE s.sale_status_desc = 'COMPLETED'
+                  AND {where_sales}
+            ),
+            started AS (
+                SELECT
+                    store_id, sale_date, slot, channel_id,
+                    COUNT(*)                                                   AS orders_started,
+                    COUNT(production_seconds)                                  AS production_count,
+                    COALESCE(SUM(production_seconds), 0)                       AS production_seconds_sum,
+                    COALESCE(SUM(production_seconds::BIGINT * production_seconds), 0) AS production_seconds_sq_sum
+                FROM orders
+                GROUP BY 1, 2, 3, 4
+            ),
+            active AS (
+                SELECT o.store_id, o.sale_date, g.slot, o.channel_id, COUNT(*) AS orders_active
+                FROM orders o
+                CROSS JOIN LATERAL generate_series(o.slot, o.last_slot) AS g(slot)
+                GROUP BY 1, 2, 3, 4
+            )
+            SELECT
+                a.store_id, a.sale_date, a.slot, a.channel_id,
+                COALESCE(st.orders_started, 0),
+                a.orders_active,
+                COALESCE(st.production_count, 0),
+                COALESCE(st.production_seconds_sum, 0),
+                COALESCE(st.production_seconds_sq_sum, 0)
+            FROM active a
+            LEFT JOIN started st
+              ON st.store_id = a.store_id AND st.sale_date = a.sale_date
+             AND st.slot = a.slot AND st.channel_id = a.channel_id
+        """
+        return await self._replace(
+            "kitchen_slot_daily", insert_sql, start_date, end_date, store_id, extra_params=sales_params
+        )
+
+    async def refresh_kitchen_production_sketch(
+        self,
+        start_date: date,
+        end_date: date,
+        store_id: Optional[int] = None,
+    ) -> int:
+        sketch = DDSketch(PRODUCTION_RELATIVE_ACCURACY)
+        where_sales, sales_params = self._sales_scope(start_date, end_date, store_id)
+        insert_sql = f"""
+            INSERT INTO kitchen_production_sketch_daily (
+                store_id, sale_date, hour, channel_id, bucket, order_count
+            )
+            SELECT
+                s.store_id,
+                s.created_at::DATE,
+                EXTRACT(HOUR FROM s.created_at)::SMALLINT,
+                s.channel_id,
+                {sketch.bucket_sql("s.production_seconds")},
+                COUNT(*)
+            FROM sales s
+            WHERE s.sale_status_desc = 'COMPLETED'
+              AND s.production_seconds IS NOT NULL
+              AND {where_sales}
+            GROUP BY 1, 2, 3, 4, 5
+        """
+        return await self._replace(
+            "kitchen_production_sketch_daily",
+            insert_sql,
+            start_date,
+            end_date,
+            store_id,
+            extra_params={**sales_params, "sketch_gamma": sketch.gamma},
+        )
+
+    # ---------------------------------------------------------
+    # COMPRADOS JUNTOS (pares de produtos por venda, migração 012)
+    # ---------------------------------------------------------
+    async def refresh_product_pairs(
+        self,
+        start_date: date,
+        end_date: date,
+        store_id: Optional[int] = None,
+    ) -> int:
+        where_sales, sales_params = self._sales_scope(start_date, end_date, store_id)
+        # cesta = produtos distintos da venda; o self-join por venda gera só
+        # os pares que existem (os não zeros de Bᵀ·B)
+        insert_sql = f"""
+            INSERT INTO product_pairs_daily (store_id, sale_date, product_a, product_b, orders)
+            WITH basket AS (
+                SELECT DISTINCT
+                    s.store_id,
+                    s.created_at::DATE AS sale_date,
+                    s.id               AS sale_id,
+                    ps.product_id
+                FROM sales s
+                JOIN product_sales ps ON ps.sale_id = s.id AND ps.sale_created_at = s.created_at
+                WHERE s.sale_status_desc = 'COMPLETED'
+                  AND {where_sales}
+                  AND ps.sale_created_at >= :start_ts AND ps.sale_created_at < :end_ts
+            )
+            SELECT a.store_id, a.sale_date, a.product_id, b.product_id, COUNT(*) AS orders
+            FROM basket a
+            JOIN basket b ON b.sale_id = a.sale_id AND b.product_id > a.product_id
+            GROUP BY 1, 2, 3, 4
+        """
+        return await self._replace(
+            "product_pairs_daily", insert_sql, start_date, end_date, store_id, extra_params=sales_params
+        )
+
+    # ---------------------------------------------------------
+    # ADICIONAIS (item_product_sales, migração 013)
+    # ---------------------------------------------------------
+    async def refresh_addon_sales(
+        self,
+        start_date: date,
+        end_date: date,
+        store_id: Optional[int] = None,
+    ) -> int:
+        where_sales, sales_params = self._sales_scope(start_date, end_date, store_id)
+        insert_sql = f"""
+            INSERT INTO addon_sales_daily (
+                store_id, sale_date, product_id, item_id, product_lines, quantity, revenue
+            )
+            SELECT
+                s.store_id,
+                s.created_at::DATE,
+                ps.product_id,
+                ips.item_id,
+                COUNT(DISTINCT ps.id),
+                COALESCE(SUM(ips.quantity * ps.quantity), 0),
+                COALESCE(SUM(ips.additional_price * ips.quantity * ps.quantity), 0)
+            FROM sales s
+            JOIN product_sales ps ON ps.sale_id = s.id AND ps.sale_created_at = s.created_at
+            JOIN item_product_sales ips ON ips.product_sale_id = ps.id
+            WHERE s.sale_status_desc = 'COMPLETED'
+              AND {where_sales}
+              AND ps.sale_created_at >= :start_ts AND ps.sale_created_at < :end_ts
+            GROUP BY 1, 2, 3, 4
+        """
+        return await self._replace(
+            "addon_sales_daily", insert_sql, start_date, end_date, store_id, extra_params=sales_params
+        )
+
+    async def refresh_addon_products(
+        self,
+        start_date: date,
+        end_date: date,
+        store_id: Optional[int] = None,
+    ) -> int:
+        where_sales, sales_params = self._sales_scope(start_date, end_date, store_id)
+        insert_sql = f"""
+            INSERT INTO addon_product_daily (
+                store_id, sale_date, product_id, product_lines, lines_with_addons, addon_revenue
+            )
+            WITH lines AS (
+                SELECT s.store_id, s.created_at::DATE AS sale_date, ps.product_id, ps.id, ps.quantity
+                FROM sales s
+                JOIN product_sales ps ON ps.sale_id = s.id AND ps.sale_created_at = s.created_at
+                WHERE s.sale_status_desc = 'COMPLETED'
+                  AND {where_sales}
+                  AND ps.sale_created_at >= :start_ts AND ps.sale_created_at < :end_ts
+            ),
+            addons AS (
+                -- adicional por unidade do produto, uma linha por product_sale
+                SELECT ips.product_sale_id, SUM(ips.additional_price * ips.quantity) AS unit_revenue
+                FROM lines l
+                JOIN item_product_sales ips ON ips.product_sale_id = l.id
+                GROUP BY 1
+            )
+            SELECT
+                l.store_id,
+                l.sale_date,
+                l.product_id,
+                COUNT(*),
+                COUNT(a.product_sale_id),
+                COALESCE(SUM(a.unit_revenue * l.quantity), 0)
+            FROM lines l
+            LEFT JOIN addons a ON a.product_sale_id = l.id
+            GROUP BY 1, 2, 3
+        """
+        return await self._replace(
+            "addon_product_daily", insert_sql, start_date, end_date, store_id, extra_params=sales_params
+        )
+
+    async def refresh_product_affinity(
+        self,
+        end_date: date,
+        window_days: int = 90,
+        store_id: Optional[int] = None,
+        top_n: int = 20,
+        min_pair_orders: int = 3,
+    ) -> int:
+        """
+        Reconstrói product_affinity da janela [end_date - window_days + 1,
+        end_date] a partir dos rollups diários. Pares com menos de
+        ``min_pair_orders`` vendas ficam de fora (lift de par raro é ruído).
+        """
+        start_date = end_date - timedelta(days=window_days - 1)
+        store_filter = "AND store_id = :store_id" if store_id is not None else ""
+        params: Dict[str, Any] = {
+            "start_date": start_date,
+            "end_date": end_date,
+            "store_id": store_id,
+            "top_n": top_n,
+            "min_pair_orders": min_pair_orders,
+        }
+        await self.db.execute(
+            text(f"DELETE FROM product_affinity WHERE TRUE {store_filter}"), params
+        )
+        res = await self.db.execute(
+            text(f"""
+                INSERT INTO product_affinity (
+                    store_id, product_id, rank, related_product_id, pair_orders,
+                    product_orders, related_orders, baskets, support, confidence, lift,
+                    window_start, window_end
+                )
+                WITH pairs AS (
+                    SELECT store_id, product_a, product_b, SUM(orders) AS pair_orders
+                    FROM product_pairs_daily
+                    WHERE sale_date BETWEEN :start_date AND :end_date {store_filter}
+                    GROUP BY 1, 2, 3
+                    HAVING SUM(orders) >= :min_pair_orders
+                ),
+                directed AS (
+                    SELECT store_id, product_a AS product_id, product_b AS related_product_id, pair_orders FROM pairs
+                    UNION ALL
+                    SELECT store_id, product_b, product_a, pair_orders FROM pairs
+                ),
+                product_orders AS (
+                    SELECT store_id, product_id, SUM(total_orders) AS orders
+                    FROM product_sales_hourly
+                    WHERE sale_date BETWEEN :start_date AND :end_date {store_filter}
+                    GROUP BY 1, 2
+                ),
+                baskets AS (
+                    SELECT store_id, SUM(total_orders) AS baskets
+                    FROM sales_hourly
+                    WHERE sale_date BETWEEN :start_date AND :end_date {store_filter}
+                    GROUP BY 1
+                ),
+                scored AS (
+                    SELECT
+                        d.store_id,
+                        d.product_id,
+                        d.related_product_id,
+                        d.pair_orders,
+                        pa.orders AS product_orders,
+                        pb.orders AS related_orders,
+                        b.baskets,
+                        d.pair_orders::FLOAT / b.baskets                      AS support,
+                        d.pair_orders::FLOAT / pa.orders                      AS confidence,
+                        d.pair_orders::FLOAT * b.baskets / (pa.orders * pb.orders) AS lift
+                    FROM directed d
+                    JOIN product_orders pa ON pa.store_id = d.store_id AND pa.product_id = d.product_id
+                    JOIN product_orders pb ON pb.store_id = d.store_id AND pb.product_id = d.related_product_id
+                    JOIN baskets b ON b.store_id = d.store_id
+                    WHERE b.baskets > 0
+                ),
+                ranked AS (
+                    SELECT
+                        scored.*,
+                        ROW_NUMBER() OVER (
+                            PARTITION BY store_id, product_id
+                            ORDER BY confidence DESC, lift DESC, related_product_id
+                        ) AS rank
+                    FROM scored
+                )
+                SELECT
+                    store_id, product_id, rank, related_product_id, pair_orders,
+                    product_orders, related_orders, baskets, support, confidence, lift,
+                    :start_date, :end_date
+                FROM ranked
+                WHERE rank <= :top_n
+            """),
+            params,
+        )
+        await self.bump_data_version(None if store_id is None else [store_id])
+        return res.rowcount or 0
+
+    # ---------------------------------------------------------
+    # CLIENTES ÚNICOS (HyperLogLog por loja/dia/canal)
+    # ---------------------------------------------------------
+    async def refresh_customer_hll(
+        self,
+        start_date: date,
+        end_date: date,
+        store_id: Optional[int] = None,
+    ) -> int:
+        sketch = HyperLogLog()
+        where_sales, sales_params = self._sales_scope(start_date, end_date, store_id)
+        insert_sql = f"""
+            INSERT INTO customer_hll_daily (store_id, sale_date, channel_id, register, rank)
+            SELECT
+                s.store_id,
+                s.created_at::DATE                          AS sale_date,
+                s.channel_id,
+                {sketch.register_sql("s.customer_id")}      AS register,
+                MAX({sketch.rank_sql("s.customer_id")})     AS rank
+            FROM sales s
+            WHERE s.sale_status_desc = 'COMPLETED'
+              AND s.customer_id IS NOT NULL
+              AND {where_sales}
+            GROUP BY 1, 2, 3, 4
+        """
+        return await self._replace(
+            "customer_hll_daily", insert_sql, start_date, end_date, store_id, extra_params=sales_params
+        )
+
+    # ---------------------------------------------------------
+    # COORTES (bitmap de clientes por loja/mês, migração 011)
+    # ---------------------------------------------------------
+    async def refresh_customer_month(self, month: date, store_id: Optional[int] = None) -> int:
+        """
+        Recalcula os bitmaps de ``month`` (qualquer dia do mês). Depende do
+        ``seen`` do último mês anterior já gravado: meses vão em ordem, e
+        mexer num mês passado pede recalcular os seguintes também.
+        """
+        month = month.replace(day=1)
+        next_month = (month + timedelta(days=32)).replace(day=1)
+        where_sales, params = self._sales_scope(month, next_month - timedelta(days=1), store_id)
+        res = await self.db.execute(
+            text(f"""
+                SELECT s.store_id, array_agg(DISTINCT s.customer_id) AS customers
+                FROM sales s
+                WHERE s.sale_status_desc = 'COMPLETED'
+                  AND s.customer_id IS NOT NULL
+                  AND {where_sales}
+                GROUP BY s.store_id
+            """),
+            {**params, **({"store_id": store_id} if store_id is not None else {})},
+        )
+        active = {int(r[0]): RoaringBitmap(r[1]) for r in res.fetchall()}
+
+        store_filter = "AND store_id = :store_id" if store_id is not None else ""
+        res = await self.db.execute(
+            text(f"""
+                SELECT DISTINCT ON (store_id) store_id, seen
+                FROM customer_month_bitmap
+                WHERE month < :month {store_filter}
+                ORDER BY store_id, month DESC
+            """),
+            {"month": month, "store_id": store_id},
+        )
+        seen_before = {int(r[0]): RoaringBitmap.from_bytes(r[1]) for r in res.fetchall()}
+
+        rows = []
+        for sid, customers in active.items():
+            before = seen_before.get(sid, RoaringBitmap())
+            new = customers - before
+            rows.append({
+                "store_id": sid,
+                "month": month,
+                "active_count": len(customers),
+                "new_count": len(new),
+                "active": customers.to_bytes(),
+                "new_customers": new.to_bytes(),
+                "seen": (before | customers).to_bytes(),
+            })
+
+        await self.db.execute(
+            text(f"DELETE FROM customer_month_bitmap WHERE month = :month {store_filter}"),
+            {"month": month, "store_id": store_id},
+        )
+        if rows:
+            await self.db.execute(
+                text("""
+                    INSERT INTO customer_month_bitmap (
+                        store_id, month, active_count, new_count, active, new_customers, seen
+                    )
+                    VALUES (:store_id, :month, :active_count, :new_count, :active, :new_customers, :seen)
+                """),
+                rows,
+            )
+        await self.bump_data_version(None if store_id is None else [store_id])
+        return len(rows)
+
+    async def refresh_all(
+        self,
+        start_date: date,
+        end_date: date,
+        store_id: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Recalcula todos os rollups no recorte; devolve linhas gravadas por tabela."""
+        refreshed = [
+            ("delivery_time_sketch_daily", self.refresh_delivery_time_sketch),
+            ("delivery_grid_daily", self.refresh_delivery_grid),
+            ("sales_hourly", self.refresh_sales_hourly),
+            ("product_sales_hourly", self.refresh_product_sales_hourly),
+            ("customer_hll_daily", self.refresh_customer_hll),
+            ("product_pairs_daily", self.refresh_product_pairs),
+            ("addon_sales_daily", self.refresh_addon_sales),
+            ("addon_product_daily", self.refresh_addon_products),
+            ("kitchen_slot_daily", self.refresh_kitchen_slots),
+            ("kitchen_production_sketch_daily", self.refresh_kitchen_production_sketch),
+        ]
+        out: List[Dict[str, Any]] = []
+        for table, refresh in refreshed:
+            rows = await refresh(start_date, end_date, store_id)
+            out.append({"table": table, "rows": rows})
+        await self.extend_coverage(start_date, end_date, store_id)
+        return out
+
+    async def extend_coverage(self, start_date: date, end_date: date, store_id: Optional[int] = None) -> None:
+        """
+        Junta o recorte recalculado ao período coberto da loja (migração 015)
+        quando encosta, sobrepõe ou o buraco entre os dois não tem venda
+        nenhuma da loja (loja fechada no domingo não tem dia pendente pra
+        drenar, e o rollup vazio daquele dia já está certo). Buraco com venda
+        não vira cobertura: o rollup dele pode nunca ter sido calculado.
+        Loja sem linha ainda começa pelo recorte.
+        """
+        res = await self.db.execute(text("SELECT to_regclass('rollup_coverage') IS NOT NULL"))
+        if not res.scalar():
+            return
+        store_filter = "WHERE st.id = :store_id" if store_id is not None else ""
+        params = {"start_date": start_date, "end_date": end_date, "store_id": store_id}
+        # dois drenos na mesma loja: o segundo espera e lê a cobertura já estendida
+        await self.db.execute(
+            text(f"""
+                SELECT c.store_id FROM rollup_coverage c JOIN stores st ON st.id = c.store_id
+                {store_filter}
+                FOR UPDATE OF c
+            """),
+            params,
+        )
+        await self.db.execute(
+            text(f"""
+                INSERT INTO rollup_coverage AS c (store_id, covered_from, covered_to)
+                SELECT
+                    store_id,
+                    CASE WHEN joins THEN LEAST(COALESCE(covered_from, :start_date), :start_date) ELSE covered_from END,
+                    CASE WHEN joins THEN GREATEST(COALESCE(covered_to, :end_date), :end_date) ELSE covered_to END
+                FROM (
+                    SELECT
+                        st.id AS store_id,
+                        cur.covered_from,
+                        cur.covered_to,
+                        cur.store_id IS NULL OR NOT EXISTS (
+                            SELECT 1
+                            FROM sales s
+                            WHERE s.store_id = st.id
+                              AND (
+                                  (s.created_at >= cur.covered_to + 1 AND s.created_at < CAST(:start_date AS DATE))
+                                  OR (s.created_at >= CAST(:end_date AS DATE) + 1 AND s.created_at < cur.covered_from)
+                              )
+                        ) AS joins
+                    FROM stores st
+                    LEFT JOIN rollup_coverage cur ON cur.store_id = st.id
+                    {store_filter}
+                ) merged
+                ON CONFLICT (store_id) DO UPDATE SET
+                    covered_from = EXCLUDED.covered_from,
+                    covered_to = EXCLUDED.covered_to,
+                    updated_at = now()
+            """),
+            params,
+        )
+
+    # ---------------------------------------------------------
+    # DIAS PENDENTES (rollup_dirty_days, migrações 006/007)
+    # ---------------------------------------------------------
+    async def claim_dirty_days(self, limit: int = 500) -> List[Tuple[int, date, float]]:
+        """
+        Tira até ``limit`` (loja, dia) da fila de pendentes. O DELETE fica na
+        transação do refresh: se o refresh falhar, o rollback devolve a marca.
+        SKIP LOCKED deixa dois workers drenarem sem pegar o mesmo dia.
+        Devolve (loja, dia, segundos desde a marca).
+        """
+        res = await self.db.execute(
+            text("""
+                DELETE FROM rollup_dirty_days d
+                USING (
+                    SELECT store_id, sale_date
+                    FROM rollup_dirty_days
+                    ORDER BY marked_at
+                    LIMIT :limit
+                    FOR UPDATE SKIP LOCKED
+                ) pick
+                WHERE d.store_id = pick.store_id
+                  AND d.sale_date = pick.sale_date
+                RETURNING d.store_id, d.sale_date, EXTRACT(EPOCH FROM now() - d.marked_at)
+            """),
+            {"limit": limit},
+        )
+        return sorted((int(r[0]), r[1], float(r[2] or 0)) for r in res.fetchall())
+
+    async def refresh_dirty(self, limit: int = 500) -> List[Dict[str, Any]]:
+        """Recalcula só os (loja, dia) pendentes; devolve o que foi feito."""
+        out: List[Dict[str, Any]] = []
+        for store_id, day, lag_seconds in await self.claim_dirty_days(limit):
+            stats = await self.refresh_all(day, day, store_id)
+            out.append({"store_id": store_id, "sale_date": day, "lag_seconds": lag_seconds, "tables": stats})
+        await self.bump_data_version(d["store_id"] for d in out)
+        return out
@@ -1,21 +1,121 @@
 # app/repositories/sales_repository.py
 from __future__ import annotations
 
-from datetime import date, timedelta
-from typing import Any, Dict, List, Optional
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Tuple
 
 from sqlalchemy import text, bindparam
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.bitmaps import RoaringBitmap
+from app.core.sampling import BLOCK_SQL, CONFIDENCE_LEVEL, SAMPLE_SEED, BlockEstimate, ci
+from app.core.sketches import PRODUCTION_RELATIVE_ACCURACY, DDSketch, HyperLogLog, NO_VALUE_BUCKET
+from app.repositories.dimension_cache import DimensionCache, named
+
+
+def day_bounds(start_date: date, end_date: date) -> Tuple[datetime, datetime]:
+    """
+    Período [start_date, end_date] como intervalo semiaberto de TIMESTAMP.
+    Filtrar `created_at >= início AND created_at < fim` (em vez de
+    `created_at::DATE BETWEEN`) deixa o planner podar as partições mensais
+    e usar o índice (store_id, created_at).
+    """
+    return (
+        datetime.combine(start_date, time.min),
+        datetime.combine(end_date + timedelta(days=1), time.min),
+    )
+
+
+def _change_pct(current: float, previous: float) -> float:
+    if not previous:
+        return 0.0
+    return round((current - previous) / previous * 100, 2)
+
+
+def overview_from_cells(
+    cells: List[Dict[str, Any]],
+    start_date: date,
+    end_date: date,
+    scale: float = 1.0,
+) -> Dict[str, Any]:
+    """
+    Revenue overview (mesmo formato do SQL cru, com ``channel_id`` no lugar
+    do nome) a partir de células (sale_date, channel_id, pedidos,
+    faturamento) do período e do anterior. ``scale`` sobe a amostra pro total.
+    """
+    total_sales = previous_sales = 0.0
+    total_orders = previous_orders = 0.0
+    daily: Dict[date, List[float]] = {}
+    channels: Dict[int, float] = {}
+    for c in cells:
+        sales = float(c["total_sales"] or 0) * scale
+        orders = float(c["total_orders"] or 0) * scale
+        if c["sale_date"] < start_date:
+            previous_sales += sales
+            previous_orders += orders
+            continue
+        if c["sale_date"] > end_date:
+            continue
+        total_sales += sales
+        total_orders += orders
+        day = daily.setdefault(c["sale_date"], [0.0, 0.0])
+        day[0] += sales
+        day[1] += orders
+        channels[c["channel_id"]] = channels.get(c["channel_id"], 0.0) + sales
+
+    total_orders_int = int(round(total_orders))
+    return {
+        "total_sales": round(total_sales, 2),
+        "total_orders": total_orders_int,
+        "average_ticket": total_sales / total_orders if total_orders else 0.0,
+        "sales_change_pct": _change_pct(total_sales, previous_sales),
+        "orders_change_pct": _change_pct(total_orders, previous_orders),
+        "top_channels": [
+            {
+                "channel_id": cid,
+                "total_sales": round(value, 2),
+                "share_pct": round(value / total_sales * 100, 2) if total_sales > 0 else 0,
+            }
+            for cid, value in sorted(channels.items(), key=lambda kv: -kv[1])
+        ],
+        "daily_breakdown": [
+            {"sale_date": day.isoformat(), "total_sales": round(v[0], 2), "total_orders": int(round(v[1]))}
+            for day, v in sorted(daily.items())
+        ],
+    }
+
+
+def customer_stats(sketch: HyperLogLog, customer_orders: int) -> Dict[str, Any]:
+    """
+    Clientes únicos (HLL) e taxa de recompra: % dos pedidos com cliente
+    identificado que não são o primeiro dele no período.
+    """
+    unique = sketch.count()
+    if customer_orders:
+        unique = min(unique, customer_orders)  # o HLL pode passar um pouco
+    return {
+        "unique_customers": unique,
+        # intervalo de 95% do HLL (± % da contagem)
+        "unique_customers_error_pct": round(1.96 * sketch.standard_error * 100, 2),
+        "repeat_rate_pct": (
+            round((customer_orders - unique) / customer_orders * 100, 2) if customer_orders else None
+        ),
+    }
+
 
 class SalesRepository:
     """
     Camada de acesso a dados.
     Tudo que é SQL direto fica aqui.
+
+    As consultas agrupam por id (loja, canal, produto) e os nomes vêm do
+    ``DimensionCache`` depois; sem cache compartilhado, cada repositório
+    usa um próprio (carrega na primeira consulta que precisar).
     """
 
-    def __init__(self, db: AsyncSession):
+    def __init__(self, db: AsyncSession, dimensions: Optional[DimensionCache] = None):
         self.db = db
+        self.dimensions = dimensions if dimensions is not None else DimensionCache()
 
     # ---------------------------------------------------------
     # helpers básicos
@@ -27,6 +127,13 @@ class SalesRepository:
     async def _rows(self, result) -> List[Dict[str, Any]]:
         return [dict(r) for r in result.mappings().all()]
 
+    async def _names(self, table: str, ids) -> Dict[int, str]:
+        return await self.dimensions.names(self.db, table, ids)
+
+    async def _channel_ids(self, channel: str) -> List[int]:
+        # filtro por nome do canal vira channel_id = ANY(...): sem JOIN em channels
+        return await self.dimensions.ids_for(self.db, "channels", channel)
+
     # ---------------------------------------------------------
     # TOP PRODUCTS
     # ---------------------------------------------------------
@@ -53,8 +160,8 @@ class SalesRepository:
         prev_filters = ["s.store_id = :store_id", "s.sale_status_desc = 'COMPLETED'"]
 
         if channel:
-            filters.append("ch.name = :channel_name")
-            prev_filters.append("ch.name = :channel_name")
+            filters.append("s.channel_id = ANY(:channel_ids)")
+            prev_filters.append("s.channel_id = ANY(:channel_ids)")
 
         if day_of_week is not None:
             pg_dow = day_of_week % 7
@@ -65,8 +172,11 @@ class SalesRepository:
             filters.append("EXTRACT(HOUR FROM s.created_at) BETWEEN :hour_start AND :hour_end")
             prev_filters.append("EXTRACT(HOUR FROM s.created_at) BETWEEN :hour_start AND :hour_end")
 
-        filters.append("s.created_at::DATE BETWEEN :start_date AND :end_date")
-        prev_filters.append("s.created_at::DATE BETWEEN :prev_start AND :prev_end")
+        filters.append("s.created_at >= :start_ts AND s.created_at < :end_ts")
+        prev_filters.append("s.created_at >= :prev_start_ts AND s.created_at < :prev_end_ts")
+        # product_sales carrega a data da venda: poda as partições dos dois lados
+        filters.append("ps.sale_created_at >= :start_ts AND ps.sale_created_at < :end_ts")
+        prev_filters.append("ps.sale_created_at >= :prev_start_ts AND ps.sale_created_at < :prev_end_ts")
 
         where_current = " AND ".join(filters)
         where_prev = " AND ".join(prev_filters)
@@ -74,33 +184,29 @@ class SalesRepository:
         query = text(f"""
         WITH current_period AS (
             SELECT 
-                p.name AS product_name,
+                ps.product_id,
                 SUM(ps.quantity) AS total_quantity,
                 SUM(ps.total_price) AS total_revenue
             FROM sales s
-            JOIN channels ch ON ch.id = s.channel_id
-            JOIN product_sales ps ON ps.sale_id = s.id
-            JOIN products p ON p.id = ps.product_id
+            JOIN product_sales ps ON ps.sale_id = s.id AND ps.sale_created_at = s.created_at
             WHERE {where_current}
-            GROUP BY p.name
+            GROUP BY ps.product_id
         ),
         previous_period AS (
             SELECT 
-                p.name AS product_name,
+                ps.product_id,
                 SUM(ps.quantity) AS total_quantity
             FROM sales s
-            JOIN channels ch ON ch.id = s.channel_id
-            JOIN product_sales ps ON ps.sale_id = s.id
-            JOIN products p ON p.id = ps.product_id
+            JOIN product_sales ps ON ps.sale_id = s.id AND ps.sale_created_at = s.created_at
             WHERE {where_prev}
-            GROUP BY p.name
+            GROUP BY ps.product_id
         ),
         totals AS (
             SELECT COALESCE(SUM(total_revenue), 0) AS total_rev
             FROM current_period
         )
         SELECT 
-            cp.product_name,
+            cp.product_id,
             cp.total_quantity,
             cp.total_revenue,
             CASE 
@@ -115,21 +221,23 @@ class SalesRepository:
             END AS wow_change_pct
         FROM current_period cp
         CROSS JOIN totals t
-        LEFT JOIN previous_period pp ON pp.product_name = cp.product_name
+        LEFT JOIN previous_period pp ON pp.product_id = cp.product_id
         ORDER BY cp.total_revenue DESC
         LIMIT :limit;
         """)
 
+        start_ts, end_ts = day_bounds(start_date, end_date)
+        prev_start_ts, prev_end_ts = day_bounds(prev_start, prev_end)
         params: Dict[str, Any] = {
             "store_id": store_id,
-            "start_date": start_date,
-            "end_date": end_date,
-            "prev_start": prev_start,
-            "prev_end": prev_end,
+            "start_ts": start_ts,
+            "end_ts": end_ts,
+            "prev_start_ts": prev_start_ts,
+            "prev_end_ts": prev_end_ts,
             "limit": limit,
         }
         if channel:
-            params["channel_name"] = channel
+            params["channel_ids"] = await self._channel_ids(channel)
         if day_of_week is not None:
             params["dow"] = day_of_week % 7
         if hour_start is not None and hour_end is not None:
@@ -137,7 +245,9 @@ class SalesRepository:
             params["hour_end"] = hour_end
 
         res = await self._execute(query, params)
-        return await self._rows(res)
+        rows = await self._rows(res)
+        names = await self._names("products", [r["product_id"] for r in rows])
+        return [named(r, "product_id", "product_name", names, keep_id=True) for r in rows]
 
     # ---------------------------------------------------------
     # DELIVERY HEATMAP
@@ -147,7 +257,84 @@ class SalesRepository:
         store_id: int,
         start_date: Optional[date],
         end_date: Optional[date],
+        limit: Optional[int] = None,
+        after: Optional[List[Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Paginação keyset por (delivery_count DESC, neighborhood, city):
+        ``after`` é a chave da última linha da página anterior e vêm até
+        ``limit + 1`` linhas. ``total_estimate`` = total de regiões.
+        """
+        if end_date is None:
+            end_date = date.today()
+        if start_date is None:
+            start_date = end_date.replace(day=1)
+
+        start_ts, end_ts = day_bounds(start_date, end_date)
+        params: Dict[str, Any] = {
+            "store_id": store_id,
+            "start_ts": start_ts,
+            "end_ts": end_ts,
+        }
+
+        keyset = ""
+        if after is not None:
+            keyset = """
+            WHERE delivery_count < :after_count
+               OR (delivery_count = :after_count AND (neighborhood, city) > (:after_neighborhood, :after_city))
+            """
+            params.update(
+                after_count=int(after[0]),
+                after_neighborhood=after[1],
+                after_city=after[2],
+            )
+        page = ""
+        if limit is not None:
+            page = "LIMIT :limit"
+            params["limit"] = limit + 1
+
+        sql = text(
+            f"""
+            WITH regions AS (
+                SELECT
+                    COALESCE(da.neighborhood, 'Sem bairro') AS neighborhood,
+                    COALESCE(da.city, 'Sem cidade')         AS city,
+                    COUNT(*)                                 AS delivery_count,
+                    AVG(s.delivery_seconds)                  AS avg_delivery_seconds
+                FROM sales s
+                JOIN delivery_addresses da ON da.sale_id = s.id
+                WHERE s.store_id = :store_id
+                  AND s.sale_status_desc = 'COMPLETED'
+                  AND s.created_at >= :start_ts AND s.created_at < :end_ts
+                GROUP BY COALESCE(da.neighborhood, 'Sem bairro'),
+                         COALESCE(da.city, 'Sem cidade')
+            ),
+            counted AS (
+                SELECT regions.*, COUNT(*) OVER () AS total_estimate
+                FROM regions
+            )
+            SELECT *
+            FROM counted
+            {keyset}
+            ORDER BY delivery_count DESC, neighborhood, city
+            {page}
+            """
+        )
+        res = await self._execute(sql, params)
+        return await self._rows(res)
+
+    async def get_delivery_heatmap_percentiles(
+        self,
+        store_id: int,
+        start_date: Optional[date],
+        end_date: Optional[date],
     ) -> List[Dict[str, Any]]:
+        """
+        Mesmo formato do heatmap acima + p50/p90/p99, lido do rollup
+        delivery_time_sketch_daily. Só soma contagens por bucket (dias x buckets),
+        nunca ordena as entregas. Lê o que tiver no rollup: não confere a
+        cobertura, isso fica com quem chama (QueryPlanner.rollup_covers).
+        """
         if end_date is None:
             end_date = date.today()
         if start_date is None:
@@ -156,17 +343,84 @@ class SalesRepository:
         sql = text(
             """
             SELECT
-                COALESCE(da.neighborhood, 'Sem bairro') AS neighborhood,
-                COALESCE(da.city, 'Sem cidade')         AS city,
-                COUNT(*)                                 AS delivery_count,
-                AVG(s.delivery_seconds)                  AS avg_delivery_seconds
-            FROM sales s
-            JOIN delivery_addresses da ON da.sale_id = s.id
-            WHERE s.store_id = :store_id
-              AND s.sale_status_desc = 'COMPLETED'
-              AND s.created_at::date BETWEEN :start_date AND :end_date
-            GROUP BY COALESCE(da.neighborhood, 'Sem bairro'),
-                     COALESCE(da.city, 'Sem cidade')
+                neighborhood,
+                city,
+                bucket,
+                SUM(delivery_count)       AS delivery_count,
+                SUM(delivery_seconds_sum) AS delivery_seconds_sum
+            FROM delivery_time_sketch_daily
+            WHERE store_id = :store_id
+              AND sale_date BETWEEN :start_date AND :end_date
+            GROUP BY neighborhood, city, bucket
+            """
+        )
+        res = await self._execute(
+            sql,
+            {
+                "store_id": store_id,
+                "start_date": start_date,
+                "end_date": end_date,
+            },
+        )
+
+        regions: Dict[tuple, Dict[str, Any]] = {}
+        for r in await self._rows(res):
+            key = (r["neighborhood"], r["city"])
+            region = regions.get(key)
+            if region is None:
+                region = regions[key] = {
+                    "neighborhood": r["neighborhood"],
+                    "city": r["city"],
+                    "delivery_count": 0,
+                    "_seconds_sum": 0,
+                    "_sketch": DDSketch(),
+                }
+            region["delivery_count"] += int(r["delivery_count"])
+            if r["bucket"] != NO_VALUE_BUCKET:
+                region["_seconds_sum"] += int(r["delivery_seconds_sum"])
+                region["_sketch"].add_bucket(r["bucket"], int(r["delivery_count"]))
+
+        out: List[Dict[str, Any]] = []
+        for region in regions.values():
+            sketch: DDSketch = region.pop("_sketch")
+            seconds_sum = region.pop("_seconds_sum")
+            timed = sketch.count
+            region["avg_delivery_seconds"] = seconds_sum / timed if timed else None
+            for label, q in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99)):
+                value = sketch.quantile(q)
+                region[f"{label}_delivery_seconds"] = round(value, 1) if value is not None else None
+            out.append(region)
+
+        out.sort(key=lambda r: (-r["delivery_count"], r["neighborhood"], r["city"]))
+        return out
+
+    async def get_delivery_grid(
+        self,
+        store_id: int,
+        start_date: date,
+        end_date: date,
+        zoom: int,
+    ) -> List[List[Any]]:
+        """
+        Células da grade lat/long (rollup delivery_grid_daily) já no formato
+        compacto [cell_x, cell_y, delivery_count, avg_s, min_s, max_s].
+        """
+        sql = text(
+            """
+            SELECT
+                cell_x,
+                cell_y,
+                SUM(delivery_count)::INTEGER                       AS delivery_count,
+                CASE WHEN SUM(timed_count) > 0
+                    THEN ROUND(SUM(delivery_seconds_sum)::NUMERIC / SUM(timed_count), 1)
+                END                                                AS avg_delivery_seconds,
+                MIN(delivery_seconds_min)                          AS min_delivery_seconds,
+                MAX(delivery_seconds_max)                          AS max_delivery_seconds
+            FROM delivery_grid_daily
+            WHERE store_id = :store_id
+              AND zoom = :zoom
+              AND sale_date BETWEEN :start_date AND :end_date
+            GROUP BY cell_x, cell_y
             ORDER BY delivery_count DESC
             """
         )
@@ -174,34 +428,190 @@ class SalesRepository:
             sql,
             {
                 "store_id": store_id,
+                "zoom": zoom,
                 "start_date": start_date,
                 "end_date": end_date,
             },
         )
+        return [
+            [
+                r["cell_x"],
+                r["cell_y"],
+                r["delivery_count"],
+                float(r["avg_delivery_seconds"]) if r["avg_delivery_seconds"] is not None else None,
+                r["min_delivery_seconds"],
+                r["max_delivery_seconds"],
+            ]
+            for r in await self._rows(res)
+        ]
+
+    # ---------------------------------------------------------
+    # MATRIZ DIA DA SEMANA × HORA (rollups da migração 008)
+    # ---------------------------------------------------------
+    async def get_hourly_matrix(
+        self,
+        store_id: int,
+        start_date: date,
+        end_date: date,
+        channel: Optional[str] = None,
+        product_id: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Pedidos/faturamento por (dow ISO 1-7, hora) somados dos rollups por
+        hora: sales_hourly (total ou por canal) ou product_sales_hourly (por
+        produto, com quantidade). Só vêm as células com venda.
+        """
+        params: Dict[str, Any] = {
+            "store_id": store_id,
+            "start_date": start_date,
+            "end_date": end_date,
+        }
+        if product_id is not None:
+            params["product_id"] = product_id
+            sql = text("""
+                SELECT
+                    EXTRACT(ISODOW FROM h.sale_date)::INTEGER AS dow,
+                    h.hour::INTEGER                         AS hour,
+                    SUM(h.total_orders)::INTEGER            AS total_orders,
+                    SUM(h.total_sales)                      AS total_sales,
+                    SUM(h.total_quantity)                   AS total_quantity
+                FROM product_sales_hourly h
+                WHERE h.store_id = :store_id
+                  AND h.product_id = :product_id
+                  AND h.sale_date BETWEEN :start_date AND :end_date
+                GROUP BY 1, 2
+            """)
+        else:
+            channel_filter = ""
+            if channel:
+                channel_filter = "AND h.channel_id = ANY(:channel_ids)"
+                params["channel_ids"] = await self._channel_ids(channel)
+            sql = text(f"""
+                SELECT
+                    EXTRACT(ISODOW FROM h.sale_date)::INTEGER AS dow,
+                    h.hour::INTEGER                         AS hour,
+                    SUM(h.total_orders)::INTEGER            AS total_orders,
+                    SUM(h.total_sales)                      AS total_sales
+                FROM sales_hourly h
+                WHERE h.store_id = :store_id
+                  AND h.sale_date BETWEEN :start_date AND :end_date
+                  {channel_filter}
+                GROUP BY 1, 2
+            """)
+        res = await self._execute(sql, params)
+        return await self._rows(res)
+
+    async def get_hourly_matrix_raw(
+        self,
+        store_id: int,
+        start_date: date,
+        end_date: date,
+        channel: Optional[str] = None,
+        product_id: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Mesmas células do get_hourly_matrix, direto de sales/product_sales,
+        pro período que o rollup por hora ainda não cobre (ver
+        QueryPlanner.rollup_covers).
+        """
+        start_ts, end_ts = day_bounds(start_date, end_date)
+        params: Dict[str, Any] = {"store_id": store_id, "start_ts": start_ts, "end_ts": end_ts}
+        if product_id is not None:
+            params["product_id"] = product_id
+            sql = text("""
+                SELECT
+                    EXTRACT(ISODOW FROM s.created_at)::INTEGER AS dow,
+                    EXTRACT(HOUR FROM s.created_at)::INTEGER   AS hour,
+                    COUNT(DISTINCT s.id)::INTEGER              AS total_orders,
+                    COALESCE(SUM(ps.total_price), 0)           AS total_sales,
+                    COALESCE(SUM(ps.quantity), 0)              AS total_quantity
+                FROM sales s
+                JOIN product_sales ps ON ps.sale_id = s.id AND ps.sale_created_at = s.created_at
+                WHERE s.store_id = :store_id
+                  AND s.sale_status_desc = 'COMPLETED'
+                  AND s.created_at >= :start_ts AND s.created_at < :end_ts
+                  AND ps.sale_created_at >= :start_ts AND ps.sale_created_at < :end_ts
+                  AND ps.product_id = :product_id
+                GROUP BY 1, 2
+            """)
+        else:
+            channel_filter = ""
+            if channel:
+                channel_filter = "AND s.channel_id = ANY(:channel_ids)"
+                params["channel_ids"] = await self._channel_ids(channel)
+            sql = text(f"""
+                SELECT
+                    EXTRACT(ISODOW FROM s.created_at)::INTEGER AS dow,
+                    EXTRACT(HOUR FROM s.created_at)::INTEGER   AS hour,
+                    COUNT(*)::INTEGER                          AS total_orders,
+                    COALESCE(SUM(s.total_amount), 0)           AS total_sales
+                FROM sales s
+                WHERE s.store_id = :store_id
+                  AND s.sale_status_desc = 'COMPLETED'
+                  AND s.created_at >= :start_ts AND s.created_at < :end_ts
+                  {channel_filter}
+                GROUP BY 1, 2
+            """)
+        res = await self._execute(sql, params)
         return await self._rows(res)
 
     # ---------------------------------------------------------
     # AT RISK CUSTOMERS
     # ---------------------------------------------------------
-    async def get_at_risk_customers(self, store_id: int) -> List[Dict[str, Any]]:
-        query = text("""
-        SELECT 
-            COALESCE(s.customer_name, 'Cliente Anônimo') AS customer_name,
-            s.customer_id,
-            COUNT(*) AS total_orders,
-            MAX(s.created_at)::DATE AS last_order_date,
-            (CURRENT_DATE - MAX(s.created_at)::DATE) AS days_since_last_order
-        FROM sales s
-        WHERE s.store_id = :store_id
-          AND s.customer_id IS NOT NULL
-          AND s.sale_status_desc = 'COMPLETED'
-          AND s.created_at >= CURRENT_DATE - INTERVAL '6 months'
-        GROUP BY s.customer_id, s.customer_name
-        HAVING COUNT(*) >= 2
-          AND MAX(s.created_at) < CURRENT_DATE - INTERVAL '30 days'
-        ORDER BY days_since_last_order DESC;
+    async def get_at_risk_customers(
+        self,
+        store_id: int,
+        limit: Optional[int] = None,
+        after: Optional[List[Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Ordenado por inatividade (last_order_date ASC) com desempate por
+        customer_id: chave única e estável pra paginação keyset. O GROUP BY
+        é só por customer_id (o índice (store_id, customer_id, created_at)
+        da migração 004 atende) e o nome vem do MAX.
+        """
+        params: Dict[str, Any] = {"store_id": store_id}
+
+        keyset = ""
+        if after is not None:
+            keyset = "WHERE (last_order_date, customer_id) > (:after_date, :after_customer_id)"
+            params.update(
+                after_date=date.fromisoformat(str(after[0])),
+                after_customer_id=int(after[1]),
+            )
+        page = ""
+        if limit is not None:
+            page = "LIMIT :limit"
+            params["limit"] = limit + 1
+
+        query = text(f"""
+        WITH at_risk AS (
+            SELECT
+                COALESCE(MAX(s.customer_name), 'Cliente Anônimo') AS customer_name,
+                s.customer_id,
+                COUNT(*) AS total_orders,
+                MAX(s.created_at)::DATE AS last_order_date,
+                (CURRENT_DATE - MAX(s.created_at)::DATE) AS days_since_last_order
+            FROM sales s
+            WHERE s.store_id = :store_id
+              AND s.customer_id IS NOT NULL
+              AND s.sale_status_desc = 'COMPLETED'
+              AND s.created_at >= CURRENT_DATE - INTERVAL '6 months'
+            GROUP BY s.customer_id
+            HAVING COUNT(*) >= 2
+              AND MAX(s.created_at) < CURRENT_DATE - INTERVAL '30 days'
+        ),
+        counted AS (
+            SELECT at_risk.*, COUNT(*) OVER () AS total_estimate
+            FROM at_risk
+        )
+        SELECT *
+        FROM counted
+        {keyset}
+        ORDER BY last_order_date, customer_id
+        {page};
         """)
-        res = await self._execute(query, {"store_id": store_id})
+        res = await self._execute(query, params)
         return await self._rows(res)
 
     # ---------------------------------------------------------
@@ -209,31 +619,58 @@ class SalesRepository:
     # ---------------------------------------------------------
     async def list_channels_for_store(self, store_id: int):
         sql = text("""
-            SELECT DISTINCT ch.id, ch.name
+            SELECT DISTINCT s.channel_id AS id
             FROM sales s
-            JOIN channels ch ON ch.id = s.channel_id
             WHERE s.store_id = :store_id
-            ORDER BY ch.name
         """)
         res = await self._execute(sql, {"store_id": store_id})
-        return await self._rows(res)
+        rows = await self._rows(res)
+        names = await self._names("channels", [r["id"] for r in rows])
+        channels = [named(r, "id", "name", names, keep_id=True) for r in rows]
+        return sorted(channels, key=lambda c: (c["name"] is None, c["name"] or "", c["id"]))
 
-    async def list_available_stores(self, limit: int = 50) -> List[Dict[str, Any]]:
+    async def list_available_stores(
+        self,
+        limit: int = 50,
+        after: Optional[List[Any]] = None,
+    ) -> List[Dict[str, Any]]:
         """
         AQUI já devolve o NOME da loja.
         É isso que o Flutter quer.
+        Keyset por (name, id) -- índice idx_stores_name_id (migração 004);
+        devolve até ``limit + 1`` linhas pra indicar se há próxima página.
         """
-        sql = text("""
+        params: Dict[str, Any] = {"limit": limit + 1}
+        keyset = ""
+        if after is not None:
+            keyset = "WHERE (st.name, st.id) > (:after_name, :after_id)"
+            params.update(after_name=after[0], after_id=int(after[1]))
+
+        sql = text(f"""
             SELECT
                 st.id   AS store_id,
                 st.name AS store_name
             FROM stores st
-            ORDER BY st.name
+            {keyset}
+            ORDER BY st.name, st.id
             LIMIT :limit
         """)
-        res = await self._execute(sql, {"limit": limit})
+        res = await self._execute(sql, params)
         return await self._rows(res)
 
+    async def estimate_row_count(self, table: str) -> Optional[int]:
+        """Estimativa do planner (pg_class.reltuples): custo zero, sem COUNT(*)."""
+        sql = text("""
+            SELECT reltuples::BIGINT AS estimate
+            FROM pg_class
+            WHERE oid = to_regclass(:table)
+        """)
+        res = await self._execute(sql, {"table": table})
+        rows = await self._rows(res)
+        if not rows or rows[0]["estimate"] is None or rows[0]["estimate"] < 0:
+            return None
+        return rows[0]["estimate"]
+
     # ---------------------------------------------------------
     # REVENUE OVERVIEW
     # ---------------------------------------------------------
@@ -256,7 +693,7 @@ class SalesRepository:
             FROM sales
             WHERE store_id = :store_id
               AND sale_status_desc = 'COMPLETED'
-              AND created_at::DATE BETWEEN :start_date AND :end_date
+              AND created_at >= :start_ts AND created_at < :end_ts
         ),
         summary AS (
             SELECT
@@ -272,7 +709,7 @@ class SalesRepository:
             FROM sales
             WHERE store_id = :store_id
               AND sale_status_desc = 'COMPLETED'
-              AND created_at::DATE BETWEEN :previous_start AND :previous_end
+              AND created_at >= :previous_start_ts AND created_at < :previous_end_ts
         ),
         daily AS (
             SELECT
@@ -285,14 +722,10 @@ class SalesRepository:
         ),
         channel_breakdown AS (
             SELECT
-                ch.name AS channel_name,
-                SUM(s.total_amount) AS channel_sales
-            FROM sales s
-            JOIN channels ch ON ch.id = s.channel_id
-            WHERE s.store_id = :store_id
-              AND s.sale_status_desc = 'COMPLETED'
-              AND s.created_at::DATE BETWEEN :start_date AND :end_date
-            GROUP BY ch.name
+                channel_id,
+                SUM(total_amount) AS channel_sales
+            FROM current_period
+            GROUP BY channel_id
         )
         SELECT
             summary.total_sales,
@@ -317,7 +750,7 @@ class SalesRepository:
                 (
                     SELECT json_agg(
                         json_build_object(
-                            'channel', channel_name,
+                            'channel_id', channel_id,
                             'total_sales', channel_sales,
                             'share_pct',
                                 CASE WHEN summary.total_sales > 0
@@ -333,33 +766,31 @@ class SalesRepository:
         FROM summary, previous_period;
         """)
 
+        start_ts, end_ts = day_bounds(start_date, end_date)
+        previous_start_ts, previous_end_ts = day_bounds(previous_start, previous_end)
         params = {
             "store_id": store_id,
-            "start_date": start_date,
-            "end_date": end_date,
-            "previous_start": previous_start,
-            "previous_end": previous_end,
+            "start_ts": start_ts,
+            "end_ts": end_ts,
+            "previous_start_ts": previous_start_ts,
+            "previous_end_ts": previous_end_ts,
         }
         res = await self._execute(query, params)
         row = (await self._rows(res))[0]
 
-        def _change(current: float, previous: float) -> float:
-            if not previous:
-                return 0.0
-            return round((current - previous) / previous * 100, 2)
-
         total_sales = float(row["total_sales"])
         total_orders = row["total_orders"]
         previous_sales = float(row["previous_total_sales"] or 0)
         previous_orders = row["previous_total_orders"] or 0
+        channels = await self._names("channels", [c["channel_id"] for c in row["top_channels"]])
 
         return {
             "total_sales": total_sales,
             "total_orders": total_orders,
             "average_ticket": float(row["average_ticket"]),
-            "sales_change_pct": _change(total_sales, previous_sales),
-            "orders_change_pct": _change(total_orders, previous_orders),
-            "top_channels": row["top_channels"],
+            "sales_change_pct": _change_pct(total_sales, previous_sales),
+            "orders_change_pct": _change_pct(total_orders, previous_orders),
+            "top_channels": [named(c, "channel_id", "channel", channels) for c in row["top_channels"]],
             "daily_breakdown": row["daily_breakdown"],
         }
 
@@ -368,17 +799,18 @@ class SalesRepository:
     # ---------------------------------------------------------
     async def get_channel_performance(self, store_id: int, period_days: int = 30):
         q = text("""
-            SELECT ch.name AS channel, SUM(s.total_amount) AS total_sales
+            SELECT s.channel_id AS channel, SUM(s.total_amount) AS total_sales
             FROM sales s
-            JOIN channels ch ON ch.id = s.channel_id
             WHERE s.store_id = :store_id
               AND s.sale_status_desc = 'COMPLETED'
-              AND s.created_at::date >= CURRENT_DATE - :period_days * INTERVAL '1 day'
-            GROUP BY ch.name
+              AND s.created_at >= CURRENT_DATE - :period_days * INTERVAL '1 day'
+            GROUP BY s.channel_id
             ORDER BY total_sales DESC
         """)
         res = await self._execute(q, {"store_id": store_id, "period_days": period_days})
-        return await self._rows(res)
+        rows = await self._rows(res)
+        names = await self._names("channels", [r["channel"] for r in rows])
+        return [named(r, "channel", "channel", names) for r in rows]
 
     # ---------------------------------------------------------
     # STORE COMPARISON (COM NOME)
@@ -391,8 +823,8 @@ class SalesRepository:
         end_date: date,
     ) -> List[Dict[str, Any]]:
         """
-        O MESMO endpoint que você já tinha,
-        mas agora faz JOIN em stores pra trazer store_name.
+        O MESMO endpoint que você já tinha, com store_name (do cache de
+        dimensões, sem JOIN em stores).
         """
         # período anterior do mesmo tamanho
         period_days = (end_date - start_date).days + 1
@@ -403,11 +835,12 @@ class SalesRepository:
         WITH current_period AS (
             SELECT
                 s.store_id,
+                s.channel_id,
                 s.total_amount
             FROM sales s
             WHERE s.sale_status_desc = 'COMPLETED'
               AND s.store_id IN (:store_a_id, :store_b_id)
-              AND s.created_at::DATE BETWEEN :start_date AND :end_date
+              AND s.created_at >= :start_ts AND s.created_at < :end_ts
         ),
         summary AS (
             SELECT
@@ -425,25 +858,20 @@ class SalesRepository:
             FROM sales s
             WHERE s.sale_status_desc = 'COMPLETED'
               AND s.store_id IN (:store_a_id, :store_b_id)
-              AND s.created_at::DATE BETWEEN :prev_start AND :prev_end
+              AND s.created_at >= :prev_start_ts AND s.created_at < :prev_end_ts
             GROUP BY s.store_id
         ),
         channel_rank AS (
             SELECT
-                s.store_id,
-                ch.name AS channel_name,
-                SUM(s.total_amount) AS channel_sales,
-                RANK() OVER (PARTITION BY s.store_id ORDER BY SUM(s.total_amount) DESC) AS channel_rank
-            FROM sales s
-            JOIN channels ch ON ch.id = s.channel_id
-            WHERE s.sale_status_desc = 'COMPLETED'
-              AND s.store_id IN (:store_a_id, :store_b_id)
-              AND s.created_at::DATE BETWEEN :start_date AND :end_date
-            GROUP BY s.store_id, ch.name
+                store_id,
+                channel_id,
+                SUM(total_amount) AS channel_sales,
+                RANK() OVER (PARTITION BY store_id ORDER BY SUM(total_amount) DESC) AS channel_rank
+            FROM current_period
+            GROUP BY store_id, channel_id
         )
         SELECT
             sum.store_id,
-            st.name AS store_name,
             sum.total_sales,
             sum.total_orders,
             sum.average_ticket,
@@ -451,29 +879,36 @@ class SalesRepository:
                 WHEN COALESCE(prev.total_sales, 0) = 0 THEN 0
                 ELSE ROUND(((sum.total_sales - prev.total_sales) / prev.total_sales * 100)::NUMERIC, 2)
             END AS sales_change_pct,
-            cr.channel_name AS top_channel,
+            cr.channel_id AS top_channel,
             CASE
                 WHEN sum.total_sales > 0 AND cr.channel_sales IS NOT NULL THEN
                     ROUND((cr.channel_sales / sum.total_sales * 100)::NUMERIC, 2)
                 ELSE NULL
             END AS top_channel_share_pct
         FROM summary sum
-        JOIN stores st ON st.id = sum.store_id
         LEFT JOIN previous_period prev ON prev.store_id = sum.store_id
         LEFT JOIN channel_rank cr ON cr.store_id = sum.store_id AND cr.channel_rank = 1
         ORDER BY sum.total_sales DESC;
         """)
 
+        start_ts, end_ts = day_bounds(start_date, end_date)
+        prev_start_ts, prev_end_ts = day_bounds(prev_start, prev_end)
         params = {
             "store_a_id": store_a_id,
             "store_b_id": store_b_id,
-            "start_date": start_date,
-            "end_date": end_date,
-            "prev_start": prev_start,
-            "prev_end": prev_end,
+            "start_ts": start_ts,
+            "end_ts": end_ts,
+            "prev_start_ts": prev_start_ts,
+            "prev_end_ts": prev_end_ts,
         }
         res = await self._execute(query, params)
-        return await self._rows(res)
+        rows = await self._rows(res)
+        stores = await self._names("stores", [r["store_id"] for r in rows])
+        channels = await self._names("channels", [r["top_channel"] for r in rows])
+        return [
+            named(named(r, "store_id", "store_name", stores, keep_id=True), "top_channel", "top_channel", channels)
+            for r in rows
+        ]
 
     async def get_store_performance_for_period(
             self,
@@ -495,7 +930,7 @@ class SalesRepository:
             SELECT s.store_id, s.total_amount, s.channel_id
             FROM sales s
             WHERE s.sale_status_desc = 'COMPLETED'
-              AND s.created_at::DATE BETWEEN :start_date AND :end_date
+              AND s.created_at >= :start_ts AND s.created_at < :end_ts
               AND s.store_id = ANY(:store_ids)
         ),
         summary AS (
@@ -510,49 +945,211 @@ class SalesRepository:
         channel_rank AS (
             SELECT
                 f.store_id,
-                ch.name                             AS channel_name,
+                f.channel_id,
                 SUM(f.total_amount)                 AS channel_sales,
                 RANK() OVER (
                     PARTITION BY f.store_id
                     ORDER BY SUM(f.total_amount) DESC
                 )                                   AS rnk
             FROM filtered f
-            JOIN channels ch ON ch.id = f.channel_id
-            GROUP BY f.store_id, ch.name
+            GROUP BY f.store_id, f.channel_id
         ),
         top_ch AS (
-            SELECT store_id, channel_name, channel_sales
+            SELECT store_id, channel_id, channel_sales
             FROM channel_rank
             WHERE rnk = 1
         )
         SELECT
-            st.name                                 AS store_name,
             sm.store_id                              AS store_id,
             sm.total_sales                           AS total_sales,
             sm.total_orders                          AS total_orders,
             sm.average_ticket                        AS average_ticket,
             CASE
-                WHEN sm.total_sales > 0 AND tc.channel_name IS NOT NULL THEN
+                WHEN sm.total_sales > 0 AND tc.channel_id IS NOT NULL THEN
                     json_build_object(
-                        'channel',   tc.channel_name,
+                        'channel_id', tc.channel_id,
                         'share_pct', ROUND((tc.channel_sales / sm.total_sales * 100)::NUMERIC, 2)
                     )
                 ELSE NULL
             END                                      AS top_channel
         FROM summary sm
-        JOIN stores st ON st.id = sm.store_id
         LEFT JOIN top_ch tc ON tc.store_id = sm.store_id
         ORDER BY sm.total_sales DESC;
         """)
 
+        start_ts, end_ts = day_bounds(start_date, end_date)
         params: Dict[str, Any] = {
             "store_ids": store_ids,  # asyncpg aceita list -> int[]
-            "start_date": start_date,
-            "end_date": end_date,
+            "start_ts": start_ts,
+            "end_ts": end_ts,
         }
 
         res = await self._execute(query, params)
-        return await self._rows(res)
+        rows = await self._rows(res)
+        stores = await self._names("stores", [r["store_id"] for r in rows])
+        channels = await self._names("channels", [(r["top_channel"] or {}).get("channel_id") for r in rows])
+        out = []
+        for r in rows:
+            r = {"store_name": stores.get(r["store_id"]), **r}
+            if r["top_channel"] is not None:
+                r["top_channel"] = named(r["top_channel"], "channel_id", "channel", channels)
+            out.append(r)
+        return out
+
+    # ---------------------------------------------------------
+    # PORTFOLIO (N LOJAS NUMA CONSULTA)
+    # ---------------------------------------------------------
+    async def get_portfolio_overview(
+        self,
+        store_ids: List[int],
+        start_date: date,
+        end_date: date,
+        top_n: int = 5,
+    ) -> List[Dict[str, Any]]:
+        """
+        Overview de várias lojas de uma vez: uma linha por loja + uma linha
+        consolidada (store_id NULL), via GROUPING SETS. Cada linha traz
+        faturamento/pedidos/ticket, variação vs. período anterior e os
+        top N canais e produtos (JSON). Um único round-trip, qualquer N.
+        """
+        period_days = (end_date - start_date).days + 1
+        prev_end = start_date - timedelta(days=1)
+        prev_start = prev_end - timedelta(days=period_days - 1)
+
+        # store_key: 0 = consolidado (ids de loja são SERIAL > 0), pra dar hash join
+        query = text("""
+        WITH filtered AS (
+            SELECT s.id, s.created_at, s.store_id, s.channel_id, s.total_amount
+            FROM sales s
+            WHERE s.sale_status_desc = 'COMPLETED'
+              AND s.store_id = ANY(:store_ids)
+              AND s.created_at >= :start_ts AND s.created_at < :end_ts
+        ),
+        summary AS (
+            SELECT
+                COALESCE(f.store_id, 0)           AS store_key,
+                f.store_id,
+                COALESCE(SUM(f.total_amount), 0) AS total_sales,
+                COUNT(*)                          AS total_orders,
+                COALESCE(AVG(f.total_amount), 0) AS average_ticket
+            FROM filtered f
+            GROUP BY GROUPING SETS ((f.store_id), ())
+        ),
+        previous_period AS (
+            SELECT
+                COALESCE(s.store_id, 0)           AS store_key,
+                COALESCE(SUM(s.total_amount), 0) AS total_sales,
+                COUNT(*)                          AS total_orders
+            FROM sales s
+            WHERE s.sale_status_desc = 'COMPLETED'
+              AND s.store_id = ANY(:store_ids)
+              AND s.created_at >= :prev_start_ts AND s.created_at < :prev_end_ts
+            GROUP BY GROUPING SETS ((s.store_id), ())
+        ),
+        channel_sales AS (
+            SELECT
+                COALESCE(f.store_id, 0) AS store_key,
+                f.channel_id,
+                SUM(f.total_amount)     AS channel_sales
+            FROM filtered f
+            GROUP BY GROUPING SETS ((f.store_id, f.channel_id), (f.channel_id))
+        ),
+        channel_json AS (
+            SELECT
+                r.store_key,
+                json_agg(
+                    json_build_object(
+                        'channel_id', r.channel_id,
+                        'total_sales', r.channel_sales,
+                        'share_pct',
+                            CASE WHEN sm.total_sales > 0
+                                THEN ROUND((r.channel_sales / sm.total_sales * 100)::NUMERIC, 2)
+                                ELSE 0
+                            END
+                    )
+                    ORDER BY r.channel_sales DESC
+                ) AS top_channels
+            FROM (
+                SELECT
+                    cs.*,
+                    ROW_NUMBER() OVER (PARTITION BY cs.store_key ORDER BY cs.channel_sales DESC) AS rn
+                FROM channel_sales cs
+            ) r
+            JOIN summary sm ON sm.store_key = r.store_key
+            WHERE r.rn <= :top_n
+            GROUP BY r.store_key
+        ),
+        product_sales_agg AS (
+            SELECT
+                COALESCE(f.store_id, 0) AS store_key,
+                ps.product_id,
+                SUM(ps.quantity)        AS total_quantity,
+                SUM(ps.total_price)     AS total_revenue
+            FROM filtered f
+            JOIN product_sales ps ON ps.sale_id = f.id AND ps.sale_created_at = f.created_at
+            WHERE ps.sale_created_at >= :start_ts AND ps.sale_created_at < :end_ts
+            GROUP BY GROUPING SETS ((f.store_id, ps.product_id), (ps.product_id))
+        ),
+        product_json AS (
+            SELECT
+                r.store_key,
+                json_agg(
+                    json_build_object(
+                        'product_id', r.product_id,
+                        'total_quantity', r.total_quantity,
+                        'total_revenue', r.total_revenue
+                    )
+                    ORDER BY r.total_revenue DESC
+                ) AS top_products
+            FROM (
+                SELECT
+                    pa.*,
+                    ROW_NUMBER() OVER (PARTITION BY pa.store_key ORDER BY pa.total_revenue DESC) AS rn
+                FROM product_sales_agg pa
+            ) r
+            WHERE r.rn <= :top_n
+            GROUP BY r.store_key
+        )
+        SELECT
+            sm.store_id,
+            sm.total_sales,
+            sm.total_orders,
+            sm.average_ticket,
+            COALESCE(prev.total_sales, 0)             AS previous_total_sales,
+            COALESCE(prev.total_orders, 0)            AS previous_total_orders,
+            COALESCE(cj.top_channels, '[]'::json)     AS top_channels,
+            COALESCE(pj.top_products, '[]'::json)     AS top_products
+        FROM summary sm
+        LEFT JOIN previous_period prev ON prev.store_key = sm.store_key
+        LEFT JOIN channel_json cj ON cj.store_key = sm.store_key
+        LEFT JOIN product_json pj ON pj.store_key = sm.store_key
+        ORDER BY sm.store_id NULLS FIRST;
+        """)
+
+        start_ts, end_ts = day_bounds(start_date, end_date)
+        prev_start_ts, prev_end_ts = day_bounds(prev_start, prev_end)
+        params: Dict[str, Any] = {
+            "store_ids": store_ids,
+            "start_ts": start_ts,
+            "end_ts": end_ts,
+            "prev_start_ts": prev_start_ts,
+            "prev_end_ts": prev_end_ts,
+            "top_n": top_n,
+        }
+        res = await self._execute(query, params)
+        rows = await self._rows(res)
+        stores = await self._names("stores", [r["store_id"] for r in rows])
+        channels = await self._names("channels", [c["channel_id"] for r in rows for c in r["top_channels"]])
+        products = await self._names("products", [p["product_id"] for r in rows for p in r["top_products"]])
+        out = []
+        for r in rows:
+            r = named(r, "store_id", "store_name", stores, keep_id=True)
+            r["top_channels"] = [named(c, "channel_id", "channel", channels) for c in r["top_channels"]]
+            r["top_products"] = [
+                named(p, "product_id", "product_name", products, keep_id=True) for p in r["top_products"]
+            ]
+            out.append(r)
+        return out
 
     # Alias opcional para compatibilidade se você realmente quiser o nome com "dor"
     async def get_store_performance_dor_period(
@@ -563,6 +1160,947 @@ class SalesRepository:
     ) -> List[Dict[str, Any]]:
         return await self.get_store_performance_for_period(store_ids, start_date, end_date)
 
+    # ---------------------------------------------------------
+    # CAMINHOS ALTERNATIVOS DO PLANNER (rollup por hora / amostra)
+    # mesmo formato das versões cruas acima
+    # ---------------------------------------------------------
+    def raw_source(self, method: str, first_day: date, end_date: date) -> str:
+        """De onde sai a versão crua do método; subclasses com aceleração sobrescrevem."""
+        return "postgres"
+
+    async def get_store_daily_orders(self, since: date) -> Dict[int, int]:
+        """Pedidos por loja desde ``since`` (rollup): base da estimativa de custo."""
+        sql = text("""
+            SELECT store_id, SUM(total_orders)::BIGINT AS total_orders
+            FROM sales_hourly
+            WHERE sale_date >= :since
+            GROUP BY store_id
+        """)
+        res = await self._execute(sql, {"since": since})
+        return {r["store_id"]: int(r["total_orders"]) for r in await self._rows(res)}
+
+    async def count_rollup_pending_days(self, store_ids: List[int], start_date: date, end_date: date) -> int:
+        """(loja, dia) do período ainda na outbox: rollup desatualizado ali."""
+        sql = text("""
+            SELECT COUNT(*) AS pending
+            FROM rollup_dirty_days
+            WHERE store_id = ANY(:store_ids)
+              AND sale_date BETWEEN :start_date AND :end_date
+        """)
+        res = await self._execute(
+            sql, {"store_ids": list(store_ids), "start_date": start_date, "end_date": end_date}
+        )
+        rows = await self._rows(res)
+        return int(rows[0]["pending"]) if rows else 0
+
+    async def count_rollup_uncovered_stores(self, store_ids: List[int], start_date: date, end_date: date) -> int:
+        """Lojas cujo rollup não cobre o período inteiro (rollup_coverage, migração 015)."""
+        sql = text("""
+            SELECT COUNT(*) AS uncovered
+            FROM unnest(CAST(:store_ids AS INTEGER[])) AS t(store_id)
+            LEFT JOIN rollup_coverage c ON c.store_id = t.store_id
+            WHERE c.store_id IS NULL
+               OR c.covered_from > :start_date
+               OR c.covered_to < :end_date
+        """)
+        res = await self._execute(
+            sql, {"store_ids": list(store_ids), "start_date": start_date, "end_date": end_date}
+        )
+        rows = await self._rows(res)
+        return int(rows[0]["uncovered"]) if rows else 0
+
+    async def _overview_with_names(self, cells, start_date: date, end_date: date, scale: float = 1.0):
+        overview = overview_from_cells(cells, start_date, end_date, scale)
+        channels = await self._names("channels", [c["channel_id"] for c in overview["top_channels"]])
+        overview["top_channels"] = [named(c, "channel_id", "channel", channels) for c in overview["top_channels"]]
+        return overview
+
+    async def get_revenue_overview_rollup(self, store_id: int, start_date: date, end_date: date) -> Dict[str, Any]:
+        period_days = (end_date - start_date).days + 1
+        previous_start = start_date - timedelta(days=period_days)
+        sql = text("""
+            SELECT sale_date, channel_id, SUM(total_orders) AS total_orders, SUM(total_sales) AS total_sales
+            FROM sales_hourly
+            WHERE store_id = :store_id
+              AND sale_date BETWEEN :previous_start AND :end_date
+            GROUP BY sale_date, channel_id
+        """)
+        res = await self._execute(
+            sql, {"store_id": store_id, "previous_start": previous_start, "end_date": end_date}
+        )
+        return await self._overview_with_names(await self._rows(res), start_date, end_date)
+
+    async def get_revenue_overview_sampled(
+        self,
+        store_id: int,
+        start_date: date,
+        end_date: date,
+        sample_pct: float,
+    ) -> Dict[str, Any]:
+        """
+        Amostra por blocos (TABLESAMPLE SYSTEM) escalada pra 100%, com
+        intervalo de confiança de faturamento, pedidos, ticket e canais.
+        As somas por bloco saem agregadas do banco (ver ``BlockEstimate``).
+        O percentual vale pras páginas da partição (todas as lojas): quem
+        escolhe é o planner, que não amostra loja pequena demais nela.
+        """
+        period_days = (end_date - start_date).days + 1
+        previous_start = start_date - timedelta(days=period_days)
+        start_ts, end_ts = day_bounds(previous_start, end_date)
+        sql = text(f"""
+            WITH sampled AS MATERIALIZED (
+                SELECT
+                    {BLOCK_SQL},
+                    s.created_at::DATE AS sale_date,
+                    s.created_at >= :current_ts AS current,
+                    s.channel_id,
+                    s.total_amount
+                FROM sales s TABLESAMPLE SYSTEM (CAST(:sample_pct AS REAL)) REPEATABLE (:seed)
+                WHERE s.store_id = :store_id
+                  AND s.sale_status_desc = 'COMPLETED'
+                  AND s.created_at >= :start_ts AND s.created_at < :end_ts
+            ),
+            per_block AS (
+                SELECT rel, page, current, channel_id, COUNT(*) AS orders, SUM(total_amount) AS value
+                FROM sampled
+                GROUP BY rel, page, current, channel_id
+            ),
+            block_totals AS (
+                SELECT rel, page, current, SUM(orders) AS orders, SUM(value) AS value
+                FROM per_block
+                GROUP BY rel, page, current
+            )
+            SELECT 'total' AS kind, current, NULL::INTEGER AS channel_id, NULL::DATE AS sale_date,
+                   SUM(orders) AS orders, SUM(value) AS value, SUM(orders * orders) AS orders_sq,
+                   SUM(value * value) AS value_sq, SUM(orders * value) AS cross_sum
+            FROM block_totals
+            GROUP BY current
+            UNION ALL
+            SELECT 'channel', TRUE, channel_id, NULL,
+                   SUM(orders), SUM(value), NULL, SUM(value * value), NULL
+            FROM per_block
+            WHERE current
+            GROUP BY channel_id
+            UNION ALL
+            SELECT 'day', TRUE, NULL, sale_date, COUNT(*), SUM(total_amount), NULL, NULL, NULL
+            FROM sampled
+            WHERE current
+            GROUP BY sale_date
+        """)
+        current_ts, _ = day_bounds(start_date, end_date)
+        res = await self._execute(
+            sql,
+            {
+                "store_id": store_id,
+                "start_ts": start_ts,
+                "end_ts": end_ts,
+                "current_ts": current_ts,
+                "sample_pct": sample_pct,
+                "seed": SAMPLE_SEED,
+            },
+        )
+        rows = await self._rows(res)
+        est = BlockEstimate(sample_pct)
+
+        empty = {"orders": 0, "value": 0, "orders_sq": 0, "value_sq": 0, "cross_sum": 0}
+        totals = {r["current"]: r for r in rows if r["kind"] == "total"}
+        current, previous = totals.get(True, empty), totals.get(False, empty)
+        sales = est.total(current["value"], current["value_sq"])
+        orders = est.total(current["orders"], current["orders_sq"])
+        ticket = est.ratio(
+            current["orders"], current["value"], current["orders_sq"], current["value_sq"], current["cross_sum"]
+        )
+        previous_sales = float(previous["value"] or 0) * est.scale
+        previous_orders = float(previous["orders"] or 0) * est.scale
+
+        channel_rows = sorted((r for r in rows if r["kind"] == "channel"), key=lambda r: -float(r["value"]))
+        names = await self._names("channels", [r["channel_id"] for r in channel_rows])
+        top_channels = []
+        for r in channel_rows:
+            channel_sales = est.total(r["value"], r["value_sq"])
+            top_channels.append({
+                "channel": names.get(r["channel_id"]),
+                "total_sales": round(channel_sales["estimate"], 2),
+                "share_pct": round(float(r["value"]) / float(current["value"]) * 100, 2) if current["value"] else 0,
+                "total_sales_ci": ci(channel_sales),
+            })
+
+        return {
+            "total_sales": round(sales["estimate"], 2),
+            "total_orders": int(round(orders["estimate"])),
+            "average_ticket": ticket["estimate"],
+            "sales_change_pct": _change_pct(sales["estimate"], previous_sales),
+            "orders_change_pct": _change_pct(orders["estimate"], previous_orders),
+            "top_channels": top_channels,
+            "daily_breakdown": [
+                {
+                    "sale_date": r["sale_date"].isoformat(),
+                    "total_sales": round(float(r["value"]) * est.scale, 2),
+                    "total_orders": int(round(float(r["orders"]) * est.scale)),
+                }
+                for r in sorted((r for r in rows if r["kind"] == "day"), key=lambda r: r["sale_date"])
+            ],
+            "confidence_intervals": {
+                "level": CONFIDENCE_LEVEL,
+                "total_sales": ci(sales),
+                "total_orders": ci(orders, 0),
+                "average_ticket": ci(ticket),
+                "sales_error_pct": sales["error_pct"],
+            },
+            "sampled_orders": int(current["orders"] or 0),
+        }
+
+    async def get_channel_performance_rollup(self, store_id: int, period_days: int = 30):
+        q = text("""
+            SELECT channel_id AS channel, SUM(total_sales) AS total_sales
+            FROM sales_hourly
+            WHERE store_id = :store_id
+              AND sale_date >= CURRENT_DATE - CAST(:period_days AS INTEGER)
+            GROUP BY channel_id
+            ORDER BY total_sales DESC
+        """)
+        res = await self._execute(q, {"store_id": store_id, "period_days": period_days})
+        rows = await self._rows(res)
+        names = await self._names("channels", [r["channel"] for r in rows])
+        return [named(r, "channel", "channel", names) for r in rows]
+
+    async def get_top_products_rollup(
+        self,
+        store_id: int,
+        start_date: date,
+        end_date: date,
+        day_of_week: Optional[int],
+        hour_start: Optional[int],
+        hour_end: Optional[int],
+        limit: int = 10,
+    ) -> List[Dict[str, Any]]:
+        """Top products sem filtro de canal (product_sales_hourly não tem canal)."""
+        period_days = (end_date - start_date).days + 1
+        prev_end = start_date - timedelta(days=1)
+        prev_start = prev_end - timedelta(days=period_days - 1)
+        filters = ""
+        params: Dict[str, Any] = {
+            "store_id": store_id,
+            "start_date": start_date,
+            "end_date": end_date,
+            "prev_start": prev_start,
+            "prev_end": prev_end,
+            "limit": limit,
+        }
+        if day_of_week is not None:
+            filters += " AND EXTRACT(DOW FROM sale_date) = :dow"
+            params["dow"] = day_of_week % 7
+        if hour_start is not None and hour_end is not None:
+            filters += " AND hour BETWEEN :hour_start AND :hour_end"
+            params.update(hour_start=hour_start, hour_end=hour_end)
+
+        query = text(f"""
+        WITH scoped AS (
+            SELECT
+                product_id,
+                SUM(total_quantity) FILTER (WHERE sale_date >= :start_date) AS total_quantity,
+                SUM(total_sales)    FILTER (WHERE sale_date >= :start_date) AS total_revenue,
+                SUM(total_quantity) FILTER (WHERE sale_date <= :prev_end)   AS previous_quantity
+            FROM product_sales_hourly
+            WHERE store_id = :store_id
+              AND sale_date BETWEEN :prev_start AND :end_date
+              {filters}
+            GROUP BY product_id
+        )
+        SELECT
+            product_id,
+            total_quantity,
+            total_revenue,
+            CASE
+                WHEN SUM(total_revenue) OVER () > 0
+                    THEN ROUND((total_revenue / SUM(total_revenue) OVER () * 100)::NUMERIC, 2)
+                ELSE 0
+            END AS pct_of_total,
+            CASE
+                WHEN previous_quantity IS NULL OR previous_quantity = 0 THEN NULL
+                ELSE ROUND(((total_quantity - previous_quantity)::DECIMAL / previous_quantity * 100)::NUMERIC, 2)
+            END AS wow_change_pct
+        FROM scoped
+        WHERE total_quantity IS NOT NULL
+        ORDER BY total_revenue DESC
+        LIMIT :limit
+        """)
+        res = await self._execute(query, params)
+        rows = await self._rows(res)
+        names = await self._names("products", [r["product_id"] for r in rows])
+        return [named(r, "product_id", "product_name", names, keep_id=True) for r in rows]
+
+    async def get_channel_performance_sampled(self, store_id: int, period_days: int, sample_pct: float):
+        """Channel performance por amostra de blocos, com intervalo por canal."""
+        q = text(f"""
+            WITH per_block AS (
+                SELECT {BLOCK_SQL}, s.channel_id, SUM(s.total_amount) AS value
+                FROM sales s TABLESAMPLE SYSTEM (CAST(:sample_pct AS REAL)) REPEATABLE (:seed)
+                WHERE s.store_id = :store_id
+                  AND s.sale_status_desc = 'COMPLETED'
+                  AND s.created_at >= CURRENT_DATE - CAST(:period_days AS INTEGER)
+                GROUP BY 1, 2, 3
+            )
+            SELECT channel_id AS channel, SUM(value) AS value, SUM(value * value) AS value_sq
+            FROM per_block
+            GROUP BY channel_id
+            ORDER BY value DESC
+        """)
+        res = await self._execute(
+            q, {"store_id": store_id, "period_days": period_days, "sample_pct": sample_pct, "seed": SAMPLE_SEED}
+        )
+        rows = await self._rows(res)
+        est = BlockEstimate(sample_pct)
+        names = await self._names("channels", [r["channel"] for r in rows])
+        out = []
+        for r in rows:
+            sales = est.total(r["value"], r["value_sq"])
+            out.append({
+                "channel": names.get(r["channel"]),
+                "total_sales": round(sales["estimate"], 2),
+                "total_sales_ci": ci(sales),
+            })
+        return out
+
+    async def get_top_products_sampled(
+        self,
+        store_id: int,
+        channel: Optional[str],
+        start_date: date,
+        end_date: date,
+        day_of_week: Optional[int],
+        hour_start: Optional[int],
+        hour_end: Optional[int],
+        sample_pct: float,
+        limit: int = 10,
+    ) -> List[Dict[str, Any]]:
+        """
+        Top products por amostra dos blocos de ``sales`` (os itens vêm pelo
+        JOIN), com intervalo de quantidade e faturamento por produto.
+        ``pct_of_total`` e ``wow_change_pct`` são razões: a escala se cancela.
+        """
+        period_days = (end_date - start_date).days + 1
+        prev_start = start_date - timedelta(days=period_days)
+        filters = ["s.store_id = :store_id", "s.sale_status_desc = 'COMPLETED'"]
+        params: Dict[str, Any] = {"store_id": store_id, "sample_pct": sample_pct, "seed": SAMPLE_SEED, "limit": limit}
+        if channel:
+            filters.append("s.channel_id = ANY(:channel_ids)")
+            params["channel_ids"] = await self._channel_ids(channel)
+        if day_of_week is not None:
+            filters.append("EXTRACT(DOW FROM s.created_at) = :dow")
+            params["dow"] = day_of_week % 7
+        if hour_start is not None and hour_end is not None:
+            filters.append("EXTRACT(HOUR FROM s.created_at) BETWEEN :hour_start AND :hour_end")
+            params.update(hour_start=hour_start, hour_end=hour_end)
+        filters.append("s.created_at >= :prev_start_ts AND s.created_at < :end_ts")
+        filters.append("ps.sale_created_at >= :prev_start_ts AND ps.sale_created_at < :end_ts")
+        params["prev_start_ts"], params["end_ts"] = day_bounds(prev_start, end_date)
+        params["start_ts"], _ = day_bounds(start_date, end_date)
+
+        query = text(f"""
+        WITH per_block AS (
+            SELECT
+                {BLOCK_SQL},
+                ps.product_id,
+                s.created_at >= :start_ts AS current,
+                SUM(ps.quantity) AS quantity,
+                SUM(ps.total_price) AS revenue
+            FROM sales s TABLESAMPLE SYSTEM (CAST(:sample_pct AS REAL)) REPEATABLE (:seed)
+            JOIN product_sales ps ON ps.sale_id = s.id AND ps.sale_created_at = s.created_at
+            WHERE {" AND ".join(filters)}
+            GROUP BY 1, 2, 3, 4
+        ),
+        per_product AS (
+            SELECT
+                product_id,
+                SUM(quantity) FILTER (WHERE current)              AS quantity,
+                SUM(quantity * quantity) FILTER (WHERE current)   AS quantity_sq,
+                SUM(revenue) FILTER (WHERE current)               AS revenue,
+                SUM(revenue * revenue) FILTER (WHERE current)     AS revenue_sq,
+                SUM(quantity) FILTER (WHERE NOT current)          AS previous_quantity
+            FROM per_block
+            GROUP BY product_id
+        )
+        SELECT *, SUM(revenue) OVER () AS total_revenue
+        FROM per_product
+        WHERE quantity IS NOT NULL
+        ORDER BY revenue DESC
+        LIMIT :limit
+        """)
+        res = await self._execute(query, params)
+        rows = await self._rows(res)
+        est = BlockEstimate(sample_pct)
+        names = await self._names("products", [r["product_id"] for r in rows])
+        out = []
+        for r in rows:
+            quantity = est.total(r["quantity"], r["quantity_sq"])
+            revenue = est.total(r["revenue"], r["revenue_sq"])
+            previous = float(r["previous_quantity"] or 0)
+            total_revenue = float(r["total_revenue"] or 0)
+            out.append({
+                "product_id": r["product_id"],
+                "product_name": names.get(r["product_id"]),
+                "total_quantity": round(quantity["estimate"], 2),
+                "total_revenue": round(revenue["estimate"], 2),
+                "pct_of_total": round(float(r["revenue"]) / total_revenue * 100, 2) if total_revenue > 0 else 0,
+                "wow_change_pct": (
+                    round((float(r["quantity"]) - previous) / previous * 100, 2) if previous else None
+                ),
+                "total_quantity_ci": ci(quantity),
+                "total_revenue_ci": ci(revenue),
+            })
+        return out
+
+    async def get_store_performance_rollup(
+        self,
+        store_ids: List[int],
+        start_date: date,
+        end_date: date,
+    ) -> List[Dict[str, Any]]:
+        sql = text("""
+            SELECT store_id, channel_id, SUM(total_orders) AS total_orders, SUM(total_sales) AS total_sales
+            FROM sales_hourly
+            WHERE store_id = ANY(:store_ids)
+              AND sale_date BETWEEN :start_date AND :end_date
+            GROUP BY store_id, channel_id
+        """)
+        res = await self._execute(
+            sql, {"store_ids": list(store_ids), "start_date": start_date, "end_date": end_date}
+        )
+        per_store: Dict[int, Dict[str, Any]] = {}
+        for r in await self._rows(res):
+            store = per_store.setdefault(r["store_id"], {"total_sales": 0, "total_orders": 0, "channels": {}})
+            store["total_sales"] += r["total_sales"]
+            store["total_orders"] += int(r["total_orders"])
+            store["channels"][r["channel_id"]] = r["total_sales"]
+
+        stores = await self._names("stores", per_store)
+        channels = await self._names("channels", [cid for st in per_store.values() for cid in st["channels"]])
+        out = []
+        for store_id, st in per_store.items():
+            top_id, top_sales = max(st["channels"].items(), key=lambda kv: kv[1])
+            total = st["total_sales"]
+            out.append({
+                "store_name": stores.get(store_id),
+                "store_id": store_id,
+                "total_sales": total,
+                "total_orders": st["total_orders"],
+                "average_ticket": total / st["total_orders"] if st["total_orders"] else 0,
+                "top_channel": (
+                    {"channel": channels.get(top_id), "share_pct": round(top_sales / total * 100, 2)}
+                    if total > 0
+                    else None
+                ),
+            })
+        out.sort(key=lambda r: r["total_sales"], reverse=True)
+        return out
+
+    # ---------------------------------------------------------
+    # CLIENTES ÚNICOS (customer_hll_daily, migração 010)
+    # ---------------------------------------------------------
+    async def get_customer_stats(
+        self,
+        store_ids: List[int],
+        start_date: date,
+        end_date: date,
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        Clientes únicos e recompra por loja no período: junta os HLL diários
+        (MAX do rank por registrador) em tempo proporcional a dias, não a vendas.
+
+        Só vêm as lojas com o período inteiro em ``rollup_coverage`` (015):
+        sem backfill, ou com o período passando do último refresh (hoje), o
+        sketch vazio daria 0 clientes em vez de "sem dado".
+        """
+        params = {"store_ids": list(store_ids), "start_date": start_date, "end_date": end_date}
+        covered = await self._execute(
+            text("""
+                SELECT store_id
+                FROM rollup_coverage
+                WHERE store_id = ANY(:store_ids)
+                  AND covered_from <= :start_date
+                  AND covered_to >= :end_date
+            """),
+            params,
+        )
+        store_ids = [r["store_id"] for r in await self._rows(covered)]
+        if not store_ids:
+            return {}
+        params["store_ids"] = store_ids
+        registers = await self._execute(
+            text("""
+                SELECT store_id, register, MAX(rank) AS rank
+                FROM customer_hll_daily
+                WHERE store_id = ANY(:store_ids)
+                  AND sale_date BETWEEN :start_date AND :end_date
+                GROUP BY store_id, register
+            """),
+            params,
+        )
+        sketches = {sid: HyperLogLog() for sid in store_ids}
+        for r in await self._rows(registers):
+            sketches[r["store_id"]].add_register(r["register"], r["rank"])
+
+        orders = await self._execute(
+            text("""
+                SELECT store_id, SUM(customer_orders)::BIGINT AS customer_orders
+                FROM sales_hourly
+                WHERE store_id = ANY(:store_ids)
+                  AND sale_date BETWEEN :start_date AND :end_date
+                GROUP BY store_id
+            """),
+            params,
+        )
+        customer_orders = {r["store_id"]: int(r["customer_orders"] or 0) for r in await self._rows(orders)}
+        return {sid: customer_stats(sketch, customer_orders.get(sid, 0)) for sid, sketch in sketches.items()}
+
+    # ---------------------------------------------------------
+    # COZINHA (kitchen_slot_daily / kitchen_production_sketch_daily, migração 014)
+    # ---------------------------------------------------------
+    async def get_kitchen_production_sketches(
+        self,
+        store_id: int,
+        start_date: date,
+        end_date: date,
+    ) -> Dict[str, Any]:
+        """
+        Sketches do tempo de produção juntados por (dia da semana ISO, hora)
+        e por canal, num GROUPING SETS só. Por hora, por dia ou geral sai
+        juntando os de (dia, hora).
+        """
+        source = """
+            SELECT EXTRACT(ISODOW FROM sale_date)::INTEGER AS dow, hour, channel_id, bucket, order_count
+            FROM kitchen_production_sketch_daily
+            WHERE store_id = :store_id
+              AND sale_date BETWEEN :start_date AND :end_date
+        """
+        return await self._kitchen_sketches(
+            source, {"store_id": store_id, "start_date": start_date, "end_date": end_date}
+        )
+
+    async def get_kitchen_production_sketches_raw(
+        self,
+        store_id: int,
+        start_date: date,
+        end_date: date,
+    ) -> Dict[str, Any]:
+        """Mesmos sketches, com os buckets calculados direto de sales (período fora do rollup)."""
+        sketch = DDSketch(PRODUCTION_RELATIVE_ACCURACY)
+        start_ts, end_ts = day_bounds(start_date, end_date)
+        source = f"""
+            SELECT
+                EXTRACT(ISODOW FROM s.created_at)::INTEGER AS dow,
+                EXTRACT(HOUR FROM s.created_at)::SMALLINT  AS hour,
+                s.channel_id,
+                {sketch.bucket_sql("s.production_seconds")} AS bucket,
+                1 AS order_count
+            FROM sales s
+            WHERE s.store_id = :store_id
+              AND s.sale_status_desc = 'COMPLETED'
+              AND s.production_seconds IS NOT NULL
+              AND s.created_at >= :start_ts AND s.created_at < :end_ts
+        """
+        return await self._kitchen_sketches(
+            source, {"store_id": store_id, "start_ts": start_ts, "end_ts": end_ts, "sketch_gamma": sketch.gamma}
+        )
+
+    async def _kitchen_sketches(self, source: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        res = await self._execute(
+            text(f"""
+                SELECT
+                    GROUPING(channel_id) AS by_time,
+                    dow, hour, channel_id, bucket,
+                    SUM(order_count)::INTEGER AS order_count
+                FROM ({source}) k
+                GROUP BY GROUPING SETS ((dow, hour, bucket), (channel_id, bucket))
+            """),
+            params,
+        )
+        by_time: Dict[Tuple[int, int], DDSketch] = {}
+        by_channel: Dict[int, DDSketch] = {}
+        for r in await self._rows(res):
+            if r["by_time"]:
+                key = (r["dow"], r["hour"])
+                target = by_time
+            else:
+                key = r["channel_id"]
+                target = by_channel
+            sketch = target.get(key)
+            if sketch is None:
+                sketch = target[key] = DDSketch(PRODUCTION_RELATIVE_ACCURACY)
+            sketch.add_bucket(r["bucket"], r["order_count"])
+
+        names = await self._names("channels", by_channel)
+        return {
+            "by_dow_hour": by_time,
+            "by_channel": {names.get(cid, str(cid)): sketch for cid, sketch in by_channel.items()},
+        }
+
+    async def get_kitchen_load(self, store_id: int, start_date: date, end_date: date) -> List[Dict[str, Any]]:
+        """
+        Por faixa de 15 min do dia (0..95), somando os dias do período: carga
+        concorrente (soma e pico diário), pedidos que entraram, tempo de
+        produção, e as somas ponderadas por pedido (carga da faixa em que o
+        pedido entrou × tempo dele) pra correlação carga × tempo.
+        """
+        slots = """
+            SELECT
+                sale_date,
+                slot,
+                SUM(orders_active)             AS active,
+                SUM(orders_started)            AS started,
+                SUM(production_count)          AS n,
+                SUM(production_seconds_sum)    AS sy,
+                SUM(production_seconds_sq_sum) AS syy
+            FROM kitchen_slot_daily
+            WHERE store_id = :store_id
+              AND sale_date BETWEEN :start_date AND :end_date
+            GROUP BY sale_date, slot
+        """
+        return await self._kitchen_load(slots, {"store_id": store_id, "start_date": start_date, "end_date": end_date})
+
+    async def get_kitchen_load_raw(self, store_id: int, start_date: date, end_date: date) -> List[Dict[str, Any]]:
+        """
+        Mesmas faixas, direto de sales (período fora do rollup): pedido
+        ocupa da faixa em que entrou até a que ficou pronto, como no refresh.
+        """
+        start_ts, end_ts = day_bounds(start_date, end_date)
+        slots = """
+            WITH orders AS (
+                SELECT
+                    s.created_at::DATE AS sale_date,
+                    s.production_seconds,
+                    FLOOR(EXTRACT(EPOCH FROM s.created_at::TIME) / 900)::INTEGER AS slot,
+                    LEAST(
+                        95,
+                        FLOOR((EXTRACT(EPOCH FROM s.created_at::TIME) + COALESCE(s.production_seconds, 0)) / 900)
+                    )::INTEGER AS last_slot
+                FROM sales s
+                WHERE s.store_id = :store_id
+                  AND s.sale_status_desc = 'COMPLETED'
+                  AND s.created_at >= :start_ts AND s.created_at < :end_ts
+            ),
+            started AS (
+                SELECT
+                    sale_date, slot,
+                    COUNT(*)                                                          AS started,
+                    COUNT(production_seconds)                                         AS n,
+                    COALESCE(SUM(production_seconds), 0)                              AS sy,
+                    COALESCE(SUM(production_seconds::BIGINT * production_seconds), 0) AS syy
+                FROM orders
+                GROUP BY 1, 2
+            ),
+            active AS (
+                SELECT o.sale_date, g.slot, COUNT(*) AS active
+                FROM orders o
+                CROSS JOIN LATERAL generate_series(o.slot, o.last_slot) AS g(slot)
+                GROUP BY 1, 2
+            )
+            SELECT
+                a.sale_date, a.slot, a.active,
+                COALESCE(st.started, 0) AS started,
+                COALESCE(st.n, 0)       AS n,
+                COALESCE(st.sy, 0)      AS sy,
+                COALESCE(st.syy, 0)     AS syy
+            FROM active a
+            LEFT JOIN started st ON st.sale_date = a.sale_date AND st.slot = a.slot
+        """
+        return await self._kitchen_load(slots, {"store_id": store_id, "start_ts": start_ts, "end_ts": end_ts})
+
+    async def _kitchen_load(self, slots: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        res = await self._execute(
+            text(f"""
+                SELECT
+                    slot::INTEGER             AS slot,
+                    SUM(active)::INTEGER      AS orders_active,
+                    MAX(active)::INTEGER      AS max_orders_active,
+                    SUM(started)::INTEGER     AS orders_started,
+                    SUM(n)::INTEGER           AS production_count,
+                    SUM(sy)::FLOAT            AS production_seconds_sum,
+                    SUM(syy)::FLOAT           AS production_seconds_sq_sum,
+                    SUM(n * active)::FLOAT    AS load_sum,
+                    SUM(n * active * active)::FLOAT AS load_sq_sum,
+                    SUM(sy * active)::FLOAT   AS load_x_seconds_sum
+                FROM ({slots}) slots
+                GROUP BY slot
+                ORDER BY slot
+            """),
+            params,
+        )
+        return await self._rows(res)
+
+    # ---------------------------------------------------------
+    # ADICIONAIS (addon_sales_daily / addon_product_daily, migração 013)
+    # ---------------------------------------------------------
+    async def get_addon_products(
+        self,
+        store_id: int,
+        start_date: date,
+        end_date: date,
+        product_id: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Linhas do produto, quantas com adicional e faturamento de adicionais
+        no período, por produto (só o ``product_id`` quando vier).
+        """
+        params: Dict[str, Any] = {"store_id": store_id, "start_date": start_date, "end_date": end_date}
+        product_filter = ""
+        if product_id is not None:
+            params["product_id"] = product_id
+            product_filter = "AND product_id = :product_id"
+        res = await self._execute(
+            text(f"""
+                SELECT
+                    product_id,
+                    SUM(product_lines)::INTEGER     AS product_lines,
+                    SUM(lines_with_addons)::INTEGER AS lines_with_addons,
+                    SUM(addon_revenue)              AS addon_revenue
+                FROM addon_product_daily
+                WHERE store_id = :store_id
+                  AND sale_date BETWEEN :start_date AND :end_date
+                  {product_filter}
+                GROUP BY product_id
+                ORDER BY addon_revenue DESC, product_id
+            """),
+            params,
+        )
+        rows = await self._rows(res)
+        names = await self._names("products", [r["product_id"] for r in rows])
+        return [named(r, "product_id", "product_name", names, keep_id=True) for r in rows]
+
+    async def get_top_addons(
+        self,
+        store_id: int,
+        product_id: int,
+        start_date: date,
+        end_date: date,
+        limit: int = 10,
+    ) -> List[Dict[str, Any]]:
+        """Itens mais colocados no produto: em quantas linhas entraram, quantidade e faturamento."""
+        res = await self._execute(
+            text("""
+                SELECT
+                    item_id,
+                    SUM(product_lines)::INTEGER AS product_lines,
+                    SUM(quantity)               AS quantity,
+                    SUM(revenue)                AS revenue
+                FROM addon_sales_daily
+                WHERE store_id = :store_id
+                  AND product_id = :product_id
+                  AND sale_date BETWEEN :start_date AND :end_date
+                GROUP BY item_id
+                ORDER BY product_lines DESC, revenue DESC, item_id
+                LIMIT :limit
+            """),
+            {
+                "store_id": store_id,
+                "product_id": product_id,
+                "start_date": start_date,
+                "end_date": end_date,
+                "limit": limit,
+            },
+        )
+        rows = await self._rows(res)
+        names = await self._names("items", [r["item_id"] for r in rows])
+        return [named(r, "item_id", "item_name", names, keep_id=True) for r in rows]
+
+    async def get_addon_products_raw(
+        self,
+        store_id: int,
+        start_date: date,
+        end_date: date,
+        product_id: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        get_addon_products direto do join sales -> product_sales ->
+        item_product_sales, pro período que o addon_product_daily ainda não
+        cobre (ver QueryPlanner.rollup_covers).
+        """
+        start_ts, end_ts = day_bounds(start_date, end_date)
+        params: Dict[str, Any] = {"store_id": store_id, "start_ts": start_ts, "end_ts": end_ts}
+        product_filter = ""
+        if product_id is not None:
+            params["product_id"] = product_id
+            product_filter = "AND ps.product_id = :product_id"
+        res = await self._execute(
+            text(f"""
+                WITH lines AS (
+                    SELECT ps.product_id, ps.id, ps.quantity
+                    FROM sales s
+                    JOIN product_sales ps ON ps.sale_id = s.id AND ps.sale_created_at = s.created_at
+                    WHERE s.store_id = :store_id
+                      AND s.sale_status_desc = 'COMPLETED'
+                      AND s.created_at >= :start_ts AND s.created_at < :end_ts
+                      AND ps.sale_created_at >= :start_ts AND ps.sale_created_at < :end_ts
+                      {product_filter}
+                ),
+                addons AS (
+                    SELECT ips.product_sale_id, SUM(ips.additional_price * ips.quantity) AS unit_revenue
+                    FROM lines l
+                    JOIN item_product_sales ips ON ips.product_sale_id = l.id
+                    GROUP BY 1
+                )
+                SELECT
+                    l.product_id,
+                    COUNT(*)::INTEGER                              AS product_lines,
+                    COUNT(a.product_sale_id)::INTEGER              AS lines_with_addons,
+                    COALESCE(SUM(a.unit_revenue * l.quantity), 0)  AS addon_revenue
+                FROM lines l
+                LEFT JOIN addons a ON a.product_sale_id = l.id
+                GROUP BY l.product_id
+                ORDER BY addon_revenue DESC, l.product_id
+            """),
+            params,
+        )
+        rows = await self._rows(res)
+        names = await self._names("products", [r["product_id"] for r in rows])
+        return [named(r, "product_id", "product_name", names, keep_id=True) for r in rows]
+
+    async def get_top_addons_raw(
+        self,
+        store_id: int,
+        product_id: int,
+        start_date: date,
+        end_date: date,
+        limit: int = 10,
+    ) -> List[Dict[str, Any]]:
+        """get_top_addons direto do join de três níveis (período fora do addon_sales_daily)."""
+        start_ts, end_ts = day_bounds(start_date, end_date)
+        res = await self._execute(
+            text("""
+                SELECT
+                    ips.item_id,
+                    COUNT(DISTINCT ps.id)::INTEGER                                   AS product_lines,
+                    COALESCE(SUM(ips.quantity * ps.quantity), 0)                     AS quantity,
+                    COALESCE(SUM(ips.additional_price * ips.quantity * ps.quantity), 0) AS revenue
+                FROM sales s
+                JOIN product_sales ps ON ps.sale_id = s.id AND ps.sale_created_at = s.created_at
+                JOIN item_product_sales ips ON ips.product_sale_id = ps.id
+                WHERE s.store_id = :store_id
+                  AND s.sale_status_desc = 'COMPLETED'
+                  AND s.created_at >= :start_ts AND s.created_at < :end_ts
+                  AND ps.sale_created_at >= :start_ts AND ps.sale_created_at < :end_ts
+                  AND ps.product_id = :product_id
+                GROUP BY ips.item_id
+                ORDER BY product_lines DESC, revenue DESC, ips.item_id
+                LIMIT :limit
+            """),
+            {"store_id": store_id, "product_id": product_id, "start_ts": start_ts, "end_ts": end_ts, "limit": limit},
+        )
+        rows = await self._rows(res)
+        names = await self._names("items", [r["item_id"] for r in rows])
+        return [named(r, "item_id", "item_name", names, keep_id=True) for r in rows]
+
+    # ---------------------------------------------------------
+    # COMPRADOS JUNTOS (product_affinity, migração 012)
+    # ---------------------------------------------------------
+    async def get_product_affinity(self, store_id: int, product_id: int, limit: int = 10) -> Dict[str, Any]:
+        """Top ``limit`` produtos levados junto com ``product_id``: leitura pela PK, sem tocar em vendas."""
+        res = await self._execute(
+            text("""
+                SELECT
+                    related_product_id, pair_orders, support, confidence, lift,
+                    product_orders, baskets, window_start, window_end
+                FROM product_affinity
+                WHERE store_id = :store_id
+                  AND product_id = :product_id
+                ORDER BY rank
+                LIMIT :limit
+            """),
+            {"store_id": store_id, "product_id": product_id, "limit": limit},
+        )
+        rows = await self._rows(res)
+        if not rows:
+            return {"product_name": None, "pairings": []}
+        names = await self._names("products", [product_id] + [r["related_product_id"] for r in rows])
+        return {
+            "product_name": names.get(product_id),
+            "pairings": [named(r, "related_product_id", "related_product_name", names, keep_id=True) for r in rows],
+        }
+
+    # ---------------------------------------------------------
+    # COORTES (customer_month_bitmap, migração 011)
+    # ---------------------------------------------------------
+    async def get_customer_month_bitmaps(
+        self,
+        store_id: int,
+        first_month: date,
+        last_month: date,
+    ) -> Dict[date, Dict[str, RoaringBitmap]]:
+        """Bitmaps ``active`` e ``new`` por mês (primeiro dia) da loja; mês sem venda não vem."""
+        res = await self._execute(
+            text("""
+                SELECT month, active, new_customers
+                FROM customer_month_bitmap
+                WHERE store_id = :store_id
+                  AND month BETWEEN :first_month AND :last_month
+            """),
+            {"store_id": store_id, "first_month": first_month, "last_month": last_month},
+        )
+        return {
+            r["month"]: {
+                "active": RoaringBitmap.from_bytes(r["active"]),
+                "new": RoaringBitmap.from_bytes(r["new_customers"]),
+            }
+            for r in await self._rows(res)
+        }
+
+    async def get_store_watermarks(self, store_ids: List[int]) -> Dict[int, int]:
+        """
+        Versão de dados por loja (migração 005). Lookup por PK: é o que
+        permite responder 304 sem rodar a consulta do widget.
+        """
+        sql = text("""
+            SELECT store_id, version
+            FROM store_data_watermark
+            WHERE store_id = ANY(:store_ids)
+        """)
+        res = await self._execute(sql, {"store_ids": store_ids})
+        marks = {sid: 0 for sid in store_ids}
+        for r in await self._rows(res):
+            marks[r["store_id"]] = r["version"]
+        return marks
+
+    async def get_live_sales_delta(
+        self,
+        store_id: int,
+        day: date,
+        after_sale_id: int = 0,
+    ) -> List[Dict[str, Any]]:
+        """
+        Vendas COMPLETED do dia com id > ``after_sale_id``, já somadas por
+        canal: é o incremento que o feed ao vivo aplica no estado em memória.
+        O filtro em created_at mantém o scan na partição do mês; o id é o
+        cursor. Cancelamentos e ids commitados fora de ordem escapam do
+        cursor e são corrigidos no resync periódico (after_sale_id=0).
+        """
+        start_ts, end_ts = day_bounds(day, day)
+        sql = text("""
+            SELECT
+                s.channel_id                     AS channel,
+                COUNT(*)                         AS total_orders,
+                COALESCE(SUM(s.total_amount), 0) AS total_sales,
+                MAX(s.id)                        AS last_sale_id
+            FROM sales s
+            WHERE s.store_id = :store_id
+              AND s.sale_status_desc = 'COMPLETED'
+              AND s.created_at >= :start_ts AND s.created_at < :end_ts
+              AND s.id > :after_sale_id
+            GROUP BY s.channel_id
+        """)
+        res = await self._execute(
+            sql,
+            {
+                "store_id": store_id,
+                "start_ts": start_ts,
+                "end_ts": end_ts,
+                "after_sale_id": after_sale_id,
+            },
+        )
+        rows = await self._rows(res)
+        names = await self._names("channels", [r["channel"] for r in rows])
+        return [named(r, "channel", "channel", names) for r in rows]
+
     async def get_last_sale_date_for_store(self, store_id: int) -> Optional[date]:
             """
             Retorna a última data (DATE) em que houve venda COMPLETED para a loja.
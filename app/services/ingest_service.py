@@ -0,0 +1,202 @@
+# app/services/ingest_service.py
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy.exc import DataError, IntegrityError
+
+from app.repositories.ingest_repository import IngestRepository
+
+# marca de fim na fila: o flusher grava o que veio antes dela e sai
+_STOP = object()
+
+
+class SalesIngestor:
+    """
+    Fila assíncrona entre a rota de ingestão e o banco (group commit).
+    Requisições concorrentes entram na fila e um único flusher junta até
+    ``max_batch`` vendas (ou o que chegou em ``max_wait`` segundos) numa
+    transação só. Cada requisição espera o commit do lote em que entrou,
+    então a resposta só sai com a venda gravada.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Any],
+        max_batch: int = 2000,
+        max_wait: float = 0.05,
+        max_pending: int = 50000,
+    ):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_pending = max_pending
+
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._pending = 0
+        self._task: Optional[asyncio.Task] = None
+
+        self.batches = 0
+        self.received = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.errors = 0
+        self.isolated_retries = 0
+        self.total_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.last_error: Optional[str] = None
+
+    # ---------------------------------------------------------
+    # entrada
+    # ---------------------------------------------------------
+    async def submit(self, sales: List[Dict[str, Any]]) -> Dict[str, Any]:
+        if not sales:
+            return {"received": 0, "inserted": 0, "duplicates": []}
+        if self._pending + len(sales) > self.max_pending:
+            raise HTTPException(
+                status_code=503,
+                detail="Fila de ingestão cheia, tente de novo",
+                headers={"Retry-After": "1"},
+            )
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending += len(sales)
+        self.received += len(sales)
+        await self._queue.put((sales, future))
+        return await future
+
+    # ---------------------------------------------------------
+    # flusher
+    # ---------------------------------------------------------
+    async def _collect(self) -> Tuple[List[Tuple[List[Dict[str, Any]], asyncio.Future]], bool]:
+        """
+        Espera a primeira requisição e junta o que chegar até encher o lote.
+        Devolve (lote, parar): com ``_STOP`` na fila o lote sai na hora.
+        """
+        first = await self._queue.get()
+        if first is _STOP:
+            return [], True
+        requests = [first]
+        size = len(first[0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            if item is _STOP:
+                return requests, True
+            requests.append(item)
+            size += len(item[0])
+        return requests, False
+
+    async def _run(self) -> None:
+        while True:
+            requests, stopping = await self._collect()
+            if requests:
+                await self.flush(requests)
+            if stopping:
+                return
+
+    async def flush(self, requests: List[Tuple[List[Dict[str, Any]], asyncio.Future]]) -> None:
+        size = sum(len(batch) for batch, _ in requests)
+        try:
+            await self._write(requests)
+        finally:
+            self._pending -= size
+
+    async def _write(self, requests: List[Tuple[List[Dict[str, Any]], asyncio.Future]]) -> None:
+        sales = [sale for batch, _ in requests for sale in batch]
+        started = time.perf_counter()
+        try:
+            async with self.session_factory() as session:
+                result = await IngestRepository(session).write_batch(sales)
+                await session.commit()
+        except Exception as exc:
+            self.errors += 1
+            self.last_error = f"{type(exc).__name__}: {exc}"[:200]
+            rejected = isinstance(exc, (IntegrityError, DataError))
+            if rejected and len(requests) > 1:
+                # dado ruim (ex.: store_id inexistente) derruba a transação de
+                # todo mundo: cada requisição tenta de novo na sua, e só a
+                # culpada recebe o erro
+                self.isolated_retries += 1
+                for request in requests:
+                    await self._write([request])
+                return
+            if rejected:
+                error = HTTPException(
+                    status_code=422,
+                    detail=f"Lote rejeitado pelo banco ({type(getattr(exc, 'orig', exc)).__name__}); corrija antes de reenviar",
+                )
+            else:
+                error = HTTPException(status_code=503, detail="Falha ao gravar o lote", headers={"Retry-After": "1"})
+            for _, future in requests:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.batches += 1
+        self.total_flush_ms += elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+
+        # quem vê a chave primeiro (na ordem da fila) é o dono da venda
+        inserted_keys = result["inserted_keys"]
+        seen = set()
+        for batch, future in requests:
+            inserted, duplicates = 0, []
+            for sale in batch:
+                key = (sale["store_id"], sale["cod_sale1"])
+                if key in inserted_keys and key not in seen:
+                    inserted += 1
+                else:
+                    duplicates.append(sale["cod_sale1"])
+                seen.add(key)
+            self.inserted += inserted
+            self.duplicates += len(duplicates)
+            if not future.done():
+                future.set_result({"received": len(batch), "inserted": inserted, "duplicates": duplicates})
+
+    async def stop(self) -> None:
+        """
+        Sem ``cancel()``: um lote cancelado no meio do flush (ou já tirado da
+        fila pelo ``_collect``) deixaria a requisição esperando pra sempre.
+        A marca de fim entra atrás do que já está na fila, o flusher termina
+        o lote atual, grava o resto e sai.
+        """
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            await self._queue.put(_STOP)
+            await task
+        # flusher que morreu antes (ou nunca subiu): o que sobrou ainda é gravado
+        requests = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not _STOP:
+                requests.append(item)
+        if requests:
+            await self.flush(requests)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "pending": self._pending,
+            "batches": self.batches,
+            "received": self.received,
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "errors": self.errors,
+            "isolated_retries": self.isolated_retries,
+            "avg_batch_size": round((self.inserted + self.duplicates) / self.batches, 1) if self.batches else None,
+            "avg_flush_ms": round(self.total_flush_ms / self.batches, 2) if self.batches else None,
+            "max_flush_ms": round(self.max_flush_ms, 2),
+            "last_error": self.last_error,
+        }
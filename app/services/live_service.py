@@ -0,0 +1,337 @@
+# app/services/live_service.py
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Set
+
+from app.repositories.dimension_cache import DimensionCache
+from app.repositories.sales_repository import SalesRepository
+
+# quantos clientes em risco o feed acompanha (primeira página da lista)
+AT_RISK_WATCH_LIMIT = 200
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """Um evento no formato text/event-stream."""
+    data = json.dumps(event, default=str, separators=(",", ":"))
+    return f"event: {event['type']}\nid: {event.get('seq', 0)}\ndata: {data}\n\n"
+
+
+class LiveDashboardState:
+    """
+    Totais do dia de uma loja mantidos em memória. Cada lote de vendas
+    novas (já somado por canal no banco) é aplicado aqui e vira um delta
+    com só o que mudou — sem rodar o revenue-overview de novo.
+    """
+
+    def __init__(self, store_id: int, day: date):
+        self.store_id = store_id
+        self.day = day
+        self.total_sales = 0.0
+        self.total_orders = 0
+        self.channels: Dict[str, Dict[str, Any]] = {}
+        self.last_sale_id = 0
+        self.at_risk: Dict[int, Dict[str, Any]] = {}
+
+    def _shares(self) -> Dict[str, float]:
+        if self.total_sales <= 0:
+            return {name: 0.0 for name in self.channels}
+        return {
+            name: round(ch["total_sales"] / self.total_sales * 100, 2)
+            for name, ch in self.channels.items()
+        }
+
+    def _totals(self) -> Dict[str, Any]:
+        return {
+            "total_sales": round(self.total_sales, 2),
+            "total_orders": self.total_orders,
+            "average_ticket": round(self.total_sales / self.total_orders, 2) if self.total_orders else 0.0,
+        }
+
+    def _channel(self, name: str, shares: Dict[str, float]) -> Dict[str, Any]:
+        ch = self.channels[name]
+        return {
+            "channel": name,
+            "total_sales": round(ch["total_sales"], 2),
+            "total_orders": ch["total_orders"],
+            "share_pct": shares.get(name, 0.0),
+        }
+
+    def apply(self, rows: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Soma o lote; devolve None se não havia nada novo."""
+        if not rows:
+            return None
+
+        shares_before = self._shares()
+        inc_sales = 0.0
+        inc_orders = 0
+        for r in rows:
+            sales = float(r["total_sales"] or 0)
+            orders = int(r["total_orders"] or 0)
+            ch = self.channels.setdefault(r["channel"], {"total_sales": 0.0, "total_orders": 0})
+            ch["total_sales"] += sales
+            ch["total_orders"] += orders
+            inc_sales += sales
+            inc_orders += orders
+            self.last_sale_id = max(self.last_sale_id, int(r["last_sale_id"] or 0))
+
+        self.total_sales += inc_sales
+        self.total_orders += inc_orders
+
+        # só os canais que receberam venda ou cuja participação mexeu
+        shares = self._shares()
+        touched = {r["channel"] for r in rows}
+        changed = sorted(
+            name for name in self.channels
+            if name in touched or shares.get(name) != shares_before.get(name)
+        )
+        return {
+            "type": "delta",
+            "store_id": self.store_id,
+            "day": self.day,
+            "increment": {"total_sales": round(inc_sales, 2), "total_orders": inc_orders},
+            "totals": self._totals(),
+            "channels": [self._channel(name, shares) for name in changed],
+        }
+
+    def set_at_risk(self, rows: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Troca a lista de clientes em risco; delta com quem entrou/saiu."""
+        current = {int(r["customer_id"]): r for r in rows}
+        added = [current[cid] for cid in current if cid not in self.at_risk]
+        removed = sorted(cid for cid in self.at_risk if cid not in current)
+        self.at_risk = current
+        if not added and not removed:
+            return None
+        return {
+            "type": "delta",
+            "store_id": self.store_id,
+            "day": self.day,
+            "at_risk_added": [
+                {
+                    "customer_id": int(r["customer_id"]),
+                    "customer_name": r["customer_name"],
+                    "total_orders": r["total_orders"],
+                    "last_order_date": r["last_order_date"],
+                    "days_since_last_order": r["days_since_last_order"],
+                }
+                for r in added
+            ],
+            "at_risk_removed": removed,
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        shares = self._shares()
+        return {
+            "type": "snapshot",
+            "store_id": self.store_id,
+            "day": self.day,
+            "totals": self._totals(),
+            "channels": [self._channel(name, shares) for name in sorted(self.channels)],
+            "at_risk_count": len(self.at_risk),
+        }
+
+
+class StoreFeed:
+    """
+    Produtor único de uma loja. Enquanto houver assinante, a cada
+    ``poll_interval`` lê a versão da loja (store_data_watermark, lookup por
+    PK) e só quando ela muda busca as vendas depois do último id visto.
+    Todo assinante recebe o mesmo evento: o custo no banco é por loja, não
+    por cliente conectado. A cada ``resync_interval`` o dia é recalculado
+    do zero (corrige cancelamentos) e a lista de clientes em risco é
+    comparada com a anterior.
+    """
+
+    def __init__(
+        self,
+        store_id: int,
+        session_factory: Callable[[], Any],
+        poll_interval: float = 2.0,
+        resync_interval: float = 300.0,
+        queue_size: int = 100,
+        today: Callable[[], date] = date.today,
+        dimensions: Optional[DimensionCache] = None,
+    ):
+        self.store_id = store_id
+        self.session_factory = session_factory
+        # nomes dos canais do delta: cache do worker, ou um da própria loja
+        self.dimensions = dimensions if dimensions is not None else DimensionCache()
+        self.poll_interval = poll_interval
+        self.resync_interval = resync_interval
+        self.queue_size = queue_size
+        self.today = today
+
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.state: Optional[LiveDashboardState] = None
+        self._version: Optional[int] = None
+        self._last_resync = 0.0
+        self._seq = 0
+        self._task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+
+        self.ticks = 0
+        self.queries = 0
+        self.events = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+
+    # ---------------------------------------------------------
+    # assinantes
+    # ---------------------------------------------------------
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        if self.state is not None:
+            queue.put_nowait(self._stamp(self.state.snapshot()))
+        self.subscribers.add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self.subscribers.discard(queue)
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def wake(self) -> None:
+        """Aviso de mudança (NOTIFY): roda o próximo tick sem esperar o intervalo."""
+        self._wake.set()
+
+    def _stamp(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        self._seq += 1
+        return {**event, "seq": self._seq}
+
+    def _publish(self, event: Dict[str, Any]) -> None:
+        event = self._stamp(event)
+        self.events += 1
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # cliente lento: descarta o atrasado e recomeça do snapshot
+                self.dropped += 1
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(self._stamp(self.state.snapshot()))
+
+    # ---------------------------------------------------------
+    # produtor
+    # ---------------------------------------------------------
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # banco fora: tenta de novo no próximo ciclo
+                self.errors += 1
+                self.last_error = f"{type(exc).__name__}: {exc}"[:200]
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def tick(self) -> None:
+        self.ticks += 1
+        async with self.session_factory() as session:
+            repo = SalesRepository(session, self.dimensions)
+            day = self.today()
+
+            # versão antes dos dados: mudança no meio do caminho reaparece no próximo tick
+            version = (await repo.get_store_watermarks([self.store_id])).get(self.store_id, 0)
+            self.queries += 1
+
+            due = time.monotonic() - self._last_resync >= self.resync_interval
+            if self.state is None or self.state.day != day or due:
+                await self._resync(repo, day)
+            elif version != self._version:
+                rows = await repo.get_live_sales_delta(self.store_id, day, self.state.last_sale_id)
+                self.queries += 1
+                delta = self.state.apply(rows)
+                if delta:
+                    self._publish(delta)
+            self._version = version
+
+    async def _resync(self, repo: SalesRepository, day: date) -> None:
+        self._last_resync = time.monotonic()
+        previous = self.state
+
+        before = previous.snapshot() if previous is not None and previous.day == day else None
+
+        state = LiveDashboardState(self.store_id, day)
+        state.apply(await repo.get_live_sales_delta(self.store_id, day, 0))
+        if before is not None:
+            state.at_risk = previous.at_risk
+        at_risk_delta = state.set_at_risk(
+            await repo.get_at_risk_customers(self.store_id, limit=AT_RISK_WATCH_LIMIT)
+        )
+        self.queries += 2
+        self.state = state
+
+        # dia novo ou totais corrigidos => snapshot; senão só a troca de clientes em risco
+        after = state.snapshot()
+        if before is None or (before["totals"], before["channels"]) != (after["totals"], after["channels"]):
+            self._publish(after)
+        if before is not None and at_risk_delta:
+            self._publish(at_risk_delta)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "store_id": self.store_id,
+            "subscribers": len(self.subscribers),
+            "ticks": self.ticks,
+            "queries": self.queries,
+            "events": self.events,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "last_sale_id": self.state.last_sale_id if self.state else None,
+        }
+
+
+class LiveDashboardHub:
+    """Um StoreFeed por loja com assinante; o feed some com o último cliente."""
+
+    def __init__(self, session_factory: Callable[[], Any], **feed_options: Any):
+        self.session_factory = session_factory
+        self.feed_options = feed_options
+        self.feeds: Dict[int, StoreFeed] = {}
+
+    @asynccontextmanager
+    async def subscribe(self, store_id: int) -> AsyncIterator[asyncio.Queue]:
+        feed = self.feeds.get(store_id)
+        if feed is None:
+            feed = self.feeds[store_id] = StoreFeed(store_id, self.session_factory, **self.feed_options)
+        queue = feed.subscribe()
+        try:
+            yield queue
+        finally:
+            feed.unsubscribe(queue)
+            if not feed.subscribers and self.feeds.get(store_id) is feed:
+                del self.feeds[store_id]
+                await feed.stop()
+
+    def wake(self, store_ids: Iterable[int]) -> None:
+        for store_id in store_ids:
+            feed = self.feeds.get(store_id)
+            if feed is not None:
+                feed.wake()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "stores": len(self.feeds),
+            "subscribers": sum(len(f.subscribers) for f in self.feeds.values()),
+            "feeds": [f.metrics() for f in self.feeds.values()],
+        }
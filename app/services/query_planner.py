@@ -0,0 +1,354 @@
+# app/services/query_planner.py
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from datetime import date, timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from app.core.sampling import CONFIDENCE_LEVEL, next_sample_pct
+
+STRATEGY_RAW = "raw"
+STRATEGY_ROLLUP = "rollup"
+STRATEGY_APPROXIMATE = "approximate"
+STRATEGIES = (STRATEGY_RAW, STRATEGY_ROLLUP, STRATEGY_APPROXIMATE)
+
+# header com a estratégia escolhida (rotas que devolvem lista ou CSV)
+STRATEGY_HEADER = "X-Query-Strategy"
+
+# itens de produto por venda (o gerador põe de 1 a 5)
+LINES_PER_SALE = 3.0
+
+# menor amostra aceita (%): abaixo disso o intervalo não diz nada
+MIN_SAMPLE_PCT = 0.1
+
+Path = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+class QueryPlanner:
+    """
+    Escolhe, por requisição, como responder um widget: SQL cru em ``sales``,
+    rollup por hora (``sales_hourly``/``product_sales_hourly``) ou amostra.
+
+    O custo é estimado em linhas: pedidos/dia de cada loja (média dos
+    últimos 28 dias no rollup, em cache por ``stats_ttl``) × dias do
+    período × seletividade dos filtros (× itens por venda nas consultas de
+    produto). Até ``raw_max_rows`` vai cru, que é exato e já atendido pela
+    janela quente/espelho quando ligados. Acima disso vai pro rollup, se a
+    consulta tiver caminho de rollup, o período estiver inteiro dentro da
+    cobertura do rollup de cada loja (``rollup_coverage``) e não houver
+    dia pendente de recálculo nele. Sem rollup, a partir de ``approx_min_rows`` e com
+    ``allow_approximate``, vai pra amostra.
+
+    ``?approx=true`` (``approximate``) pede a amostra explicitamente, com
+    ou sem planner ligado: o percentual sai de ``approx_target_rows`` (ou
+    vem pronto no refinamento progressivo) e só volta pro cru quando a
+    amostra seria a tabela inteira, quando a loja é uma fatia pequena demais
+    da partição (o TABLESAMPLE sorteia páginas de todas as lojas, ver
+    ``_plan_sample``) ou quando a janela quente/espelho já responde.
+
+    Plano escolhido, estimativa e latência por estratégia ficam nas
+    métricas (``/health/planner``), pra calibrar os limites.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        raw_max_rows: int = 50_000,
+        approx_min_rows: int = 5_000_000,
+        approx_target_rows: int = 200_000,
+        allow_approximate: bool = False,
+        default_daily_orders: float = 100.0,
+        stats_ttl: float = 600.0,
+        today: Callable[[], date] = date.today,
+    ):
+        self.enabled = enabled
+        self.raw_max_rows = raw_max_rows
+        self.approx_min_rows = approx_min_rows
+        self.approx_target_rows = approx_target_rows
+        self.allow_approximate = allow_approximate
+        self.default_daily_orders = default_daily_orders
+        self.stats_ttl = stats_ttl
+        self.today = today
+
+        self._rates: Dict[int, float] = {}
+        self._rates_at: Optional[float] = None
+        self._rates_lock = asyncio.Lock()
+
+        self.stats_loads = 0
+        self.fallbacks = 0
+        self.last_error: Optional[str] = None
+        self._by_query: Dict[str, Dict[str, Dict[str, float]]] = {}
+
+    @classmethod
+    def from_env(cls) -> "QueryPlanner":
+        return cls(
+            enabled=os.getenv("PLANNER_ENABLED", "1") == "1",
+            raw_max_rows=int(os.getenv("PLANNER_RAW_MAX_ROWS", "50000")),
+            approx_min_rows=int(os.getenv("PLANNER_APPROX_MIN_ROWS", "5000000")),
+            approx_target_rows=int(os.getenv("PLANNER_APPROX_TARGET_ROWS", "200000")),
+            allow_approximate=os.getenv("PLANNER_ALLOW_APPROXIMATE", "0") == "1",
+            default_daily_orders=float(os.getenv("PLANNER_DEFAULT_DAILY_ORDERS", "100")),
+        )
+
+    # ---------------------------------------------------------
+    # estatística das lojas
+    # ---------------------------------------------------------
+    async def store_rates(self, repo: Any) -> Dict[int, float]:
+        """Pedidos/dia por loja; erro (ex.: rollup não migrado) => padrão."""
+        if self._rates_at is not None and time.monotonic() - self._rates_at < self.stats_ttl:
+            return self._rates
+        async with self._rates_lock:
+            if self._rates_at is not None and time.monotonic() - self._rates_at < self.stats_ttl:
+                return self._rates
+            try:
+                since = self.today() - timedelta(days=28)
+                orders = await repo.get_store_daily_orders(since)
+                self._rates = {sid: total / 28 for sid, total in orders.items()}
+                self.stats_loads += 1
+            except Exception as exc:
+                self._record_error(exc)
+                await rollback_session(repo)
+            self._rates_at = time.monotonic()
+        return self._rates
+
+    def _rate(self, rates: Dict[int, float], store_id: int) -> float:
+        if store_id in rates:
+            return rates[store_id]
+        # loja sem histórico no rollup: média das outras, senão o padrão
+        return sum(rates.values()) / len(rates) if rates else self.default_daily_orders
+
+    # ---------------------------------------------------------
+    # plano
+    # ---------------------------------------------------------
+    async def plan(
+        self,
+        repo: Any,
+        query: str,
+        method: str,
+        store_ids: Iterable[int],
+        start_date: date,
+        end_date: date,
+        strategies: Iterable[str],
+        selectivity: float = 1.0,
+        product_lines: bool = False,
+        approximate: bool = False,
+        sample_pct: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """
+        ``start_date`` é o primeiro dia que a consulta lê (com o período de
+        comparação, se houver); ``strategies`` são os caminhos que ela tem.
+        """
+        store_ids = list(store_ids)
+        available = [s for s in strategies if s in STRATEGIES]
+        days = max((end_date - start_date).days + 1, 1)
+        plan: Dict[str, Any] = {
+            "query": query,
+            "strategy": STRATEGY_RAW,
+            "reason": "planner_off",
+            "source": "postgres",
+            "days": days,
+            "stores": len(store_ids),
+            "estimated_rows": None,
+        }
+        approximate = approximate and STRATEGY_APPROXIMATE in available
+        if not self.enabled and not approximate:
+            return plan
+
+        rates = await self.store_rates(repo)
+        store_orders = sum(self._rate(rates, sid) for sid in store_ids)
+        # TABLESAMPLE sorteia páginas da partição, de todas as lojas
+        partition_orders = sum(self._rate(rates, sid) for sid in set(rates) | set(store_ids))
+        share = store_orders / partition_orders if partition_orders else 1.0
+        rows = store_orders * days * selectivity
+        if product_lines:
+            rows *= LINES_PER_SALE
+        plan["estimated_rows"] = int(rows)
+
+        source = repo.raw_source(method, start_date, end_date)
+        if source != "postgres":
+            # janela quente/espelho já respondem o cru sem ir ao Postgres
+            plan.update(reason=f"raw_served_by_{source}", source=source)
+            return plan
+        if approximate:
+            return self._plan_sample(plan, rows, sample_pct, share)
+        if rows <= self.raw_max_rows:
+            plan["reason"] = "small"
+            return plan
+
+        if STRATEGY_ROLLUP in available:
+            uncovered, pending = await self._rollup_gaps(repo, store_ids, start_date, end_date)
+            if not uncovered and not pending:
+                plan.update(strategy=STRATEGY_ROLLUP, reason="large", source="rollup")
+                return plan
+            if uncovered:
+                plan["rollup_uncovered_stores"] = uncovered
+            if pending:
+                plan["rollup_pending_days"] = pending
+
+        if STRATEGY_APPROXIMATE in available and self.allow_approximate and rows >= self.approx_min_rows:
+            return self._plan_sample(plan, rows, None, share, reason="huge")
+
+        if plan.get("rollup_uncovered_stores"):
+            plan["reason"] = "rollup_not_covered"
+        elif plan.get("rollup_pending_days"):
+            plan["reason"] = "rollup_stale"
+        else:
+            plan["reason"] = "no_cheaper_path"
+        return plan
+
+    async def rollup_covers(self, repo: Any, store_ids: List[int], start_date: date, end_date: date) -> bool:
+        """
+        Rollup cobre o período inteiro e não tem dia pendente. Pra quem lê um
+        rollup direto, fora do plan() (heatmap, matriz por hora...).
+        """
+        uncovered, pending = await self._rollup_gaps(repo, store_ids, start_date, end_date)
+        return not uncovered and not pending
+
+    async def _rollup_gaps(self, repo: Any, store_ids: List[int], start_date: date, end_date: date):
+        """
+        (lojas sem cobertura do período, dias pendentes). Rollup vazio
+        (nunca populado) não tem dia pendente: sem a cobertura, o planner
+        responderia zeros. Erro (migração não aplicada) conta como sem cobertura.
+        """
+        try:
+            uncovered = await repo.count_rollup_uncovered_stores(store_ids, start_date, end_date)
+            if uncovered:
+                return uncovered, 0
+            return 0, await repo.count_rollup_pending_days(store_ids, start_date, end_date)
+        except Exception as exc:
+            self._record_error(exc)
+            await rollback_session(repo)
+            return len(store_ids), 0
+
+    def _plan_sample(
+        self,
+        plan: Dict[str, Any],
+        rows: float,
+        sample_pct: Optional[float],
+        share: float = 1.0,
+        reason: str = "requested",
+    ) -> Dict[str, Any]:
+        """
+        ``sample_pct`` sai das linhas da(s) loja(s), pra amostra ter
+        ~``approx_target_rows`` delas; mas o TABLESAMPLE lê essa fração das
+        páginas da partição inteira. Com a loja sendo ``share`` da partição,
+        a amostra lê p/share vezes o que o exato lê pelo índice da loja:
+        com p >= share não compensa e vai o exato.
+        """
+        if sample_pct is None:
+            sample_pct = self.approx_target_rows / rows * 100 if rows else 100.0
+        sample_pct = round(max(MIN_SAMPLE_PCT, min(100.0, sample_pct)), 3)
+        plan["store_share_pct"] = round(share * 100, 2)
+        if sample_pct >= 100:
+            # amostra do tamanho da tabela: o exato custa o mesmo
+            plan["reason"] = "sample_would_be_full"
+            return plan
+        if sample_pct >= share * 100:
+            # loja pequena na partição: as páginas sorteadas são quase todas de outras lojas
+            plan["reason"] = "sample_not_cheaper"
+            return plan
+        plan.update(
+            strategy=STRATEGY_APPROXIMATE,
+            reason=reason,
+            sample_pct=sample_pct,
+            confidence_level=CONFIDENCE_LEVEL,
+            # refinamento: mesma requisição com sample_pct maior; None => pedir o exato
+            next_sample_pct=next_sample_pct(sample_pct),
+        )
+        return plan
+
+    async def execute(
+        self,
+        repo: Any,
+        query: str,
+        method: str,
+        store_ids: Iterable[int],
+        start_date: date,
+        end_date: date,
+        paths: Dict[str, Path],
+        selectivity: float = 1.0,
+        product_lines: bool = False,
+        approximate: bool = False,
+        sample_pct: Optional[float] = None,
+    ):
+        """Planeja, roda o caminho escolhido e devolve (resultado, plano)."""
+        plan = await self.plan(
+            repo,
+            query,
+            method,
+            store_ids,
+            start_date,
+            end_date,
+            paths.keys(),
+            selectivity,
+            product_lines,
+            approximate,
+            sample_pct,
+        )
+        started = time.perf_counter()
+        try:
+            result = await paths[plan["strategy"]](plan)
+        except Exception as exc:
+            if plan["strategy"] == STRATEGY_RAW:
+                raise
+            # rollup/amostra com erro (ex.: migração 008 não aplicada): cai no cru
+            self._record_error(exc)
+            self.fallbacks += 1
+            await rollback_session(repo)
+            plan.update(strategy=STRATEGY_RAW, reason=f"{plan['strategy']}_failed", source="postgres")
+            for key in ("sample_pct", "confidence_level", "next_sample_pct"):
+                plan.pop(key, None)
+            result = await paths[STRATEGY_RAW](plan)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        plan["elapsed_ms"] = round(elapsed_ms, 2)
+        self.record(plan, elapsed_ms)
+        return result, plan
+
+    # ---------------------------------------------------------
+    # métricas
+    # ---------------------------------------------------------
+    def record(self, plan: Dict[str, Any], elapsed_ms: float) -> None:
+        entry = self._by_query.setdefault(plan["query"], {}).setdefault(
+            plan["strategy"], {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "estimated_rows": 0}
+        )
+        entry["count"] += 1
+        entry["total_ms"] += elapsed_ms
+        entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+        entry["estimated_rows"] += plan["estimated_rows"] or 0
+
+    def _record_error(self, exc: BaseException) -> None:
+        self.last_error = f"{type(exc).__name__}: {exc}"[:200]
+
+    def metrics(self) -> Dict[str, Any]:
+        queries: Dict[str, List[Dict[str, Any]]] = {}
+        for query, strategies in sorted(self._by_query.items()):
+            queries[query] = [
+                {
+                    "strategy": strategy,
+                    "count": int(e["count"]),
+                    "avg_ms": round(e["total_ms"] / e["count"], 2),
+                    "max_ms": round(e["max_ms"], 2),
+                    "avg_estimated_rows": int(e["estimated_rows"] / e["count"]),
+                }
+                for strategy, e in sorted(strategies.items())
+            ]
+        return {
+            "enabled": self.enabled,
+            "raw_max_rows": self.raw_max_rows,
+            "approx_min_rows": self.approx_min_rows,
+            "allow_approximate": self.allow_approximate,
+            "stores_with_stats": len(self._rates),
+            "stats_loads": self.stats_loads,
+            "fallbacks": self.fallbacks,
+            "last_error": self.last_error,
+            "queries": queries,
+        }
+
+
+async def rollback_session(repo: Any) -> None:
+    # transação abortada no Postgres não aceita a próxima consulta
+    rollback = getattr(repo.db, "rollback", None)
+    if rollback is not None:
+        await rollback()
@@ -2,18 +2,21 @@ from __future__ import annotations
 
 from datetime import date, datetime
 from io import StringIO
-from typing import Iterable
+from typing import Iterable, Optional
 
 from fastapi import HTTPException
 
 from app.repositories.sales_repository import SalesRepository
+from app.services.query_planner import STRATEGY_RAW, STRATEGY_ROLLUP, QueryPlanner
 
 
 class ReportService:
     """Gera relatórios executivos em CSV a partir dos dados de vendas."""
 
-    def __init__(self, repository: SalesRepository) -> None:
+    def __init__(self, repository: SalesRepository, planner: Optional[QueryPlanner] = None) -> None:
         self.repo = repository
+        self.planner = planner if planner is not None else QueryPlanner(enabled=False)
+        self.last_plan: Optional[dict] = None
 
     async def build_store_performance_report(
         self,
@@ -30,10 +33,23 @@ class ReportService:
         if start > end:
             raise HTTPException(status_code=400, detail="Data inicial deve ser anterior à final")
 
-        store_metrics = await self.repo.get_store_performance_for_period(
-            store_ids=list(store_ids),
-            start_date=start,
-            end_date=end,
+        store_ids = list(store_ids)
+        # muitas lojas x período longo => rollup por hora em vez de varrer sales
+        store_metrics, self.last_plan = await self.planner.execute(
+            self.repo,
+            "store_performance",
+            "get_store_performance_for_period",
+            store_ids,
+            start,
+            end,
+            {
+                STRATEGY_RAW: lambda plan: self.repo.get_store_performance_for_period(
+                    store_ids=store_ids,
+                    start_date=start,
+                    end_date=end,
+                ),
+                STRATEGY_ROLLUP: lambda plan: self.repo.get_store_performance_rollup(store_ids, start, end),
+            },
         )
 
         if not store_metrics:
@@ -0,0 +1,95 @@
+# app/services/rollup_refresher.py
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Callable, Dict, Optional
+
+from app.repositories.rollup_repository import RollupRepository
+
+
+class RollupRefresher:
+    """
+    Drena rollup_dirty_days em background quando chega aviso de mudança:
+    só os (loja, dia) tocados são recalculados. Um dreno por vez; aviso
+    que chega durante o dreno agenda mais uma rodada, e ``min_interval``
+    evita recalcular o mesmo dia a cada venda numa rajada.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Any],
+        batch: int = 200,
+        min_interval: float = 5.0,
+    ):
+        self.session_factory = session_factory
+        self.batch = batch
+        self.min_interval = min_interval
+
+        self._task: Optional[asyncio.Task] = None
+        self._again = False
+
+        self.runs = 0
+        self.store_days = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self.last_run_ms: Optional[float] = None
+        self.last_lag_seconds: Optional[float] = None
+        self.max_lag_seconds = 0.0
+
+    def schedule(self, *_: Any) -> None:
+        """Serve direto como handler do ChangeListener."""
+        if self._task is not None and not self._task.done():
+            self._again = True
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            self._again = False
+            started = time.perf_counter()
+            try:
+                await self.drain()
+            except Exception as exc:  # a marca continua na tabela; próximo aviso tenta de novo
+                self.errors += 1
+                self.last_error = f"{type(exc).__name__}: {exc}"[:200]
+            self.runs += 1
+            self.last_run_ms = (time.perf_counter() - started) * 1000
+            if not self._again:
+                return
+            await asyncio.sleep(self.min_interval)
+
+    async def drain(self) -> int:
+        total = 0
+        while True:
+            async with self.session_factory() as session:
+                done = await RollupRepository(session).refresh_dirty(self.batch)
+                await session.commit()
+            if not done:
+                return total
+            total += len(done)
+            self.store_days += len(done)
+            lag = max(d["lag_seconds"] for d in done)
+            self.last_lag_seconds = lag
+            self.max_lag_seconds = max(self.max_lag_seconds, lag)
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "runs": self.runs,
+            "store_days": self.store_days,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "last_run_ms": round(self.last_run_ms, 2) if self.last_run_ms is not None else None,
+            "last_lag_seconds": round(self.last_lag_seconds, 3) if self.last_lag_seconds is not None else None,
+            "max_lag_seconds": round(self.max_lag_seconds, 3),
+        }
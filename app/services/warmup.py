@@ -0,0 +1,147 @@
+# app/services/warmup.py
+from __future__ import annotations
+
+import asyncio
+import time
+from datetime import date, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.core.db_router import STATEMENT_TIMEOUT_SQL, DatabaseRouter, DatabaseTarget
+from app.core.geo import DEFAULT_GRID_ZOOM
+from app.repositories.dimension_cache import DimensionCache
+from app.repositories.sales_repository import SalesRepository
+
+# loja que não existe: cada consulta vira um lookup de índice vazio, mas o
+# statement é preparado na conexão do mesmo jeito
+WARMUP_STORE_ID = -1
+WARMUP_STATEMENT_TIMEOUT_MS = 5000
+
+RepoCall = Callable[[SalesRepository], Awaitable[Any]]
+
+
+def warmup_calls(today: Optional[date] = None) -> Dict[str, RepoCall]:
+    """
+    Uma chamada por método público do SalesRepository, no formato que as
+    rotas usam por padrão (sem filtros opcionais, primeira página). O teste
+    garante que método novo no repositório entra aqui também.
+    """
+    day = today or date.today()
+    start = day - timedelta(days=6)
+    sid = WARMUP_STORE_ID
+    return {
+        "get_top_products_flexible": lambda r: r.get_top_products_flexible(
+            sid, None, start, day, None, None, None, limit=10
+        ),
+        "get_delivery_heatmap_by_store": lambda r: r.get_delivery_heatmap_by_store(sid, start, day, limit=50),
+        "get_delivery_heatmap_percentiles": lambda r: r.get_delivery_heatmap_percentiles(sid, start, day),
+        "get_delivery_grid": lambda r: r.get_delivery_grid(sid, start, day, zoom=DEFAULT_GRID_ZOOM),
+        "get_hourly_matrix": lambda r: r.get_hourly_matrix(sid, start, day),
+        "get_hourly_matrix_raw": lambda r: r.get_hourly_matrix_raw(sid, start, day),
+        "get_at_risk_customers": lambda r: r.get_at_risk_customers(sid, limit=50),
+        "list_channels_for_store": lambda r: r.list_channels_for_store(sid),
+        "list_available_stores": lambda r: r.list_available_stores(limit=1),
+        "estimate_row_count": lambda r: r.estimate_row_count("stores"),
+        "get_revenue_overview": lambda r: r.get_revenue_overview(sid, start, day),
+        "get_channel_performance": lambda r: r.get_channel_performance(sid, 30),
+        "get_store_comparison": lambda r: r.get_store_comparison(sid, sid - 1, start, day),
+        "get_store_performance_for_period": lambda r: r.get_store_performance_for_period([sid], start, day),
+        "get_store_performance_dor_period": lambda r: r.get_store_performance_dor_period([sid], start, day),
+        "get_portfolio_overview": lambda r: r.get_portfolio_overview([sid], start, day),
+        "get_store_watermarks": lambda r: r.get_store_watermarks([sid]),
+        "get_live_sales_delta": lambda r: r.get_live_sales_delta(sid, day, 0),
+        "get_last_sale_date_for_store": lambda r: r.get_last_sale_date_for_store(sid),
+        # caminhos alternativos do planner
+        "get_store_daily_orders": lambda r: r.get_store_daily_orders(start),
+        "count_rollup_pending_days": lambda r: r.count_rollup_pending_days([sid], start, day),
+        "count_rollup_uncovered_stores": lambda r: r.count_rollup_uncovered_stores([sid], start, day),
+        "get_revenue_overview_rollup": lambda r: r.get_revenue_overview_rollup(sid, start, day),
+        "get_revenue_overview_sampled": lambda r: r.get_revenue_overview_sampled(sid, start, day, 1.0),
+        "get_channel_performance_rollup": lambda r: r.get_channel_performance_rollup(sid, 30),
+        "get_top_products_rollup": lambda r: r.get_top_products_rollup(sid, start, day, None, None, None),
+        "get_channel_performance_sampled": lambda r: r.get_channel_performance_sampled(sid, 30, 1.0),
+        "get_top_products_sampled": lambda r: r.get_top_products_sampled(sid, None, start, day, None, None, None, 1.0),
+        "get_store_performance_rollup": lambda r: r.get_store_performance_rollup([sid], start, day),
+        "get_customer_stats": lambda r: r.get_customer_stats([sid], start, day),
+        "get_product_affinity": lambda r: r.get_product_affinity(sid, 1),
+        "get_addon_products": lambda r: r.get_addon_products(sid, start, day),
+        "get_addon_products_raw": lambda r: r.get_addon_products_raw(sid, start, day),
+        "get_kitchen_production_sketches": lambda r: r.get_kitchen_production_sketches(sid, start, day),
+        "get_kitchen_load": lambda r: r.get_kitchen_load(sid, start, day),
+        "get_kitchen_production_sketches_raw": lambda r: r.get_kitchen_production_sketches_raw(sid, start, day),
+        "get_kitchen_load_raw": lambda r: r.get_kitchen_load_raw(sid, start, day),
+        "get_top_addons": lambda r: r.get_top_addons(sid, 1, start, day),
+        "get_top_addons_raw": lambda r: r.get_top_addons_raw(sid, 1, start, day),
+        "get_customer_month_bitmaps": lambda r: r.get_customer_month_bitmaps(sid, start.replace(day=1), day),
+    }
+
+
+async def _warm_connection(
+    target: DatabaseTarget,
+    calls: Dict[str, RepoCall],
+    dimensions: Optional[DimensionCache] = None,
+) -> Dict[str, int]:
+    """Roda todas as consultas numa mesma sessão (= uma conexão do pool)."""
+    prepared = errors = 0
+    timeout = {"timeout": f"{WARMUP_STATEMENT_TIMEOUT_MS}ms"}
+    async with target.session_factory() as session:
+        await session.execute(STATEMENT_TIMEOUT_SQL, timeout)
+        repo = SalesRepository(session, dimensions)
+        for call in calls.values():
+            try:
+                await call(repo)
+                prepared += 1
+            except Exception:
+                # ex.: tabela de migração ainda não aplicada; a transação
+                # abortada não pode levar as próximas junto
+                errors += 1
+                await session.rollback()
+                await session.execute(STATEMENT_TIMEOUT_SQL, timeout)
+        await session.rollback()
+    return {"prepared": prepared, "errors": errors}
+
+
+def pool_size(target: DatabaseTarget, default: int = 5) -> int:
+    pool = getattr(target.engine, "pool", None)
+    size = getattr(pool, "size", None)
+    return size() if callable(size) else default
+
+
+async def warm_up(
+    router: DatabaseRouter,
+    connections: Optional[int] = None,
+    today: Optional[date] = None,
+    dimensions: Optional[DimensionCache] = None,
+) -> Dict[str, Any]:
+    """
+    Abre o pool mínimo de cada banco (primário e réplicas) com as conexões
+    em paralelo, pra que sejam conexões distintas, e prepara em cada uma
+    todos os statements do SalesRepository. A primeira requisição do
+    worker já encontra conexão aberta, catálogo em cache e statement pronto.
+    """
+    calls = warmup_calls(today)
+    started = time.perf_counter()
+    targets: List[Dict[str, Any]] = []
+    for target in [router.primary, *router.replicas]:
+        n = connections or pool_size(target)
+        target_started = time.perf_counter()
+        results = await asyncio.gather(
+            *(_warm_connection(target, calls, dimensions) for _ in range(n)),
+            return_exceptions=True,
+        )
+        failed = [r for r in results if isinstance(r, BaseException)]
+        done = [r for r in results if not isinstance(r, BaseException)]
+        if failed:
+            target.record_error(failed[0])
+        targets.append({
+            "name": target.name,
+            "connections": len(done),
+            "failed_connections": len(failed),
+            "statements": sum(r["prepared"] for r in done),
+            "errors": sum(r["errors"] for r in done),
+            "elapsed_ms": round((time.perf_counter() - target_started) * 1000, 2),
+        })
+    return {
+        "queries": len(calls),
+        "targets": targets,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
@@ -2,14 +2,81 @@
 from __future__ import annotations
 
 from datetime import date, timedelta
-from typing import Optional
+from typing import List, Optional
 
+from app.core.geo import GRID_ORIGIN, cell_size
+from app.core.pagination import decode_cursor, paginate
+from app.core.sketches import PRODUCTION_RELATIVE_ACCURACY, DDSketch
 from app.repositories.sales_repository import SalesRepository
+from app.services.query_planner import (
+    STRATEGY_APPROXIMATE,
+    STRATEGY_RAW,
+    STRATEGY_ROLLUP,
+    QueryPlanner,
+    rollback_session,
+)
+
+# teto de lojas por consulta de portfólio (uma única query, mas o payload cresce)
+MAX_PORTFOLIO_STORES = 500
+
+# página do heatmap quando vem cursor sem limit (sem os dois, vem tudo)
+HEATMAP_PAGE_SIZE = 100
+
+# período padrão da matriz dia da semana × hora
+HOURLY_MATRIX_DEFAULT_WEEKS = 12
+
+# matriz de coorte: meses de coorte × meses depois do 1º pedido
+COHORT_DEFAULT_MONTHS = 12
+
+# período padrão dos widgets de adicionais
+ADDONS_DEFAULT_DAYS = 30
+
+# 4 semanas fechadas: todo dia da semana entra o mesmo número de vezes
+KITCHEN_DEFAULT_DAYS = 28
+KITCHEN_SLOT_MINUTES = 15
+KITCHEN_PEAK_SLOTS = 5
+
+# loja sem HLL (rollup não populado ou tabela ausente)
+EMPTY_CUSTOMER_STATS = {"unique_customers": None, "unique_customers_error_pct": None, "repeat_rate_pct": None}
+
+
+def _add_months(month: date, months: int) -> date:
+    years, index = divmod(month.month - 1 + months, 12)
+    return date(month.year + years, index + 1, 1)
+
+
+def _percentiles(sketch: DDSketch) -> dict:
+    def q(p):
+        value = sketch.quantile(p)
+        return round(value) if value is not None else None
+
+    return {"orders": sketch.count, "p50_seconds": q(0.5), "p90_seconds": q(0.9), "p99_seconds": q(0.99)}
+
+
+def _merged(sketches) -> DDSketch:
+    out = DDSketch(PRODUCTION_RELATIVE_ACCURACY)
+    for sketch in sketches:
+        out.merge(sketch)
+    return out
+
+
+class InvalidWidgetRequest(ValueError):
+    """Filtro/período que não faz sentido pro widget; a rota devolve 400."""
+
+
+def _change_pct(current: float, previous: float) -> float:
+    if not previous:
+        return 0.0
+    return round((current - previous) / previous * 100, 2)
 
 
 class WidgetService:
-    def __init__(self, repo: SalesRepository):
+    def __init__(self, repo: SalesRepository, planner: Optional[QueryPlanner] = None):
         self.repo = repo
+        # sem planner (testes, scripts): sempre o caminho cru
+        self.planner = planner if planner is not None else QueryPlanner(enabled=False)
+        # plano da última consulta planejada, pra rota pôr no header
+        self.last_plan: Optional[dict] = None
 
     async def list_channels_for_store(self, store_id: int):
         return await self.repo.list_channels_for_store(store_id)
@@ -21,7 +88,9 @@ class WidgetService:
         day_of_week: int,
         hour_start: int,
         hour_end: int,
-        limit: int = 10
+        limit: int = 10,
+        approx: bool = False,
+        sample_pct: Optional[float] = None,
     ):
         end_date = date.today()
         start_date = end_date - timedelta(days=29)
@@ -46,7 +115,7 @@ class WidgetService:
         end_date = last_date
         start_date = end_date - timedelta(days=29)
 
-        rows = await self.repo.get_top_products_flexible(
+        rows = await self._top_products(
             store_id=store_id,
             channel=channel,  # None => sem filtro de canal
             start_date=start_date,
@@ -55,6 +124,8 @@ class WidgetService:
             hour_start=hour_start,
             hour_end=hour_end,
             limit=limit,
+            approx=approx,
+            sample_pct=sample_pct,
         )
         return {
             "store_id": store_id,
@@ -66,7 +137,67 @@ class WidgetService:
             "limit": limit,
             "start_date": start_date,
             "end_date": end_date,
+            "query_plan": self.last_plan,
+        }
+
+    async def _top_products(
+        self,
+        store_id: int,
+        channel: Optional[str],
+        start_date: date,
+        end_date: date,
+        day_of_week: Optional[int],
+        hour_start: Optional[int],
+        hour_end: Optional[int],
+        limit: int = 10,
+        approx: bool = False,
+        sample_pct: Optional[float] = None,
+    ):
+        """
+        Top products planejado: cru, rollup por hora (sem filtro de canal) ou,
+        com ``approx``, amostra de blocos com intervalo de confiança.
+        """
+        period_days = (end_date - start_date).days + 1
+        selectivity = 1.0
+        if day_of_week is not None:
+            selectivity /= 7
+        if hour_start is not None and hour_end is not None:
+            selectivity *= max(hour_end - hour_start + 1, 1) / 24
+        paths = {
+            STRATEGY_RAW: lambda plan: self.repo.get_top_products_flexible(
+                store_id=store_id,
+                channel=channel,
+                start_date=start_date,
+                end_date=end_date,
+                day_of_week=day_of_week,
+                hour_start=hour_start,
+                hour_end=hour_end,
+                limit=limit,
+            ),
+            STRATEGY_APPROXIMATE: lambda plan: self.repo.get_top_products_sampled(
+                store_id, channel, start_date, end_date, day_of_week, hour_start, hour_end, plan["sample_pct"], limit
+            ),
         }
+        if channel is None:
+            paths[STRATEGY_ROLLUP] = lambda plan: self.repo.get_top_products_rollup(
+                store_id, start_date, end_date, day_of_week, hour_start, hour_end, limit
+            )
+        else:
+            selectivity /= 2  # canal típico: metade das vendas
+        rows, self.last_plan = await self.planner.execute(
+            self.repo,
+            "top_products",
+            "get_top_products_flexible",
+            [store_id],
+            start_date - timedelta(days=period_days),
+            end_date,
+            paths,
+            selectivity=selectivity,
+            product_lines=True,
+            approximate=approx,
+            sample_pct=sample_pct,
+        )
+        return rows
 
     async def get_top_products_flexible(
             self,
@@ -78,9 +209,11 @@ class WidgetService:
             hour_start: Optional[int],
             hour_end: Optional[int],
             limit: int = 10,
+            approx: bool = False,
+            sample_pct: Optional[float] = None,
     ):
         # 1) tenta exatamente o que o Flutter pediu
-        rows = await self.repo.get_top_products_flexible(
+        rows = await self._top_products(
             store_id=store_id,
             channel=channel,
             start_date=start_date,
@@ -89,13 +222,15 @@ class WidgetService:
             hour_start=hour_start,
             hour_end=hour_end,
             limit=limit,
+            approx=approx,
+            sample_pct=sample_pct,
         )
         if rows:
             return rows
 
         # 2) se veio vazio e tinha canal, tenta sem canal
         if channel is not None:
-            rows = await self.repo.get_top_products_flexible(
+            rows = await self._top_products(
                 store_id=store_id,
                 channel=None,  # 👈 tira o canal
                 start_date=start_date,
@@ -104,13 +239,15 @@ class WidgetService:
                 hour_start=hour_start,
                 hour_end=hour_end,
                 limit=limit,
+                approx=approx,
+                sample_pct=sample_pct,
             )
             if rows:
                 return rows
 
         # 3) se ainda veio vazio e tinha dia/hora, tenta só o período
         if day_of_week is not None or (hour_start is not None and hour_end is not None):
-            rows = await self.repo.get_top_products_flexible(
+            rows = await self._top_products(
                 store_id=store_id,
                 channel=None,
                 start_date=start_date,
@@ -119,6 +256,8 @@ class WidgetService:
                 hour_start=None,
                 hour_end=None,
                 limit=limit,
+                approx=approx,
+                sample_pct=sample_pct,
             )
             return rows
 
@@ -130,35 +269,472 @@ class WidgetService:
         store_id: int,
         start_date: Optional[date],
         end_date: Optional[date],
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ):
+        scope = {"w": "heatmap", "store_id": store_id, "start": start_date, "end": end_date}
+        after = decode_cursor(cursor, scope, (int, str, str))
+        # sem limit nem cursor: todas as regiões (o app desenha o mapa inteiro
+        # e não segue next_cursor); limit/cursor continuam paginando
+        if limit is None and after is not None:
+            limit = HEATMAP_PAGE_SIZE
+
+        def _key(r):
+            return [r["delivery_count"], r["neighborhood"], r["city"]]
+
+        if end_date is None:
+            end_date = date.today()
+        if start_date is None:
+            start_date = end_date.replace(day=1)
+
+        # rollup com percentis (p50/p90/p99) só se cobre o período inteiro sem
+        # dia pendente (mesma regra do planner); senão, consulta direta em
+        # sales, com os percentis nulos pra linha ter o mesmo formato
+        if await self.planner.rollup_covers(self.repo, [store_id], start_date, end_date):
+            rows = await self.repo.get_delivery_heatmap_percentiles(
+                store_id=store_id,
+                start_date=start_date,
+                end_date=end_date,
+            )
+            # já vem ordenado por (-delivery_count, neighborhood, city)
+            total = len(rows)
+            if after is not None:
+                after_key = (-int(after[0]), after[1], after[2])
+                rows = [
+                    r for r in rows
+                    if (-r["delivery_count"], r["neighborhood"], r["city"]) > after_key
+                ]
+            if limit is not None:
+                rows = rows[: limit + 1]
+        else:
+            rows = await self.repo.get_delivery_heatmap_by_store(
+                store_id=store_id,
+                start_date=start_date,
+                end_date=end_date,
+                limit=limit,
+                after=after,
+            )
+            total = rows[0]["total_estimate"] if rows else 0
+            for r in rows:
+                r.pop("total_estimate", None)
+                r.update(p50_delivery_seconds=None, p90_delivery_seconds=None, p99_delivery_seconds=None)
+
+        page, next_cursor = paginate(rows, limit, _key, scope) if limit is not None else (rows, None)
+        return {
+            "store_id": store_id,
+            "period_start": start_date,
+            "period_end": end_date,
+            "regions": page,
+            "next_cursor": next_cursor,
+            "total_estimate": total,
+        }
+
+    async def get_delivery_grid_insight(
+        self,
+        store_id: int,
+        start_date: Optional[date],
+        end_date: Optional[date],
+        zoom: int,
     ):
-        rows = await self.repo.get_delivery_heatmap_by_store(
+        # zoom já validado na rota (só os GRID_ZOOMS têm rollup)
+        if end_date is None:
+            end_date = date.today()
+        if start_date is None:
+            start_date = end_date.replace(day=1)
+
+        cells = await self.repo.get_delivery_grid(
             store_id=store_id,
             start_date=start_date,
             end_date=end_date,
+            zoom=zoom,
         )
+        lon_step, lat_step = cell_size(zoom)
+        # célula (x, y) cobre [origem + x*step, origem + (x+1)*step)
         return {
             "store_id": store_id,
             "period_start": start_date,
             "period_end": end_date,
-            "regions": rows,
+            "zoom": zoom,
+            "origin": {"longitude": GRID_ORIGIN[0], "latitude": GRID_ORIGIN[1]},
+            "cell_size": {"longitude": lon_step, "latitude": lat_step},
+            "fields": [
+                "cell_x",
+                "cell_y",
+                "delivery_count",
+                "avg_delivery_seconds",
+                "min_delivery_seconds",
+                "max_delivery_seconds",
+            ],
+            "cells": cells,
         }
 
-    async def get_at_risk_customers_insight(self, store_id: int):
-        rows = await self.repo.get_at_risk_customers(store_id)
+    async def get_hourly_matrix_insight(
+        self,
+        store_id: int,
+        start_date: Optional[date],
+        end_date: Optional[date],
+        channel: Optional[str] = None,
+        product_id: Optional[int] = None,
+    ):
+        if channel and product_id is not None:
+            raise InvalidWidgetRequest("Filtre por channel ou por product_id, não pelos dois")
+        if end_date is None:
+            end_date = date.today()
+        if start_date is None:
+            # 12 semanas fechadas: cada dia da semana aparece o mesmo número de vezes
+            start_date = end_date - timedelta(weeks=HOURLY_MATRIX_DEFAULT_WEEKS) + timedelta(days=1)
+        if start_date > end_date:
+            raise InvalidWidgetRequest("start_date depois de end_date")
+
+        # rollup por hora só se cobre o período inteiro sem dia pendente;
+        # senão (período até hoje, loja sem backfill) soma direto em sales
+        covered = await self.planner.rollup_covers(self.repo, [store_id], start_date, end_date)
+        fetch = self.repo.get_hourly_matrix if covered else self.repo.get_hourly_matrix_raw
+        rows = await fetch(
+            store_id=store_id,
+            start_date=start_date,
+            end_date=end_date,
+            channel=channel,
+            product_id=product_id,
+        )
+        fields = ["total_orders", "total_sales"]
+        if product_id is not None:
+            fields.append("total_quantity")
+        # linha = dia da semana ISO (0 = segunda ... 6 = domingo), coluna = hora
+        matrix = {f: [[0] * 24 for _ in range(7)] for f in fields}
+        for r in rows:
+            for f in fields:
+                value = r[f] or 0
+                matrix[f][r["dow"] - 1][r["hour"]] = value if f == "total_orders" else round(float(value), 2)
+
+        # quantas segundas, terças... o período tem: média por dia = célula / ocorrências
+        days = (end_date - start_date).days + 1
+        occurrences = [days // 7] * 7
+        for i in range(days % 7):
+            occurrences[(start_date.isoweekday() - 1 + i) % 7] += 1
+
         return {
             "store_id": store_id,
-            "customers": rows,
+            "period_start": start_date,
+            "period_end": end_date,
+            "channel": channel,
+            "product_id": product_id,
+            "dows": [1, 2, 3, 4, 5, 6, 7],
+            "hours": list(range(24)),
+            "dow_occurrences": occurrences,
+            "fields": fields,
+            "matrix": matrix,
+            "totals": {f: round(sum(map(sum, matrix[f])), 2) for f in fields},
         }
 
-    async def get_channel_performance_insight(self, store_id: int, period_days: int = 30):
-        # se quiser depois a gente liga nesse teu SQL de channel_performance
-        return await self.repo.get_channel_performance(store_id, period_days)
+    @staticmethod
+    def _addon_period(start_date: Optional[date], end_date: Optional[date]):
+        if end_date is None:
+            end_date = date.today()
+        if start_date is None:
+            start_date = end_date - timedelta(days=ADDONS_DEFAULT_DAYS - 1)
+        if start_date > end_date:
+            raise InvalidWidgetRequest("start_date depois de end_date")
+        return start_date, end_date
+
+    async def get_addon_summary_insight(
+        self,
+        store_id: int,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        limit: int = 10,
+    ):
+        start_date, end_date = self._addon_period(start_date, end_date)
+        if await self.planner.rollup_covers(self.repo, [store_id], start_date, end_date):
+            rows = await self.repo.get_addon_products(store_id, start_date, end_date)
+        else:
+            # rollup não cobre (período até hoje, loja sem backfill): join de três níveis
+            rows = await self.repo.get_addon_products_raw(store_id, start_date, end_date)
+
+        lines = sum(r["product_lines"] for r in rows)
+        with_addons = sum(r["lines_with_addons"] for r in rows)
+        revenue = sum(float(r["addon_revenue"] or 0) for r in rows)
+        return {
+            "store_id": store_id,
+            "start_date": start_date,
+            "end_date": end_date,
+            "product_lines": lines,
+            "lines_with_addons": with_addons,
+            "attach_rate_pct": round(with_addons / lines * 100, 2) if lines else None,
+            "addon_revenue": round(revenue, 2),
+            "products": [
+                {
+                    "product_id": r["product_id"],
+                    "product_name": r["product_name"],
+                    "product_lines": r["product_lines"],
+                    "attach_rate_pct": round(r["lines_with_addons"] / r["product_lines"] * 100, 2)
+                    if r["product_lines"] else None,
+                    "addon_revenue": round(float(r["addon_revenue"] or 0), 2),
+                }
+                for r in rows[:limit]
+            ],
+        }
+
+    async def get_top_addons_insight(
+        self,
+        store_id: int,
+        product_id: int,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        limit: int = 10,
+    ):
+        start_date, end_date = self._addon_period(start_date, end_date)
+        if await self.planner.rollup_covers(self.repo, [store_id], start_date, end_date):
+            top_addons, addon_products = self.repo.get_top_addons, self.repo.get_addon_products
+        else:
+            top_addons, addon_products = self.repo.get_top_addons_raw, self.repo.get_addon_products_raw
+        addons = await top_addons(store_id, product_id, start_date, end_date, limit)
+        # denominador do attach rate: linhas do produto no período (mesma fonte dos itens)
+        products = await addon_products(store_id, start_date, end_date, product_id=product_id)
+        product = products[0] if products else None
+        lines = product["product_lines"] if product else 0
+
+        return {
+            "store_id": store_id,
+            "product_id": product_id,
+            "product_name": product["product_name"] if product else None,
+            "start_date": start_date,
+            "end_date": end_date,
+            "product_lines": lines,
+            "attach_rate_pct": round(product["lines_with_addons"] / lines * 100, 2) if lines else None,
+            "addons": [
+                {
+                    "item_id": a["item_id"],
+                    "item_name": a["item_name"],
+                    "product_lines": a["product_lines"],
+                    "attach_rate_pct": round(a["product_lines"] / lines * 100, 2) if lines else None,
+                    "quantity": round(float(a["quantity"] or 0), 2),
+                    "revenue": round(float(a["revenue"] or 0), 2),
+                }
+                for a in addons
+            ],
+        }
+
+    async def get_kitchen_throughput_insight(
+        self,
+        store_id: int,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+    ):
+        if end_date is None:
+            end_date = date.today()
+        if start_date is None:
+            start_date = end_date - timedelta(days=KITCHEN_DEFAULT_DAYS - 1)
+        if start_date > end_date:
+            raise InvalidWidgetRequest("start_date depois de end_date")
+        days = (end_date - start_date).days + 1
+
+        if await self.planner.rollup_covers(self.repo, [store_id], start_date, end_date):
+            sketches_of, load_of = self.repo.get_kitchen_production_sketches, self.repo.get_kitchen_load
+        else:
+            # rollup não cobre (período até hoje, loja sem backfill): direto de sales
+            sketches_of, load_of = self.repo.get_kitchen_production_sketches_raw, self.repo.get_kitchen_load_raw
+
+        sketches = await sketches_of(store_id, start_date, end_date)
+        by_dow_hour = sketches["by_dow_hour"]
+        by_hour = [_merged(s for (_, h), s in by_dow_hour.items() if h == hour) for hour in range(24)]
+        by_dow = [_merged(s for (d, _), s in by_dow_hour.items() if d == dow) for dow in range(1, 8)]
+        # p90 por dia da semana (linha, segunda = 0) × hora: onde a cozinha trava
+        p90_matrix = [[None] * 24 for _ in range(7)]
+        for (dow, hour), sketch in by_dow_hour.items():
+            value = sketch.quantile(0.9)
+            p90_matrix[dow - 1][hour] = round(value) if value is not None else None
+
+        rows = await load_of(store_id, start_date, end_date)
+        slots = []
+        for r in rows:
+            minutes = r["slot"] * KITCHEN_SLOT_MINUTES
+            timed = r["production_count"]
+            slots.append({
+                "slot": f"{minutes // 60:02d}:{minutes % 60:02d}",
+                "avg_orders_active": round(r["orders_active"] / days, 2),
+                "max_orders_active": r["max_orders_active"],
+                "avg_orders_started": round(r["orders_started"] / days, 2),
+                "avg_production_seconds": round(r["production_seconds_sum"] / timed) if timed else None,
+            })
+
+        # correlação de Pearson por pedido: x = carga da faixa em que entrou, y = tempo de produção
+        n = sum(r["production_count"] for r in rows)
+        sx = sum(r["load_sum"] for r in rows)
+        sy = sum(r["production_seconds_sum"] for r in rows)
+        sxx = sum(r["load_sq_sum"] for r in rows)
+        syy = sum(r["production_seconds_sq_sum"] for r in rows)
+        sxy = sum(r["load_x_seconds_sum"] for r in rows)
+        var_x = n * sxx - sx * sx
+        var_y = n * syy - sy * sy
+        correlation = slope = None
+        if n > 1 and var_x > 0 and var_y > 0:
+            cov = n * sxy - sx * sy
+            correlation = round(cov / (var_x * var_y) ** 0.5, 3)
+            slope = round(cov / var_x, 1)
+
+        return {
+            "store_id": store_id,
+            "start_date": start_date,
+            "end_date": end_date,
+            "relative_accuracy_pct": PRODUCTION_RELATIVE_ACCURACY * 100,
+            "production": {
+                "overall": _percentiles(_merged(by_dow_hour.values())),
+                "by_hour": [{"hour": hour, **_percentiles(s)} for hour, s in enumerate(by_hour)],
+                "by_dow": [{"dow": dow, **_percentiles(s)} for dow, s in enumerate(by_dow, start=1)],
+                "by_channel": sorted(
+                    ({"channel": name, **_percentiles(s)} for name, s in sketches["by_channel"].items()),
+                    key=lambda c: -c["orders"],
+                ),
+                "p90_matrix": p90_matrix,
+            },
+            "load": {
+                "slot_minutes": KITCHEN_SLOT_MINUTES,
+                "slots": slots,
+                "peak_slots": sorted(slots, key=lambda s: -s["avg_orders_active"])[:KITCHEN_PEAK_SLOTS],
+            },
+            "load_vs_production": {
+                "orders": n,
+                "correlation": correlation,
+                # segundos a mais de produção por pedido a mais na cozinha (regressão linear)
+                "seconds_per_extra_order": slope,
+            },
+        }
+
+    async def get_frequently_bought_together_insight(self, store_id: int, product_id: int, limit: int = 10):
+        affinity = await self.repo.get_product_affinity(store_id, product_id, limit)
+        rows = affinity["pairings"]
+        # janela e volumes do produto são os mesmos em todas as linhas
+        first = rows[0] if rows else {}
+        return {
+            "store_id": store_id,
+            "product_id": product_id,
+            "product_name": affinity["product_name"],
+            "window_start": first.get("window_start"),
+            "window_end": first.get("window_end"),
+            "product_orders": first.get("product_orders"),
+            "baskets": first.get("baskets"),
+            "pairings": [
+                {
+                    "product_id": r["related_product_id"],
+                    "product_name": r["related_product_name"],
+                    "pair_orders": r["pair_orders"],
+                    "support_pct": round(r["support"] * 100, 3),
+                    "confidence_pct": round(r["confidence"] * 100, 2),
+                    "lift": round(r["lift"], 2),
+                }
+                for r in rows
+            ],
+        }
+
+    async def get_cohort_retention_insight(
+        self,
+        store_id: int,
+        end_month: Optional[date] = None,
+        months: int = COHORT_DEFAULT_MONTHS,
+    ):
+        """
+        Retenção por coorte (mês do 1º pedido × meses depois) a partir dos
+        bitmaps mensais de clientes: cada célula é uma interseção de bitmaps.
+        """
+        end_month = (end_month or date.today()).replace(day=1)
+        first_month = _add_months(end_month, -(months - 1))
+        bitmaps = await self.repo.get_customer_month_bitmaps(store_id, first_month, end_month)
+
+        cohorts = [_add_months(first_month, i) for i in range(months)]
+        sizes, retained, retention = [], [], []
+        for i, cohort in enumerate(cohorts):
+            new = bitmaps.get(cohort, {}).get("new")
+            size = len(new) if new is not None else 0
+            counts, pcts = [], []
+            for offset in range(months):
+                if i + offset >= months:
+                    # mês ainda não aconteceu dentro da janela
+                    counts.append(None)
+                    pcts.append(None)
+                    continue
+                active = bitmaps.get(cohorts[i + offset], {}).get("active")
+                count = new.intersection_count(active) if size and active is not None else 0
+                counts.append(count)
+                pcts.append(round(count / size * 100, 2) if size else None)
+            sizes.append(size)
+            retained.append(counts)
+            retention.append(pcts)
+
+        return {
+            "store_id": store_id,
+            "first_month": first_month,
+            "end_month": end_month,
+            "cohorts": [m.strftime("%Y-%m") for m in cohorts],
+            "offsets": list(range(months)),
+            "cohort_sizes": sizes,
+            "active_customers": [len(bitmaps[m]["active"]) if m in bitmaps else 0 for m in cohorts],
+            "matrix": {"retained_customers": retained, "retention_pct": retention},
+        }
+
+    async def get_at_risk_customers_insight(
+        self,
+        store_id: int,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+    ):
+        scope = {"w": "at-risk", "store_id": store_id}
+        rows = await self.repo.get_at_risk_customers(
+            store_id,
+            limit=limit,
+            after=decode_cursor(cursor, scope, (date, int)),
+        )
+        total = rows[0]["total_estimate"] if rows else 0
+        for r in rows:
+            r.pop("total_estimate", None)
+
+        page, next_cursor = paginate(
+            rows,
+            limit,
+            lambda r: [r["last_order_date"].isoformat(), r["customer_id"]],
+            scope,
+        )
+        return {
+            "store_id": store_id,
+            "customers": page,
+            "next_cursor": next_cursor,
+            "total_estimate": total,
+        }
+
+    async def get_channel_performance_insight(
+        self,
+        store_id: int,
+        period_days: int = 30,
+        approx: bool = False,
+        sample_pct: Optional[float] = None,
+    ):
+        today = date.today()
+        rows, self.last_plan = await self.planner.execute(
+            self.repo,
+            "channel_performance",
+            "get_channel_performance",
+            [store_id],
+            today - timedelta(days=period_days),
+            today,
+            {
+                STRATEGY_RAW: lambda plan: self.repo.get_channel_performance(store_id, period_days),
+                STRATEGY_ROLLUP: lambda plan: self.repo.get_channel_performance_rollup(store_id, period_days),
+                STRATEGY_APPROXIMATE: lambda plan: self.repo.get_channel_performance_sampled(
+                    store_id, period_days, plan["sample_pct"]
+                ),
+            },
+            approximate=approx,
+            sample_pct=sample_pct,
+        )
+        return rows
 
     async def get_revenue_overview(
         self,
         store_id: int,
         start_date: Optional[date],
         end_date: Optional[date],
+        approx: bool = False,
+        sample_pct: Optional[float] = None,
     ):
         # se não vier período, faz igual teu provider fazia: pega mês atual
         if end_date is None:
@@ -166,18 +742,60 @@ class WidgetService:
         if start_date is None:
             start_date = end_date.replace(day=1)
 
-        data = await self.repo.get_revenue_overview(
-            store_id=store_id,
-            start_date=start_date,
-            end_date=end_date,
+        period_days = (end_date - start_date).days + 1
+        data, self.last_plan = await self.planner.execute(
+            self.repo,
+            "revenue_overview",
+            "get_revenue_overview",
+            [store_id],
+            start_date - timedelta(days=period_days),  # com o período anterior
+            end_date,
+            {
+                STRATEGY_RAW: lambda plan: self.repo.get_revenue_overview(
+                    store_id=store_id,
+                    start_date=start_date,
+                    end_date=end_date,
+                ),
+                STRATEGY_ROLLUP: lambda plan: self.repo.get_revenue_overview_rollup(store_id, start_date, end_date),
+                STRATEGY_APPROXIMATE: lambda plan: self.repo.get_revenue_overview_sampled(
+                    store_id, start_date, end_date, plan["sample_pct"]
+                ),
+            },
+            approximate=approx,
+            sample_pct=sample_pct,
+        )
+        customers = await self._customer_stats([store_id], start_date, end_date)
+        previous = await self._customer_stats(
+            [store_id], start_date - timedelta(days=period_days), start_date - timedelta(days=1)
         )
+        current = customers.get(store_id, EMPTY_CUSTOMER_STATS)
+        before = previous.get(store_id, EMPTY_CUSTOMER_STATS)
         return {
             "store_id": store_id,
             "start_date": start_date,
             "end_date": end_date,
             **data,
+            **current,
+            "unique_customers_change_pct": (
+                _change_pct(current["unique_customers"], before["unique_customers"])
+                if current["unique_customers"] is not None and before["unique_customers"] is not None
+                else None
+            ),
+            "query_plan": self.last_plan,
         }
 
+    async def _customer_stats(self, store_ids: List[int], start_date: date, end_date: date):
+        """
+        HLL de clientes (migração 010). Loja sem cobertura do rollup no
+        período fica fora do dict e recebe EMPTY_CUSTOMER_STATS (nulos).
+        """
+        try:
+            return await self.repo.get_customer_stats(store_ids, start_date, end_date)
+        except Exception:
+            # migração 010/015 não aplicada: o resto da resposta não depende disso
+            await rollback_session(self.repo)
+            return {}
+
     async def get_store_comparison(
         self,
         store_a_id: int,
@@ -191,11 +809,87 @@ class WidgetService:
             start_date=start_date,
             end_date=end_date,
         )
+        customers = await self._customer_stats([store_a_id, store_b_id], start_date, end_date)
+        rows = [{**r, **customers.get(r["store_id"], EMPTY_CUSTOMER_STATS)} for r in rows]
         return {
             "period_start": start_date,
             "period_end": end_date,
             "stores": rows,
         }
 
-    async def list_available_stores(self):
-        return await self.repo.list_available_stores()
+    async def get_portfolio_overview(
+        self,
+        store_ids: List[int],
+        start_date: Optional[date],
+        end_date: Optional[date],
+        top_n: int = 5,
+    ):
+        # mesma regra do revenue overview: sem período => mês corrente
+        if end_date is None:
+            end_date = date.today()
+        if start_date is None:
+            start_date = end_date.replace(day=1)
+        if start_date > end_date:
+            raise InvalidWidgetRequest("Data inicial deve ser anterior à final")
+
+        unique_ids = sorted(set(store_ids))
+        if not unique_ids:
+            raise InvalidWidgetRequest("Informe ao menos uma loja")
+        if len(unique_ids) > MAX_PORTFOLIO_STORES:
+            raise InvalidWidgetRequest(f"Máximo de {MAX_PORTFOLIO_STORES} lojas por consulta")
+
+        rows = await self.repo.get_portfolio_overview(
+            store_ids=unique_ids,
+            start_date=start_date,
+            end_date=end_date,
+            top_n=top_n,
+        )
+
+        def _shape(row):
+            total_sales = float(row["total_sales"])
+            previous_sales = float(row["previous_total_sales"] or 0)
+            previous_orders = row["previous_total_orders"] or 0
+            return {
+                "store_id": row["store_id"],
+                "store_name": row["store_name"],
+                "total_sales": total_sales,
+                "total_orders": row["total_orders"],
+                "average_ticket": float(row["average_ticket"]),
+                "sales_change_pct": _change_pct(total_sales, previous_sales),
+                "orders_change_pct": _change_pct(row["total_orders"], previous_orders),
+                "top_channels": row["top_channels"],
+                "top_products": row["top_products"],
+            }
+
+        combined = next((_shape(r) for r in rows if r["store_id"] is None), None)
+        stores = [_shape(r) for r in rows if r["store_id"] is not None]
+        stores.sort(key=lambda r: r["total_sales"], reverse=True)
+        if combined is not None:
+            combined.pop("store_id")
+            combined.pop("store_name")
+            combined["store_count"] = len(stores)
+
+        return {
+            "period_start": start_date,
+            "period_end": end_date,
+            "store_ids": unique_ids,
+            "combined": combined,
+            "stores": stores,
+        }
+
+    async def get_data_watermarks(self, store_ids: List[int]):
+        return await self.repo.get_store_watermarks(store_ids)
+
+    async def list_available_stores(self, limit: int = 50, cursor: Optional[str] = None):
+        scope = {"w": "stores"}
+        rows = await self.repo.list_available_stores(
+            limit=limit,
+            after=decode_cursor(cursor, scope, (str, int)),
+        )
+        page, next_cursor = paginate(rows, limit, lambda r: [r["store_name"], r["store_id"]], scope)
+        return {
+            # "data": o _getList do Flutter já entende esse envelope
+            "data": page,
+            "next_cursor": next_cursor,
+            "total_estimate": await self.repo.estimate_row_count("stores"),
+        }
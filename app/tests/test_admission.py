@@ -0,0 +1,71 @@
+# tests/test_admission.py
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.admission import AdmissionController, EndpointClass
+
+
+def _controller(**kwargs):
+    limits = dict(max_concurrent=1, max_per_tenant=1, max_queue=10, max_wait=1.0)
+    limits.update(kwargs)
+    return AdmissionController({"export": EndpointClass("export", **limits)})
+
+
+@pytest.mark.asyncio
+async def test_free_slot_goes_round_robin_between_tenants():
+    admission = _controller()
+    order = []
+    release = asyncio.Event()
+
+    async def job(tenant, tag):
+        async with admission.acquire("export", tenant):
+            order.append(tag)
+            await release.wait()
+
+    first = asyncio.create_task(job("owner", "owner-1"))
+    await asyncio.sleep(0)
+    # o dono enfileira 3 exports antes do outro tenant pedir o seu
+    queued = [asyncio.create_task(job("owner", f"owner-{i}")) for i in (2, 3, 4)]
+    await asyncio.sleep(0)
+    other = asyncio.create_task(job("other", "other-1"))
+    await asyncio.sleep(0)
+    assert admission.metrics()["classes"][0]["queued"] == 4
+
+    release.set()
+    await asyncio.gather(first, other, *queued)
+    assert order == ["owner-1", "owner-2", "other-1", "owner-3", "owner-4"]
+
+
+@pytest.mark.asyncio
+async def test_full_queue_and_wait_timeout_reject_with_retry_after():
+    admission = _controller(max_queue=1, max_wait=0.05)
+    hold = asyncio.Event()
+
+    async def holder():
+        async with admission.acquire("export", "a"):
+            await hold.wait()
+
+    running = asyncio.create_task(holder())
+    await asyncio.sleep(0)
+    waiting = asyncio.create_task(admission.acquire("export", "b").__aenter__())
+    await asyncio.sleep(0)
+
+    with pytest.raises(HTTPException) as full:
+        async with admission.acquire("export", "c"):
+            pass
+    assert full.value.status_code == 503
+    assert full.value.headers == {"Retry-After": "1"}
+
+    with pytest.raises(HTTPException):
+        await waiting  # 50 ms na fila sem vaga
+    hold.set()
+    await running
+
+    stats = admission.metrics()["classes"][0]
+    assert (stats["rejected_full"], stats["rejected_timeout"], stats["active"], stats["queued"]) == (1, 1, 0, 0)
+
+    # classe desconhecida (ex.: stream ao vivo) passa sem contar
+    async with admission.acquire(None, "x"):
+        pass
@@ -0,0 +1,257 @@
+# tests/test_analytics_mirror.py
+import json
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from app.repositories.analytics_mirror import MirrorSalesRepository, ParquetMirror
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def mappings(self):
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class FakePostgres:
+    """Sessão do Postgres: só deve ser usada quando o espelho não cobre."""
+
+    def __init__(self):
+        self.queries = 0
+
+    async def execute(self, statement, params=None):
+        self.queries += 1
+        return FakeResult([])
+
+
+class FakeMirror:
+    def __init__(self, covered_through, fail=False):
+        self.covered = covered_through
+        self.fail = fail
+        self.fallbacks = 0
+        self.errors = 0
+
+    def covers(self, method, start_date, end_date):
+        return end_date <= self.covered
+
+    async def query_many(self, statements):
+        if self.fail:
+            raise RuntimeError("arquivo parquet corrompido")
+        return [[
+            {"store_name": "Loja 1", "store_id": 1, "total_sales": Decimal("200.00"), "total_orders": 4,
+             "average_ticket": Decimal("50.00"), "channel_name": "iFood", "channel_sales": Decimal("150.00")},
+            {"store_name": "Loja 2", "store_id": 2, "total_sales": Decimal("0"), "total_orders": 0,
+             "average_ticket": Decimal("0"), "channel_name": None, "channel_sales": None},
+        ]]
+
+    def record_error(self, exc):
+        self.errors += 1
+
+
+@pytest.mark.asyncio
+async def test_report_served_from_mirror_only_when_covered():
+    pg = FakePostgres()
+    repo = MirrorSalesRepository(pg, FakeMirror(covered_through=date(2025, 10, 31)))
+
+    rows = await repo.get_store_performance_for_period([1, 2], date(2025, 1, 1), date(2025, 10, 31))
+    assert pg.queries == 0
+    assert rows[0]["top_channel"] == {"channel": "iFood", "share_pct": Decimal("75.00")}
+    assert rows[1]["top_channel"] is None
+    assert "channel_sales" not in rows[0]
+
+    # período até hoje (ainda não exportado) e erro no DuckDB caem no Postgres
+    await repo.get_store_performance_for_period([1], date(2025, 11, 1), date(2025, 11, 30))
+    failing = MirrorSalesRepository(pg, FakeMirror(date(2025, 10, 31), fail=True))
+    await failing.get_store_performance_for_period([1], date(2025, 1, 1), date(2025, 1, 31))
+    assert pg.queries == 2
+    assert (repo.mirror.fallbacks, failing.mirror.fallbacks, failing.mirror.errors) == (1, 1, 1)
+
+
+def test_mirror_coverage_follows_state_file_and_query_classes(tmp_path):
+    mirror = ParquetMirror(str(tmp_path), query_classes=["reports", "nope"])
+    assert mirror.query_classes == ["reports"]
+    assert not mirror.covers("get_store_performance_for_period", date(2025, 1, 1), date(2025, 1, 1))  # nada exportado
+
+    (tmp_path / "_state.json").write_text(json.dumps({"covered_from": "2025-01-01", "covered_through": "2025-10-31"}))
+    assert mirror.covers("get_store_performance_for_period", date(2025, 1, 1), date(2025, 10, 31))
+    assert not mirror.covers("get_store_performance_for_period", date(2025, 10, 1), date(2025, 11, 1))
+    # começa antes do primeiro dia exportado (ex.: período anterior da comparação)
+    assert not mirror.covers("get_store_performance_for_period", date(2024, 12, 31), date(2025, 1, 31))
+    assert not mirror.covers("get_revenue_overview", date(2025, 1, 1), date(2025, 1, 1))  # classe desligada
+
+    # estado antigo sem covered_from: não cobre nada até o próximo export
+    (tmp_path / "_state.json").write_text(json.dumps({"covered_through": "2025-11-30"}))
+    assert not mirror.covers("get_store_performance_for_period", date(2025, 11, 1), date(2025, 11, 30))
+
+
+def test_export_coverage_only_grows_without_gaps(tmp_path):
+    mirror = ParquetMirror(str(tmp_path))
+    (tmp_path / "_state.json").write_text(json.dumps({"covered_from": "2025-03-01", "covered_through": "2025-10-30"}))
+    assert mirror._coverage_after(date(2025, 10, 29), date(2025, 10, 31)) == {
+        "covered_from": "2025-03-01", "covered_through": "2025-10-31",
+    }
+    assert mirror._coverage_after(date(2025, 1, 1), date(2025, 2, 28)) == {
+        "covered_from": "2025-01-01", "covered_through": "2025-10-30",
+    }
+    # buraco entre o exportado e o novo recorte: vale só o novo
+    assert mirror._coverage_after(date(2025, 11, 5), date(2025, 11, 6)) == {
+        "covered_from": "2025-11-05", "covered_through": "2025-11-06",
+    }
+
+
+class FakeDuckDb:
+    """Conexão DuckDB de mentira: grava o .tmp do COPY e guarda os SQL."""
+
+    def __init__(self, dirty):
+        self.dirty = dirty
+        self.sql = []
+        self.rows = []
+
+    def connect(self):
+        return self
+
+    def execute(self, sql):
+        self.sql.append(sql)
+        if "to_regclass" in sql:
+            self.rows = [(True,)]
+        elif "FROM mirror_dirty_days" in sql and sql.startswith("SELECT"):
+            self.rows = self.dirty
+        elif sql.startswith("COPY"):
+            tmp = sql.rsplit(" TO '", 1)[1].split("'", 1)[0]
+            open(tmp, "w").close()
+        elif "read_parquet" in sql:
+            self.rows = [(0,)]
+        return self
+
+    def fetchone(self):
+        return self.rows[0]
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+def test_incremental_export_reexports_old_dirty_days(tmp_path, monkeypatch):
+    from datetime import datetime
+
+    from app.repositories import analytics_mirror
+
+    fake = FakeDuckDb(dirty=[(date(2025, 3, 10), datetime(2025, 10, 31, 9, 0, 0, 123456))])
+    monkeypatch.setattr(analytics_mirror, "duckdb", fake)
+    (tmp_path / "_state.json").write_text(json.dumps({"covered_from": "2025-01-01", "covered_through": "2025-10-30"}))
+
+    mirror = ParquetMirror(str(tmp_path), lookback_days=2)
+    stats = mirror.export("postgresql+asyncpg://u:p@db/x", end=date(2025, 10, 31))
+
+    # lookback (29..31/10) + o dia corrigido em março, fora da janela
+    assert sorted({s["day"] for s in stats if s["day"]}) == [
+        date(2025, 3, 10), date(2025, 10, 29), date(2025, 10, 30), date(2025, 10, 31),
+    ]
+    assert (tmp_path / "sales" / "sale_date=2025-03-10" / "data.parquet").exists()
+    delete = [sql for sql in fake.sql if "DELETE FROM mirror_dirty_days" in sql]
+    assert len(delete) == 1 and "2025-10-31 09:00:00.123456" in delete[0]
+    assert (mirror.covered_from(), mirror.covered_through()) == (date(2025, 1, 1), date(2025, 10, 31))
+
+
+def _write_mirror(root, sales, lines):
+    """Monta o layout do export (Parquet por dia + dimensões) direto no DuckDB."""
+    import duckdb
+
+    con = duckdb.connect()
+    for table, rows in (
+        ("stores", [(1, "Loja 1"), (2, "Loja 2")]),
+        ("channels", [(1, "iFood"), (2, "Balcão")]),
+        ("products", [(10, "X-Burger"), (11, "Batata")]),
+    ):
+        con.execute("CREATE OR REPLACE TABLE t (id INTEGER, name VARCHAR)")
+        con.executemany("INSERT INTO t VALUES (?, ?)", rows)
+        con.execute(f"COPY t TO '{root / (table + '.parquet')}' (FORMAT PARQUET)")
+
+    days = sorted({created_at.date() for _, _, _, created_at, _, _ in sales})
+    for day in days:
+        day_sales = [s for s in sales if s[3].date() == day]
+        ids = {s[0] for s in day_sales}
+        con.execute("""
+            CREATE OR REPLACE TABLE s (
+                id INTEGER, store_id INTEGER, channel_id INTEGER, customer_id INTEGER, sub_brand_id INTEGER,
+                created_at TIMESTAMP, sale_status_desc VARCHAR, total_amount DECIMAL(10,2),
+                total_discount DECIMAL(10,2), delivery_fee DECIMAL(10,2),
+                production_seconds INTEGER, delivery_seconds INTEGER
+            )
+        """)
+        con.executemany(
+            "INSERT INTO s VALUES (?, ?, ?, NULL, NULL, ?, ?, ?, 0, 0, NULL, NULL)",
+            [list(row) for row in day_sales],
+        )
+        con.execute("""
+            CREATE OR REPLACE TABLE ps (
+                id INTEGER, sale_id INTEGER, product_id INTEGER, quantity DOUBLE,
+                total_price DECIMAL(10,2), sale_created_at TIMESTAMP
+            )
+        """)
+        created = {s[0]: s[3] for s in day_sales}
+        day_lines = [[*line, created[line[1]]] for line in lines if line[1] in ids]
+        if day_lines:
+            con.executemany("INSERT INTO ps VALUES (?, ?, ?, ?, ?, ?)", day_lines)
+        for table, name in (("s", "sales"), ("ps", "product_sales")):
+            folder = root / name / f"sale_date={day.isoformat()}"
+            folder.mkdir(parents=True)
+            con.execute(f"COPY {table} TO '{folder / 'data.parquet'}' (FORMAT PARQUET)")
+    con.close()
+    (root / "_state.json").write_text(json.dumps({
+        "covered_from": days[0].isoformat(), "covered_through": days[-1].isoformat(),
+    }))
+
+
+@pytest.mark.asyncio
+async def test_mirror_queries_run_on_duckdb(tmp_path):
+    pytest.importorskip("duckdb")
+    from datetime import datetime
+
+    # (id, store_id, channel_id, created_at, status, total_amount)
+    sales = [
+        (1, 1, 1, datetime(2025, 9, 20, 12), "COMPLETED", Decimal("100.00")),   # período anterior
+        (2, 1, 1, datetime(2025, 10, 1, 12), "COMPLETED", Decimal("60.00")),
+        (3, 1, 2, datetime(2025, 10, 2, 20), "COMPLETED", Decimal("40.00")),
+        (4, 2, 2, datetime(2025, 10, 2, 21), "COMPLETED", Decimal("30.00")),
+        (5, 1, 1, datetime(2025, 10, 3, 13), "CANCELLED", Decimal("999.00")),
+    ]
+    # (id, sale_id, product_id, quantity, total_price)
+    lines = [(1, 1, 10, 2.0, Decimal("100.00")), (2, 2, 10, 1.0, Decimal("60.00")),
+             (3, 3, 11, 2.0, Decimal("40.00")), (4, 4, 11, 1.0, Decimal("30.00"))]
+    _write_mirror(tmp_path, sales, lines)
+
+    mirror = ParquetMirror(str(tmp_path), query_classes=["reports", "comparison", "overview", "portfolio"])
+    pg = FakePostgres()
+    repo = MirrorSalesRepository(pg, mirror)
+    start, end = date(2025, 10, 1), date(2025, 10, 3)
+
+    report = await repo.get_store_performance_for_period([1, 2], start, end)
+    assert [(r["store_id"], float(r["total_sales"]), r["total_orders"]) for r in report] == [(1, 100.0, 2), (2, 30.0, 1)]
+    assert report[0]["top_channel"]["channel"] == "iFood"
+
+    overview = await repo.get_revenue_overview(1, date(2025, 9, 29), end)  # anterior: 23..28/09
+    assert overview["total_sales"] == 100.0 and overview["total_orders"] == 2
+    assert overview["sales_change_pct"] == 0.0
+    assert [d["sale_date"] for d in overview["daily_breakdown"]] == ["2025-10-01", "2025-10-02"]
+
+    comparison = await repo.get_store_comparison(1, 2, start, end)
+    assert {r["store_id"]: float(r["total_sales"]) for r in comparison} == {1: 100.0, 2: 30.0}
+
+    portfolio = await repo.get_portfolio_overview([1, 2], start, end, top_n=2)
+    combined = next(r for r in portfolio if r["store_id"] is None)
+    assert float(combined["total_sales"]) == 130.0 and combined["total_orders"] == 3
+    assert [p["product_name"] for p in combined["top_products"]] == ["Batata", "X-Burger"]
+    assert pg.queries == 0 and mirror.served == 4
+
+    # período anterior antes do primeiro dia exportado: vai pro Postgres
+    await repo.get_store_comparison(1, 2, date(2025, 9, 20), date(2025, 10, 3))
+    assert pg.queries == 1 and mirror.served == 4
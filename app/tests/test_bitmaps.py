@@ -0,0 +1,30 @@
+# tests/test_bitmaps.py
+import random
+
+from app.core.bitmaps import ARRAY_MAX, RoaringBitmap
+
+
+def test_roaring_set_algebra_matches_python_sets():
+    rnd = random.Random(3)
+    a_ids = set(rnd.sample(range(300_000), 5_000))
+    b_ids = set(rnd.sample(range(300_000), 8_000)) | set(range(70_000, 80_000))  # um contêiner denso
+    a, b = RoaringBitmap(a_ids), RoaringBitmap(b_ids)
+
+    assert len(a) == len(a_ids) and 12345 in RoaringBitmap([12345])
+    assert a.intersection_count(b) == len(a_ids & b_ids)
+    assert set(a & b) == a_ids & b_ids
+    assert set(a | b) == a_ids | b_ids
+    assert set(b - a) == b_ids - a_ids
+    assert list(a) == sorted(a_ids)
+
+
+def test_roaring_serialization_round_trip_and_compression():
+    sparse = RoaringBitmap([1, 2, 3, 70_000])
+    # 2 contêineres em lista: cabeçalho de 7 bytes + 2 bytes por id
+    assert len(sparse.to_bytes()) == 2 * 7 + 4 * 2
+    assert RoaringBitmap.from_bytes(sparse.to_bytes()) == sparse
+
+    dense = RoaringBitmap(range(ARRAY_MAX + 1))
+    assert len(dense.to_bytes()) == 7 + 8192
+    assert RoaringBitmap.from_bytes(dense.to_bytes()) == dense
+    assert RoaringBitmap.from_bytes(b"") == RoaringBitmap()
@@ -0,0 +1,87 @@
+# tests/test_cancellation.py
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.cancellation import CLIENT_CLOSED_REQUEST, RequestCanceller
+
+
+class FakeRequest:
+    def __init__(self, disconnected=False):
+        self.url = SimpleNamespace(path="/api/v1/widgets/top-products-flex")
+        self.disconnected = disconnected
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+class QueryCanceled(Exception):
+    def __init__(self):
+        super().__init__("canceling statement due to statement timeout")
+        self.orig = SimpleNamespace(sqlstate="57014")
+
+
+@pytest.mark.asyncio
+async def test_newer_request_in_group_cancels_older():
+    canceller = RequestCanceller(poll_interval=0.01)
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def fast():
+        return {"ok": True}
+
+    first = asyncio.create_task(canceller.run(FakeRequest(), slow(), group="sheet-1"))
+    await asyncio.sleep(0.02)
+    assert await canceller.run(FakeRequest(), fast(), group="sheet-1") == {"ok": True}
+
+    with pytest.raises(HTTPException) as exc:
+        await first
+    assert exc.value.status_code == 409
+    assert cancelled == [True]
+    assert canceller.metrics()["superseded"] == 1
+    assert canceller.metrics()["in_flight_groups"] == 0
+
+
+@pytest.mark.asyncio
+async def test_disconnect_and_statement_timeout():
+    canceller = RequestCanceller(poll_interval=0.01)
+
+    with pytest.raises(HTTPException) as exc:
+        await canceller.run(FakeRequest(disconnected=True), asyncio.sleep(10))
+    assert exc.value.status_code == CLIENT_CLOSED_REQUEST
+
+    async def timed_out():
+        raise QueryCanceled()
+
+    with pytest.raises(HTTPException) as exc:
+        await canceller.run(FakeRequest(), timed_out())
+    assert exc.value.status_code == 504
+    assert canceller.metrics() == {
+        "in_flight_groups": 0, "completed": 0, "disconnected": 1, "superseded": 0, "timed_out": 1,
+    }
+
+
+@pytest.mark.asyncio
+async def test_same_group_from_other_tenant_does_not_cancel():
+    canceller = RequestCanceller(poll_interval=0.01)
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "a"
+
+    async def fast():
+        return "b"
+
+    first = asyncio.create_task(canceller.run(FakeRequest(), slow(), group="filters", owner="tenant:a"))
+    await asyncio.sleep(0.02)
+    assert await canceller.run(FakeRequest(), fast(), group="filters", owner="tenant:b") == "b"
+    assert await first == "a"
+    assert canceller.metrics()["superseded"] == 0
@@ -0,0 +1,98 @@
+# tests/test_change_listener.py
+import json
+from datetime import date
+
+import pytest
+
+from app.core.change_listener import ChangeListener
+from app.core.http_cache import ROLLUPS_CHANNEL, WatermarkCache
+from app.repositories.rollup_repository import RollupRepository
+
+
+def _payload(store_id, version, day):
+    return json.dumps({"store_id": store_id, "version": version, "from": day, "to": day, "at": 0})
+
+
+@pytest.mark.asyncio
+async def test_notifications_are_coalesced_per_store():
+    listener = ChangeListener(connect=None)
+    received = []
+    listener.add_handler(received.append)
+
+    listener.on_notify(_payload(7, 10, "2025-10-30"))
+    listener.on_notify(_payload(7, 12, "2025-10-31"))
+    listener.on_notify(_payload(9, 3, "2025-10-31"))
+    listener.on_notify("not json")
+    await listener.dispatch()
+
+    assert len(received) == 1
+    assert received[0][7] == {
+        "store_id": 7, "version": 12, "from": date(2025, 10, 30), "to": date(2025, 10, 31),
+    }
+    assert set(received[0]) == {7, 9}
+    assert listener.metrics()["notifications"] == 3
+    assert listener.metrics()["errors"] == 1
+
+    # nada pendente: handler não é chamado de novo
+    await listener.dispatch()
+    assert len(received) == 1
+
+
+def test_watermark_cache_ignores_reads_older_than_invalidation():
+    cache = WatermarkCache()
+    assert cache.get_many([1]) == ({}, [1])  # desligado sem listener
+
+    cache.set_enabled(True)
+    cache.update({1: 5}, cache.token())
+    assert cache.get_many([1, 2]) == ({1: 5}, [2])
+
+    token = cache.token()   # leitura começa...
+    cache.invalidate([1])   # ...aviso chega no meio...
+    cache.update({1: 5}, token)  # ...e a versão velha não volta
+    assert cache.get_many([1]) == ({}, [1])
+
+    cache.update({1: 6}, cache.token())
+    assert cache.get_many([1]) == ({1: 6}, [])
+
+
+class RollupDb:
+    """Fila com dois dias pendentes da loja 7; o resto só registra o SQL."""
+
+    def __init__(self):
+        self.sql = []
+
+    async def execute(self, statement, params=None):
+        sql = " ".join(str(statement).split())
+        self.sql.append((sql, params))
+
+        class Result:
+            rowcount = 0
+
+            def fetchall(self):
+                if sql.startswith("DELETE FROM rollup_dirty_days"):
+                    return [(7, date(2025, 10, 30), 1.0), (7, date(2025, 10, 31), 0.5)]
+                return []
+
+            def scalar(self):
+                return True
+
+        return Result()
+
+
+@pytest.mark.asyncio
+async def test_refresh_dirty_bumps_version_after_rewriting_rollups():
+    db = RollupDb()
+    done = await RollupRepository(db).refresh_dirty()
+    assert [d["sale_date"] for d in done] == [date(2025, 10, 30), date(2025, 10, 31)]
+
+    # último comando da transação: versão sobe (uma vez por loja) e avisa a API
+    sql, params = db.sql[-1]
+    assert "UPDATE store_data_watermark" in sql and "pg_notify" in sql
+    assert params == {"all_stores": False, "store_ids": [7], "channel": ROLLUPS_CHANNEL}
+    assert not any("store_data_watermark SET" in s for s, _ in db.sql[:-1])
+
+    cache = WatermarkCache()
+    cache.set_enabled(True)
+    cache.update({7: 3, 9: 1}, cache.token())
+    cache.on_rollups_notify("7")
+    assert cache.get_many([7, 9]) == ({9: 1}, [7])
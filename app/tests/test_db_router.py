@@ -0,0 +1,78 @@
+# tests/test_db_router.py
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app.core.db_router import DatabaseRouter, DatabaseTarget
+
+
+class FakeResult:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar_one(self):
+        return self.value
+
+
+class FakeSession:
+    """Sessão stub: devolve o nome do alvo ou falha como conexão caída."""
+
+    def __init__(self, name, lag=0.0, down=False):
+        self.name, self.lag, self.down = name, lag, down
+
+    async def execute(self, statement, params=None):
+        if self.down:
+            raise OperationalError("SELECT 1", {}, ConnectionRefusedError("down"))
+        if "pg_is_in_recovery" in str(statement):
+            return FakeResult(self.lag)
+        return FakeResult(self.name)
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+def _target(name, **kw):
+    return DatabaseTarget(name, lambda: FakeSession(name, **kw))
+
+
+async def _read(router):
+    async with router.session(read_only=True) as session:
+        return (await session.execute("SELECT 1")).scalar_one()
+
+
+@pytest.mark.asyncio
+async def test_reads_round_robin_across_replicas():
+    router = DatabaseRouter(_target("primary"), [_target("r1"), _target("r2")])
+    assert [await _read(router) for _ in range(4)] == ["r1", "r2", "r1", "r2"]
+
+
+@pytest.mark.asyncio
+async def test_replica_failure_falls_back_and_leaves_rotation():
+    router = DatabaseRouter(_target("primary"), [_target("r1", down=True)])
+    assert await _read(router) == "primary"
+    replica = router.replicas[0]
+    assert not replica.healthy and replica.errors == 1
+    assert router.metrics()["targets"][0]["queries"] == 1
+
+
+@pytest.mark.asyncio
+async def test_lagging_replica_is_skipped_after_health_check():
+    router = DatabaseRouter(
+        _target("primary"),
+        [_target("r1", lag=120.0), _target("r2", lag=1.0)],
+        max_lag_seconds=30,
+    )
+    await router.check_health()
+    assert {await _read(router) for _ in range(3)} == {"r2"}
+
+
+@pytest.mark.asyncio
+async def test_writes_always_go_to_primary():
+    router = DatabaseRouter(_target("primary"), [_target("r1")])
+    async with router.session(read_only=False) as session:
+        assert (await session.execute("SELECT 1")).scalar_one() == "primary"
@@ -0,0 +1,88 @@
+# tests/test_dimension_cache.py
+from datetime import date
+
+import pytest
+
+from app.repositories.dimension_cache import DimensionCache
+from app.repositories.sales_repository import SalesRepository
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+    def mappings(self):
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class FakeDb:
+    """Dimensões em dicionário; a consulta de vendas devolve só ids."""
+
+    def __init__(self):
+        self.channels = {1: "iFood", 2: "Balcão"}
+        self.products = {10: "X-Burger"}
+        self.sql = []
+
+    async def execute(self, statement, params=None):
+        sql = str(statement)
+        self.sql.append(sql)
+        for table in ("channels", "products"):
+            if f"FROM {table}" in sql:
+                names = getattr(self, table)
+                ids = params["ids"] if params and "ids" in params else names
+                return FakeResult([(i, names[i]) for i in ids if i in names])
+        if "product_sales" in sql:
+            return FakeResult([
+                {"product_id": 11, "total_quantity": 3, "total_revenue": 30, "pct_of_total": 60, "wow_change_pct": None},
+                {"product_id": 10, "total_quantity": 1, "total_revenue": 20, "pct_of_total": 40, "wow_change_pct": None},
+            ])
+        return FakeResult([{"channel": 2, "total_sales": 80}, {"channel": 1, "total_sales": 50}])
+
+
+@pytest.mark.asyncio
+async def test_queries_group_by_id_and_names_come_from_cache():
+    db = FakeDb()
+    dims = DimensionCache()
+    repo = SalesRepository(db, dims)
+
+    assert await repo.get_channel_performance(1) == [
+        {"channel": "Balcão", "total_sales": 80},
+        {"channel": "iFood", "total_sales": 50},
+    ]
+    await repo.get_channel_performance(1)
+    assert not any("JOIN channels" in sql for sql in db.sql)
+    assert dims.loads == 1  # canais lidos uma vez só
+
+    # produto cadastrado depois da carga: lookup por PK; filtro de canal vira id
+    await dims.load(db, ["products"])
+    db.products[11] = "Batata"
+    rows = await repo.get_top_products_flexible(1, "iFood", date(2025, 10, 1), date(2025, 10, 31), None, None, None)
+    assert [(r["product_id"], r["product_name"]) for r in rows] == [(11, "Batata"), (10, "X-Burger")]
+    top_sql = next(sql for sql in db.sql if "product_sales" in sql)
+    assert "s.channel_id = ANY(:channel_ids)" in top_sql and "JOIN products" not in top_sql
+    assert dims.lookups == 1
+
+
+@pytest.mark.asyncio
+async def test_notify_and_reconnect_reload_renamed_names():
+    db = FakeDb()
+    dims = DimensionCache(ttl=3600)
+    assert await dims.names(db, "channels", [1]) == {1: "iFood"}
+
+    db.channels[1] = "iFood Entrega"
+    assert await dims.names(db, "channels", [1]) == {1: "iFood"}  # ainda no TTL
+    dims.on_notify("channels")
+    assert await dims.names(db, "channels", [1]) == {1: "iFood Entrega"}
+
+    db.channels[1] = "iFood"
+    dims.on_notify("products")  # outra tabela: canais seguem válidos
+    assert await dims.ids_for(db, "channels", "iFood Entrega") == [1]
+    dims.set_enabled(True)  # reconexão: pode ter perdido aviso
+    assert await dims.ids_for(db, "channels", "iFood") == [1]
+    assert dims.metrics()["notified"] is True
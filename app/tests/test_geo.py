@@ -0,0 +1,92 @@
+# tests/test_geo.py
+import math
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.geo import GRID_ORIGIN, GRID_ZOOMS, cell_of, cell_size, cell_sql
+from app.main import app
+from app.repositories.sales_repository import SalesRepository
+from app.services.widget_service import WidgetService
+
+POINTS = [(-23.5505, -46.6333), (-22.9068, -43.1729), (0.0, 0.0), (51.5, -0.1275)]
+
+
+def _eval_sql(expr, latitude, longitude, zoom):
+    # FLOOR((lon + 180) * POWER(2, z) / 360)::INTEGER em Python
+    expr = expr.replace("FLOOR", "math.floor").replace("POWER", "pow").replace("::INTEGER", "")
+    return eval(expr, {"math": math, "lat": latitude, "lon": longitude, "z": zoom})
+
+
+@pytest.mark.parametrize("zoom", GRID_ZOOMS)
+def test_cell_of_matches_sql_and_contains_point(zoom):
+    lon_step, lat_step = cell_size(zoom)
+    x_sql, y_sql = cell_sql("lat", "lon", "z")
+    for latitude, longitude in POINTS:
+        x, y = cell_of(latitude, longitude, zoom)
+        assert (x, y) == (_eval_sql(x_sql, latitude, longitude, zoom), _eval_sql(y_sql, latitude, longitude, zoom))
+        # célula (x, y) cobre [origem + x*step, origem + (x+1)*step)
+        assert GRID_ORIGIN[0] + x * lon_step <= longitude < GRID_ORIGIN[0] + (x + 1) * lon_step
+        assert GRID_ORIGIN[1] + y * lat_step <= latitude < GRID_ORIGIN[1] + (y + 1) * lat_step
+        # zooms aninham: +2 de zoom = 4x4 células dentro da anterior
+        fine_x, fine_y = cell_of(latitude, longitude, zoom + 2)
+        assert (fine_x // 4, fine_y // 4) == (x, y)
+
+
+class GridResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def mappings(self):
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class GridDb:
+    def __init__(self, rows):
+        self.rows = rows
+        self.params = None
+
+    async def execute(self, statement, params=None):
+        self.params = params
+        return GridResult(self.rows)
+
+
+@pytest.mark.asyncio
+async def test_delivery_grid_is_compact_per_cell():
+    db = GridDb([
+        {"cell_x": 5630, "cell_y": 6120, "delivery_count": 12, "avg_delivery_seconds": Decimal("1800.5"),
+         "min_delivery_seconds": 600, "max_delivery_seconds": 3000},
+        {"cell_x": 5631, "cell_y": 6120, "delivery_count": 3, "avg_delivery_seconds": None,
+         "min_delivery_seconds": None, "max_delivery_seconds": None},
+    ])
+    service = WidgetService(SalesRepository(db))
+    body = await service.get_delivery_grid_insight(1, date(2025, 10, 1), date(2025, 10, 31), 14)
+
+    assert db.params == {"store_id": 1, "zoom": 14, "start_date": date(2025, 10, 1), "end_date": date(2025, 10, 31)}
+    assert body["cell_size"] == {"longitude": 360 / 2 ** 14, "latitude": 180 / 2 ** 14}
+    assert len(body["fields"]) == len(body["cells"][0])
+    assert body["cells"] == [[5630, 6120, 12, 1800.5, 600, 3000], [5631, 6120, 3, None, None, None]]
+
+
+def test_delivery_grid_rejects_zoom_without_rollup():
+    from app.api.v1.routes.widgets import get_widget_service
+
+    class NoGridService:
+        async def get_data_watermarks(self, store_ids):
+            return {sid: 1 for sid in store_ids}
+
+        async def get_delivery_grid_insight(self, **kwargs):
+            raise AssertionError("zoom inválido não deveria chegar no serviço")
+
+    app.dependency_overrides[get_widget_service] = lambda: NoGridService()
+    try:
+        r = TestClient(app).get("/api/v1/widgets/delivery-heatmap/grid", params={"store_id": 1, "zoom": 13})
+    finally:
+        app.dependency_overrides.clear()
+    assert r.status_code == 400
+    assert "zoom" in r.json()["detail"]
@@ -0,0 +1,110 @@
+# tests/test_hot_window.py
+from datetime import date, datetime
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from app.repositories.hot_window import HotSalesWindow, HotWindowSalesRepository  # noqa: E402
+
+TODAY = date(2025, 10, 31)  # sexta
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeDb:
+    """Responde as consultas da janela a partir de listas em memória."""
+
+    def __init__(self):
+        # (id, created_at, channel_id, total_amount, customer_id)
+        self.sales = [
+            (1, datetime(2025, 10, 3, 12, 10), 1, 100.0, 7),    # período anterior
+            (2, datetime(2025, 10, 30, 12, 30), 1, 50.0, 7),
+            (3, datetime(2025, 10, 31, 20, 5), 2, 30.0, None),
+        ]
+        # (sale_id, product_id, quantity, total_price)
+        self.lines = [(1, 10, 2.0, 100.0), (2, 10, 1.0, 40.0), (2, 11, 1.0, 10.0), (3, 11, 3.0, 30.0)]
+        self.queries = 0
+
+    async def execute(self, statement, params=None):
+        self.queries += 1
+        sql = str(statement)
+        if "FROM channels" in sql:
+            return FakeResult([(1, "iFood"), (2, "Balcão")])
+        if "FROM products" in sql:
+            return FakeResult([(10, "X-Burger"), (11, "Batata")])
+        after = params["after_sale_id"]
+        if "product_sales" in sql:
+            return FakeResult([line for line in self.lines if line[0] > after])
+        return FakeResult([sale for sale in self.sales if sale[0] > after])
+
+
+@pytest.mark.asyncio
+async def test_window_aggregations_match_sql_shapes():
+    db = FakeDb()
+    hot = HotSalesWindow(days=62, today=lambda: TODAY)
+    repo = HotWindowSalesRepository(db, hot)
+
+    overview = await repo.get_revenue_overview(1, date(2025, 10, 16), TODAY)
+    assert overview["total_sales"] == 80.0 and overview["total_orders"] == 2
+    assert overview["sales_change_pct"] == -20.0  # 80 vs 100 no período anterior
+    assert overview["top_channels"] == [
+        {"channel": "iFood", "total_sales": 50.0, "share_pct": 62.5},
+        {"channel": "Balcão", "total_sales": 30.0, "share_pct": 37.5},
+    ]
+    assert [d["sale_date"] for d in overview["daily_breakdown"]] == ["2025-10-30", "2025-10-31"]
+
+    top = await repo.get_top_products_flexible(1, None, date(2025, 10, 16), TODAY, None, None, None)
+    assert [(r["product_name"], r["total_quantity"], r["wow_change_pct"]) for r in top] == [
+        ("X-Burger", 1.0, -50.0), ("Batata", 4.0, None),
+    ]
+    # sexta (ISO 5) às 20h, só no Balcão
+    friday = await repo.get_top_products_flexible(1, "Balcão", date(2025, 10, 16), TODAY, 5, 19, 21)
+    assert [r["product_name"] for r in friday] == ["Batata"]
+
+    matrix = await repo.get_hourly_matrix(1, date(2025, 10, 1), TODAY, product_id=11)
+    assert matrix == [
+        {"dow": 4, "hour": 12, "total_orders": 1, "total_sales": 10.0, "total_quantity": 1.0},
+        {"dow": 5, "hour": 20, "total_orders": 1, "total_sales": 30.0, "total_quantity": 3.0},
+    ]
+    assert hot.metrics()["loads"] == 1 and hot.metrics()["hits"] == 4
+
+
+@pytest.mark.asyncio
+async def test_incremental_refresh_and_memory_budget():
+    db = FakeDb()
+    hot = HotSalesWindow(days=62, refresh_seconds=3600, today=lambda: TODAY)
+    window = await hot.get(db, 1)
+    assert window.size == 3 and window.last_sale_id == 3
+
+    db.sales.append((4, datetime(2025, 10, 31, 21, 0), 1, 20.0, None))
+    db.lines.append((4, 10, 1.0, 20.0))
+    assert (await hot.get(db, 1)).size == 3  # ainda fresco: não consulta
+    hot.refresh_seconds = 0
+    window = await hot.get(db, 1)
+    assert window.size == 4 and len(window.lines["sale_idx"]) == 5
+    assert hot.metrics()["refreshes"] == 1
+
+    # cancelamento (UPDATE, id antigo) não aparece no incremento; o aviso de
+    # mudança recarrega a loja inteira
+    hot.refresh_seconds = 3600
+    db.sales = [sale for sale in db.sales if sale[0] != 2]
+    db.lines = [line for line in db.lines if line[0] != 2]
+    hot.invalidate([1])
+    window = await hot.get(db, 1)
+    assert window.size == 3 and 2 not in window.sales["sale_id"]
+    assert hot.metrics()["loads"] == 2
+
+    # período fora da janela não usa memória
+    assert not hot.covers(date(2025, 1, 1))
+
+    # orçamento menor que uma loja: não fica em cache e a consulta vai pro SQL
+    tiny = HotSalesWindow(days=62, max_bytes=10, today=lambda: TODAY)
+    assert await tiny.get(db, 1) is None
+    assert tiny.metrics()["stores"] == 0 and tiny.metrics()["too_big"] == 1
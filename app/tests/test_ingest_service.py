@@ -0,0 +1,152 @@
+# tests/test_ingest_service.py
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
+
+from app.repositories.ingest_repository import unnest_insert_sql
+from app.services import ingest_service
+from app.services.ingest_service import SalesIngestor
+
+
+class FakeSession:
+    commits = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def commit(self):
+        FakeSession.commits += 1
+
+
+class FakeIngestRepo:
+    """Finge que (1, 'old') já estava gravada."""
+
+    batches = []
+    fail = False
+
+    def __init__(self, session):
+        pass
+
+    async def write_batch(self, sales):
+        if FakeIngestRepo.fail:
+            raise RuntimeError("db down")
+        FakeIngestRepo.batches.append(len(sales))
+        keys = {(s["store_id"], s["cod_sale1"]) for s in sales} - {(1, "old")}
+        return {"inserted_keys": keys, "store_days": [], "written": {}}
+
+
+def _sale(cod, store_id=1):
+    return {"store_id": store_id, "cod_sale1": cod}
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_transaction(monkeypatch):
+    monkeypatch.setattr(ingest_service, "IngestRepository", FakeIngestRepo)
+    FakeIngestRepo.batches = []
+    ingestor = SalesIngestor(FakeSession, max_batch=100, max_wait=0.05)
+
+    r1, r2 = await asyncio.gather(
+        ingestor.submit([_sale("a"), _sale("old")]),
+        ingestor.submit([_sale("b"), _sale("a")]),
+    )
+    await ingestor.stop()
+
+    assert FakeIngestRepo.batches == [4]
+    assert r1 == {"received": 2, "inserted": 1, "duplicates": ["old"]}
+    # "a" já veio na requisição anterior do mesmo lote
+    assert r2 == {"received": 2, "inserted": 1, "duplicates": ["a"]}
+    assert ingestor.metrics()["batches"] == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_and_full_queue_return_503(monkeypatch):
+    monkeypatch.setattr(ingest_service, "IngestRepository", FakeIngestRepo)
+    FakeIngestRepo.fail = True
+    ingestor = SalesIngestor(FakeSession, max_wait=0, max_pending=3)
+    try:
+        with pytest.raises(HTTPException) as exc:
+            await ingestor.submit([_sale("x")])
+        assert exc.value.status_code == 503
+        assert ingestor.metrics()["pending"] == 0
+
+        with pytest.raises(HTTPException) as exc:
+            await ingestor.submit([_sale(str(i)) for i in range(4)])
+        assert exc.value.headers == {"Retry-After": "1"}
+    finally:
+        FakeIngestRepo.fail = False
+        await ingestor.stop()
+
+
+@pytest.mark.asyncio
+async def test_stop_waits_for_flush_in_progress_and_drains_queue(monkeypatch):
+    class SlowRepo(FakeIngestRepo):
+        async def write_batch(self, sales):
+            await asyncio.sleep(0.05)
+            return await super().write_batch(sales)
+
+    monkeypatch.setattr(ingest_service, "IngestRepository", SlowRepo)
+    FakeIngestRepo.batches = []
+    ingestor = SalesIngestor(FakeSession, max_batch=1, max_wait=0)
+
+    pending = [asyncio.create_task(ingestor.submit([_sale(cod)])) for cod in ("a", "b", "c")]
+    await asyncio.sleep(0.01)  # "a" no meio do flush, "b" e "c" na fila
+    await ingestor.stop()
+
+    results = await asyncio.wait_for(asyncio.gather(*pending), timeout=1)
+    assert [r["inserted"] for r in results] == [1, 1, 1]
+    assert FakeIngestRepo.batches == [1, 1, 1]
+    assert ingestor.metrics()["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_bad_sale_only_fails_its_own_request(monkeypatch):
+    class FkRepo(FakeIngestRepo):
+        async def write_batch(self, sales):
+            if any(s["store_id"] == 999 for s in sales):
+                raise IntegrityError("INSERT INTO sales", {}, Exception("violates foreign key constraint"))
+            return await super().write_batch(sales)
+
+    monkeypatch.setattr(ingest_service, "IngestRepository", FkRepo)
+    FakeIngestRepo.batches = []
+    ingestor = SalesIngestor(FakeSession, max_batch=100, max_wait=0.05)
+
+    good, bad, other = await asyncio.gather(
+        ingestor.submit([_sale("a")]),
+        ingestor.submit([_sale("b", store_id=999)]),
+        ingestor.submit([_sale("c")]),
+        return_exceptions=True,
+    )
+    await ingestor.stop()
+
+    assert good["inserted"] == 1 and other["inserted"] == 1
+    assert isinstance(bad, HTTPException) and bad.status_code == 422 and not bad.headers
+    # lote inteiro falhou uma vez; depois uma transação por requisição
+    assert FakeIngestRepo.batches == [1, 1]
+    assert ingestor.metrics()["isolated_retries"] == 1 and ingestor.metrics()["pending"] == 0
+
+
+def test_unnest_insert_sql_one_array_per_column():
+    sql = unnest_insert_sql("payments", [("sale_id", "INTEGER"), ("value", "NUMERIC")])
+    assert sql == (
+        "INSERT INTO payments (sale_id, value) "
+        "SELECT * FROM unnest(CAST(:sale_id AS INTEGER[]), CAST(:value AS NUMERIC[]))"
+    )
+
+
+def test_created_at_with_offset_is_rejected():
+    from pydantic import ValidationError
+
+    from app.api.v1.routes.ingest import SaleIn
+
+    sale = {
+        "store_id": 1, "channel_id": 1, "cod_sale1": "a", "sale_status_desc": "COMPLETED",
+        "total_amount_items": "10", "total_amount": "10",
+    }
+    assert SaleIn(**sale, created_at="2025-10-31T12:00:00").created_at.hour == 12
+    with pytest.raises(ValidationError):
+        SaleIn(**sale, created_at="2025-10-31T12:00:00-03:00")
@@ -0,0 +1,84 @@
+# tests/test_live_service.py
+from datetime import date
+
+import pytest
+
+from app.services import live_service
+from app.services.live_service import LiveDashboardHub, LiveDashboardState
+
+DAY = date(2025, 10, 31)
+
+
+def test_state_apply_returns_only_changed_channels():
+    state = LiveDashboardState(1, DAY)
+    state.apply([
+        {"channel": "iFood", "total_sales": 100, "total_orders": 1, "last_sale_id": 10},
+        {"channel": "Rappi", "total_sales": 100, "total_orders": 1, "last_sale_id": 12},
+    ])
+    delta = state.apply([{"channel": "iFood", "total_sales": 0, "total_orders": 0, "last_sale_id": 13}])
+    # sem venda nova em valor: participação não muda, só o canal tocado vem
+    assert [c["channel"] for c in delta["channels"]] == ["iFood"]
+
+    delta = state.apply([{"channel": "iFood", "total_sales": 200, "total_orders": 2, "last_sale_id": 20}])
+    assert delta["increment"] == {"total_sales": 200.0, "total_orders": 2}
+    assert delta["totals"] == {"total_sales": 400.0, "total_orders": 4, "average_ticket": 100.0}
+    assert {c["channel"]: c["share_pct"] for c in delta["channels"]} == {"iFood": 75.0, "Rappi": 25.0}
+    assert state.last_sale_id == 20
+    assert state.apply([]) is None
+
+
+class FakeRepo:
+    version = 1
+    pending = []
+    queries = 0
+
+    def __init__(self, session, dimensions=None):
+        pass
+
+    async def get_store_watermarks(self, store_ids):
+        return {sid: FakeRepo.version for sid in store_ids}
+
+    async def get_live_sales_delta(self, store_id, day, after_sale_id=0):
+        FakeRepo.queries += 1
+        if after_sale_id == 0:
+            return [{"channel": "iFood", "total_sales": 50, "total_orders": 1, "last_sale_id": 1}]
+        rows, FakeRepo.pending = FakeRepo.pending, []
+        return rows
+
+    async def get_at_risk_customers(self, store_id, limit=None):
+        return []
+
+
+class FakeSession:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_hub_single_producer_fans_out_deltas(monkeypatch):
+    monkeypatch.setattr(live_service, "SalesRepository", FakeRepo)
+    hub = LiveDashboardHub(FakeSession, poll_interval=3600, today=lambda: DAY)
+
+    async with hub.subscribe(7) as q1, hub.subscribe(7) as q2:
+        assert len(hub.feeds) == 1
+        feed = hub.feeds[7]
+        snap1, snap2 = await q1.get(), await q2.get()
+        assert snap1 == snap2 and snap1["type"] == "snapshot"
+        assert snap1["totals"]["total_sales"] == 50.0
+
+        # mesma versão: nenhuma consulta de vendas
+        before = FakeRepo.queries
+        await feed.tick()
+        assert FakeRepo.queries == before and q1.empty()
+
+        FakeRepo.version = 2
+        FakeRepo.pending = [{"channel": "Rappi", "total_sales": 50, "total_orders": 1, "last_sale_id": 2}]
+        await feed.tick()
+        d1, d2 = q1.get_nowait(), q2.get_nowait()
+        assert d1 is d2 and d1["type"] == "delta"
+        assert d1["totals"]["total_orders"] == 2
+
+    assert hub.feeds == {}
@@ -0,0 +1,43 @@
+# tests/test_pagination.py
+from datetime import date
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.pagination import decode_cursor, encode_cursor, paginate
+
+
+def test_cursor_round_trip():
+    scope = {"w": "stores"}
+    token = encode_cursor(["Loja Centro", 42], scope)
+    assert decode_cursor(token, scope) == ["Loja Centro", 42]
+
+
+def test_cursor_rejects_other_query_and_garbage():
+    token = encode_cursor([10, "Centro", "SP"], {"store_id": 1})
+    with pytest.raises(HTTPException):
+        decode_cursor(token, {"store_id": 2})
+    with pytest.raises(HTTPException):
+        decode_cursor("não-é-cursor", {"store_id": 1})
+
+
+def test_cursor_validates_key_types():
+    scope = {"w": "at-risk", "store_id": 1}
+    token = encode_cursor(["2025-10-01", 42], scope)
+    assert decode_cursor(token, scope, (date, int)) == [date(2025, 10, 1), 42]
+
+    # mesmo escopo, chave adulterada: tamanho, tipo ou data inválida => 400
+    for bad in (["2025-10-01"], ["2025-10-01", "42"], ["2025-10-01", True], ["ontem", 42], ["2025-10-01", None]):
+        with pytest.raises(HTTPException) as exc:
+            decode_cursor(encode_cursor(bad, scope), scope, (date, int))
+        assert exc.value.status_code == 400
+
+
+def test_paginate_uses_extra_row_as_has_more():
+    rows = [{"id": i} for i in range(4)]
+    page, cursor = paginate(rows, 3, lambda r: [r["id"]], {})
+    assert [r["id"] for r in page] == [0, 1, 2]
+    assert decode_cursor(cursor, {}) == [2]
+
+    page, cursor = paginate(rows[:3], 3, lambda r: [r["id"]], {})
+    assert len(page) == 3 and cursor is None
@@ -0,0 +1,160 @@
+# tests/test_query_planner.py
+from datetime import date
+
+import pytest
+
+from app.services.query_planner import QueryPlanner
+
+TODAY = date(2025, 10, 31)
+
+
+class FakeDb:
+    def __init__(self):
+        self.rollbacks = 0
+
+    async def rollback(self):
+        self.rollbacks += 1
+
+
+class FakeRepo:
+    """Só o que o planner pergunta: volume por loja, dias pendentes e fonte do cru."""
+
+    def __init__(self, daily_orders=1000, pending=0, source="postgres", uncovered=0):
+        self.db = FakeDb()
+        self.daily_orders = daily_orders
+        self.pending = pending
+        self.source = source
+        self.uncovered = uncovered
+
+    def raw_source(self, method, first_day, end_date):
+        return self.source
+
+    async def get_store_daily_orders(self, since):
+        return {1: self.daily_orders * 28, 2: self.daily_orders * 28}
+
+    async def count_rollup_pending_days(self, store_ids, start_date, end_date):
+        return self.pending
+
+    async def count_rollup_uncovered_stores(self, store_ids, start_date, end_date):
+        if self.uncovered is None:
+            raise RuntimeError('relation "rollup_coverage" does not exist')
+        return self.uncovered
+
+
+def paths(calls, rollup_error=None):
+    async def raw(plan):
+        calls.append("raw")
+        return "raw"
+
+    async def rollup(plan):
+        calls.append("rollup")
+        if rollup_error:
+            raise rollup_error
+        return "rollup"
+
+    async def approximate(plan):
+        calls.append(f"approximate@{plan['sample_pct']}")
+        return "approximate"
+
+    return {"raw": raw, "rollup": rollup, "approximate": approximate}
+
+
+async def run(planner, repo, days, calls, rollup_error=None, **kwargs):
+    start = date.fromordinal(TODAY.toordinal() - days + 1)
+    return await planner.execute(
+        repo, "revenue_overview", "get_revenue_overview", [1], start, TODAY, paths(calls, rollup_error), **kwargs
+    )
+
+
+@pytest.mark.asyncio
+async def test_strategy_follows_estimated_rows():
+    planner = QueryPlanner(raw_max_rows=50_000, approx_min_rows=1_000_000, today=lambda: TODAY)
+    calls = []
+
+    # 1000 pedidos/dia x 30 dias: cru
+    result, plan = await run(planner, FakeRepo(), 30, calls)
+    assert (result, plan["reason"], plan["estimated_rows"]) == ("raw", "small", 30_000)
+
+    # 1000 x 365: rollup
+    result, plan = await run(planner, FakeRepo(), 365, calls)
+    assert (result, plan["source"]) == ("rollup", "rollup")
+
+    # dia pendente no rollup: sem amostra liberada, volta pro cru
+    result, plan = await run(planner, FakeRepo(pending=2), 365, calls)
+    assert (result, plan["reason"], plan["rollup_pending_days"]) == ("raw", "rollup_stale", 2)
+
+    # rollup nunca populado pro período (sem dia pendente): cru, não zeros
+    result, plan = await run(planner, FakeRepo(uncovered=1), 365, calls)
+    assert (result, plan["reason"], plan["rollup_uncovered_stores"]) == ("raw", "rollup_not_covered", 1)
+
+    # sem a migração de cobertura: também cru
+    repo = FakeRepo(uncovered=None)
+    result, plan = await run(planner, repo, 365, calls)
+    assert (result, plan["reason"], repo.db.rollbacks) == ("raw", "rollup_not_covered", 1)
+
+    # janela quente/espelho respondem o cru: nem olha o rollup
+    result, plan = await run(planner, FakeRepo(source="memory"), 365, calls)
+    assert (result, plan["reason"]) == ("raw", "raw_served_by_memory")
+    assert planner.stats_loads == 1  # estatística das lojas em cache
+
+    # amostra só com allow_approximate e acima de approx_min_rows
+    planner = QueryPlanner(approx_min_rows=1_000_000, allow_approximate=True, today=lambda: TODAY)
+    result, plan = await run(planner, FakeRepo(daily_orders=10_000, pending=1), 365, calls)
+    assert result == "approximate" and calls[-1] == "approximate@5.479"
+
+
+@pytest.mark.asyncio
+async def test_rollup_failure_falls_back_to_raw_and_is_measured():
+    planner = QueryPlanner(today=lambda: TODAY)
+    repo = FakeRepo()
+    calls = []
+
+    result, plan = await run(planner, repo, 365, calls, rollup_error=RuntimeError("relation does not exist"))
+    assert result == "raw" and calls == ["rollup", "raw"]
+    assert plan["reason"] == "rollup_failed" and repo.db.rollbacks == 1
+
+    metrics = planner.metrics()
+    assert metrics["fallbacks"] == 1 and "relation does not exist" in metrics["last_error"]
+    assert [e["strategy"] for e in metrics["queries"]["revenue_overview"]] == ["raw"]
+
+    # desligado: sempre cru, sem estatística
+    off = QueryPlanner(enabled=False)
+    result, plan = await run(off, FakeRepo(), 365, calls)
+    assert (result, plan["reason"], off.stats_loads) == ("raw", "planner_off", 0)
+
+
+@pytest.mark.asyncio
+async def test_approx_request_samples_and_refines_to_exact():
+    planner = QueryPlanner(enabled=False, approx_target_rows=36_500, today=lambda: TODAY)
+    calls = []
+
+    # ?approx=true vale mesmo com o planner automático desligado
+    result, plan = await run(planner, FakeRepo(), 365, calls, approximate=True)
+    assert result == "approximate" and plan["sample_pct"] == 10.0
+    assert plan["next_sample_pct"] is None and plan["confidence_level"] == 0.95
+
+    # passo do refinamento com percentual vindo da URL
+    result, plan = await run(planner, FakeRepo(), 365, calls, approximate=True, sample_pct=1)
+    assert (plan["sample_pct"], plan["next_sample_pct"]) == (1.0, 10.0)
+
+    # período curto: a amostra seria a tabela inteira, vai o exato
+    result, plan = await run(planner, FakeRepo(), 30, calls, approximate=True)
+    assert (result, plan["reason"]) == ("raw", "sample_would_be_full")
+
+
+@pytest.mark.asyncio
+async def test_approx_skips_store_that_is_a_small_share_of_the_partition():
+    class CrowdedRepo(FakeRepo):
+        async def get_store_daily_orders(self, since):
+            return {sid: self.daily_orders * 28 for sid in range(1, 41)}
+
+    planner = QueryPlanner(enabled=False, approx_target_rows=36_500, today=lambda: TODAY)
+    calls = []
+
+    # 10% das páginas da partição pra 2,5% de linhas da loja: lê mais que o exato
+    result, plan = await run(planner, CrowdedRepo(), 365, calls, approximate=True)
+    assert (result, plan["reason"], plan["store_share_pct"]) == ("raw", "sample_not_cheaper", 2.5)
+
+    # amostra abaixo da fatia da loja ainda compensa
+    result, plan = await run(planner, CrowdedRepo(), 365, calls, approximate=True, sample_pct=1)
+    assert (result, plan["sample_pct"]) == ("approximate", 1.0)
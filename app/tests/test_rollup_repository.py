@@ -0,0 +1,74 @@
+# tests/test_rollup_repository.py
+import re
+from datetime import date, datetime
+
+import pytest
+
+from app.repositories.rollup_repository import RollupRepository
+
+
+class Result:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+
+class DuckSession:
+    """
+    Sessão que roda o upsert da cobertura num DuckDB em memória (mesmo SQL,
+    :param vira $param). O lock de linha é no-op: não há concorrência aqui.
+    """
+
+    def __init__(self, con):
+        self.con = con
+
+    async def execute(self, statement, params=None):
+        sql = str(statement)
+        if "to_regclass" in sql:
+            return Result(True)
+        if "FOR UPDATE" in sql:
+            return Result(None)
+        used = {k: v for k, v in (params or {}).items() if f":{k}" in sql}
+        self.con.execute(re.sub(r"(?<!:):(\w+)", r"$\1", sql), used)
+        return Result(None)
+
+
+@pytest.mark.asyncio
+async def test_coverage_bridges_days_without_sales():
+    duckdb = pytest.importorskip("duckdb")
+
+    con = duckdb.connect()
+    con.execute("CREATE TABLE stores (id INTEGER PRIMARY KEY)")
+    con.execute("INSERT INTO stores VALUES (1), (2)")
+    con.execute("CREATE TABLE sales (store_id INTEGER, created_at TIMESTAMP)")
+    con.execute(
+        "CREATE TABLE rollup_coverage (store_id INTEGER PRIMARY KEY, covered_from DATE NOT NULL,"
+        " covered_to DATE NOT NULL, updated_at TIMESTAMP NOT NULL DEFAULT now())"
+    )
+    # loja 1 fecha no domingo (05/10); loja 2 vendeu no dia 05 e esse dia ainda não foi recalculado
+    con.executemany(
+        "INSERT INTO sales VALUES (?, ?)",
+        [(1, datetime(2025, 10, d, 12)) for d in (3, 4, 6)] + [(2, datetime(2025, 10, d, 12)) for d in (3, 4, 5, 6)],
+    )
+    repo = RollupRepository(DuckSession(con))
+
+    def coverage():
+        rows = con.execute("SELECT store_id, covered_from, covered_to FROM rollup_coverage ORDER BY 1").fetchall()
+        return {sid: (start.day, end.day) for sid, start, end in rows}
+
+    # refresh_all por período, depois o dreno dia a dia (só dias com venda ficam pendentes)
+    await repo.extend_coverage(date(2025, 10, 1), date(2025, 10, 4))
+    await repo.extend_coverage(date(2025, 10, 6), date(2025, 10, 6), 1)
+    await repo.extend_coverage(date(2025, 10, 6), date(2025, 10, 6), 2)
+    # domingo sem venda não trava a cobertura; buraco com venda não vira cobertura
+    assert coverage() == {1: (1, 6), 2: (1, 4)}
+
+    # o dia 05 da loja 2 é drenado: encosta e junta
+    await repo.extend_coverage(date(2025, 10, 5), date(2025, 10, 5), 2)
+    assert coverage()[2] == (1, 5)
+    # recorte anterior ao coberto, com venda no meio: continua de fora
+    con.execute("INSERT INTO sales VALUES (1, TIMESTAMP '2025-09-28 10:00:00')")
+    await repo.extend_coverage(date(2025, 9, 20), date(2025, 9, 25), 1)
+    assert coverage()[1] == (1, 6)
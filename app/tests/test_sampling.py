@@ -0,0 +1,54 @@
+# tests/test_sampling.py
+import random
+
+from app.core.sampling import BlockEstimate, next_sample_pct
+
+
+def _population(rnd):
+    # blocos com 0 a 80 pedidos de valor variado: (pedidos, valor)
+    blocks = []
+    for _ in range(4000):
+        orders = rnd.randint(0, 80)
+        blocks.append((orders, sum(rnd.uniform(10, 120) for _ in range(orders))))
+    return blocks
+
+
+def _sums(blocks):
+    return {
+        "orders": sum(x for x, _ in blocks),
+        "value": sum(y for _, y in blocks),
+        "orders_sq": sum(x * x for x, _ in blocks),
+        "value_sq": sum(y * y for _, y in blocks),
+        "cross_sum": sum(x * y for x, y in blocks),
+    }
+
+
+def test_block_sample_intervals_cover_true_totals():
+    rnd = random.Random(42)
+    blocks = _population(rnd)
+    true = _sums(blocks)
+    true_ticket = true["value"] / true["orders"]
+
+    est = BlockEstimate(sample_pct=5)
+    hits_total = hits_ticket = 0
+    runs = 400
+    for _ in range(runs):
+        sample = _sums([b for b in blocks if rnd.random() < 0.05])
+        total = est.total(sample["value"], sample["value_sq"])
+        ticket = est.ratio(**sample)
+        hits_total += total["low"] <= true["value"] <= total["high"]
+        hits_ticket += ticket["low"] <= true_ticket <= ticket["high"]
+
+    # intervalo de 95%: cobre o valor real em ~95% das amostras
+    assert 0.9 <= hits_total / runs <= 0.99
+    assert 0.9 <= hits_ticket / runs <= 0.99
+
+
+def test_full_sample_is_exact_and_refinement_steps():
+    blocks = [(2, 50.0), (1, 30.0)]
+    full = BlockEstimate(sample_pct=100)
+    total = full.total(**{k: v for k, v in _sums(blocks).items() if k in ("value", "value_sq")})
+    assert (total["estimate"], total["low"], total["high"]) == (80.0, 80.0, 80.0)
+
+    assert next_sample_pct(1.0) == 10.0
+    assert next_sample_pct(10.0) is None  # 100%: próximo passo é o exato
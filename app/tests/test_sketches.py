@@ -0,0 +1,69 @@
+# tests/test_sketches.py
+import hashlib
+import random
+
+import pytest
+
+from app.core.sketches import DDSketch, HyperLogLog
+
+
+def _exact(values, q):
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+def test_ddsketch_quantiles_within_relative_accuracy():
+    rnd = random.Random(42)
+    values = [rnd.randint(600, 3600) for _ in range(5000)]
+
+    sketch = DDSketch(relative_accuracy=0.01)
+    for v in values:
+        sketch.add(v)
+
+    for q in (0.5, 0.9, 0.99):
+        exact = _exact(values, q)
+        assert sketch.quantile(q) == pytest.approx(exact, rel=0.01)
+
+
+def test_ddsketch_merge_equals_single_sketch():
+    rnd = random.Random(7)
+    days = [[rnd.randint(600, 3600) for _ in range(200)] for _ in range(30)]
+
+    merged = DDSketch()
+    single = DDSketch()
+    for day in days:
+        daily = DDSketch()
+        for v in day:
+            daily.add(v)
+            single.add(v)
+        # simula o rollup: só (bucket, contagem) sobrevivem
+        merged.merge(DDSketch.from_buckets(daily.bins.items()))
+
+    assert merged.count == single.count == 6000
+    assert merged.bins == single.bins
+    assert merged.quantile(0.9) == single.quantile(0.9)
+
+
+def test_ddsketch_empty_returns_none():
+    assert DDSketch().quantile(0.9) is None
+
+
+def test_hyperloglog_count_merge_and_sql_mirror():
+    # dois "dias" com clientes em comum: o merge conta a união, não a soma
+    day_a, day_b = HyperLogLog(), HyperLogLog()
+    for customer_id in range(20_000):
+        day_a.add(customer_id)
+    for customer_id in range(15_000, 40_000):
+        day_b.add(customer_id)
+    day_a.merge(day_b)
+    assert day_a.count() == pytest.approx(40_000, rel=3 * day_a.standard_error)
+
+    small = HyperLogLog.from_registers(day_b.registers.items())
+    assert small.count() == day_b.count()
+
+    # mesma conta que o SQL faz em bits (register_sql / rank_sql)
+    for customer_id in (1, 42, 987_654):
+        bits = bin(int(hashlib.md5(str(customer_id).encode()).hexdigest()[:16], 16))[2:].zfill(64)
+        rest = bits[12:]
+        expected = (int(bits[:12], 2), rest.find("1") + 1 if "1" in rest else len(rest) + 1)
+        assert HyperLogLog().position(customer_id) == expected
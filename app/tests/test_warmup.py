@@ -0,0 +1,76 @@
+# tests/test_warmup.py
+import asyncio
+import inspect
+
+import pytest
+
+from app.core.db_router import DatabaseRouter, DatabaseTarget, LazyDatabaseRouter
+from app.repositories.sales_repository import SalesRepository
+from app.services.warmup import warm_up, warmup_calls
+
+
+class FakeResult:
+    def mappings(self):
+        return self
+
+    def all(self):
+        return []
+
+
+class FakeSession:
+    """Conta statements e quantas sessões ficam abertas ao mesmo tempo."""
+
+    open_now = 0
+    max_open = 0
+    statements = 0
+
+    async def execute(self, statement, params=None):
+        await asyncio.sleep(0)
+        if "AS last_sale_id" in str(statement):
+            raise RuntimeError("canceling statement due to statement timeout")
+        FakeSession.statements += 1
+        return FakeResult()
+
+    async def rollback(self):
+        pass
+
+    async def __aenter__(self):
+        FakeSession.open_now += 1
+        FakeSession.max_open = max(FakeSession.max_open, FakeSession.open_now)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        FakeSession.open_now -= 1
+
+
+def test_warmup_covers_every_repository_method():
+    public = {
+        name for name, fn in inspect.getmembers(SalesRepository, inspect.iscoroutinefunction)
+        if not name.startswith("_")
+    }
+    assert set(warmup_calls()) == public
+
+
+@pytest.mark.asyncio
+async def test_warm_up_opens_pool_in_parallel_and_survives_errors():
+    router = DatabaseRouter(DatabaseTarget("primary", FakeSession))
+    stats = await warm_up(router, connections=3)
+
+    assert FakeSession.max_open == 3  # conexões distintas, não a mesma reaproveitada
+    primary = stats["targets"][0]
+    queries = stats["queries"]
+    assert primary["connections"] == 3
+    # por conexão falham 2 (delta ao vivo com timeout; revenue overview sem
+    # linha no fake) e as outras seguem depois do rollback
+    assert primary["errors"] == 3 * 2
+    assert primary["statements"] == 3 * (queries - 2)
+
+
+def test_lazy_router_only_builds_on_first_use():
+    built = []
+    lazy = LazyDatabaseRouter(lambda: built.append(1) or DatabaseRouter(DatabaseTarget("primary", FakeSession)))
+    assert not lazy.is_open and built == []
+
+    lazy.session()
+    lazy.session()
+    assert lazy.is_open and built == [1]
@@ -0,0 +1,398 @@
+# tests/test_widget_service.py
+from datetime import date
+
+import pytest
+
+from app.core.bitmaps import RoaringBitmap
+from app.core.sketches import HyperLogLog
+from app.repositories.sales_repository import customer_stats
+from app.services.widget_service import InvalidWidgetRequest, WidgetService
+
+
+class FakeRepo:
+    def __init__(self, uncovered=0):
+        self.calls = []
+        self.uncovered = uncovered
+
+    async def count_rollup_uncovered_stores(self, store_ids, start_date, end_date):
+        return self.uncovered
+
+    async def count_rollup_pending_days(self, store_ids, start_date, end_date):
+        return 0
+
+    async def get_portfolio_overview(self, store_ids, start_date, end_date, top_n):
+        self.calls.append(store_ids)
+        return [
+            {
+                "store_id": None, "store_name": None,
+                "total_sales": 300.0, "total_orders": 3, "average_ticket": 100.0,
+                "previous_total_sales": 200.0, "previous_total_orders": 4,
+                "top_channels": [{"channel": "iFood", "share_pct": 66.67}],
+                "top_products": [],
+            },
+            {
+                "store_id": 1, "store_name": "Loja 1",
+                "total_sales": 100.0, "total_orders": 1, "average_ticket": 100.0,
+                "previous_total_sales": 0, "previous_total_orders": 0,
+                "top_channels": [], "top_products": [],
+            },
+            {
+                "store_id": 2, "store_name": "Loja 2",
+                "total_sales": 200.0, "total_orders": 2, "average_ticket": 100.0,
+                "previous_total_sales": 200.0, "previous_total_orders": 4,
+                "top_channels": [], "top_products": [],
+            },
+        ]
+
+    async def get_hourly_matrix(self, store_id, start_date, end_date, channel, product_id):
+        self.calls.append((start_date, end_date, channel, product_id))
+        return [
+            {"dow": 1, "hour": 12, "total_orders": 5, "total_sales": 250.5},
+            {"dow": 7, "hour": 20, "total_orders": 2, "total_sales": 80.0},
+        ]
+
+    async def get_hourly_matrix_raw(self, store_id, start_date, end_date, channel, product_id):
+        self.calls.append("raw")
+        return [{"dow": 3, "hour": 11, "total_orders": 4, "total_sales": 120.0}]
+
+
+@pytest.mark.asyncio
+async def test_portfolio_overview_splits_combined_and_stores():
+    repo = FakeRepo()
+    service = WidgetService(repo)
+
+    body = await service.get_portfolio_overview([2, 1, 2], date(2025, 10, 1), date(2025, 10, 31))
+
+    assert repo.calls == [[1, 2]]
+    assert body["combined"]["total_sales"] == 300.0
+    assert body["combined"]["sales_change_pct"] == 50.0
+    assert body["combined"]["store_count"] == 2
+    assert [s["store_id"] for s in body["stores"]] == [2, 1]
+    assert body["stores"][1]["sales_change_pct"] == 0.0
+
+
+@pytest.mark.asyncio
+async def test_portfolio_overview_requires_stores():
+    with pytest.raises(InvalidWidgetRequest):
+        await WidgetService(FakeRepo()).get_portfolio_overview([], None, None)
+
+
+@pytest.mark.asyncio
+async def test_hourly_matrix_fills_7x24_grid():
+    repo = FakeRepo()
+    # 2025-10-01 é quarta: 10 dias = 1 de cada + quarta/quinta/sexta extras
+    body = await WidgetService(repo).get_hourly_matrix_insight(
+        1, date(2025, 10, 1), date(2025, 10, 10), channel="iFood"
+    )
+
+    assert repo.calls == [(date(2025, 10, 1), date(2025, 10, 10), "iFood", None)]
+    orders = body["matrix"]["total_orders"]
+    assert len(orders) == 7 and all(len(row) == 24 for row in orders)
+    assert orders[0][12] == 5 and orders[6][20] == 2
+    assert body["totals"] == {"total_orders": 7, "total_sales": 330.5}
+    assert body["dow_occurrences"] == [1, 1, 2, 2, 2, 1, 1]
+
+    with pytest.raises(InvalidWidgetRequest):
+        await WidgetService(repo).get_hourly_matrix_insight(1, None, None, channel="iFood", product_id=3)
+
+    # rollup sem cobertura do período: soma direto em sales, não matriz zerada
+    repo = FakeRepo(uncovered=1)
+    body = await WidgetService(repo).get_hourly_matrix_insight(1, date(2025, 10, 1), date(2025, 10, 10))
+    assert repo.calls == ["raw"] and body["totals"]["total_orders"] == 4
+
+
+@pytest.mark.asyncio
+async def test_store_comparison_adds_unique_customers_and_repeat_rate():
+    class ComparisonRepo:
+        async def get_store_comparison(self, store_a_id, store_b_id, start_date, end_date):
+            return [{"store_id": 1, "store_name": "Loja 1", "total_orders": 10}]
+
+        async def get_customer_stats(self, store_ids, start_date, end_date):
+            sketch = HyperLogLog()
+            for customer_id in (7, 8, 9, 10):
+                sketch.add(customer_id)
+            return {1: customer_stats(sketch, 8)}
+
+    body = await WidgetService(ComparisonRepo()).get_store_comparison(1, 2, date(2025, 10, 1), date(2025, 10, 31))
+    store = body["stores"][0]
+    # 8 pedidos identificados de 4 clientes: metade é recompra
+    assert (store["unique_customers"], store["repeat_rate_pct"]) == (4, 50.0)
+
+
+@pytest.mark.asyncio
+async def test_cohort_retention_is_bitmap_intersections():
+    class CohortRepo:
+        async def get_customer_month_bitmaps(self, store_id, first_month, last_month):
+            assert (first_month, last_month) == (date(2025, 8, 1), date(2025, 10, 1))
+            return {
+                date(2025, 8, 1): {"active": RoaringBitmap([1, 2, 3, 4]), "new": RoaringBitmap([1, 2, 3, 4])},
+                # setembro sem venda: não vem linha
+                date(2025, 10, 1): {"active": RoaringBitmap([2, 4, 9]), "new": RoaringBitmap([9])},
+            }
+
+    body = await WidgetService(CohortRepo()).get_cohort_retention_insight(1, date(2025, 10, 20), months=3)
+    assert body["cohorts"] == ["2025-08", "2025-09", "2025-10"]
+    assert body["cohort_sizes"] == [4, 0, 1]
+    assert body["matrix"]["retention_pct"] == [
+        [100.0, 0.0, 50.0],
+        [None, None, None],
+        [100.0, None, None],
+    ]
+    assert body["matrix"]["retained_customers"][0] == [4, 0, 2]
+
+
+@pytest.mark.asyncio
+async def test_frequently_bought_together_formats_precomputed_pairs():
+    class AffinityRepo:
+        async def get_product_affinity(self, store_id, product_id, limit):
+            # 200 vendas na loja, 40 com o produto 1, 20 com o 2 e 10 com os dois
+            return {
+                "product_name": "X-Burguer",
+                "pairings": [
+                    {
+                        "related_product_id": 2,
+                        "related_product_name": "Batata",
+                        "pair_orders": 10,
+                        "support": 0.05,
+                        "confidence": 0.25,
+                        "lift": 2.5,
+                        "product_orders": 40,
+                        "baskets": 200,
+                        "window_start": date(2025, 8, 3),
+                        "window_end": date(2025, 10, 31),
+                    }
+                ],
+            }
+
+    body = await WidgetService(AffinityRepo()).get_frequently_bought_together_insight(1, 1)
+    assert (body["product_name"], body["product_orders"], body["baskets"]) == ("X-Burguer", 40, 200)
+    pair = body["pairings"][0]
+    assert (pair["product_name"], pair["support_pct"], pair["confidence_pct"], pair["lift"]) == ("Batata", 5.0, 25.0, 2.5)
+
+    class EmptyRepo:
+        async def get_product_affinity(self, store_id, product_id, limit):
+            return {"product_name": None, "pairings": []}
+
+    body = await WidgetService(EmptyRepo()).get_frequently_bought_together_insight(1, 99)
+    assert body["pairings"] == [] and body["window_end"] is None
+
+
+@pytest.mark.asyncio
+async def test_addon_attach_rate_uses_product_lines_as_denominator():
+    class AddonRepo(FakeRepo):
+        async def get_addon_products(self, store_id, start_date, end_date, product_id=None):
+            assert (start_date, end_date) == (date(2025, 10, 2), date(2025, 10, 31))
+            rows = [
+                {"product_id": 1, "product_name": "X-Burguer", "product_lines": 40, "lines_with_addons": 30, "addon_revenue": 120},
+                {"product_id": 2, "product_name": "Batata", "product_lines": 60, "lines_with_addons": 0, "addon_revenue": 0},
+            ]
+            return [r for r in rows if product_id is None or r["product_id"] == product_id]
+
+        async def get_top_addons(self, store_id, product_id, start_date, end_date, limit):
+            return [{"item_id": 7, "item_name": "Bacon", "product_lines": 20, "quantity": 22.0, "revenue": 88}]
+
+        async def get_addon_products_raw(self, store_id, start_date, end_date, product_id=None):
+            self.calls.append("raw")
+            return await self.get_addon_products(store_id, start_date, end_date, product_id)
+
+        async def get_top_addons_raw(self, store_id, product_id, start_date, end_date, limit):
+            self.calls.append("raw")
+            return await self.get_top_addons(store_id, product_id, start_date, end_date, limit)
+
+    service = WidgetService(AddonRepo())
+    summary = await service.get_addon_summary_insight(1, end_date=date(2025, 10, 31), limit=1)
+    assert (summary["product_lines"], summary["attach_rate_pct"], summary["addon_revenue"]) == (100, 30.0, 120.0)
+    assert [p["attach_rate_pct"] for p in summary["products"]] == [75.0]
+
+    top = await service.get_top_addons_insight(1, 1, end_date=date(2025, 10, 31))
+    assert (top["product_name"], top["attach_rate_pct"]) == ("X-Burguer", 75.0)
+    assert (top["addons"][0]["item_name"], top["addons"][0]["attach_rate_pct"]) == ("Bacon", 50.0)
+    assert service.repo.calls == []
+
+    # rollup sem cobertura do período: as duas consultas vão pro join cru
+    uncovered = WidgetService(AddonRepo(uncovered=1))
+    await uncovered.get_addon_summary_insight(1, end_date=date(2025, 10, 31))
+    top = await uncovered.get_top_addons_insight(1, 1, end_date=date(2025, 10, 31))
+    assert uncovered.repo.calls == ["raw", "raw", "raw"] and top["attach_rate_pct"] == 75.0
+
+    with pytest.raises(InvalidWidgetRequest):
+        await service.get_addon_summary_insight(1, date(2025, 11, 1), date(2025, 10, 31))
+
+
+@pytest.mark.asyncio
+async def test_kitchen_throughput_from_slot_sums_and_sketches():
+    import random
+    import statistics
+
+    from app.core.sketches import PRODUCTION_RELATIVE_ACCURACY, DDSketch
+
+    rnd = random.Random(3)
+    # (dia, faixa, carga da faixa, tempo de produção): cozinha cheia => mais lenta
+    orders = []
+    for day in range(28):
+        for slot in (44, 45, 46, 76, 80):
+            load = rnd.randint(1, 12)
+            orders += [(day, slot, load, 300 + 60 * load + rnd.randint(-120, 120)) for _ in range(load)]
+
+    class KitchenRepo(FakeRepo):
+        async def get_kitchen_production_sketches(self, store_id, start_date, end_date):
+            sketch = DDSketch(PRODUCTION_RELATIVE_ACCURACY)
+            for *_, seconds in orders:
+                sketch.add(seconds)
+            return {"by_dow_hour": {(5, 11): sketch}, "by_channel": {"iFood": sketch}}
+
+        async def get_kitchen_load(self, store_id, start_date, end_date):
+            per_day = {}
+            for day, slot, load, seconds in orders:
+                cell = per_day.setdefault((day, slot), {"active": load, "n": 0, "sy": 0, "syy": 0})
+                cell["n"] += 1
+                cell["sy"] += seconds
+                cell["syy"] += seconds * seconds
+            rows = {}
+            for (_, slot), c in per_day.items():
+                r = rows.setdefault(slot, dict.fromkeys(
+                    ("orders_active", "max_orders_active", "orders_started", "production_count",
+                     "production_seconds_sum", "production_seconds_sq_sum", "load_sum", "load_sq_sum",
+                     "load_x_seconds_sum"), 0))
+                r["slot"] = slot
+                r["orders_active"] += c["active"]
+                r["max_orders_active"] = max(r["max_orders_active"], c["active"])
+                r["orders_started"] += c["n"]
+                r["production_count"] += c["n"]
+                r["production_seconds_sum"] += c["sy"]
+                r["production_seconds_sq_sum"] += c["syy"]
+                r["load_sum"] += c["n"] * c["active"]
+                r["load_sq_sum"] += c["n"] * c["active"] ** 2
+                r["load_x_seconds_sum"] += c["active"] * c["sy"]
+            return [rows[s] for s in sorted(rows)]
+
+        async def get_kitchen_production_sketches_raw(self, store_id, start_date, end_date):
+            self.calls.append("raw")
+            return await self.get_kitchen_production_sketches(store_id, start_date, end_date)
+
+        async def get_kitchen_load_raw(self, store_id, start_date, end_date):
+            self.calls.append("raw")
+            return await self.get_kitchen_load(store_id, start_date, end_date)
+
+    body = await WidgetService(KitchenRepo()).get_kitchen_throughput_insight(1, end_date=date(2025, 10, 31))
+    # rollup sem cobertura do período: mesmas contas sobre as consultas diretas em sales
+    uncovered = KitchenRepo(uncovered=1)
+    assert await WidgetService(uncovered).get_kitchen_throughput_insight(1, end_date=date(2025, 10, 31)) == body
+    assert uncovered.calls == ["raw", "raw"]
+
+    expected = statistics.correlation([o[2] for o in orders], [o[3] for o in orders])
+    assert body["load_vs_production"]["correlation"] == pytest.approx(expected, abs=1e-3)
+    assert body["load_vs_production"]["seconds_per_extra_order"] == pytest.approx(60, abs=5)
+
+    true_p90 = sorted(o[3] for o in orders)[int(0.9 * (len(orders) - 1))]
+    p90 = body["production"]["by_hour"][11]["p90_seconds"]
+    assert abs(p90 - true_p90) <= 0.02 * true_p90
+    assert body["production"]["p90_matrix"][4][11] == p90 and body["production"]["by_hour"][0]["orders"] == 0
+    assert body["load"]["slots"][0]["slot"] == "11:00" and len(body["load"]["peak_slots"]) == 5
+
+    with pytest.raises(InvalidWidgetRequest):
+        await WidgetService(KitchenRepo()).get_kitchen_throughput_insight(1, date(2025, 11, 1), date(2025, 10, 31))
+
+
+@pytest.mark.asyncio
+async def test_customer_stats_are_null_outside_rollup_coverage():
+    from app.repositories.sales_repository import SalesRepository
+
+    class Result:
+        def __init__(self, rows):
+            self.rows = rows
+
+        def mappings(self):
+            return self
+
+        def all(self):
+            return self.rows
+
+    class CoverageDb:
+        """Só a loja 1 tem customer_hll_daily/sales_hourly cobrindo o período."""
+
+        async def execute(self, statement, params=None):
+            sql = str(statement)
+            if "rollup_coverage" in sql:
+                return Result([{"store_id": 1}] if params["end_date"] <= date(2025, 10, 30) else [])
+            if "customer_hll_daily" in sql:
+                assert params["store_ids"] == [1]
+                return Result([{"store_id": 1, "register": 3, "rank": 2}])
+            return Result([{"store_id": 1, "customer_orders": 5}])
+
+    class ComparisonRepo(SalesRepository):
+        async def get_store_comparison(self, store_a_id, store_b_id, start_date, end_date):
+            return [{"store_id": 1, "total_orders": 10}, {"store_id": 2, "total_orders": 4}]
+
+    service = WidgetService(ComparisonRepo(CoverageDb()))
+    body = await service.get_store_comparison(1, 2, date(2025, 10, 1), date(2025, 10, 30))
+    one, two = body["stores"]
+    assert one["unique_customers"] is not None and one["unique_customers"] > 0
+    # loja sem backfill: nulo, não 0
+    assert (two["unique_customers"], two["repeat_rate_pct"]) == (None, None)
+
+    # período até hoje passa do último refresh: nulo pras duas
+    body = await service.get_store_comparison(1, 2, date(2025, 10, 1), date(2025, 10, 31))
+    assert [s["unique_customers"] for s in body["stores"]] == [None, None]
+
+
+class HeatmapRepo:
+    def __init__(self, uncovered=0, pending=0):
+        self.uncovered = uncovered
+        self.pending = pending
+        self.calls = []
+
+    async def count_rollup_uncovered_stores(self, store_ids, start_date, end_date):
+        return self.uncovered
+
+    async def count_rollup_pending_days(self, store_ids, start_date, end_date):
+        return self.pending
+
+    async def get_delivery_heatmap_percentiles(self, store_id, start_date, end_date):
+        self.calls.append("rollup")
+        return [
+            {
+                "neighborhood": name, "city": "SP", "delivery_count": count, "avg_delivery_seconds": 900.0,
+                "p50_delivery_seconds": 880.0, "p90_delivery_seconds": 1200.0, "p99_delivery_seconds": 1500.0,
+            }
+            for name, count in (("Centro", 3), ("Lapa", 2))
+        ]
+
+    async def get_delivery_heatmap_by_store(self, store_id, start_date, end_date, limit, after):
+        self.calls.append("raw")
+        return [{
+            "neighborhood": "Centro", "city": "SP", "delivery_count": 5,
+            "avg_delivery_seconds": 950.0, "total_estimate": 1,
+        }]
+
+
+@pytest.mark.asyncio
+async def test_delivery_heatmap_uses_rollup_only_when_covered():
+    covered = HeatmapRepo()
+    body = await WidgetService(covered).get_delivery_heatmap_insight(1, date(2025, 10, 1), date(2025, 10, 30))
+    assert covered.calls == ["rollup"] and body["regions"][0]["p90_delivery_seconds"] == 1200.0
+    rollup_fields = set(body["regions"][0])
+
+    # rollup parcial (loja sem backfill ou dia pendente): cru, mesmo formato de linha
+    for repo in (HeatmapRepo(uncovered=1), HeatmapRepo(pending=2)):
+        body = await WidgetService(repo).get_delivery_heatmap_insight(1, date(2025, 10, 1), date(2025, 10, 31))
+        assert repo.calls == ["raw"]
+        region = body["regions"][0]
+        assert set(region) == rollup_fields
+        assert (region["p50_delivery_seconds"], region["p99_delivery_seconds"]) == (None, None)
+        assert body["total_estimate"] == 1
+
+
+@pytest.mark.asyncio
+async def test_delivery_heatmap_returns_every_region_without_limit_or_cursor():
+    service = WidgetService(HeatmapRepo())
+    body = await service.get_delivery_heatmap_insight(1, date(2025, 10, 1), date(2025, 10, 30))
+    assert [r["neighborhood"] for r in body["regions"]] == ["Centro", "Lapa"] and body["next_cursor"] is None
+
+    # quem pagina continua paginando; cursor sem limit usa a página padrão
+    first = await service.get_delivery_heatmap_insight(1, date(2025, 10, 1), date(2025, 10, 30), limit=1)
+    assert [r["neighborhood"] for r in first["regions"]] == ["Centro"]
+    rest = await service.get_delivery_heatmap_insight(
+        1, date(2025, 10, 1), date(2025, 10, 30), cursor=first["next_cursor"]
+    )
+    assert [r["neighborhood"] for r in rest["regions"]] == ["Lapa"] and rest["next_cursor"] is None
@@ -6,7 +6,14 @@ from app.main import app  # importa o FastAPI app da sua aplicação
 
 # Fake do serviço que o endpoint usa
 class FakeWidgetService:
-    async def get_revenue_overview(self, store_id: int, start_date, end_date):
+    calls = 0
+    watermark = 7
+
+    async def get_data_watermarks(self, store_ids):
+        return {sid: FakeWidgetService.watermark for sid in store_ids}
+
+    async def get_revenue_overview(self, store_id: int, start_date, end_date, approx=False, sample_pct=None):
+        FakeWidgetService.calls += 1
         return {
             "total_sales": 12345.67,
             "total_orders": 321,
@@ -19,8 +26,17 @@ class FakeWidgetService:
                 {"channel": "iFood", "share_pct": 62.5},
                 {"channel": "Rappi", "share_pct": 23.0},
             ],
+            "daily_breakdown": [
+                {"sale_date": f"2025-10-{d:02d}", "total_sales": 400.0 + d, "total_orders": 10 + d}
+                for d in range(1, 32)
+            ],
         }
 
+    async def get_portfolio_overview(self, store_ids, start_date, end_date, top_n=5):
+        from app.services.widget_service import InvalidWidgetRequest
+
+        raise InvalidWidgetRequest("Máximo de 50 lojas por consulta")
+
 
 @pytest.fixture(autouse=True)
 def override_deps():
@@ -50,3 +66,75 @@ def test_revenue_overview_ok():
     body = r.json()
     assert body["total_sales"] == 12345.67
     assert body["top_channels"][0]["channel"] == "iFood"
+
+
+def test_revenue_overview_conditional_get():
+    client = TestClient(app)
+    url = "/api/v1/widgets/revenue-overview"
+    params = {"store_id": 1, "start_date": "2025-10-01", "end_date": "2025-10-31"}
+    FakeWidgetService.calls = 0
+    FakeWidgetService.watermark = 7
+
+    first = client.get(url, params=params)
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == "private, max-age=60"
+
+    # mesma versão de dados => 304 sem rodar o serviço
+    again = client.get(url, params=params, headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.content == b""
+    assert FakeWidgetService.calls == 1
+
+    # venda nova na loja => versão muda => payload novo
+    FakeWidgetService.watermark = 8
+    changed = client.get(url, params=params, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+
+
+def test_revenue_overview_columnar():
+    client = TestClient(app)
+    r = client.get(
+        "/api/v1/widgets/revenue-overview",
+        params={"store_id": 1, "start_date": "2025-10-01", "end_date": "2025-10-31", "format": "columnar"},
+    )
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["format"] == "columnar"
+    assert body["daily_breakdown"]["sale_date"][0] == "2025-10-01"
+    assert len(body["daily_breakdown"]["total_orders"]) == 31
+    assert body["top_channels"]["channel"] == ["iFood", "Rappi"]
+
+
+def test_portfolio_invalid_request_is_400():
+    r = TestClient(app).get("/api/v1/widgets/portfolio/overview", params={"store_ids": [1, 2]})
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Máximo de 50 lojas por consulta"
+
+
+def test_large_payload_is_gzipped():
+    client = TestClient(app)
+    r = client.get(
+        "/api/v1/widgets/revenue-overview",
+        params={"store_id": 1, "start_date": "2025-10-01", "end_date": "2025-10-31"},
+        headers={"Accept-Encoding": "gzip"},
+    )
+    assert r.status_code == 200, r.text
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.headers["vary"] == "Accept-Encoding"
+    assert r.headers["etag"].startswith("W/")
+    assert len(r.json()["daily_breakdown"]) == 31
+
+
+def test_columnar_empty_list_keeps_columns():
+    from app.core.encoding import apply_format
+
+    body = apply_format(
+        {"customers": [], "daily_breakdown": []},
+        "columnar",
+        "customers",
+        "daily_breakdown",
+        columns={"daily_breakdown": ("sale_date", "total_orders")},
+    )
+    assert body["daily_breakdown"] == {"sale_date": [], "total_orders": []}
+    assert body["customers"] == {}